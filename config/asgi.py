@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Под ASGI эндпоинты баланса и операций обслуживаются асинхронными представлениями
+# (wallet.api.async_views) с собственным пулом соединений psycopg.
+os.environ.setdefault("WALLET_ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
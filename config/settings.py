@@ -37,7 +37,6 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
-    'drf_yasg',
 
     'rest_framework',
 
@@ -46,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "utilities.metrics.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -53,6 +53,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "utilities.db_routing.replica_stickiness_middleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -85,6 +86,39 @@ DATABASES = {
         'USER': os.environ.get("POSTGRES_USER"),
         'PASSWORD': os.environ.get("POSTGRES_PASSWORD"),
         'HOST': os.environ.get("POSTGRES_HOST_DOCKER"),
+        # Постоянные соединения (секунды) с проверкой перед повторным использованием.
+        'CONN_MAX_AGE': int(os.environ.get("POSTGRES_CONN_MAX_AGE", default=60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Реплики для чтения (хосты через запятую). Списки кошельков, баланс и информация
+# о кошельке читаются с реплик; операции и чтения клиента в течение
+# DATABASE_REPLICA_STICKY_SECONDS после его операции - с основной базы данных.
+
+DATABASE_REPLICAS = []
+
+for number, replica_host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', default='').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['utilities.db_routing.ReplicaRouter']
+
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', default=5))
+DATABASE_REPLICA_STICKY_CACHE = os.environ.get('DATABASE_REPLICA_STICKY_CACHE', default='default')
+
+# Кэш Django: по умолчанию в памяти процесса. При репликах закрепления за основной базой данных должны быть
+# видны всем процессам, поэтому кэш DATABASE_REPLICA_STICKY_CACHE должен быть общим (Redis, Memcached,
+# DatabaseCache): CACHE_BACKEND и CACHE_LOCATION. Иначе проверка системы (manage.py check) завершается ошибкой.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', default=''),
     }
 }
 
@@ -128,3 +162,167 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "users.User"
+
+# Wallet operations
+# True - операция выполняется одним UPDATE ... RETURNING,
+# False - через SELECT ... FOR UPDATE и сохранение модели.
+
+WALLET_ATOMIC_OPERATIONS = os.environ.get('WALLET_ATOMIC_OPERATIONS', default='True') == 'True'
+
+# Полосы баланса для "горячих" кошельков (manage.py stripe_wallet).
+# Стратегия выбора полосы для пополнения: random или round_robin.
+
+WALLET_STRIPE_STRATEGY = os.environ.get('WALLET_STRIPE_STRATEGY', default='random')
+
+WALLET_MAX_STRIPES = int(os.environ.get('WALLET_MAX_STRIPES', default=64))
+
+# Максимальное количество операций в одном пакете (POST api/v1/wallets/operations/batch/).
+
+WALLET_BATCH_MAX_SIZE = int(os.environ.get('WALLET_BATCH_MAX_SIZE', default=1000))
+
+# Транзакции операций с кошельками (wallet.transactions.retrying_atomic): уровень изоляции
+# (read committed, repeatable read или serializable), lock_timeout в миллисекундах (0 - без ограничения)
+# и повторы после взаимной блокировки, ошибки сериализации и lock_timeout: не более MAX_RETRIES
+# повторов со случайной паузой до min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^номер повтора) секунд.
+
+WALLET_TRANSACTIONS = {
+    'ISOLATION_LEVEL': os.environ.get('WALLET_ISOLATION_LEVEL', default='read committed'),
+    'LOCK_TIMEOUT': int(os.environ.get('WALLET_LOCK_TIMEOUT', default=0)),
+    'MAX_RETRIES': int(os.environ.get('WALLET_TRANSACTION_MAX_RETRIES', default=3)),
+    'RETRY_BASE_DELAY': float(os.environ.get('WALLET_TRANSACTION_RETRY_BASE_DELAY', default=0.005)),
+    'RETRY_MAX_DELAY': float(os.environ.get('WALLET_TRANSACTION_RETRY_MAX_DELAY', default=0.1)),
+}
+
+# Ключи идемпотентности для POST api/v1/wallets/<WALLET_UUID>/operation/ (заголовок Idempotency-Key).
+# BACKEND: wallet.idempotency.DatabaseIdempotencyStore (общая таблица для всех процессов)
+# или wallet.idempotency.LocMemIdempotencyStore (LRU-кэш в памяти процесса).
+
+WALLET_IDEMPOTENCY = {
+    'BACKEND': os.environ.get('WALLET_IDEMPOTENCY_BACKEND', default='wallet.idempotency.DatabaseIdempotencyStore'),
+    'TTL': int(os.environ.get('WALLET_IDEMPOTENCY_TTL', default=86400)),
+    'OPTIONS': {
+        'wait_timeout': float(os.environ.get('WALLET_IDEMPOTENCY_WAIT_TIMEOUT', default=30)),
+    },
+}
+
+# Кэш балансов для GET api/v1/wallets/<WALLET_UUID>/ и .../info/.
+# Локальный LRU-кэш процесса и необязательный общий кэш Django (алиас из CACHES).
+# Записи удаляются после фиксации операции, локальные записи других процессов
+# живут не дольше WALLET_BALANCE_CACHE_LOCAL_TTL секунд.
+
+WALLET_BALANCE_CACHE = {
+    'ENABLED': os.environ.get('WALLET_BALANCE_CACHE_ENABLED', default='True') == 'True',
+    'LOCAL_MAX_ENTRIES': int(os.environ.get('WALLET_BALANCE_CACHE_LOCAL_MAX_ENTRIES', default=100000)),
+    'LOCAL_TTL': float(os.environ.get('WALLET_BALANCE_CACHE_LOCAL_TTL', default=1)),
+    'SHARED_CACHE_ALIAS': os.environ.get('WALLET_BALANCE_CACHE_SHARED_ALIAS') or None,
+    'SHARED_TTL': int(os.environ.get('WALLET_BALANCE_CACHE_SHARED_TTL', default=30)),
+}
+
+# Список кошельков GET api/v1/wallets: размер страницы по умолчанию и максимальный
+# (?page_size=), а также размер пакета строк серверного курсора в режиме ?stream=json|ndjson.
+
+WALLET_LIST_PAGE_SIZE = int(os.environ.get('WALLET_LIST_PAGE_SIZE', default=100))
+WALLET_LIST_MAX_PAGE_SIZE = int(os.environ.get('WALLET_LIST_MAX_PAGE_SIZE', default=1000))
+WALLET_LIST_STREAM_CHUNK_SIZE = int(os.environ.get('WALLET_LIST_STREAM_CHUNK_SIZE', default=2000))
+
+# Быстрая проверка данных операции и вывод кошелька без полей DRF (wallet.api.fast_serializers).
+# Ответы и ошибки совпадают с WalletOperationSerializer и WalletSerializer.
+
+WALLET_FAST_SERIALIZERS = os.environ.get('WALLET_FAST_SERIALIZERS', default='True') == 'True'
+
+# Асинхронные представления баланса, информации о кошельке и операций (wallet.api.async_views).
+# config/asgi.py включает их по умолчанию, под WSGI используются синхронные представления.
+# WALLET_ASYNC_DB - пул асинхронных соединений psycopg каждого процесса ASGI.
+
+WALLET_ASYNC_VIEWS = os.environ.get('WALLET_ASYNC_VIEWS', default='False') == 'True'
+
+WALLET_ASYNC_DB = {
+    'MIN_SIZE': int(os.environ.get('WALLET_ASYNC_DB_MIN_SIZE', default=2)),
+    'MAX_SIZE': int(os.environ.get('WALLET_ASYNC_DB_MAX_SIZE', default=20)),
+    'TIMEOUT': float(os.environ.get('WALLET_ASYNC_DB_TIMEOUT', default=30)),
+}
+
+# Логгер приложения (utilities.logger_utils): записи передаются через очередь фоновому
+# потоку вывода. LOG_FORMAT - text или json, LOG_INFO_SAMPLE_RATE - доля выводимых
+# массовых INFO-записей горячего пути (операции с кошельками), от 0 до 1.
+
+LOGGER = {
+    'LEVEL': os.environ.get('LOG_LEVEL', default='DEBUG'),
+    'FORMAT': os.environ.get('LOG_FORMAT', default='text'),
+    'INFO_SAMPLE_RATE': float(os.environ.get('LOG_INFO_SAMPLE_RATE', default=1)),
+}
+
+# Метрики процесса в формате Prometheus (GET /metrics, utilities.metrics): время обработки
+# запросов по эндпоинтам, количество SQL-запросов, ожидание блокировок и результаты операций.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', default='True') == 'True'
+
+# Контрольные точки балансов для GET api/v1/wallets/<WALLET_UUID>/balance/?at= (manage.py create_balance_checkpoints).
+# Точка создается, если после предыдущей накопилось не меньше MIN_ENTRIES записей журнала, на момент
+# SAFETY_LAG секунд назад (записи журнала не позже этого момента уже зафиксированы), пакетами по BATCH_SIZE кошельков.
+
+WALLET_CHECKPOINTS = {
+    'MIN_ENTRIES': int(os.environ.get('WALLET_CHECKPOINT_MIN_ENTRIES', default=100)),
+    'SAFETY_LAG': int(os.environ.get('WALLET_CHECKPOINT_SAFETY_LAG', default=300)),
+    'BATCH_SIZE': int(os.environ.get('WALLET_CHECKPOINT_BATCH_SIZE', default=1000)),
+}
+
+# Контроль допуска POST api/v1/wallets/<WALLET_UUID>/operation/ (wallet.admission): до блокировки кошелька
+# проверяются MAX_IN_FLIGHT одновременных операций (иначе 503), корзина токенов кошелька
+# (WALLET_RATE в секунду, емкость WALLET_BURST) и WALLET_CONCURRENCY одновременных операций кошелька (иначе 429).
+# LocMemAdmissionController применяет ограничения в каждом процессе, DatabaseAdmissionController - во всех:
+# он используется по умолчанию, если сервер запущен с несколькими процессами (WEB_CONCURRENCY > 1).
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', default=1))
+
+WALLET_ADMISSION = {
+    'ENABLED': os.environ.get('WALLET_ADMISSION_ENABLED', default='True') == 'True',
+    'BACKEND': os.environ.get('WALLET_ADMISSION_BACKEND') or (
+        'wallet.admission.DatabaseAdmissionController' if WEB_CONCURRENCY > 1
+        else 'wallet.admission.LocMemAdmissionController'
+    ),
+    'MAX_IN_FLIGHT': int(os.environ.get('WALLET_ADMISSION_MAX_IN_FLIGHT', default=64)),
+    'WALLET_CONCURRENCY': int(os.environ.get('WALLET_ADMISSION_WALLET_CONCURRENCY', default=8)),
+    'WALLET_RATE': float(os.environ.get('WALLET_ADMISSION_WALLET_RATE', default=100)),
+    'WALLET_BURST': int(os.environ.get('WALLET_ADMISSION_WALLET_BURST', default=200)),
+}
+
+# Блокировки средств (двухфазное списание, wallet.services.hold_funds): срок блокировки по умолчанию TTL
+# и не больше MAX_TTL секунд. Истекшие блокировки снимает manage.py release_expired_holds пакетами по SWEEP_BATCH_SIZE.
+
+WALLET_HOLDS = {
+    'TTL': int(os.environ.get('WALLET_HOLD_TTL', default=900)),
+    'MAX_TTL': int(os.environ.get('WALLET_HOLD_MAX_TTL', default=604800)),
+    'SWEEP_BATCH_SIZE': int(os.environ.get('WALLET_HOLD_SWEEP_BATCH_SIZE', default=1000)),
+}
+
+# Рендерер и парсер JSON API пользователей и кошельков: API_FAST_JSON=True - orjson (utilities.renderers),
+# False - JSONRenderer и JSONParser DRF. Версия API передается в заголовке Accept
+# (application/json; version=2): в версии 2 денежные суммы - строки без потери точности, в версии 1 - числа.
+
+API_FAST_JSON = os.environ.get('API_FAST_JSON', default='True') == 'True'
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'utilities.renderers.FastJSONRenderer' if API_FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'utilities.renderers.FastJSONParser' if API_FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.AcceptHeaderVersioning',
+    'DEFAULT_VERSION': '1',
+    'ALLOWED_VERSIONS': ['1', '2'],
+}
+
+# Документация API (utilities.api_docs): API_DOCS_DYNAMIC=True - схема OpenAPI строится drf_yasg из кода
+# один раз в процессе; False - drf_yasg не импортируется, GET /swagger.json отдает файл API_SCHEMA_FILE,
+# созданный при сборке командой generate_api_schema.
+
+API_DOCS_DYNAMIC = os.environ.get('API_DOCS_DYNAMIC', default='True') == 'True'
+API_SCHEMA_FILE = os.environ.get('API_SCHEMA_FILE') or str(BASE_DIR / 'resources' / 'openapi.json')
+
+if API_DOCS_DYNAMIC:
+    INSTALLED_APPS.append('drf_yasg')
@@ -17,28 +17,18 @@ Including another URLconf
 # from django.contrib import admin
 from django.urls import path, include
 
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-# from rest_framework import permissions
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Snippets API",
-        default_version='v1',
-        description="Test description",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@snippets.local"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    # permission_classes=(permissions.AllowAny,),
-)
+from utilities.api_docs import asset_view, docs_view, schema_view
+from utilities.metrics import metrics_view
 
 urlpatterns = [
     # path("admin/", admin.site.urls),
     path("api/v1/users/", include('users.api.urls', 'users')),
     path("api/v1/wallets/", include('wallet.api.urls', 'wallet')),
 
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger.json', schema_view, name='schema-json'),
+    path('swagger/', docs_view, {'ui': 'swagger'}, name='schema-swagger-ui'),
+    path('redoc/', docs_view, {'ui': 'redoc'}, name='schema-redoc'),
+    path('api-docs/assets/<str:name>', asset_view, name='api-docs-asset'),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
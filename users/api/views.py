@@ -1,6 +1,18 @@
 from users.models import User
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
 from users.api.serializers import UserSerializer
+from users.services import bulk_onboard_users, read_user_records
+
+
+# Форматы тела запроса импорта пользователей.
+IMPORT_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+}
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -10,3 +22,24 @@ class UserViewSet(viewsets.ModelViewSet):
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def import_users(self, request: Request) -> Response:
+        """
+        Массовый импорт пользователей с кошельками (только для администраторов).
+
+        Тело запроса - CSV (Content-Type: text/csv, заголовок email,first_name,last_name)
+        или NDJSON (Content-Type: application/x-ndjson). Тело читается построчно и
+        записывается пакетами; в ответе - отчет об импорте.
+        """
+
+        file_format = IMPORT_FORMATS.get(request.content_type.split(';')[0].strip())
+        if file_format is None:
+            return Response(
+                {'error': 'Поддерживаются только Content-Type text/csv и application/x-ndjson.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        lines = (line.decode('utf-8-sig') for line in (request.stream or []))
+        report = bulk_onboard_users(read_user_records(lines, file_format))
+        return Response(report, status=status.HTTP_200_OK)
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+
+from users.services import bulk_onboard_users, read_user_records
+
+
+class Command(BaseCommand):
+    """
+    Массовый импорт пользователей с кошельками
+    """
+
+    help = 'Импорт пользователей из CSV или NDJSON с созданием кошельков пакетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу CSV (email,first_name,last_name) или NDJSON')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Формат файла (по умолчанию определяется по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Количество пользователей в пакете (по умолчанию 5000)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Импортирует пользователей и выводит прогресс после каждого пакета.
+        """
+
+        path = Path(kwargs['path'])
+        file_format = kwargs['format'] or ('ndjson' if path.suffix in ('.ndjson', '.jsonl') else 'csv')
+
+        def progress(report: dict) -> None:
+            self.stdout.write(
+                f"Обработано {report['processed']}: создано {report['created']}, пропущено {report['skipped']}, "
+                f"с ошибками {report['invalid']} ({report['rate']} записей/с)"
+            )
+
+        try:
+            with path.open(encoding='utf-8-sig', newline='') as file:
+                report = bulk_onboard_users(read_user_records(file, file_format), kwargs['chunk_size'], progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Запись {error['record']}: {error['error']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Импорт завершен за {report['elapsed']} с: создано пользователей с кошельками - {report['created']}"
+        ))
@@ -0,0 +1,152 @@
+import csv
+import json
+import time
+import secrets
+
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User
+from wallet.models import Wallet
+from utilities.logger_utils import logger
+
+
+USER_TABLE = User._meta.db_table
+WALLET_TABLE = Wallet._meta.db_table
+
+# Пользователи пакета и их кошельки создаются одним запросом. Существующие
+# email пропускаются (ON CONFLICT DO NOTHING), кошельки создаются только
+# для действительно добавленных пользователей.
+ONBOARD_SQL = f"""
+    WITH new_users AS (
+        INSERT INTO {USER_TABLE} (password, is_superuser, is_staff, is_active, date_joined,
+                                  email, first_name, last_name)
+        SELECT u.password, FALSE, FALSE, TRUE, %s, u.email, u.first_name, u.last_name
+          FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[])
+               AS u(email, first_name, last_name, password)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    ), new_wallets AS (
+        INSERT INTO {WALLET_TABLE} (wallet_id, user_id, balance, held_balance, stripe_count)
+        SELECT gen_random_uuid(), id, 0, 0, 0 FROM new_users
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM new_users), (SELECT count(*) FROM new_wallets)
+"""
+
+# Максимальное количество ошибок валидации, сохраняемых в отчете.
+MAX_REPORTED_ERRORS = 100
+
+EMAIL_MAX_LENGTH = User._meta.get_field('email').max_length
+NAME_MAX_LENGTH = User._meta.get_field('first_name').max_length
+
+
+def read_user_records(lines: Iterable[str], file_format: str) -> Iterator[dict]:
+    """
+    Читает записи пользователей из CSV (с заголовком email,first_name,last_name) или NDJSON.
+
+    Args:
+        lines (Iterable[str]): Строки файла или тела запроса.
+        file_format (str): Формат данных ("csv" или "ndjson").
+    """
+
+    if file_format == 'csv':
+        yield from csv.DictReader(lines)
+    elif file_format == 'ndjson':
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield {'_error': "Некорректная строка JSON"}
+    else:
+        raise ValueError(f"Неверный формат файла: {file_format}. Допустимые значения: csv, ndjson.")
+
+
+def _clean_record(record) -> tuple[Optional[tuple], Optional[str]]:
+    """
+    Проверяет запись пользователя и возвращает (email, first_name, last_name) либо текст ошибки.
+    """
+
+    if not isinstance(record, dict):
+        return None, "Запись должна быть объектом"
+    if '_error' in record:
+        return None, record['_error']
+
+    email = User.objects.normalize_email(str(record.get('email') or '').strip())
+    first_name = str(record.get('first_name') or '').strip()
+    last_name = str(record.get('last_name') or '').strip() or None
+
+    if '@' not in email or len(email) > EMAIL_MAX_LENGTH:
+        return None, f"Некорректный email: {email!r}"
+    if not first_name or len(first_name) > NAME_MAX_LENGTH:
+        return None, f"Некорректное имя пользователя {email}"
+    if last_name is not None and len(last_name) > NAME_MAX_LENGTH:
+        return None, f"Некорректная фамилия пользователя {email}"
+    return (email, first_name, last_name), None
+
+
+def bulk_onboard_users(records: Iterable[dict], chunk_size: int = 5000,
+                       progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Создает пользователей и их кошельки пакетами, без сигнала post_save на каждого пользователя.
+
+    Каждый пакет записывается одним запросом (пользователи и кошельки) в своей
+    транзакции, поэтому прерванный импорт можно повторить: уже созданные
+    пользователи пропускаются по email. Импортированные пользователи получают
+    неиспользуемый пароль и задают его через восстановление пароля.
+
+    Args:
+        records (Iterable[dict]): Записи пользователей (email, first_name, last_name).
+        chunk_size (int): Количество записей в пакете.
+        progress (Optional[Callable]): Вызывается после каждого пакета с текущим отчетом.
+
+    Returns:
+        dict: Отчет: processed, created, skipped (email уже существует), invalid,
+        errors (первые ошибки с номерами записей), elapsed (секунды), rate (записей в секунду).
+    """
+
+    if chunk_size < 1:
+        raise ValueError("Размер пакета должен быть положительным.")
+
+    report = {'processed': 0, 'created': 0, 'skipped': 0, 'invalid': 0, 'errors': [], 'elapsed': 0.0, 'rate': 0.0}
+    started = time.monotonic()
+    records = iter(records)
+
+    while chunk := list(islice(records, chunk_size)):
+        emails, first_names, last_names = [], [], []
+
+        for number, record in enumerate(chunk, report['processed'] + 1):
+            cleaned, error = _clean_record(record)
+            if error is not None:
+                report['invalid'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'record': number, 'error': error})
+                continue
+            emails.append(cleaned[0])
+            first_names.append(cleaned[1])
+            last_names.append(cleaned[2])
+
+        if emails:
+            # Неиспользуемый пароль, как make_password(None), но без генерации строки посимвольно.
+            passwords = [UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30) for _ in emails]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(ONBOARD_SQL, [timezone.now(), emails, first_names, last_names, passwords])
+                created, _ = cursor.fetchone()
+            report['created'] += created
+            report['skipped'] += len(emails) - created
+
+        report['processed'] += len(chunk)
+        report['elapsed'] = round(time.monotonic() - started, 3)
+        report['rate'] = round(report['processed'] / report['elapsed'], 1) if report['elapsed'] else 0.0
+
+        if progress is not None:
+            progress(report)
+
+    logger.info("Импорт пользователей завершен: обработано %s, создано %s, пропущено %s, с ошибками %s за %s с",
+                report['processed'], report['created'], report['skipped'], report['invalid'], report['elapsed'])
+    return report
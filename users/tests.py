@@ -1,8 +1,18 @@
+import io
+import tempfile
+
+from pathlib import Path
+
+from django.core.management import call_command
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
 from users.factories import UserFactory
+from users.models import User
+from users.services import bulk_onboard_users, read_user_records
+from wallet.models import Wallet
 from utilities.logger_utils import logger
+from utilities.renderers import FastJSONRenderer
 
 
 class UserViewSetTestCase(APITestCase):
@@ -30,6 +40,21 @@ class UserViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         logger.info("Тест test_create_user пройден успешно")
 
+    def test_create_user_fast_json(self):
+        """
+        Тестирует, что API пользователей разбирает и формирует JSON рендерером и парсером orjson.
+        """
+
+        logger.info("Начало теста test_create_user_fast_json")
+        response = self.client.post('/api/v1/users/', ('{"first_name": "Fast", "last_name": "User", '
+                                     '"email": "fast@example.com", "password": "pass"}'),
+                                    content_type='application/json', HTTP_ACCEPT='application/json; version=2')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.json()['email'], 'fast@example.com')
+        logger.info("Тест test_create_user_fast_json пройден успешно")
+
     def test_create_user_with_factory(self):
         """
         Тестирует создание нового пользователя с помощью фабрики.
@@ -55,3 +80,70 @@ class UserViewSetTestCase(APITestCase):
         self.assertIsNotNone(user.id)
         self.assertEqual(user.email, 'custom@example.com')
         logger.info("Тест test_create_user_with_custom_email пройден успешно")
+
+
+class BulkOnboardingTestCase(APITestCase):
+    """
+    Тесты для массового импорта пользователей с кошельками.
+    """
+
+    CSV = (
+        "email,first_name,last_name\n"
+        "anna@example.com,Anna,Smith\n"
+        "boris@example.com,Boris,\n"
+        "not-an-email,Bad,Row\n"
+        "anna@example.com,Anna,Duplicate\n"
+    )
+
+    def test_bulk_onboard_creates_wallets(self):
+        """
+        Тестирует, что импорт создает пользователей и их кошельки и пропускает дубликаты и ошибки.
+        """
+
+        logger.info("Начало теста test_bulk_onboard_creates_wallets")
+        reports = []
+        report = bulk_onboard_users(read_user_records(io.StringIO(self.CSV), 'csv'), chunk_size=2,
+                                    progress=lambda r: reports.append(r['processed']))
+
+        self.assertEqual((report['created'], report['skipped'], report['invalid']), (2, 1, 1))
+        self.assertEqual(report['errors'][0]['record'], 3)
+        self.assertEqual(reports, [2, 4])
+        users = User.objects.filter(email__in=['anna@example.com', 'boris@example.com'])
+        self.assertEqual(Wallet.objects.filter(user__in=users, balance=0).count(), 2)
+        self.assertFalse(users.get(email='anna@example.com').has_usable_password())
+        logger.info("Тест test_bulk_onboard_creates_wallets пройден успешно")
+
+    def test_import_is_repeatable(self):
+        """
+        Тестирует, что повторный импорт того же файла не создает новых пользователей.
+        """
+
+        logger.info("Начало теста test_import_is_repeatable")
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'users.ndjson'
+        path.write_text('{"email": "vera@example.com", "first_name": "Vera"}\n{broken\n', encoding='utf-8')
+
+        out = io.StringIO()
+        call_command('import_users', str(path), stdout=out, stderr=io.StringIO())
+        call_command('import_users', str(path), stdout=out, stderr=io.StringIO())
+
+        self.assertIn('создано 0, пропущено 1', out.getvalue())
+        self.assertEqual(Wallet.objects.filter(user__email='vera@example.com').count(), 1)
+        logger.info("Тест test_import_is_repeatable пройден успешно")
+
+    def test_import_endpoint_requires_admin(self):
+        """
+        Тестирует эндпоинт импорта пользователей.
+        """
+
+        logger.info("Начало теста test_import_endpoint_requires_admin")
+        url = '/api/v1/users/import/'
+        self.assertEqual(self.client.post(url, self.CSV, content_type='text/csv').status_code, 403)
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.post(url, self.CSV, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(self.client.post(url, '[]', content_type='application/json').status_code, 415)
+        logger.info("Тест test_import_endpoint_requires_admin пройден успешно")
+
@@ -0,0 +1,220 @@
+import hashlib
+import importlib.util
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.http import Http404, HttpRequest, HttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.http import etag, require_safe
+
+from utilities.logger_utils import logger
+
+
+class _SchemaPlaceholder:
+    """
+    Заменяет drf_yasg.openapi, если drf_yasg не импортируется (API_DOCS_DYNAMIC=False):
+    описания схемы в декораторах представлений вычисляются, но не используются.
+    """
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+if settings.API_DOCS_DYNAMIC:
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    openapi = _SchemaPlaceholder()
+
+    def swagger_auto_schema(*args, **kwargs):
+        return lambda view: view
+
+
+# Описание API в схеме OpenAPI.
+SCHEMA_INFO = {
+    'title': "Snippets API",
+    'default_version': 'v1',
+    'description': "Test description",
+    'terms_of_service': "https://www.google.com/policies/terms/",
+    'contact': {'email': "contact@snippets.local"},
+    'license': {'name': "BSD License"},
+}
+
+# Скрипты и стили Swagger UI и ReDoc из статических файлов установленного пакета drf-yasg
+# (версия закреплена в requirements.txt) отдает asset_view: страницы документации не загружают
+# скрипты со сторонних серверов. Имя: (файл в каталоге static/drf-yasg пакета, Content-Type).
+DOCS_ASSETS = {
+    'swagger_css': ('swagger-ui-dist/swagger-ui.css', 'text/css; charset=utf-8'),
+    'swagger_js': ('swagger-ui-dist/swagger-ui-bundle.js', 'text/javascript; charset=utf-8'),
+    'redoc_js': ('redoc/redoc.min.js', 'text/javascript; charset=utf-8'),
+}
+
+# Адрес файла содержит его хэш (?v=), поэтому браузер может хранить файл без повторной проверки.
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+DOCS_TEMPLATES = {
+    'swagger': 'api_docs/swagger.html',
+    'redoc': 'api_docs/redoc.html',
+}
+
+
+def generate_schema() -> bytes:
+    """
+    Строит схему OpenAPI всех эндпоинтов drf_yasg и возвращает ее в JSON.
+
+    Схема не зависит от запроса: host и schemes не указываются, интерфейсы
+    документации используют адрес страницы.
+
+    :raises RuntimeError: Если API_DOCS_DYNAMIC=False (описания swagger_auto_schema не загружены).
+    """
+
+    if not settings.API_DOCS_DYNAMIC:
+        raise RuntimeError("Схема OpenAPI строится только при API_DOCS_DYNAMIC=True.")
+
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    info = openapi.Info(
+        title=SCHEMA_INFO['title'],
+        default_version=SCHEMA_INFO['default_version'],
+        description=SCHEMA_INFO['description'],
+        terms_of_service=SCHEMA_INFO['terms_of_service'],
+        contact=openapi.Contact(**SCHEMA_INFO['contact']),
+        license=openapi.License(**SCHEMA_INFO['license']),
+    )
+    schema = OpenAPISchemaGenerator(info).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+@lru_cache(maxsize=None)
+def load_schema() -> Optional[tuple[bytes, str]]:
+    """
+    Схема OpenAPI процесса и ее ETag (SHA-256 содержимого).
+
+    При API_DOCS_DYNAMIC=True схема строится из кода один раз в процессе, иначе
+    читается из файла API_SCHEMA_FILE (команда generate_api_schema). Возвращает
+    None, если файла нет.
+    """
+
+    if settings.API_DOCS_DYNAMIC:
+        content = generate_schema()
+    else:
+        try:
+            content = Path(settings.API_SCHEMA_FILE).read_bytes()
+        except FileNotFoundError:
+            logger.error("Файл схемы OpenAPI %s не найден: выполните python manage.py generate_api_schema",
+                         settings.API_SCHEMA_FILE)
+            return None
+    return content, hashlib.sha256(content).hexdigest()
+
+
+def assets_dir() -> Path:
+    """
+    Каталог статических файлов установленного пакета drf-yasg.
+
+    Пакет находится без импорта (importlib.util.find_spec), поэтому при
+    API_DOCS_DYNAMIC=False drf_yasg по-прежнему не загружается.
+
+    :raises Http404: Если пакет drf-yasg не установлен.
+    """
+
+    spec = importlib.util.find_spec('drf_yasg')
+    if spec is None or not spec.submodule_search_locations:
+        logger.error("Пакет drf-yasg не установлен: файлы интерфейса документации недоступны")
+        raise Http404
+    return Path(next(iter(spec.submodule_search_locations))) / 'static' / 'drf-yasg'
+
+
+@lru_cache(maxsize=None)
+def load_asset(name: str) -> tuple[bytes, str]:
+    """
+    Содержимое файла интерфейса документации и его ETag (SHA-256 содержимого).
+
+    :raises Http404: Если файл с таким именем не входит в DOCS_ASSETS или пакет drf-yasg не установлен.
+    """
+
+    if name not in DOCS_ASSETS:
+        raise Http404
+    content = (assets_dir() / DOCS_ASSETS[name][0]).read_bytes()
+    return content, hashlib.sha256(content).hexdigest()
+
+
+def _schema_etag(request: HttpRequest, *args, **kwargs) -> Optional[str]:
+    schema = load_schema()
+    return schema[1] if schema is not None else None
+
+
+@require_safe
+@etag(_schema_etag)
+def schema_view(request: HttpRequest) -> HttpResponse:
+    """
+    Схема OpenAPI в JSON (GET /swagger.json).
+
+    Ответ содержит ETag: запрос с If-None-Match получает 304 без тела.
+    """
+
+    schema = load_schema()
+    if schema is None:
+        raise Http404
+    response = HttpResponse(schema[0], content_type='application/json')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _asset_etag(request: HttpRequest, name: str) -> str:
+    return load_asset(name)[1]
+
+
+@require_safe
+@etag(_asset_etag)
+def asset_view(request: HttpRequest, name: str) -> HttpResponse:
+    """
+    Скрипт или стиль интерфейса документации (GET /api-docs/assets/<name>).
+
+    Args:
+        request (HttpRequest): Запрос.
+        name (str): Имя файла (ключ DOCS_ASSETS).
+    """
+
+    content, _ = load_asset(name)
+    response = HttpResponse(content, content_type=DOCS_ASSETS[name][1])
+    response['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
+
+
+@require_safe
+def docs_view(request: HttpRequest, ui: str) -> HttpResponse:
+    """
+    Страница Swagger UI (GET /swagger/) или ReDoc (GET /redoc/), загружающая схему из GET /swagger.json.
+
+    Запрос с ?format=openapi возвращает схему, как представления drf_yasg.
+
+    Args:
+        request (HttpRequest): Запрос.
+        ui (str): Интерфейс документации (ключ DOCS_TEMPLATES).
+    """
+
+    if request.GET.get('format') == 'openapi':
+        return schema_view(request)
+
+    return render(request, DOCS_TEMPLATES[ui], {
+        'title': SCHEMA_INFO['title'],
+        'spec_url': reverse('schema-json'),
+        **{name: f"{reverse('api-docs-asset', args=[name])}?v={load_asset(name)[1][:16]}" for name in DOCS_ASSETS},
+    })
+
+
+def _reset_schema(*, setting: str, **kwargs) -> None:
+    if setting in ('API_DOCS_DYNAMIC', 'API_SCHEMA_FILE'):
+        load_schema.cache_clear()
+
+
+setting_changed.connect(_reset_schema)
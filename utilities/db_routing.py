@@ -0,0 +1,277 @@
+import random
+import threading
+
+from functools import wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest
+from django.utils.decorators import sync_and_async_middleware
+
+
+# Разрешено ли текущему запросу читать с реплик (устанавливается декоратором replica_reads).
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Ключи закрепления текущего запроса: закрепление проверяется при каждом чтении.
+_pin_keys = ContextVar('replica_pin_keys', default=())
+
+_stats_lock = threading.Lock()
+_stats = {'connections_opened': {}, 'reads': {}}
+
+STICKY_KEY_PREFIX = 'db-primary-pin:'
+
+# Методы, после которых клиент не закрепляется за основной базой данных.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Кэши, содержимое которых не видно другим процессам.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class ReplicaRouter:
+    """
+    Маршрутизатор баз данных: чтение с реплик из DATABASE_REPLICAS, запись - в "default".
+
+    Реплики используются только внутри блока use_replicas() (представления,
+    помеченные декоратором replica_reads), остальные запросы, в том числе все
+    операции с балансом и чтения после них, выполняются на основной базе данных.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        """
+        Выбирает случайную реплику, если чтение с реплик разрешено, иначе основную базу.
+        """
+
+        alias = 'default'
+        if settings.DATABASE_REPLICAS and replicas_allowed():
+            alias = random.choice(settings.DATABASE_REPLICAS)
+
+        with _stats_lock:
+            _stats['reads'][alias] = _stats['reads'].get(alias, 0) + 1
+        return alias
+
+    def db_for_write(self, model, **hints) -> str:
+        """
+        Все записи выполняются на основной базе данных.
+        """
+
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        """
+        Реплики содержат те же данные, что и основная база: связи разрешены.
+        """
+
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str = None, **hints) -> bool:
+        """
+        Миграции применяются только к основной базе данных.
+        """
+
+        return db == 'default'
+
+
+@contextmanager
+def use_replicas(enabled: bool = True, pin_keys: Iterable[str] = ()) -> Iterator[None]:
+    """
+    Разрешает (или запрещает) чтение с реплик внутри блока.
+
+    Args:
+        enabled (bool): Разрешено ли чтение с реплик.
+        pin_keys (Iterable[str]): Ключи закрепления (client_key, wallet_key): пока хотя бы
+            один из них закреплен за основной базой данных, чтения выполняются на ней.
+    """
+
+    token = _replica_reads.set(enabled)
+    keys_token = _pin_keys.set(tuple(pin_keys))
+    try:
+        yield
+    finally:
+        _pin_keys.reset(keys_token)
+        _replica_reads.reset(token)
+
+
+def replicas_allowed() -> bool:
+    """
+    Разрешено ли чтение с реплик в текущем контексте.
+
+    Закрепление ключей блока use_replicas() проверяется в момент вызова, а не при
+    входе в блок: операция, зафиксированная во время запроса, закрепляет кошелек,
+    и следующие чтения того же запроса уже не попадают на отстающую реплику.
+    """
+
+    if not _replica_reads.get():
+        return False
+    keys = _pin_keys.get()
+    return not (keys and is_pinned(*keys))
+
+
+def client_key(request: HttpRequest) -> str:
+    """
+    Ключ клиента для закрепления за основной базой данных: пользователь либо IP-адрес.
+    """
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def pin_to_primary(keys: Iterable[str]) -> None:
+    """
+    Закрепляет клиентов или кошельки за основной базой данных на DATABASE_REPLICA_STICKY_SECONDS секунд.
+
+    Пока закрепление действует, их чтения не попадают на реплики, которые
+    могут еще не получить последние изменения.
+    """
+
+    if settings.DATABASE_REPLICAS:
+        caches[settings.DATABASE_REPLICA_STICKY_CACHE].set_many(
+            {STICKY_KEY_PREFIX + key: 1 for key in keys}, settings.DATABASE_REPLICA_STICKY_SECONDS
+        )
+
+
+async def apin_to_primary(keys: Iterable[str]) -> None:
+    """
+    Асинхронная версия pin_to_primary для асинхронных представлений.
+    """
+
+    if settings.DATABASE_REPLICAS:
+        await caches[settings.DATABASE_REPLICA_STICKY_CACHE].aset_many(
+            {STICKY_KEY_PREFIX + key: 1 for key in keys}, settings.DATABASE_REPLICA_STICKY_SECONDS
+        )
+
+
+def is_pinned(*keys: str) -> bool:
+    """
+    Проверяет, закреплен ли хотя бы один из ключей за основной базой данных.
+    """
+
+    if not settings.DATABASE_REPLICAS:
+        return False
+    return bool(caches[settings.DATABASE_REPLICA_STICKY_CACHE].get_many([STICKY_KEY_PREFIX + key for key in keys]))
+
+
+def check_sticky_cache(app_configs=None, **kwargs) -> list[Error]:
+    """
+    Проверка системы: при репликах кэш закреплений (DATABASE_REPLICA_STICKY_CACHE) должен быть
+    общим для всех процессов, иначе закрепление, установленное одним процессом, не действует в
+    остальных, и клиент читает с отстающей реплики баланс до своей операции.
+    """
+
+    if not settings.DATABASE_REPLICAS:
+        return []
+
+    alias = settings.DATABASE_REPLICA_STICKY_CACHE
+    config = settings.CACHES.get(alias)
+    if config is None:
+        return [Error(f"Кэш закреплений {alias!r} (DATABASE_REPLICA_STICKY_CACHE) не настроен в CACHES.",
+                      id='wallet.E001')]
+    if config['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f"Кэш закреплений {alias!r} (DATABASE_REPLICA_STICKY_CACHE) хранится в памяти процесса: "
+            f"закрепления за основной базой данных не видны другим процессам.",
+            hint="Укажите общий кэш (Redis, Memcached, DatabaseCache) в CACHE_BACKEND и CACHE_LOCATION.",
+            id='wallet.E002',
+        )]
+    return []
+
+
+def wallet_key(wallet_id) -> str:
+    """
+    Ключ кошелька для закрепления за основной базой данных.
+    """
+
+    return f'wallet:{wallet_id}'
+
+
+def replica_reads(view_method):
+    """
+    Декоратор метода представления: чтения запроса выполняются на репликах,
+    если ни клиент, ни запрошенный кошелек (wallet_id) не закреплены за
+    основной базой данных после недавней операции.
+
+    Закрепление проверяется перед каждым чтением (replicas_allowed), поэтому
+    закрепление, установленное после начала запроса, действует сразу.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        keys = [client_key(request)]
+        if kwargs.get('wallet_id') is not None:
+            keys.append(wallet_key(kwargs['wallet_id']))
+        with use_replicas(pin_keys=keys):
+            return view_method(self, request, *args, **kwargs)
+    return wrapper
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    """
+    Закрепляет клиента за основной базой данных после изменяющего запроса
+    (POST, PUT, PATCH, DELETE), чтобы его следующие чтения видели результат
+    операции, а не отстающее состояние реплики.
+    """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            response = await get_response(request)
+            if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 500:
+                await request.auser()
+                pin_to_primary([client_key(request)])
+            return response
+    else:
+        def middleware(request: HttpRequest):
+            response = get_response(request)
+            if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 500:
+                pin_to_primary([client_key(request)])
+            return response
+
+    return middleware
+
+
+def _count_connection(sender, connection, **kwargs) -> None:
+    """
+    Считает открытые соединения с каждой базой данных.
+    """
+
+    with _stats_lock:
+        opened = _stats['connections_opened']
+        opened[connection.alias] = opened.get(connection.alias, 0) + 1
+
+
+connection_created.connect(_count_connection)
+
+
+def connection_stats() -> dict:
+    """
+    Возвращает статистику соединений процесса: настройки и состояние соединения
+    каждой базы данных в текущем потоке, число открытых соединений и чтений.
+    """
+
+    with _stats_lock:
+        opened = dict(_stats['connections_opened'])
+        reads = dict(_stats['reads'])
+
+    databases = {}
+    for alias in connections:
+        connection = connections[alias]
+        databases[alias] = {
+            'host': connection.settings_dict['HOST'],
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'connected': connection.connection is not None,
+            'connections_opened': opened.get(alias, 0),
+            'reads_routed': reads.get(alias, 0),
+        }
+    return databases
@@ -1,20 +1,106 @@
+import json
+import queue
+import atexit
+import random
 import logging
 
+from logging.handlers import QueueHandler, QueueListener
 
-logger = logging.getLogger("custom_logger")
-logger.setLevel(logging.DEBUG)
+from django.conf import settings
 
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-ch.setFormatter(formatter)
+# Поля записи, которые JsonFormatter добавляет в вывод, если они переданы через extra.
+STRUCTURED_FIELDS = ('wallet_id', 'operation', 'amount', 'balance')
 
-logger.addHandler(ch)
 
-# Примеры использования логгера
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись журнала одной строкой JSON.
+
+    Кроме времени, уровня, имени логгера и сообщения выводит поля STRUCTURED_FIELDS,
+    переданные в extra (например, extra={'wallet_id': ..., 'operation': ...}).
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю rate записей уровня INFO, помеченных extra={'sampled': True}.
+
+    Такими записями помечаются массовые сообщения горячего пути (каждая операция
+    с кошельком). Остальные записи и записи других уровней не отбрасываются.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno != logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Помещает запись в очередь без форматирования в вызывающем потоке.
+
+    Стандартный QueueHandler форматирует сообщение перед помещением в очередь;
+    здесь форматирование (%-подстановка, JSON) и вывод выполняет поток
+    QueueListener. Аргументы сообщения должны быть неизменяемыми значениями
+    (UUID, Decimal, строки, числа).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _build_logger() -> tuple[logging.Logger, QueueListener]:
+    """
+    Создает логгер приложения: запись помещается в очередь, вывод в stderr выполняет фоновый поток.
+    """
+
+    config = settings.LOGGER
+
+    stream_handler = logging.StreamHandler()
+    if config['FORMAT'] == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler)
+
+    app_logger = logging.getLogger("custom_logger")
+    app_logger.setLevel(config['LEVEL'])
+    app_logger.propagate = False
+    app_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    app_logger.addFilter(SamplingFilter(config['INFO_SAMPLE_RATE']))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return app_logger, listener
+
+
+logger, listener = _build_logger()
+
+# Примеры использования логгера (форматирование выполняется в фоновом потоке)
 # logger.debug("Это отладочное сообщение")
-# logger.info("Это информационное сообщение")
+# logger.info("Кошелек %s пополнен на %s", wallet_id, amount, extra={'wallet_id': wallet_id, 'sampled': True})
 # logger.warning("Это предупреждающее сообщение")
 # logger.error("Это сообщение об ошибке")
 # logger.critical("Это критическое сообщение")
@@ -0,0 +1,336 @@
+import time
+import bisect
+import weakref
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+
+# Границы корзин гистограмм (секунды и количество запросов).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Имена эндпоинтов в метриках по имени маршрута (остальные маршруты - под своим именем).
+ENDPOINT_NAMES = {
+    'wallet-list': 'list',
+    'wallet-detail': 'retrieve',
+    'wallet-balance': 'info',
+    'wallet-balance-at': 'balance_at',
+    'wallet-operation': 'operation',
+    'wallet-transfer': 'transfer',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Счетчик SQL-запросов текущего HTTP-запроса (список из одного числа, общий для копий контекста).
+_query_count = ContextVar('query_count', default=None)
+
+_local = threading.local()
+_shards_lock = threading.Lock()
+# Значения потоков: (ссылка на поток, значения). Значения завершившихся потоков переносятся в _retired.
+_shards = []
+_retired = {}
+_metrics = []
+
+
+def _shard() -> dict:
+    """
+    Возвращает значения метрик текущего потока.
+
+    Каждый поток изменяет только свои значения, поэтому запись метрики не
+    требует блокировок; значения потоков суммируются при выводе метрик.
+    """
+
+    try:
+        return _local.values
+    except AttributeError:
+        values = _local.values = {}
+        with _shards_lock:
+            _collect_finished()
+            _shards.append((weakref.ref(threading.current_thread()), values))
+        return values
+
+
+def _merge(target: dict, values: dict) -> None:
+    """
+    Добавляет значения метрик values к target.
+    """
+
+    for key, counts in list(values.items()):
+        current = target.get(key)
+        if current is None:
+            target[key] = list(counts)
+        else:
+            for index, count in enumerate(counts):
+                current[index] += count
+
+
+def _collect_finished() -> None:
+    """
+    Переносит значения завершившихся потоков в _retired (вызывается под _shards_lock).
+    """
+
+    alive = []
+    for thread, values in _shards:
+        thread = thread()
+        if thread is None or not thread.is_alive():
+            _merge(_retired, values)
+        else:
+            alive.append((weakref.ref(thread), values))
+    _shards[:] = alive
+
+
+class Metric:
+    """
+    Метрика процесса с метками. Значения хранятся по потокам (см. _shard).
+    """
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _metrics.append(self)
+
+    def _values(self, labels: tuple, size: int) -> list:
+        shard = _shard()
+        values = shard.get((self.name, labels))
+        if values is None:
+            values = shard[(self.name, labels)] = [0] * size
+        return values
+
+    def _labels(self, labels: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self, values: dict) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Счетчик (только увеличивается).
+    """
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values(labels, 1)[0] += amount
+
+    def render(self, values: dict) -> list[str]:
+        return [f'{self.name}{self._labels(labels)} {_number(counts[0])}' for labels, counts in values.items()]
+
+
+class Histogram(Metric):
+    """
+    Гистограмма: количество наблюдений по корзинам, их сумма и количество.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels) -> None:
+        # Значения: количество по корзинам (последняя - +Inf) и сумма наблюдений.
+        values = self._values(labels, len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self, *labels) -> Iterator[None]:
+        """
+        Измеряет время выполнения блока.
+        """
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self, values: dict) -> list[str]:
+        lines = []
+        for labels, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bucket = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{self._labels(labels, bucket)} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(labels)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{self._labels(labels)} {cumulative}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUEST_LATENCY = Histogram(
+    'wallet_http_request_duration_seconds', "Время обработки HTTP-запроса.",
+    ('endpoint', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'wallet_http_request_db_queries', "Количество SQL-запросов за HTTP-запрос.",
+    ('endpoint',), buckets=QUERY_COUNT_BUCKETS,
+)
+LOCK_WAIT = Histogram(
+    'wallet_lock_wait_seconds', "Время ожидания блокировки строк кошельков.",
+    ('lock',), buckets=LOCK_WAIT_BUCKETS,
+)
+OPERATION_OUTCOMES = Counter(
+    'wallet_operation_outcomes_total', "Результаты операций с кошельками.",
+    ('operation', 'outcome'),
+)
+ADMISSION_REJECTIONS = Counter(
+    'wallet_admission_rejections_total', "Операции, отклоненные контролем допуска.",
+    ('reason',),
+)
+
+
+def collect() -> dict:
+    """
+    Суммирует значения метрик всех потоков процесса: {имя метрики: {метки: значения}}.
+    """
+
+    totals = {}
+    with _shards_lock:
+        _collect_finished()
+        _merge(totals, _retired)
+        for _, values in _shards:
+            _merge(totals, values)
+
+    collected = {metric.name: {} for metric in _metrics}
+    for (name, labels), values in totals.items():
+        collected[name][labels] = values
+    return collected
+
+
+def render_metrics() -> str:
+    """
+    Возвращает метрики процесса в текстовом формате Prometheus.
+    """
+
+    collected = collect()
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render(collected[metric.name]))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Метрики процесса в формате Prometheus (GET /metrics).
+    """
+
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+def _count_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL-запросов: увеличивает счетчик запросов текущего HTTP-запроса.
+    """
+
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs) -> None:
+    """
+    Подключает подсчет запросов к соединению с базой данных.
+    """
+
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter)
+
+
+def _endpoint(request: HttpRequest) -> str:
+    """
+    Имя эндпоинта запроса для меток метрик.
+    """
+
+    match = request.resolver_match
+    if match is None or not match.url_name:
+        return 'unmatched'
+    return ENDPOINT_NAMES.get(match.url_name, match.url_name)
+
+
+def _observe_request(request: HttpRequest, response: Optional[HttpResponse], started: float, queries: list) -> None:
+    """
+    Записывает время обработки и количество SQL-запросов HTTP-запроса.
+    """
+
+    endpoint = _endpoint(request)
+    status = response.status_code if response is not None else 500
+    REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint, request.method, status)
+    REQUEST_QUERIES.observe(queries[0], endpoint)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Измеряет время обработки и количество SQL-запросов каждого HTTP-запроса.
+
+    Запросы асинхронных представлений через пул psycopg (wallet.async_services)
+    не проходят через соединения Django и не учитываются в количестве запросов.
+    """
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            if not settings.METRICS_ENABLED:
+                return await get_response(request)
+            queries = [0]
+            token = _query_count.set(queries)
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await get_response(request)
+            finally:
+                _query_count.reset(token)
+                _observe_request(request, response, started, queries)
+            return response
+    else:
+        def middleware(request: HttpRequest):
+            if not settings.METRICS_ENABLED:
+                return get_response(request)
+            for connection in connections.all(initialized_only=True):
+                _install_query_counter(connection)
+            queries = [0]
+            token = _query_count.set(queries)
+            started = time.perf_counter()
+            response = None
+            try:
+                response = get_response(request)
+            finally:
+                _query_count.reset(token)
+                _observe_request(request, response, started, queries)
+            return response
+
+    return middleware
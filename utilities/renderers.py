@@ -0,0 +1,149 @@
+import re
+import json
+
+from decimal import Decimal
+from typing import Optional, Union
+
+from django.conf import settings
+from django.http import HttpRequest
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.json import strict_constant
+from rest_framework.utils.mediatypes import _MediaType
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - без orjson используются JSONRenderer и JSONParser DRF
+    orjson = None
+
+
+# Версия API (Accept: application/json; version=2), в которой денежные суммы передаются
+# строками без потери точности. В версии 1 (по умолчанию) суммы - числа JSON (float).
+EXACT_DECIMAL_VERSION = '2'
+
+# Целые числа длиннее 18 цифр orjson читает как float: такие тела разбирает json.
+LONG_NUMBER_RE = re.compile(rb'[0-9]{19,}')
+
+# Символы, которые JSONRenderer DRF экранирует для встраивания JSON в JavaScript. Их UTF-8
+# начинается с байта 0xE2: поиск одного байта быстрее поиска последовательностей.
+LINE_SEPARATOR_LEAD = b'\xe2'
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+_encoder = JSONEncoder()
+
+
+def decimal_value(value: Decimal, version: Optional[str]) -> Union[float, str]:
+    """
+    Денежная сумма для ответа API: строка с двумя знаками после точки в версии
+    EXACT_DECIMAL_VERSION, иначе float (как в ответах до появления версий).
+
+    Args:
+        value (Decimal): Сумма.
+        version (Optional[str]): Версия API запроса (request.version).
+    """
+
+    if version == EXACT_DECIMAL_VERSION:
+        return f'{value:.2f}'
+    return float(value)
+
+
+def accept_version(request: HttpRequest) -> Optional[str]:
+    """
+    Версия API из заголовка Accept для представлений без DRF (как AcceptHeaderVersioning).
+
+    Возвращает None, если версия не указана.
+    """
+
+    for media_type in request.headers.get('Accept', '').split(','):
+        version = _MediaType(media_type.strip()).params.get('version')
+        if version:
+            return version
+    return None
+
+
+class ExactDecimalJSONEncoder(JSONEncoder):
+    """
+    Кодировщик DRF, который записывает Decimal строкой без потери точности.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+def _exact_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson, совместимый с JSONRenderer DRF.
+
+    Типы, которые orjson не кодирует сам (Decimal, datetime, ленивые строки и т. п.),
+    преобразуются кодировщиком DRF, поэтому ответы совпадают с JSONRenderer, кроме
+    записи чисел с экспонентой (1e16 вместо 1e+16). Decimal в версии API
+    EXACT_DECIMAL_VERSION записывается строкой, в остальных версиях - float, как в DRF.
+    Ответы с отступами (?indent, browsable API) и данные, которые orjson не может
+    закодировать (например, целые длиннее 64 бит), формирует JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        request = renderer_context.get('request')
+        exact = getattr(request, 'version', None) == EXACT_DECIMAL_VERSION
+        if exact:
+            self.encoder_class = ExactDecimalJSONEncoder
+
+        if orjson is None or not self.compact or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_exact_default if exact else _default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if LINE_SEPARATOR_LEAD in ret:
+            for separator, escaped in LINE_SEPARATORS:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON-парсер на orjson, совместимый с JSONParser DRF.
+
+    Тела с целыми числами длиннее 18 цифр разбираются json, чтобы такие числа
+    не превращались в float. Числа с точкой, как и в JSONParser, становятся
+    float: суммы до 15 значащих цифр переводятся в Decimal без потерь, большие
+    суммы следует передавать строкой.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            body = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding).encode()
+            if LONG_NUMBER_RE.search(body):
+                return json.loads(body, parse_constant=strict_constant if self.strict else None)
+            return orjson.loads(body)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,434 @@
+import math
+import time
+import random
+import threading
+
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from rest_framework import status
+
+from wallet.models import WalletAdmissionBucket
+from utilities.metrics import ADMISSION_REJECTIONS
+
+
+# Причины отказа в допуске операции.
+GLOBAL_IN_FLIGHT = 'global_in_flight'
+WALLET_CONCURRENCY = 'wallet_concurrency'
+WALLET_RATE = 'wallet_rate'
+
+# Через сколько секунд клиенту следует повторить запрос, отклоненный из-за ограничения одновременных операций.
+CONCURRENCY_RETRY_AFTER = 1
+
+REJECTION_MESSAGES = {
+    GLOBAL_IN_FLIGHT: 'Сервис перегружен: слишком много одновременных операций. Повторите запрос.',
+    WALLET_CONCURRENCY: 'Слишком много одновременных операций с кошельком. Повторите запрос.',
+    WALLET_RATE: 'Превышена частота операций с кошельком. Повторите запрос.',
+}
+
+
+class AdmissionRejected(Exception):
+    """
+    Операция отклонена контролем допуска до обращения к кошельку.
+
+    Attributes:
+        reason (str): Причина отказа (GLOBAL_IN_FLIGHT, WALLET_CONCURRENCY или WALLET_RATE).
+        retry_after (int): Через сколько секунд следует повторить запрос (Retry-After).
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        """
+        503 - при перегрузке сервиса, 429 - при превышении ограничений кошелька.
+        """
+
+        if self.reason == GLOBAL_IN_FLIGHT:
+            return status.HTTP_503_SERVICE_UNAVAILABLE
+        return status.HTTP_429_TOO_MANY_REQUESTS
+
+    @property
+    def message(self) -> str:
+        return REJECTION_MESSAGES[self.reason]
+
+
+class BaseAdmissionController:
+    """
+    Контроль допуска операций с кошельками.
+
+    Операция допускается, если выполняется меньше max_in_flight операций,
+    у кошелька меньше wallet_concurrency одновременных операций и в корзине
+    токенов кошелька есть токен (корзина емкостью wallet_burst пополняется со
+    скоростью wallet_rate токенов в секунду). Иначе запрос отклоняется сразу,
+    не ожидая блокировки кошелька в базе данных, поэтому очередь на блокировку
+    и число занятых соединений ограничены. Места занимаются до токена: запрос,
+    отклоненный из-за ограничения одновременных операций, не расходует токен.
+
+    Ограничения действуют в пределах хранилища контроллера: в памяти процесса
+    (LocMemAdmissionController) или в базе данных для всех процессов
+    (DatabaseAdmissionController).
+
+    Args:
+        enabled (bool): Включен ли контроль допуска.
+        max_in_flight (int): Максимум одновременных операций (0 - без ограничения).
+        wallet_concurrency (int): Максимум одновременных операций одного кошелька (0 - без ограничения).
+        wallet_rate (float): Скорость пополнения корзины токенов кошелька в секунду (0 - без ограничения).
+        wallet_burst (int): Емкость корзины токенов кошелька.
+    """
+
+    # Проверка допуска не выполняет ввода-вывода и не ждет (можно вызывать в цикле событий).
+    local = False
+
+    def __init__(self, enabled: bool = True, max_in_flight: int = 64, wallet_concurrency: int = 8,
+                 wallet_rate: float = 100.0, wallet_burst: int = 200, **options):
+        if min(max_in_flight, wallet_concurrency, wallet_rate) < 0 or (wallet_rate and wallet_burst < 1):
+            raise ValueError("Ограничения контроля допуска не могут быть отрицательными, "
+                             "емкость корзины токенов должна быть положительной.")
+
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.wallet_concurrency = wallet_concurrency
+        self.wallet_rate = wallet_rate
+        self.wallet_burst = wallet_burst
+
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, wallet_id: str) -> Iterator[None]:
+        """
+        Допускает операцию с кошельком на время блока with.
+
+        :raises AdmissionRejected: Если операция не допущена.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        try:
+            global_slot, slot = self._enter(wallet_id)
+        except AdmissionRejected as e:
+            ADMISSION_REJECTIONS.inc(e.reason)
+            raise
+
+        try:
+            yield
+        finally:
+            if slot is not None:
+                self._release_slot(wallet_id, slot)
+            self._release_global_slot(global_slot)
+
+    def _enter(self, wallet_id: str) -> tuple:
+        """
+        Занимает общее место, место кошелька и токен (в этом порядке).
+        Возвращает (общее место, место кошелька или None).
+        """
+
+        global_slot = self._acquire_global_slot()
+        try:
+            slot = self._acquire_slot(wallet_id) if self.wallet_concurrency else None
+            try:
+                if self.wallet_rate:
+                    self._take_token(wallet_id)
+            except BaseException:
+                if slot is not None:
+                    self._release_slot(wallet_id, slot)
+                raise
+        except BaseException:
+            self._release_global_slot(global_slot)
+            raise
+        return global_slot, slot
+
+    def _acquire_global_slot(self):
+        """
+        Учитывает операцию в процессе и возвращает ее общее место.
+
+        :raises AdmissionRejected: Если в процессе уже выполняется max_in_flight операций.
+        """
+
+        with self._in_flight_lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                raise AdmissionRejected(GLOBAL_IN_FLIGHT, CONCURRENCY_RETRY_AFTER)
+            self._in_flight += 1
+
+    def _release_global_slot(self, global_slot) -> None:
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def _retry_after(self, tokens: float) -> int:
+        """
+        Через сколько секунд в корзине с tokens токенами появится целый токен.
+        """
+
+        return max(math.ceil((1 - tokens) / self.wallet_rate), 1)
+
+    def _take_token(self, wallet_id: str) -> None:
+        """
+        Забирает токен из корзины кошелька.
+
+        :raises AdmissionRejected: Если корзина пуста.
+        """
+
+        raise NotImplementedError
+
+    def _acquire_slot(self, wallet_id: str):
+        """
+        Занимает одно из wallet_concurrency мест кошелька и возвращает его.
+
+        :raises AdmissionRejected: Если все места заняты.
+        """
+
+        raise NotImplementedError
+
+    def _release_slot(self, wallet_id: str, slot) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """
+        Возвращает количество операций, выполняющихся в процессе.
+        """
+
+        return {'in_flight': self._in_flight, 'max_in_flight': self.max_in_flight}
+
+
+class LocMemAdmissionController(BaseAdmissionController):
+    """
+    Контроль допуска в памяти процесса: все ограничения действуют в каждом процессе отдельно.
+
+    Подходит для развертывания с одним процессом (в том числе ASGI); при
+    нескольких процессах ограничения умножаются на количество процессов,
+    поэтому следует использовать DatabaseAdmissionController (по умолчанию
+    при WEB_CONCURRENCY > 1).
+
+    Args:
+        max_buckets (int): Максимальное количество корзин токенов (вытесненная корзина считается полной).
+    """
+
+    local = True
+
+    def __init__(self, enabled: bool = True, max_in_flight: int = 64, wallet_concurrency: int = 8,
+                 wallet_rate: float = 100.0, wallet_burst: int = 200, max_buckets: int = 100000, **options):
+        super().__init__(enabled, max_in_flight, wallet_concurrency, wallet_rate, wallet_burst, **options)
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _take_token(self, wallet_id: str) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated = self._buckets.pop(wallet_id, (self.wallet_burst, now))
+            tokens = min(self.wallet_burst, tokens + (now - updated) * self.wallet_rate)
+            taken = tokens >= 1
+            self._buckets[wallet_id] = (tokens - taken, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+        if not taken:
+            raise AdmissionRejected(WALLET_RATE, self._retry_after(tokens))
+
+    def _acquire_slot(self, wallet_id: str) -> bool:
+        with self._lock:
+            count = self._slots.get(wallet_id, 0)
+            if count >= self.wallet_concurrency:
+                raise AdmissionRejected(WALLET_CONCURRENCY, CONCURRENCY_RETRY_AFTER)
+            self._slots[wallet_id] = count + 1
+        return True
+
+    def _release_slot(self, wallet_id: str, slot: bool) -> None:
+        with self._lock:
+            count = self._slots.pop(wallet_id) - 1
+            if count:
+                self._slots[wallet_id] = count
+
+
+class DatabaseAdmissionController(BaseAdmissionController):
+    """
+    Контроль допуска, общий для всех процессов, на PostgreSQL.
+
+    Корзины токенов хранятся в нежурналируемой таблице WalletAdmissionBucket
+    и изменяются одним запросом INSERT ... ON CONFLICT DO UPDATE, который
+    пополняет корзину за прошедшее время и забирает токен, только если он есть.
+    Места кошелька - сеансовые рекомендательные блокировки (advisory lock)
+    с ключом (hashtext(wallet_id), номер места): pg_try_advisory_lock не ждет,
+    а блокировки соединения, разорванного вместе с процессом, снимаются
+    сервером. Кошельки с совпадающим hashtext делят места. Общие места
+    (max_in_flight для всех процессов) - такие же блокировки с ключом
+    GLOBAL_SLOT_KEY + номер места: однокомпонентные ключи не пересекаются
+    с двухкомпонентными. Сеансовые блокировки несовместимы с пулером
+    соединений в режиме транзакций.
+
+    Каждая допущенная операция выполняет до трех коротких запросов в режиме
+    autocommit до транзакции операции и до двух - после нее.
+
+    Args:
+        purge_probability (float): Вероятность удаления пакета полных корзин при проверке допуска.
+        purge_batch_size (int): Размер пакета удаляемых корзин.
+    """
+
+    TABLE = WalletAdmissionBucket._meta.db_table
+
+    # Время берется clock_timestamp(): внутри внешней транзакции now() не меняется.
+    TAKE_TOKEN_SQL = f"""
+        INSERT INTO {TABLE} AS b (wallet_id, tokens, updated_at)
+        VALUES (%(wallet_id)s, %(burst)s - 1, clock_timestamp())
+        ON CONFLICT (wallet_id) DO UPDATE
+           SET tokens = LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at)
+                                                    * %(rate)s) - 1,
+               updated_at = clock_timestamp()
+         WHERE LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) >= 1
+        RETURNING tokens
+    """
+
+    # Первое свободное место, начиная со случайного: pg_try_advisory_lock вызывается до первого успеха.
+    ACQUIRE_SLOT_SQL = """
+        SELECT slot
+          FROM (SELECT (%(start)s + n) %% %(slots)s AS slot FROM generate_series(0, %(slots)s - 1) n) s
+         WHERE pg_try_advisory_lock(hashtext(%(wallet_id)s), slot)
+         LIMIT 1
+    """
+
+    RELEASE_SLOT_SQL = "SELECT pg_advisory_unlock(hashtext(%s), %s)"
+
+    # Ключ первого общего места (сеансовые блокировки GLOBAL_SLOT_KEY .. GLOBAL_SLOT_KEY + max_in_flight - 1).
+    GLOBAL_SLOT_KEY = 0x57414C4C45540000
+
+    ACQUIRE_GLOBAL_SLOT_SQL = """
+        SELECT slot
+          FROM (SELECT (%(start)s + n) %% %(slots)s AS slot FROM generate_series(0, %(slots)s - 1) n) s
+         WHERE pg_try_advisory_lock(%(key)s + slot)
+         LIMIT 1
+    """
+
+    RELEASE_GLOBAL_SLOT_SQL = "SELECT pg_advisory_unlock(%s + %s)"
+
+    # Корзины, которые уже пополнились бы до полной: их удаление не меняет ограничения.
+    PURGE_SQL = f"""
+        DELETE FROM {TABLE}
+         WHERE wallet_id IN (SELECT wallet_id FROM {TABLE}
+                              WHERE updated_at < clock_timestamp() - make_interval(secs => %s)
+                              LIMIT %s FOR UPDATE SKIP LOCKED)
+    """
+
+    def __init__(self, enabled: bool = True, max_in_flight: int = 64, wallet_concurrency: int = 8,
+                 wallet_rate: float = 100.0, wallet_burst: int = 200,
+                 purge_probability: float = 0.001, purge_batch_size: int = 1000, **options):
+        super().__init__(enabled, max_in_flight, wallet_concurrency, wallet_rate, wallet_burst, **options)
+        self.purge_probability = purge_probability
+        self.purge_batch_size = purge_batch_size
+
+    def _take_token(self, wallet_id: str) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(self.TAKE_TOKEN_SQL,
+                           {'wallet_id': wallet_id, 'burst': self.wallet_burst, 'rate': self.wallet_rate})
+            taken = cursor.fetchone() is not None
+
+        if random.random() < self.purge_probability:
+            self.purge()
+        if not taken:
+            raise AdmissionRejected(WALLET_RATE, self._retry_after(0))
+
+    def _acquire_slot(self, wallet_id: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(self.ACQUIRE_SLOT_SQL, {'wallet_id': wallet_id, 'slots': self.wallet_concurrency,
+                                                   'start': random.randrange(self.wallet_concurrency)})
+            row = cursor.fetchone()
+
+        if row is None:
+            raise AdmissionRejected(WALLET_CONCURRENCY, CONCURRENCY_RETRY_AFTER)
+        return row[0]
+
+    def _release_slot(self, wallet_id: str, slot: int) -> None:
+        # Соединение могло быть закрыто ошибкой операции: его блокировки сняты сервером.
+        if connection.connection is None:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(self.RELEASE_SLOT_SQL, [wallet_id, slot])
+
+    def _acquire_global_slot(self) -> Optional[int]:
+        """
+        Занимает одно из max_in_flight общих мест всех процессов и возвращает его.
+
+        Сначала проверяется ограничение процесса: процесс, в котором уже выполняется
+        max_in_flight операций, отклоняет запрос без обращения к базе данных.
+
+        :raises AdmissionRejected: Если все места заняты.
+        """
+
+        super()._acquire_global_slot()
+        if not self.max_in_flight:
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.ACQUIRE_GLOBAL_SLOT_SQL, {'key': self.GLOBAL_SLOT_KEY,
+                                                              'slots': self.max_in_flight,
+                                                              'start': random.randrange(self.max_in_flight)})
+                row = cursor.fetchone()
+        except BaseException:
+            super()._release_global_slot(None)
+            raise
+
+        if row is None:
+            super()._release_global_slot(None)
+            raise AdmissionRejected(GLOBAL_IN_FLIGHT, CONCURRENCY_RETRY_AFTER)
+        return row[0]
+
+    def _release_global_slot(self, global_slot: Optional[int]) -> None:
+        super()._release_global_slot(global_slot)
+        if global_slot is None or connection.connection is None:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(self.RELEASE_GLOBAL_SLOT_SQL, [self.GLOBAL_SLOT_KEY, global_slot])
+
+    def purge(self) -> int:
+        """
+        Удаляет пакет полных корзин и возвращает количество удаленных.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(self.PURGE_SQL, [self.wallet_burst / self.wallet_rate, self.purge_batch_size])
+            return cursor.rowcount
+
+
+@lru_cache(maxsize=None)
+def get_admission_controller() -> BaseAdmissionController:
+    """
+    Возвращает контроль допуска операций согласно настройке WALLET_ADMISSION.
+    """
+
+    config = settings.WALLET_ADMISSION
+    controller_class = import_string(config['BACKEND'])
+    return controller_class(
+        enabled=config['ENABLED'],
+        max_in_flight=config['MAX_IN_FLIGHT'],
+        wallet_concurrency=config['WALLET_CONCURRENCY'],
+        wallet_rate=config['WALLET_RATE'],
+        wallet_burst=config['WALLET_BURST'],
+        **config.get('OPTIONS', {})
+    )
+
+
+def _reset_controller(setting: str, **kwargs) -> None:
+    """
+    Сбрасывает контроль допуска при изменении настройки (override_settings в тестах).
+    """
+
+    if setting == 'WALLET_ADMISSION':
+        get_admission_controller.cache_clear()
+
+
+setting_changed.connect(_reset_controller)
@@ -0,0 +1,131 @@
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.http import HttpRequest, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.settings import api_settings
+
+from wallet.admission import AdmissionRejected, get_admission_controller
+from wallet.cache import get_balance_cache
+from wallet.transactions import TransactionContention
+from wallet.async_services import aload_wallet, aperform_operation
+from wallet.api.fast_serializers import validate_operation, wallet_representation
+from wallet.api.views import WalletViewSet, contention_response
+from utilities.renderers import accept_version, decimal_value
+
+
+# Синхронные представления для запросов, которые асинхронный путь не обрабатывает.
+sync_retrieve = sync_to_async(WalletViewSet.as_view({'get': 'retrieve'}))
+sync_info = sync_to_async(WalletViewSet.as_view({'get': 'info'}))
+sync_operation = sync_to_async(WalletViewSet.as_view({'post': 'operation'}))
+
+
+def json_response(data: dict, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    """
+    Возвращает JSON-ответ, совпадающий по содержимому с ответом DRF (первый рендерер DEFAULT_RENDERER_CLASSES).
+    """
+
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(renderer.render(data), status=status_code, content_type='application/json')
+
+
+def supported_version(request: HttpRequest) -> bool:
+    """
+    Указана ли в заголовке Accept допустимая версия API (или не указана никакая).
+
+    Запросы с недопустимой версией передаются синхронным представлениям, которые отвечают 406.
+    """
+
+    version = accept_version(request)
+    return version is None or version in api_settings.ALLOWED_VERSIONS
+
+
+def not_found(wallet_id) -> HttpResponse:
+    """
+    Ответ 404 для несуществующего кошелька.
+    """
+
+    return json_response({'error': f'Кошелек с UUID {wallet_id} не найден.'}, status.HTTP_404_NOT_FOUND)
+
+
+@require_GET
+async def wallet_retrieve(request: HttpRequest, wallet_id) -> HttpResponse:
+    """
+    Асинхронное получение баланса кошелька (GET api/v1/wallets/<WALLET_UUID>/).
+    """
+
+    if not supported_version(request):
+        return await sync_retrieve(request, wallet_id=wallet_id)
+
+    data = await get_balance_cache().aget_or_load(str(wallet_id), lambda: aload_wallet(wallet_id))
+    if data is None:
+        return not_found(wallet_id)
+    return json_response({'balance': decimal_value(data['balance'], accept_version(request))})
+
+
+@require_GET
+async def wallet_info(request: HttpRequest, wallet_id) -> HttpResponse:
+    """
+    Асинхронное получение информации о кошельке (GET api/v1/wallets/<WALLET_UUID>/info/).
+    """
+
+    if not supported_version(request):
+        return await sync_info(request, wallet_id=wallet_id)
+
+    data = await get_balance_cache().aget_or_load(str(wallet_id), lambda: aload_wallet(wallet_id))
+    if data is None:
+        return not_found(wallet_id)
+    return json_response(wallet_representation(wallet_id, data['user'], data['balance']))
+
+
+@csrf_exempt
+@require_POST
+async def wallet_operation(request: HttpRequest, wallet_id) -> HttpResponse:
+    """
+    Асинхронное выполнение операции с кошельком (POST api/v1/wallets/<WALLET_UUID>/operation/).
+
+    Асинхронно выполняются только корректные JSON-запросы без Idempotency-Key
+    к кошелькам без полос. Остальные запросы (ошибки валидации, формы, ключи
+    идемпотентности, кошельки с полосами, нехватка средств, несуществующий
+    кошелек) передаются синхронному WalletViewSet.operation, поэтому ответы
+    и ошибки не отличаются от синхронного API. Контроль допуска, который
+    обращается к базе данных (не local), также выполняется синхронным путем;
+    запрос, допущенный здесь, передается синхронному пути без повторной проверки.
+    """
+
+    controller = get_admission_controller()
+
+    validated = None
+    if (request.content_type == 'application/json' and 'Idempotency-Key' not in request.headers
+            and supported_version(request)):
+        try:
+            validated = validate_operation(json.loads(request.body))
+        except ValueError:
+            pass
+
+    if validated is not None and controller.local:
+        try:
+            with controller.admit(str(wallet_id)):
+                wallet = await aperform_operation(wallet_id, *validated)
+                if wallet is None:
+                    # Запрос уже допущен: синхронное представление не проверяет его повторно.
+                    request.wallet_admitted = True
+                    return await sync_operation(request, wallet_id=wallet_id)
+        except AdmissionRejected as e:
+            response = json_response({'error': e.message}, e.status_code)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        except TransactionContention:
+            contention = contention_response()
+            response = json_response(contention.data, contention.status_code)
+            response['Retry-After'] = contention['Retry-After']
+            return response
+        return json_response({
+            'message': 'Операция выполнена успешно.',
+            'new_balance': decimal_value(wallet.balance, accept_version(request))
+        })
+
+    return await sync_operation(request, wallet_id=wallet_id)
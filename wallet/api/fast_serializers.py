@@ -0,0 +1,71 @@
+import re
+
+from decimal import Decimal
+from typing import Optional
+
+from wallet.api.serializers import AMOUNT_FIELD, WalletOperationSerializer
+
+
+# Сумма, которую WalletOperationSerializer гарантированно принимает без изменений:
+# до max_digits - decimal_places цифр целой части и до decimal_places знаков после точки.
+AMOUNT_RE = re.compile(rf'[0-9]{{1,{AMOUNT_FIELD.max_digits - AMOUNT_FIELD.decimal_places}}}'
+                       rf'(?:\.[0-9]{{1,{AMOUNT_FIELD.decimal_places}}})?')
+
+# Типы операций, которые принимает WalletOperationSerializer (записи журнала TRANSFER_* и CAPTURE
+# создаются только переводами и списанием блокировок).
+OPERATION_TYPES = frozenset(WalletOperationSerializer._declared_fields['operation_type'].choices)
+
+CENT = Decimal('0.01')
+
+
+def validate_operation(data) -> Optional[tuple[str, Decimal]]:
+    """
+    Быстрая проверка данных операции без полей DRF.
+
+    Принимает только заведомо корректные данные JSON-запроса и возвращает
+    (operation_type, amount) так же, как validated_data сериализатора
+    WalletOperationSerializer. Во всех остальных случаях (ошибки, формы,
+    нестандартная запись суммы) возвращает None: такие данные проверяет
+    WalletOperationSerializer, поэтому тексты ошибок не меняются.
+
+    Args:
+        data: Данные запроса (request.data).
+    """
+
+    if type(data) is not dict:
+        return None
+
+    operation_type = data.get('operation_type')
+    amount = data.get('amount')
+
+    if type(operation_type) is not str or operation_type not in OPERATION_TYPES:
+        return None
+
+    if type(amount) in (int, float):
+        amount = str(amount)
+    elif type(amount) is str:
+        amount = amount.strip()
+    else:
+        return None
+
+    if not AMOUNT_RE.fullmatch(amount):
+        return None
+
+    amount = Decimal(amount).quantize(CENT)
+    if amount < CENT:
+        return None
+    return operation_type, amount
+
+
+def wallet_representation(wallet_id, user_id: int, balance: Decimal) -> dict:
+    """
+    Представление кошелька, совпадающее с WalletSerializer, из значений .values()
+    без создания экземпляра модели.
+
+    Args:
+        wallet_id: UUID кошелька.
+        user_id (int): Идентификатор владельца.
+        balance (Decimal): Общий баланс кошелька (с учетом полос).
+    """
+
+    return {'wallet_id': str(wallet_id), 'user': user_id, 'balance': f'{balance:.2f}'}
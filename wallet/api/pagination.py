@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class WalletCursorPagination(CursorPagination):
+    """
+    Постраничный вывод кошельков по курсору (keyset) на wallet_id.
+
+    Следующая страница выбирается условием wallet_id > <последний UUID страницы>
+    по первичному ключу, а не смещением, поэтому кошельки, созданные во время
+    обхода, не приводят к пропускам и повторам, а запрос любой страницы
+    стоит одинаково.
+    """
+
+    ordering = 'wallet_id'
+    page_size = settings.WALLET_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.WALLET_LIST_MAX_PAGE_SIZE
@@ -1,14 +1,26 @@
 from decimal import Decimal
 from typing import Optional
-from wallet.models import Wallet
+from django.conf import settings
+from wallet.models import Wallet, WalletHold, WalletTransaction
 from rest_framework import serializers
 
 
+# Разрядность денежных сумм API: суммы хранятся в MinorUnitsField (BIGINT минорных единиц).
+AMOUNT_FIELD = WalletTransaction._meta.get_field('amount')
+
+
 class WalletSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели кошелька.
+
+    Баланс выводится с учетом полос баланса (WalletStripe).
     """
 
+    balance = serializers.DecimalField(source='get_total_balance',
+                                       max_digits=None,
+                                       decimal_places=2,
+                                       read_only=True)
+
     class Meta:
         """
         Метаданные сериализатора.
@@ -18,13 +30,32 @@ class WalletSerializer(serializers.ModelSerializer):
         fields = ['wallet_id', 'user', 'balance']
 
 
+class WalletTransactionSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для записи журнала операций кошелька.
+    """
+
+    amount = serializers.DecimalField(max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places,
+                                      read_only=True)
+
+    class Meta:
+        """
+        Метаданные сериализатора.
+        """
+
+        model = WalletTransaction
+        fields = ['id', 'operation_type', 'amount', 'created_at']
+
+
 class WalletOperationSerializer(serializers.Serializer):
     """
     Сериализатор для валидации данных операции (operationType и amount).
     """
 
     operation_type = serializers.ChoiceField(choices=['DEPOSIT', 'WITHDRAW'])
-    amount = serializers.DecimalField(min_value=Decimal('0.01'), max_digits=10, decimal_places=2)
+    amount = serializers.DecimalField(min_value=Decimal('0.01'), max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places)
 
     def validate_amount(self, value: float) -> Optional[float]:
         """
@@ -34,3 +65,101 @@ class WalletOperationSerializer(serializers.Serializer):
         if value < 0:
             raise serializers.ValidationError("Сумма должна быть положительной.")
         return value
+
+
+class WalletTransferSerializer(serializers.Serializer):
+    """
+    Сериализатор для валидации данных перевода (кошелек получателя и сумма).
+    """
+
+    destination_wallet_id = serializers.UUIDField()
+    amount = serializers.DecimalField(min_value=Decimal('0.01'), max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places)
+
+
+class WalletHoldCreateSerializer(serializers.Serializer):
+    """
+    Сериализатор для валидации данных блокировки средств (сумма и срок блокировки).
+    """
+
+    amount = serializers.DecimalField(min_value=Decimal('0.01'), max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places)
+    ttl = serializers.IntegerField(min_value=1, max_value=settings.WALLET_HOLDS['MAX_TTL'], required=False,
+                                   help_text="Срок блокировки в секундах (по умолчанию WALLET_HOLD_TTL)")
+
+
+class WalletHoldCaptureSerializer(serializers.Serializer):
+    """
+    Сериализатор для валидации данных списания блокировки.
+    """
+
+    amount = serializers.DecimalField(min_value=Decimal('0.01'), max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places, required=False,
+                                      help_text="Списываемая сумма (по умолчанию вся заблокированная сумма)")
+
+
+class WalletHoldSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор блокировки средств с доступным балансом кошелька после операции.
+    """
+
+    wallet_id = serializers.UUIDField(read_only=True)
+    amount = serializers.DecimalField(max_digits=AMOUNT_FIELD.max_digits,
+                                      decimal_places=AMOUNT_FIELD.decimal_places,
+                                      read_only=True)
+    captured_amount = serializers.DecimalField(max_digits=AMOUNT_FIELD.max_digits,
+                                               decimal_places=AMOUNT_FIELD.decimal_places,
+                                               read_only=True)
+    available_balance = serializers.DecimalField(source='wallet.get_available_balance',
+                                                 max_digits=None,
+                                                 decimal_places=AMOUNT_FIELD.decimal_places,
+                                                 read_only=True)
+
+    class Meta:
+        """
+        Метаданные сериализатора.
+        """
+
+        model = WalletHold
+        fields = ['hold_id', 'wallet_id', 'status', 'amount', 'captured_amount', 'created_at', 'expires_at',
+                  'settled_at', 'available_balance']
+
+
+class WalletBalanceAtQuerySerializer(serializers.Serializer):
+    """
+    Сериализатор для валидации параметров запроса баланса на момент времени.
+    """
+
+    at = serializers.DateTimeField(help_text="Момент времени в формате ISO 8601 (дата или дата и время)")
+
+
+class WalletBalanceAtSerializer(serializers.Serializer):
+    """
+    Сериализатор баланса кошелька на момент времени.
+    """
+
+    wallet_id = serializers.UUIDField()
+    at = serializers.DateTimeField()
+    balance = serializers.DecimalField(max_digits=AMOUNT_FIELD.max_digits, decimal_places=AMOUNT_FIELD.decimal_places)
+    checkpoint_at = serializers.DateTimeField(allow_null=True,
+                                              help_text="Момент контрольной точки, от которой вычислен баланс")
+    replayed_entries = serializers.IntegerField(help_text="Количество проигранных записей журнала операций")
+
+
+class WalletBatchItemSerializer(WalletOperationSerializer):
+    """
+    Сериализатор для валидации одной операции пакета (wallet_id, operationType и amount).
+    """
+
+    wallet_id = serializers.UUIDField()
+
+
+class WalletBatchOperationSerializer(serializers.Serializer):
+    """
+    Сериализатор для валидации пакета операций.
+    """
+
+    atomic = serializers.BooleanField(default=True)
+    operations = WalletBatchItemSerializer(many=True,
+                                           allow_empty=False,
+                                           max_length=settings.WALLET_BATCH_MAX_SIZE)
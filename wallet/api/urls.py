@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.urls import path
+from rest_framework.permissions import IsAdminUser
 
 from wallet.apps import WalletConfig
 from wallet.api.views import WalletViewSet
@@ -6,13 +8,42 @@ from wallet.api.views import WalletViewSet
 
 app_name = WalletConfig.name
 
+# Под ASGI (WALLET_ASYNC_VIEWS=True) баланс, информация о кошельке и операции
+# обслуживаются асинхронными представлениями, под WSGI - WalletViewSet.
+if settings.WALLET_ASYNC_VIEWS:
+    from wallet.api.async_views import wallet_info as info_view
+    from wallet.api.async_views import wallet_operation as operation_view
+    from wallet.api.async_views import wallet_retrieve as retrieve_view
+else:
+    retrieve_view = WalletViewSet.as_view({'get': 'retrieve'})
+    info_view = WalletViewSet.as_view({'get': 'info'})
+    operation_view = WalletViewSet.as_view({'post': 'operation'})
+
 urlpatterns = [
     # GET api/v1/wallets
     path('', WalletViewSet.as_view({'get': 'list'}), name='wallet-list'),
+    # POST api/v1/wallets/operations/batch
+    path('operations/batch/', WalletViewSet.as_view({'post': 'batch'}), name='wallet-batch-operation'),
+    # GET api/v1/wallets/stats
+    path('stats/', WalletViewSet.as_view({'get': 'stats'}, permission_classes=[IsAdminUser]), name='wallet-stats'),
+    # GET api/v1/wallets/export
+    path('export/', WalletViewSet.as_view({'get': 'export'}, permission_classes=[IsAdminUser]), name='wallet-export'),
+    # POST api/v1/wallets/holds/<HOLD_UUID>/capture
+    path('holds/<uuid:hold_id>/capture/', WalletViewSet.as_view({'post': 'capture'}), name='wallet-hold-capture'),
+    # POST api/v1/wallets/holds/<HOLD_UUID>/release
+    path('holds/<uuid:hold_id>/release/', WalletViewSet.as_view({'post': 'release'}), name='wallet-hold-release'),
     # GET api/v1/wallets/<WALLET_UUID>
-    path('<uuid:wallet_id>/', WalletViewSet.as_view({'get': 'retrieve'}), name='wallet-detail'),
+    path('<uuid:wallet_id>/', retrieve_view, name='wallet-detail'),
     # GET api/v1/wallets/<WALLET_UUID>/info
-    path('<uuid:wallet_id>/info/', WalletViewSet.as_view({'get': 'info'}), name='wallet-balance'),
+    path('<uuid:wallet_id>/info/', info_view, name='wallet-balance'),
+    # GET api/v1/wallets/<WALLET_UUID>/balance?at=<TIMESTAMP>
+    path('<uuid:wallet_id>/balance/', WalletViewSet.as_view({'get': 'balance'}), name='wallet-balance-at'),
+    # GET api/v1/wallets/<WALLET_UUID>/transactions
+    path('<uuid:wallet_id>/transactions/', WalletViewSet.as_view({'get': 'transactions'}), name='wallet-transactions'),
     # POST api/v1/wallets/<WALLET_UUID>/operation
-    path('<uuid:wallet_id>/operation/', WalletViewSet.as_view({'post': 'operation'}), name='wallet-operation'),
+    path('<uuid:wallet_id>/operation/', operation_view, name='wallet-operation'),
+    # POST api/v1/wallets/<WALLET_UUID>/transfer
+    path('<uuid:wallet_id>/transfer/', WalletViewSet.as_view({'post': 'transfer'}), name='wallet-transfer'),
+    # POST api/v1/wallets/<WALLET_UUID>/holds
+    path('<uuid:wallet_id>/holds/', WalletViewSet.as_view({'post': 'hold'}), name='wallet-hold'),
 ]
@@ -1,20 +1,132 @@
-from typing import Optional
+import json
 
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from typing import AsyncIterator, Iterator, Optional
+
+from asgiref.sync import sync_to_async
 
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 
-from django.http import Http404
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import Http404, StreamingHttpResponse
+from utilities.api_docs import openapi, swagger_auto_schema
+from utilities.db_routing import client_key, connection_stats, replica_reads, use_replicas
 from utilities.logger_utils import logger
+from utilities.renderers import decimal_value
+
+from wallet.admission import AdmissionRejected, get_admission_controller
+from wallet.async_services import async_pool_stats
+from wallet.cache import get_balance_cache
+from wallet.checkpoints import balance_at
+from wallet.export import EXPORT_COPY_SQL, WalletExport
+from wallet.models import Wallet, WalletTransaction
+from wallet.idempotency import IdempotencyConflict, IdempotencyInProgress, get_idempotency_store, make_fingerprint
+from wallet.services import (capture_hold, hold_funds, perform_batch_operations, perform_operation, release_hold,
+                             transfer)
+from wallet.transactions import TransactionContention, retry_stats, retrying_atomic
+from wallet.api.pagination import WalletCursorPagination
+from wallet.api.fast_serializers import validate_operation, wallet_representation
+from wallet.api.serializers import (WalletBalanceAtQuerySerializer, WalletBalanceAtSerializer,
+                                    WalletBatchOperationSerializer, WalletHoldCaptureSerializer,
+                                    WalletHoldCreateSerializer, WalletHoldSerializer, WalletOperationSerializer,
+                                    WalletSerializer, WalletTransactionSerializer, WalletTransferSerializer)
+
+
+# Форматы потокового списка кошельков (?stream=) и их Content-Type.
+LIST_STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Максимальное количество записей, возвращаемых эндпоинтом transactions.
+TRANSACTIONS_MAX_LIMIT = 500
+
+# Через сколько секунд клиенту следует повторить запрос, не выполненный из-за конкуренции (Retry-After).
+CONTENTION_RETRY_AFTER = 1
+
+# Максимальная длина заголовка Idempotency-Key.
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def contention_response() -> Response:
+    """
+    Ответ 503 на операцию, не выполненную из-за конкуренции после всех повторов в сервисе.
+    """
+
+    return Response(
+        {'error': 'Операция не выполнена из-за одновременных операций с кошельком. Повторите запрос.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(CONTENTION_RETRY_AFTER)}
+    )
+
+
+async def async_chunks(chunks: Iterator) -> AsyncIterator:
+    """
+    Асинхронный итератор по синхронному итератору блоков ответа.
 
-from wallet.models import Wallet
-from wallet.services import perform_operation
-from wallet.api.serializers import WalletOperationSerializer, WalletSerializer
+    Каждый блок читается в потоке запроса (sync_to_async с thread_sensitive=True),
+    поэтому итератор, читающий базу данных, выполняется в одном потоке с одним
+    соединением и транзакцией, а блоки отправляются клиенту по мере чтения.
+    """
+
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    end = object()
+    try:
+        while (chunk := await next_chunk(chunks, end)) is not end:
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def streaming_response(request: Request, chunks: Iterator, **kwargs) -> StreamingHttpResponse:
+    """
+    Потоковый ответ из синхронного итератора блоков.
+
+    Под ASGI StreamingHttpResponse целиком считывает синхронный итератор
+    перед отправкой (sync_to_async(list)), поэтому ответ ASGI-запроса
+    получает асинхронный итератор async_chunks().
+    """
+
+    if isinstance(request._request, ASGIRequest):
+        chunks = async_chunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+def idempotency_key(request: Request, key: str) -> str:
+    """
+    Ключ идемпотентности в хранилище: заголовок Idempotency-Key с префиксом клиента
+    (пользователь либо IP-адрес), чтобы одинаковые ключи разных клиентов не совпадали.
+    """
+
+    return f'{client_key(request)}:{key}'
+
+
+def replayed_response(replay: tuple) -> Response:
+    """
+    Сохраненный ответ (статус, данные) на повтор запроса с ключом идемпотентности.
+    """
+
+    status_code, data = replay
+    return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def admission_response(rejected: AdmissionRejected) -> Response:
+    """
+    Ответ 429 или 503 на операцию, отклоненную контролем допуска (заголовок Retry-After).
+    """
+
+    return Response(
+        {'error': rejected.message},
+        status=rejected.status_code,
+        headers={'Retry-After': str(rejected.retry_after)}
+    )
 
 
 class WalletViewSet(viewsets.ModelViewSet):
@@ -26,29 +138,91 @@ class WalletViewSet(viewsets.ModelViewSet):
     * Получение информации о конкретном кошельке
     * Просмотр баланса
     * Пополнение и снятие средств
+    * Блокировка средств с последующим списанием или снятием блокировки
     """
 
-    queryset = Wallet.objects.all()
+    queryset = Wallet.objects.with_total_balance()
     serializer_class = WalletSerializer
+    pagination_class = WalletCursorPagination
     lookup_field = 'wallet_id'
 
     @swagger_auto_schema(
         operation_description="Получение списка всех кошельков с их балансами и информацией о владельцах",
         responses={
             200: WalletSerializer(many=True),
+            400: "Неверный формат потока",
             403: "Отказано в доступе. Требуются права администратора."
         },
+        manual_parameters=[
+            openapi.Parameter(
+                'stream', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(LIST_STREAM_CONTENT_TYPES),
+                description="Вернуть все кошельки потоком (json - массив, ndjson - кошелек в строке) без разбиения на страницы"
+            ),
+        ],
         tags=['wallets']
     )
+    @replica_reads
     def list(self, request: Request) -> Optional[Response]:
         """
-        Возвращает список всех кошельков.
+        Возвращает список кошельков.
+
+        По умолчанию список разбит на страницы по курсору (next/previous).
+        С параметром stream=json или stream=ndjson возвращаются все кошельки
+        потоком, без загрузки списка в память.
         """
 
-        wallets = self.get_queryset()
-        serializer = self.get_serializer(wallets, many=True)
+        stream_format = request.query_params.get('stream')
+        if stream_format is not None:
+            if stream_format not in LIST_STREAM_CONTENT_TYPES:
+                return Response(
+                    {'error': f'Неверный формат потока: {stream_format}. Допустимые значения: json, ndjson.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self._stream_list(stream_format)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+
+        return self.get_paginated_response(serializer.data)
+
+    def _stream_list(self, stream_format: str) -> StreamingHttpResponse:
+        """
+        Отдает все кошельки потоком JSON-массива или NDJSON (один кошелек в строке).
+
+        Строки читаются серверным курсором пакетами по WALLET_LIST_STREAM_CHUNK_SIZE
+        и записываются в ответ по мере чтения, поэтому расход памяти не зависит
+        от количества кошельков.
+        """
+
+        chunk_size = settings.WALLET_LIST_STREAM_CHUNK_SIZE
+        queryset = self.get_queryset()
+        # Поток читается после выхода из представления: база данных (реплика) выбирается сейчас.
+        rows = (
+            queryset.using(queryset.db)
+            .order_by('wallet_id')
+            .values_list('wallet_id', 'user', 'total_balance')
+            .iterator(chunk_size=chunk_size)
+        )
+        separator = ',' if stream_format == 'json' else '\n'
+
+        def content() -> Iterator[str]:
+            if stream_format == 'json':
+                yield '['
+
+            chunk = []
+            first = True
+            for wallet_id, user_id, balance in rows:
+                chunk.append(json.dumps(wallet_representation(wallet_id, user_id, balance)))
+                if len(chunk) == chunk_size:
+                    yield ('' if first else separator) + separator.join(chunk)
+                    first = False
+                    chunk = []
+            if chunk:
+                yield ('' if first else separator) + separator.join(chunk)
+
+            yield ']' if stream_format == 'json' else '\n'
+
+        return streaming_response(self.request, content(), content_type=LIST_STREAM_CONTENT_TYPES[stream_format])
 
     @swagger_auto_schema(
         operation_description="Получение баланса конкретного кошелька по его UUID",
@@ -70,16 +244,18 @@ class WalletViewSet(viewsets.ModelViewSet):
         },
         tags=['wallets']
     )
+    @replica_reads
     def retrieve(self, request: Request, wallet_id: str = None) -> Optional[Response]:
         """
         Получение баланса конкретного кошелька.
 
-        Возвращает текущий баланс кошелька в минимальных денежных единицах (копейках/центах).
+        Возвращает текущий баланс кошелька в основных денежных единицах (баланс хранится
+        в БД в минимальных единицах - копейках/центах, - см. MinorUnitsField).
         """
 
         try:
-            wallet = self.get_object()
-            return Response({'balance': float(wallet.balance)}, status=status.HTTP_200_OK)
+            data = self._get_cached_wallet(wallet_id)
+            return Response({'balance': decimal_value(data['balance'], request.version)}, status=status.HTTP_200_OK)
         except Wallet.DoesNotExist:
             return Response(
                 {'error': f'Кошелек с UUID {wallet_id} не найден.'},
@@ -101,6 +277,7 @@ class WalletViewSet(viewsets.ModelViewSet):
         tags=['wallets']
     )
     @action(detail=True, methods=['get'])
+    @replica_reads
     def info(self, request: Request, wallet_id: str = None) -> Optional[Response]:
         """
         Получение детальной информации о кошельке.
@@ -109,12 +286,19 @@ class WalletViewSet(viewsets.ModelViewSet):
         * UUID кошелька
         * Информацию о владельце
         * Текущий баланс
-        * Дату создания
-        * Дату последней операции
+
+        История операций, в том числе дата последней операции, доступна
+        в эндпоинте transactions.
         """
 
         try:
-            wallet = self.get_object()
+            data = self._get_cached_wallet(wallet_id)
+            if settings.WALLET_FAST_SERIALIZERS:
+                return Response(wallet_representation(wallet_id, data['user'], data['balance']),
+                                status=status.HTTP_200_OK)
+
+            wallet = Wallet(wallet_id=wallet_id, user_id=data['user'])
+            wallet.total_balance = data['balance']
             serializer = self.get_serializer(wallet)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Wallet.DoesNotExist:
@@ -128,6 +312,113 @@ class WalletViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @staticmethod
+    def _get_cached_wallet(wallet_id: str) -> dict:
+        """
+        Возвращает владельца и общий баланс кошелька ({"user", "balance"}) из кэша балансов.
+
+        При промахе кэша кошелек загружается одним запросом к основной базе данных
+        (не к реплике): значение попадает в общий кэш и видно всем клиентам, поэтому
+        баланс отстающей реплики не должен заменить в кэше баланс после операции.
+        Одновременные промахи по тому же кошельку ждут результата этого запроса.
+
+        :raises Wallet.DoesNotExist: Если кошелек не найден.
+        """
+
+        def load() -> Optional[dict]:
+            with use_replicas(False):
+                row = (Wallet.objects.with_total_balance().filter(wallet_id=wallet_id)
+                       .values('user', 'total_balance').first())
+            return row and {'user': row['user'], 'balance': row['total_balance']}
+
+        data = get_balance_cache().get_or_load(str(wallet_id), load)
+        if data is None:
+            raise Wallet.DoesNotExist
+        return data
+
+    @swagger_auto_schema(
+        operation_description="Получение баланса кошелька на момент времени",
+        query_serializer=WalletBalanceAtQuerySerializer,
+        responses={
+            200: WalletBalanceAtSerializer,
+            404: "Кошелек не найден",
+            400: "Неверное значение at"
+        },
+        tags=['wallets']
+    )
+    @action(detail=True, methods=['get'])
+    @replica_reads
+    def balance(self, request: Request, wallet_id: str = None) -> Response:
+        """
+        Получение баланса кошелька на момент времени (?at=).
+
+        Баланс вычисляется от ближайшей контрольной точки баланса проигрыванием
+        записей журнала операций между ней и запрошенным моментом (см.
+        wallet.checkpoints.balance_at). Момент без часового пояса считается
+        в часовом поясе TIME_ZONE.
+        """
+
+        query = WalletBalanceAtQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            data = balance_at(wallet_id, query.validated_data['at'])
+        except Wallet.DoesNotExist:
+            return Response(
+                {'error': f'Кошелек с UUID {wallet_id} не найден.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(WalletBalanceAtSerializer(data).data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Получение последних операций кошелька (новые - первыми)",
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description=f"Количество операций (по умолчанию 50, не более {TRANSACTIONS_MAX_LIMIT})"),
+        ],
+        responses={
+            200: WalletTransactionSerializer(many=True),
+            404: "Кошелек не найден",
+            400: "Неверное значение limit"
+        },
+        tags=['wallets']
+    )
+    @action(detail=True, methods=['get'])
+    def transactions(self, request: Request, wallet_id: str = None) -> Response:
+        """
+        Получение последних операций кошелька из журнала операций.
+
+        Запрос выбирает только столбцы индекса wallet_transaction_recent_idx
+        и выполняется сканированием только индекса.
+        """
+
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= TRANSACTIONS_MAX_LIMIT:
+            return Response(
+                {'error': f'limit должен быть числом от 1 до {TRANSACTIONS_MAX_LIMIT}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entries = list(
+            WalletTransaction.objects
+            .filter(wallet_id=wallet_id)
+            .order_by('-created_at')
+            .values('id', 'operation_type', 'amount', 'created_at')[:limit]
+        )
+        if not entries and not Wallet.objects.filter(wallet_id=wallet_id).exists():
+            return Response(
+                {'error': f'Кошелек с UUID {wallet_id} не найден.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        serializer = WalletTransactionSerializer(entries, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     @swagger_auto_schema(
         operation_description="""
             Выполнение финансовой операции с кошельком.
@@ -138,6 +429,11 @@ class WalletViewSet(viewsets.ModelViewSet):
             При попытке снятия проверяется достаточность средств на балансе.
             """,
         request_body=WalletOperationSerializer,
+        manual_parameters=[
+            openapi.Parameter('Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="Ключ идемпотентности: повторный запрос с тем же ключом "
+                                          "получает сохраненный ответ исходного запроса"),
+        ],
         responses={
             200: openapi.Response(
                 description="Операция выполнена успешно",
@@ -157,6 +453,11 @@ class WalletViewSet(viewsets.ModelViewSet):
             ),
             400: "Некорректные данные операции или недостаточно средств",
             404: "Кошелек не найден",
+            409: "Запрос с тем же ключом идемпотентности еще выполняется",
+            422: "Ключ идемпотентности использован с другими данными запроса",
+            429: "Превышено ограничение одновременных операций или частоты операций кошелька (заголовок Retry-After)",
+            503: "Операция не выполнена из-за одновременных операций с кошельком или перегрузки сервиса "
+                 "(заголовок Retry-After)",
         },
         tags=['wallets']
     )
@@ -164,24 +465,121 @@ class WalletViewSet(viewsets.ModelViewSet):
     def operation(self, request: Request, wallet_id: str = None) -> Response:
         """
         Выполнение финансовых операций с кошельком.
+
+        Если передан заголовок Idempotency-Key, ответ сохраняется и возвращается
+        повторным запросам с тем же ключом без повторного выполнения операции.
+        Повторный запрос, пришедший во время выполнения исходного, ждет его завершения.
+
+        Запрос проходит контроль допуска (WALLET_ADMISSION): при перегрузке
+        процесса возвращается 503, при превышении ограничений кошелька - 429,
+        в обоих случаях с заголовком Retry-After. Повтор завершенного запроса
+        с тем же ключом идемпотентности получает сохраненный ответ до контроля
+        допуска. Запрос, уже допущенный асинхронным представлением
+        (request.wallet_admitted), повторно не проверяется.
         """
 
-        serializer = WalletOperationSerializer(data=request.data)
+        fingerprint = make_fingerprint(str(wallet_id), request.data)
+        replay = self._replay(request, fingerprint)
+        if replay is not None:
+            return replay
+
+        def run() -> Response:
+            return self._idempotent(request, fingerprint, lambda: self._run_operation(request, wallet_id))
+
+        if getattr(request, 'wallet_admitted', False):
+            return run()
+
+        try:
+            with get_admission_controller().admit(str(wallet_id)):
+                return run()
+        except AdmissionRejected as e:
+            return admission_response(e)
+
+    @staticmethod
+    def _replay(request: Request, fingerprint: str) -> Optional[Response]:
+        """
+        Сохраненный ответ на запрос с тем же Idempotency-Key и отпечатком данных либо None.
+        """
+
+        key = request.headers.get('Idempotency-Key')
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return None
+
+        replay = get_idempotency_store().lookup(idempotency_key(request, key), fingerprint)
+        return replay and replayed_response(replay)
+
+    @staticmethod
+    def _idempotent(request: Request, fingerprint: str, run) -> Response:
+        """
+        Выполняет run() с учетом заголовка Idempotency-Key: ответ сохраняется и
+        возвращается повторным запросам с тем же ключом и отпечатком данных.
+
+        Захват ключа и run() выполняются в одной транзакции retrying_atomic:
+        она начинается с уровнем изоляции и lock_timeout из WALLET_TRANSACTIONS
+        и повторяется целиком после ошибки сериализации.
+        """
+
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return run()
+
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'error': f'Длина Idempotency-Key не должна превышать {IDEMPOTENCY_KEY_MAX_LENGTH} символов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        @retrying_atomic
+        def idempotent_request() -> Response:
+            with get_idempotency_store().guard(idempotency_key(request, key), fingerprint) as entry:
+                if entry.replay is not None:
+                    return replayed_response(entry.replay)
 
-        if serializer.is_valid():
-            wallet = perform_operation(
-                wallet_id,
-                serializer.validated_data['operation_type'],
-                serializer.validated_data['amount']
+                response = run()
+                entry.complete(response.status_code, response.data)
+                return response
+
+        try:
+            return idempotent_request()
+        except TransactionContention:
+            return contention_response()
+        except IdempotencyConflict:
+            return Response(
+                {'error': f'Ключ идемпотентности {key} уже использован с другими данными запроса.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
             )
+        except IdempotencyInProgress:
             return Response(
-                {
-                    'message': 'Операция выполнена успешно.',
-                    'new_balance': float(wallet.balance)
-                },
-                status=status.HTTP_200_OK
+                {'error': f'Запрос с ключом идемпотентности {key} еще выполняется.'},
+                status=status.HTTP_409_CONFLICT
             )
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def _run_operation(self, request: Request, wallet_id: str) -> Response:
+        """
+        Валидирует данные операции и выполняет ее.
+        """
+
+        validated = validate_operation(request.data) if settings.WALLET_FAST_SERIALIZERS else None
+
+        if validated is None:
+            serializer = WalletOperationSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            validated = serializer.validated_data['operation_type'], serializer.validated_data['amount']
+
+        try:
+            wallet = perform_operation(wallet_id, *validated)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransactionContention:
+            return contention_response()
+        return Response(
+            {
+                'message': 'Операция выполнена успешно.',
+                'new_balance': decimal_value(wallet.get_total_balance(), request.version)
+            },
+            status=status.HTTP_200_OK
+        )
         # except Http404:  # Ловим Http404, который выбрасывается self.get_object()
         #     return Response(
         #         {'error': f'Кошелек с UUID {wallet_id} не найден.'},
@@ -196,3 +594,329 @@ class WalletViewSet(viewsets.ModelViewSet):
         #         {'error': 'Произошла ошибка обработки запроса. Пожалуйста, проверьте данные и повторите попытку.'},
         #         status=status.HTTP_400_BAD_REQUEST
         # )
+
+    @swagger_auto_schema(
+        operation_description="""
+            Перевод средств с кошелька на другой кошелек в одной транзакции.
+            Оба кошелька блокируются в порядке возрастания UUID, поэтому встречные переводы
+            не приводят к взаимной блокировке. В журнал операций записываются
+            TRANSFER_OUT отправителя и TRANSFER_IN получателя.
+            """,
+        request_body=WalletTransferSerializer,
+        manual_parameters=[
+            openapi.Parameter('Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="Ключ идемпотентности: повторный запрос с тем же ключом "
+                                          "получает сохраненный ответ исходного запроса"),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Перевод выполнен успешно",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'message': openapi.Schema(type=openapi.TYPE_STRING,
+                                                  description="Сообщение об успешном выполнении"),
+                        'new_balance': openapi.Schema(type=openapi.TYPE_NUMBER,
+                                                      description="Новый баланс кошелька отправителя"),
+                    }
+                )
+            ),
+            400: "Некорректные данные перевода, перевод на тот же кошелек или недостаточно средств",
+            404: "Кошелек отправителя или получателя не найден",
+            409: "Запрос с тем же ключом идемпотентности еще выполняется",
+            422: "Ключ идемпотентности использован с другими данными запроса",
+            503: "Перевод не выполнен из-за одновременных операций с кошельками (заголовок Retry-After)",
+        },
+        tags=['wallets']
+    )
+    @action(detail=True, methods=['post'])
+    def transfer(self, request: Request, wallet_id: str = None) -> Response:
+        """
+        Перевод средств на другой кошелек (поддерживает заголовок Idempotency-Key).
+        """
+
+        return self._idempotent(request, make_fingerprint('transfer', str(wallet_id), request.data),
+                                lambda: self._run_transfer(request, wallet_id))
+
+    @staticmethod
+    def _run_transfer(request: Request, wallet_id: str) -> Response:
+        """
+        Валидирует данные перевода и выполняет его.
+        """
+
+        serializer = WalletTransferSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            source, _ = transfer(wallet_id, serializer.validated_data['destination_wallet_id'],
+                                 serializer.validated_data['amount'])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransactionContention:
+            return contention_response()
+        return Response(
+            {
+                'message': 'Перевод выполнен успешно.',
+                'new_balance': decimal_value(source.get_total_balance(), request.version)
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @swagger_auto_schema(
+        operation_description="""
+            Блокировка средств кошелька (первая фаза двухфазного списания).
+            Заблокированная сумма не может быть списана другими операциями до списания блокировки
+            (POST .../holds/<HOLD_UUID>/capture/), ее снятия (.../release/) или истечения срока.
+            """,
+        request_body=WalletHoldCreateSerializer,
+        manual_parameters=[
+            openapi.Parameter('Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="Ключ идемпотентности: повторный запрос с тем же ключом "
+                                          "получает сохраненный ответ исходного запроса"),
+        ],
+        responses={
+            201: WalletHoldSerializer,
+            400: "Некорректные данные блокировки или недостаточно средств",
+            404: "Кошелек не найден",
+            409: "Запрос с тем же ключом идемпотентности еще выполняется",
+            422: "Ключ идемпотентности использован с другими данными запроса",
+            503: "Блокировка не выполнена из-за одновременных операций с кошельком (заголовок Retry-After)",
+        },
+        tags=['wallets']
+    )
+    @action(detail=True, methods=['post'])
+    def hold(self, request: Request, wallet_id: str = None) -> Response:
+        """
+        Блокировка средств кошелька (поддерживает заголовок Idempotency-Key).
+        """
+
+        return self._idempotent(request, make_fingerprint('hold', str(wallet_id), request.data),
+                                lambda: self._run_hold(request, wallet_id))
+
+    @staticmethod
+    def _run_hold(request: Request, wallet_id: str) -> Response:
+        """
+        Валидирует данные блокировки и блокирует средства.
+        """
+
+        serializer = WalletHoldCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hold = hold_funds(wallet_id, serializer.validated_data['amount'], serializer.validated_data.get('ttl'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransactionContention:
+            return contention_response()
+        return Response(WalletHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        operation_description="""
+            Списание заблокированных средств (вторая фаза двухфазного списания).
+            Списывается amount (по умолчанию вся заблокированная сумма), остаток блокировки освобождается.
+            В журнал операций записывается CAPTURE.
+            """,
+        request_body=WalletHoldCaptureSerializer,
+        manual_parameters=[
+            openapi.Parameter('Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING,
+                              description="Ключ идемпотентности: повторный запрос с тем же ключом "
+                                          "получает сохраненный ответ исходного запроса"),
+        ],
+        responses={
+            200: WalletHoldSerializer,
+            400: "Некорректная сумма, блокировка уже завершена или истекла",
+            404: "Блокировка не найдена",
+            409: "Запрос с тем же ключом идемпотентности еще выполняется",
+            422: "Ключ идемпотентности использован с другими данными запроса",
+            503: "Списание не выполнено из-за одновременных операций с кошельком (заголовок Retry-After)",
+        },
+        tags=['wallets']
+    )
+    @action(detail=False, methods=['post'], url_path=r'holds/(?P<hold_id>[^/.]+)/capture')
+    def capture(self, request: Request, hold_id: str = None) -> Response:
+        """
+        Списание заблокированных средств (поддерживает заголовок Idempotency-Key).
+        """
+
+        return self._idempotent(request, make_fingerprint('capture', str(hold_id), request.data),
+                                lambda: self._run_capture(request, hold_id))
+
+    @staticmethod
+    def _run_capture(request: Request, hold_id: str) -> Response:
+        """
+        Валидирует данные списания и списывает блокировку.
+        """
+
+        serializer = WalletHoldCaptureSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hold = capture_hold(hold_id, serializer.validated_data.get('amount'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransactionContention:
+            return contention_response()
+        return Response(WalletHoldSerializer(hold).data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Снятие блокировки средств без списания",
+        responses={
+            200: WalletHoldSerializer,
+            400: "Блокировка уже завершена",
+            404: "Блокировка не найдена",
+            503: "Снятие не выполнено из-за одновременных операций с кошельком (заголовок Retry-After)",
+        },
+        tags=['wallets']
+    )
+    @action(detail=False, methods=['post'], url_path=r'holds/(?P<hold_id>[^/.]+)/release')
+    def release(self, request: Request, hold_id: str = None) -> Response:
+        """
+        Снятие блокировки средств. Повторное снятие возвращает 400.
+        """
+
+        try:
+            hold = release_hold(hold_id)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except TransactionContention:
+            return contention_response()
+        return Response(WalletHoldSerializer(hold).data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="""
+            Выполнение пакета финансовых операций с кошельками в одной транзакции.
+            Кошельки блокируются в порядке возрастания UUID, изменения балансов записываются одним запросом.
+            * atomic=true (по умолчанию) - при ошибке хотя бы одной операции не применяется ни одна
+            * atomic=false - ошибочные операции пропускаются, остальные применяются
+            """,
+        request_body=WalletBatchOperationSerializer,
+        responses={
+            200: openapi.Response(
+                description="Пакет обработан, результат для каждой операции в исходном порядке",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'results': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    'wallet_id': openapi.Schema(type=openapi.TYPE_STRING),
+                                    'status': openapi.Schema(type=openapi.TYPE_STRING,
+                                                             enum=['ok', 'error', 'rolled_back']),
+                                    'new_balance': openapi.Schema(type=openapi.TYPE_NUMBER),
+                                    'error': openapi.Schema(type=openapi.TYPE_STRING),
+                                }
+                            )
+                        )
+                    }
+                )
+            ),
+            400: "Некорректные данные пакета либо (при atomic=true) ошибка одной из операций",
+            503: "Пакет не выполнен из-за одновременных операций с кошельками (заголовок Retry-After)",
+        },
+        tags=['wallets']
+    )
+    @action(detail=False, methods=['post'], url_path='operations/batch')
+    def batch(self, request: Request) -> Response:
+        """
+        Выполнение пакета финансовых операций с кошельками.
+        """
+
+        serializer = WalletBatchOperationSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = perform_batch_operations(
+                serializer.validated_data['operations'],
+                atomic=serializer.validated_data['atomic']
+            )
+        except TransactionContention:
+            return contention_response()
+        for result in results:
+            if 'new_balance' in result:
+                result['new_balance'] = decimal_value(result['new_balance'], request.version)
+
+        failed = serializer.validated_data['atomic'] and any(result['status'] == 'error' for result in results)
+        return Response(
+            {'results': results},
+            status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK
+        )
+
+    @swagger_auto_schema(
+        operation_description="Выгрузка всех кошельков в CSV или NDJSON (только для администраторов)",
+        manual_parameters=[
+            openapi.Parameter('file_format', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=sorted(EXPORT_COPY_SQL),
+                              description="Формат выгрузки (по умолчанию csv)"),
+            openapi.Parameter('gzip', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                              description="Сжать выгрузку gzip"),
+            openapi.Parameter('snapshot', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                              description="Выгрузка и итоги в одном снимке данных (по умолчанию true)"),
+        ],
+        responses={200: "Файл выгрузки", 400: "Неверный формат выгрузки", 403: "Недостаточно прав"},
+        tags=['wallets']
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    @replica_reads
+    def export(self, request: Request) -> Response | StreamingHttpResponse:
+        """
+        Потоковая выгрузка всех кошельков через COPY ... TO STDOUT (см. wallet.export.WalletExport).
+
+        В режиме snapshot количество кошельков и сумма балансов того же снимка
+        данных передаются в заголовках X-Wallet-Count и X-Wallet-Total-Balance.
+        """
+
+        params = request.query_params
+        try:
+            export = WalletExport(params.get('file_format', 'csv'),
+                                  compress=params.get('gzip', 'false').lower() in ('1', 'true'),
+                                  snapshot=params.get('snapshot', 'true').lower() in ('1', 'true'),
+                                  # Выгрузка читается после выхода из представления: база данных выбирается сейчас.
+                                  using=router.db_for_read(Wallet))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Первый блок читается сразу, чтобы итоги снимка попали в заголовки ответа.
+        chunks = iter(export)
+        first = next(chunks, b'')
+
+        def content() -> Iterator[bytes]:
+            yield first
+            yield from chunks
+
+        filename = f'wallets.{export.file_format}' + ('.gz' if export.compress else '')
+        response = streaming_response(request, content(),
+                                      content_type='application/gzip' if export.compress else export.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if export.totals is not None:
+            response['X-Wallet-Count'] = export.totals['wallets']
+            response['X-Wallet-Total-Balance'] = f"{export.totals['balance']:.2f}"
+        return response
+
+    @swagger_auto_schema(
+        operation_description="Счетчики кэша балансов и соединений с базами данных (только для администраторов)",
+        responses={200: "Счетчики попаданий и промахов кэша", 403: "Недостаточно прав"},
+        tags=['wallets']
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def stats(self, request: Request) -> Response:
+        """
+        Счетчики кэша балансов для подбора его размера и времени жизни записей,
+        статистика соединений с базами данных и пулов асинхронных соединений процесса,
+        количество повторов транзакций.
+        """
+
+        return Response(
+            {
+                'balance_cache': get_balance_cache().stats(),
+                'databases': connection_stats(),
+                'async_pools': async_pool_stats(),
+                'transactions': retry_stats(),
+            },
+            status=status.HTTP_200_OK
+        )
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class WalletConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "wallet"
+
+    def ready(self):
+        """
+        Регистрирует проверку системы кэша закреплений за основной базой данных.
+        """
+
+        from utilities.db_routing import check_sticky_cache
+
+        checks.register(check_sticky_cache, checks.Tags.caches)
@@ -0,0 +1,167 @@
+import weakref
+import asyncio
+
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+import psycopg
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from wallet.cache import get_balance_cache
+from wallet.models import Wallet, from_minor, to_minor
+from wallet.services import DEPOSIT_SQL, STRIPE_TABLE, WALLET_TABLE, WITHDRAW_SQL
+from wallet.transactions import RETRYABLE_SQLSTATES, begin_statements, retry_pause
+from utilities.db_routing import apin_to_primary, wallet_key
+from utilities.metrics import LOCK_WAIT, OPERATION_OUTCOMES
+from utilities.logger_utils import logger
+
+
+# Владелец и общий баланс кошелька (с учетом полос).
+LOAD_WALLET_SQL = f"""
+    SELECT w.user_id,
+           w.balance + COALESCE((SELECT SUM(s.balance)
+                                   FROM {STRIPE_TABLE} s
+                                  WHERE s.wallet_id = w.wallet_id), 0)
+      FROM {WALLET_TABLE} w
+     WHERE w.wallet_id = %s
+"""
+
+# Пулы соединений по циклам событий: соединения psycopg привязаны к циклу, в котором созданы.
+_pools = weakref.WeakKeyDictionary()
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    Возвращает пул асинхронных соединений psycopg текущего цикла событий.
+
+    Пул создается при первом обращении с параметрами базы данных "default"
+    и настройкой WALLET_ASYNC_DB. Соединения работают в режиме autocommit:
+    чтения выполняются одним SQL-запросом, операции - в явной транзакции.
+    """
+
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+
+    if pool is None:
+        config = settings.WALLET_ASYNC_DB
+        database = connections['default'].settings_dict
+        conninfo = make_conninfo(**{
+            name: value for name, value in [
+                ('dbname', database['NAME']),
+                ('user', database['USER']),
+                ('password', database['PASSWORD']),
+                ('host', database['HOST']),
+                ('port', database['PORT']),
+            ] if value
+        })
+        pool = _pools[loop] = AsyncConnectionPool(
+            conninfo,
+            min_size=config['MIN_SIZE'],
+            max_size=config['MAX_SIZE'],
+            timeout=config['TIMEOUT'],
+            kwargs={'autocommit': True},
+            name='wallet-async',
+            open=False,
+        )
+
+    await pool.open()
+    return pool
+
+
+async def close_async_pool() -> None:
+    """
+    Закрывает пул соединений текущего цикла событий (при остановке приложения и в тестах).
+    """
+
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+def async_pool_stats() -> list[dict]:
+    """
+    Возвращает статистику пулов асинхронных соединений процесса (psycopg_pool get_stats()).
+    """
+
+    return [pool.get_stats() for pool in list(_pools.values())]
+
+
+async def aload_wallet(wallet_id: str) -> Optional[dict]:
+    """
+    Загружает владельца и общий баланс кошелька ({"user", "balance"}) либо None, если кошелек не найден.
+    """
+
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        cursor = await conn.execute(LOAD_WALLET_SQL, [wallet_id])
+        row = await cursor.fetchone()
+
+    return row and {'user': row[0], 'balance': from_minor(row[1])}
+
+
+async def aperform_operation(wallet_id: str, operation_type: str, amount: Decimal) -> Optional[Wallet]:
+    """
+    Асинхронно выполняет операцию над кошельком без полос одним SQL-запросом.
+
+    Использует те же запросы, что и perform_operation (изменение баланса и запись
+    журнала операций в одном запросе). Возвращает None, если запрос не изменил
+    кошелек: кошелек не найден, на нем недостаточно средств или его баланс разбит
+    на полосы. В этих случаях баланс не изменен, и операцию следует выполнить
+    синхронным perform_operation, который вернет соответствующую ошибку.
+
+    Как и retrying_atomic, запрос выполняется в транзакции с уровнем изоляции
+    и lock_timeout из WALLET_TRANSACTIONS и повторяется после временных ошибок БД.
+
+    Args:
+        wallet_id (str): UUID кошелька.
+        operation_type (str): Тип операции ("DEPOSIT" или "WITHDRAW").
+        amount (Decimal): Сумма операции.
+
+    :raises TransactionContention: Если операция не выполнена после всех повторов.
+    """
+
+    minor = to_minor(amount)
+    if operation_type == "DEPOSIT":
+        sql, params = DEPOSIT_SQL, [minor, wallet_id, minor, timezone.now()]
+    else:
+        sql, params = WITHDRAW_SQL, [minor, wallet_id, minor, minor, timezone.now()]
+
+    statements = begin_statements()
+    pool = await get_async_pool()
+    attempt = 0
+    while True:
+        try:
+            async with pool.connection() as conn, conn.transaction():
+                if statements:
+                    await conn.execute(statements)
+                with LOCK_WAIT.time('update'):
+                    cursor = await conn.execute(sql, params)
+                row = await cursor.fetchone()
+            break
+        except psycopg.Error as e:
+            if e.sqlstate not in RETRYABLE_SQLSTATES:
+                raise
+            await asyncio.sleep(retry_pause('aperform_operation', e.sqlstate, attempt, e))
+            attempt += 1
+
+    if row is None:
+        return None
+
+    wallet = Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]))
+    OPERATION_OUTCOMES.inc(operation_type, 'success')
+    await apin_to_primary([wallet_key(wallet.wallet_id)])
+    await get_balance_cache().ainvalidate([wallet.wallet_id])
+
+    logger.info(
+        "Операция %s на %s с кошельком %s выполнена. Новый баланс: %s",
+        operation_type, amount, wallet.wallet_id, wallet.balance,
+        extra={'wallet_id': wallet.wallet_id, 'operation': operation_type, 'amount': amount,
+               'balance': wallet.balance, 'sampled': True}
+    )
+    return wallet
@@ -0,0 +1,362 @@
+import time
+import asyncio
+import threading
+
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+
+
+class _Flight:
+    """
+    Загрузка значения из базы данных, которую ждут одновременные промахи по тому же ключу.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.failed = False
+        self.stale = False
+
+
+class _AsyncFlight(_Flight):
+    """
+    Загрузка значения для асинхронных представлений: промахи ждут ее без блокировки цикла событий.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.event = asyncio.Event()
+
+
+class BalanceCache:
+    """
+    Кэш балансов кошельков для эндпоинтов чтения.
+
+    Состоит из локального LRU-кэша процесса и необязательного общего кэша
+    Django (например, Redis или Memcached). Одновременные промахи по одному
+    кошельку выполняют один запрос к базе данных (single-flight), остальные
+    ждут его результата. Записи удаляются из кэша после фиксации транзакции,
+    изменившей баланс (invalidate_on_commit), поэтому откаченная операция
+    не оставляет в кэше несуществующего значения.
+
+    Локальные записи других процессов не удаляются и живут не дольше local_ttl,
+    поэтому local_ttl следует выбирать коротким.
+
+    Записи общего кэша хранятся с поколением кошелька, которое invalidate()
+    увеличивает. Загрузка сохраняет значение с поколением, прочитанным до
+    запроса к базе данных, поэтому значение, загруженное до удаления записи
+    другим процессом, не совпадает с текущим поколением и не возвращается.
+
+    Args:
+        enabled (bool): Включен ли кэш.
+        local_max_entries (int): Максимальное количество записей локального кэша.
+        local_ttl (float): Время жизни локальной записи в секундах.
+        shared_alias (Optional[str]): Алиас общего кэша из CACHES (None - без общего кэша).
+        shared_ttl (int): Время жизни записи общего кэша в секундах.
+    """
+
+    KEY_PREFIX = 'wallet-balance:'
+    GENERATION_PREFIX = 'wallet-balance-generation:'
+
+    # Время жизни поколения кошелька в общем кэше (секунды): намного больше
+    # shared_ttl, чтобы поколение не сбрасывалось, пока живут записи кошелька.
+    GENERATION_TTL = 86400
+
+    def __init__(self, enabled: bool = True, local_max_entries: int = 100000, local_ttl: float = 1.0,
+                 shared_alias: Optional[str] = None, shared_ttl: int = 30):
+        self.enabled = enabled
+        self.local_max_entries = local_max_entries
+        self.local_ttl = local_ttl
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl
+
+        self._local = OrderedDict()
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ['hits', 'misses', 'shared_hits', 'loads', 'coalesced', 'invalidations'], 0
+        )
+
+    @property
+    def shared(self):
+        """
+        Общий кэш Django либо None, если он не настроен.
+        """
+
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get_or_load(self, wallet_id: str, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """
+        Возвращает данные кошелька из кэша либо загружает их функцией loader.
+
+        Args:
+            wallet_id (str): UUID кошелька.
+            loader (Callable): Загружает данные кошелька из базы данных
+                ({"user", "balance"}) и возвращает None, если кошелек не найден.
+        """
+
+        if not self.enabled:
+            return loader()
+
+        key = str(wallet_id)
+        hit, flight, leader = self._lookup(key, self._flights, _Flight)
+        if hit:
+            return flight
+
+        if not leader:
+            flight.event.wait()
+            return loader() if flight.failed else flight.value
+
+        try:
+            value = self._load(key, loader, flight)
+        except BaseException:
+            flight.failed = True
+            raise
+        else:
+            flight.value = value
+            return value
+        finally:
+            self._finish(key, flight, self._flights)
+
+    async def aget_or_load(self, wallet_id: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """
+        Асинхронный вариант get_or_load() для асинхронных представлений.
+
+        Args:
+            wallet_id (str): UUID кошелька.
+            loader (Callable): Корутина, загружающая данные кошелька ({"user", "balance"}),
+                возвращает None, если кошелек не найден.
+        """
+
+        if not self.enabled:
+            return await loader()
+
+        key = str(wallet_id)
+        hit, flight, leader = self._lookup(key, self._async_flights, _AsyncFlight)
+        if hit:
+            return flight
+
+        if not leader:
+            await flight.event.wait()
+            return await loader() if flight.failed else flight.value
+
+        try:
+            shared = self.shared
+            value, generation = None, 0
+            if shared is not None:
+                keys = self._shared_keys(key)
+                value, generation = self._shared_value(keys, await shared.aget_many(keys))
+            if value is not None:
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+            else:
+                value = await loader()
+                with self._lock:
+                    self._stats['loads'] += 1
+                if shared is not None and value is not None and not flight.stale:
+                    await shared.aset(keys[0], (generation, value), self.shared_ttl)
+        except BaseException:
+            flight.failed = True
+            raise
+        else:
+            flight.value = value
+            return value
+        finally:
+            self._finish(key, flight, self._async_flights)
+
+    def _lookup(self, key: str, flights: dict, flight_class: type) -> tuple:
+        """
+        Ищет запись в локальном кэше, а при промахе - загрузку, уже выполняющуюся по ключу.
+
+        Возвращает (True, значение, None) при попадании, иначе (False, загрузка, является ли
+        вызывающий ее исполнителем).
+        """
+
+        with self._lock:
+            record = self._local.get(key)
+            if record is not None and record[0] > time.monotonic():
+                self._local.move_to_end(key)
+                self._stats['hits'] += 1
+                return True, record[1], None
+
+            self._stats['misses'] += 1
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = flight_class()
+            else:
+                self._stats['coalesced'] += 1
+            return False, flight, leader
+
+    def _finish(self, key: str, flight: _Flight, flights: dict) -> None:
+        """
+        Сохраняет результат загрузки в локальный кэш и будит ожидающих.
+        """
+
+        with self._lock:
+            del flights[key]
+            if not flight.failed and not flight.stale and flight.value is not None:
+                self._local[key] = (time.monotonic() + self.local_ttl, flight.value)
+                while len(self._local) > self.local_max_entries:
+                    self._local.popitem(last=False)
+        flight.event.set()
+
+    def _load(self, key: str, loader: Callable[[], Optional[dict]], flight: _Flight) -> Optional[dict]:
+        """
+        Загружает значение из общего кэша, а при промахе - из базы данных.
+        """
+
+        shared = self.shared
+        if shared is not None:
+            keys = self._shared_keys(key)
+            value, generation = self._shared_value(keys, shared.get_many(keys))
+            if value is not None:
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return value
+
+        value = loader()
+        with self._lock:
+            self._stats['loads'] += 1
+
+        if shared is not None and value is not None and not flight.stale:
+            shared.set(keys[0], (generation, value), self.shared_ttl)
+        return value
+
+    def _shared_keys(self, key: str) -> tuple[str, str]:
+        """
+        Ключи записи и поколения кошелька в общем кэше.
+        """
+
+        return self.KEY_PREFIX + key, self.GENERATION_PREFIX + key
+
+    @staticmethod
+    def _shared_value(keys: tuple[str, str], found: dict) -> tuple[Optional[dict], int]:
+        """
+        Возвращает (значение, поколение) по результату get_many() ключей _shared_keys().
+
+        Значение равно None, если записи нет или она сохранена с другим поколением.
+        """
+
+        generation = found.get(keys[1], 0)
+        record = found.get(keys[0])
+        if record is not None and record[0] == generation:
+            return record[1], generation
+        return None, generation
+
+    def invalidate(self, wallet_ids: Iterable[str]) -> None:
+        """
+        Удаляет записи кошельков из локального и общего кэша и увеличивает их поколения.
+
+        Загрузка, выполняющаяся в этот момент в любом процессе, не сохранит свой
+        результат: в локальный кэш - из-за отметки stale, в общий - из-за поколения.
+        """
+
+        if not self.enabled:
+            return
+
+        keys = self._invalidate_local(wallet_ids)
+
+        shared = self.shared
+        if shared is not None:
+            for key in keys:
+                generation_key = self.GENERATION_PREFIX + key
+                shared.add(generation_key, 0, self.GENERATION_TTL)
+                try:
+                    shared.incr(generation_key)
+                except ValueError:
+                    shared.add(generation_key, 1, self.GENERATION_TTL)
+            shared.delete_many([self.KEY_PREFIX + key for key in keys])
+
+    async def ainvalidate(self, wallet_ids: Iterable[str]) -> None:
+        """
+        Асинхронный вариант invalidate() для асинхронных представлений.
+        """
+
+        if not self.enabled:
+            return
+
+        keys = self._invalidate_local(wallet_ids)
+
+        shared = self.shared
+        if shared is not None:
+            for key in keys:
+                generation_key = self.GENERATION_PREFIX + key
+                await shared.aadd(generation_key, 0, self.GENERATION_TTL)
+                try:
+                    await shared.aincr(generation_key)
+                except ValueError:
+                    await shared.aadd(generation_key, 1, self.GENERATION_TTL)
+            await shared.adelete_many([self.KEY_PREFIX + key for key in keys])
+
+    def _invalidate_local(self, wallet_ids: Iterable[str]) -> list[str]:
+        """
+        Удаляет записи из локального кэша и возвращает их ключи.
+        """
+
+        keys = [str(wallet_id) for wallet_id in wallet_ids]
+
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+                for flights in (self._flights, self._async_flights):
+                    flight = flights.get(key)
+                    if flight is not None:
+                        flight.stale = True
+            self._stats['invalidations'] += len(keys)
+        return keys
+
+    def invalidate_on_commit(self, wallet_ids: Iterable[str]) -> None:
+        """
+        Удаляет записи кошельков после фиксации текущей транзакции.
+        """
+
+        wallet_ids = list(wallet_ids)
+        transaction.on_commit(lambda: self.invalidate(wallet_ids))
+
+    def stats(self) -> dict:
+        """
+        Возвращает счетчики попаданий и промахов кэша.
+        """
+
+        with self._lock:
+            stats = dict(self._stats, local_entries=len(self._local))
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+@lru_cache(maxsize=None)
+def get_balance_cache() -> BalanceCache:
+    """
+    Возвращает кэш балансов согласно настройке WALLET_BALANCE_CACHE.
+    """
+
+    config = settings.WALLET_BALANCE_CACHE
+    return BalanceCache(
+        enabled=config['ENABLED'],
+        local_max_entries=config['LOCAL_MAX_ENTRIES'],
+        local_ttl=config['LOCAL_TTL'],
+        shared_alias=config['SHARED_CACHE_ALIAS'],
+        shared_ttl=config['SHARED_TTL'],
+    )
+
+
+def _reset_cache(setting: str, **kwargs) -> None:
+    """
+    Сбрасывает кэш при изменении настройки (override_settings в тестах).
+    """
+
+    if setting == 'WALLET_BALANCE_CACHE':
+        get_balance_cache.cache_clear()
+
+
+setting_changed.connect(_reset_cache)
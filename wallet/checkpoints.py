@@ -0,0 +1,224 @@
+import time
+
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from wallet.models import Wallet, WalletBalanceCheckpoint, WalletStripe, WalletTransaction, signed_amount, zero_amount
+from utilities.logger_utils import logger
+
+
+WALLET_TABLE = Wallet._meta.db_table
+STRIPE_TABLE = WalletStripe._meta.db_table
+LEDGER_TABLE = WalletTransaction._meta.db_table
+CHECKPOINT_TABLE = WalletBalanceCheckpoint._meta.db_table
+
+CREDIT_TYPES_SQL = ', '.join(f"'{operation_type}'" for operation_type in WalletTransaction.CREDIT_TYPES)
+
+# Контрольные точки пакета кошельков (по wallet_id после %(after)s) на момент %(at)s
+# создаются одним запросом, то есть по одному снимку данных. Для кошелька с
+# предыдущей точкой баланс - баланс этой точки плюс записи журнала после нее,
+# для кошелька без точек - текущий баланс минус записи журнала после %(at)s
+# (начальный баланс кошелька не имеет записи в журнале). Точка создается, только
+# если после предыдущей накопилось не меньше %(min_entries)s записей.
+# Запрос возвращает количество кошельков пакета, последний wallet_id пакета,
+# количество созданных точек, а также сумму и максимум количества записей,
+# которые запросу баланса на текущий момент нужно проиграть после ближайшей точки.
+CHECKPOINT_SQL = f"""
+    WITH batch AS (
+        SELECT w.wallet_id,
+               w.balance + COALESCE((SELECT SUM(s.balance)
+                                       FROM {STRIPE_TABLE} s
+                                      WHERE s.wallet_id = w.wallet_id), 0) AS total
+          FROM {WALLET_TABLE} w
+         WHERE w.wallet_id > %(after)s
+         ORDER BY w.wallet_id
+         LIMIT %(limit)s
+    ), replay AS (
+        SELECT b.wallet_id, b.total, c.as_of AS last_as_of, c.balance AS last_balance,
+               r.entries, r.delta, r.entries_after, r.delta_after
+          FROM batch b
+          LEFT JOIN LATERAL (SELECT as_of, balance
+                               FROM {CHECKPOINT_TABLE}
+                              WHERE wallet_id = b.wallet_id
+                              ORDER BY as_of DESC
+                              LIMIT 1) c ON TRUE
+         CROSS JOIN LATERAL (
+             SELECT count(*) FILTER (WHERE t.created_at <= %(at)s) AS entries,
+                    COALESCE(SUM(CASE WHEN t.operation_type IN ({CREDIT_TYPES_SQL}) THEN t.amount ELSE -t.amount END)
+                             FILTER (WHERE t.created_at <= %(at)s), 0) AS delta,
+                    count(*) FILTER (WHERE t.created_at > %(at)s) AS entries_after,
+                    COALESCE(SUM(CASE WHEN t.operation_type IN ({CREDIT_TYPES_SQL}) THEN t.amount ELSE -t.amount END)
+                             FILTER (WHERE t.created_at > %(at)s), 0) AS delta_after
+               FROM {LEDGER_TABLE} t
+              WHERE t.wallet_id = b.wallet_id
+                AND t.created_at > COALESCE(c.as_of, '-infinity')
+         ) r
+    ), created AS (
+        INSERT INTO {CHECKPOINT_TABLE} (wallet_id, as_of, balance, entries)
+        SELECT wallet_id, %(at)s,
+               CASE WHEN last_as_of IS NULL THEN total - delta_after ELSE last_balance + delta END,
+               entries
+          FROM replay
+         WHERE entries >= %(min_entries)s
+           AND (last_as_of IS NULL OR last_as_of < %(at)s)
+        ON CONFLICT (wallet_id, as_of) DO NOTHING
+        RETURNING wallet_id
+    )
+    SELECT count(*),
+           (SELECT wallet_id FROM batch ORDER BY wallet_id DESC LIMIT 1),
+           count(created.wallet_id),
+           COALESCE(SUM(CASE WHEN created.wallet_id IS NULL THEN r.entries + r.entries_after
+                             ELSE r.entries_after END), 0),
+           COALESCE(MAX(CASE WHEN created.wallet_id IS NULL THEN r.entries + r.entries_after
+                             ELSE r.entries_after END), 0)
+      FROM replay r
+      LEFT JOIN created ON created.wallet_id = r.wallet_id
+"""
+
+
+def balance_at(wallet_id: str, at: datetime) -> dict:
+    """
+    Вычисляет баланс кошелька (с учетом полос) на момент at.
+
+    Баланс вычисляется от ближайшей контрольной точки: от последней точки не
+    позже at проигрываются записи журнала до at, а если такой точки нет -
+    от первой точки после at записи журнала между at и этой точкой вычитаются.
+    Кошелек без контрольных точек вычисляется от текущего баланса одним
+    запросом. Учитываются операции, созданные не позже at.
+
+    Args:
+        wallet_id (str): UUID кошелька.
+        at (datetime): Момент времени (с часовым поясом).
+
+    Returns:
+        dict: wallet_id, at, balance, checkpoint_at (момент контрольной точки
+        или None, если баланс вычислен от текущего), replayed_entries
+        (количество проигранных записей журнала).
+
+    :raises Wallet.DoesNotExist: Если кошелек не найден.
+    """
+
+    checkpoints = WalletBalanceCheckpoint.objects.filter(wallet_id=wallet_id).values('as_of', 'balance')
+    ledger = WalletTransaction.objects.filter(wallet_id=wallet_id)
+
+    checkpoint = checkpoints.filter(as_of__lte=at).order_by('-as_of').first()
+    if checkpoint is not None:
+        replay = ledger.filter(created_at__gt=checkpoint['as_of'], created_at__lte=at).replay()
+        balance = checkpoint['balance'] + replay['delta']
+    else:
+        checkpoint = checkpoints.filter(as_of__gt=at).order_by('as_of').first()
+        if checkpoint is not None:
+            replay = ledger.filter(created_at__gt=at, created_at__lte=checkpoint['as_of']).replay()
+            balance = checkpoint['balance'] - replay['delta']
+        else:
+            replay = _replay_from_current(wallet_id, at)
+            balance = replay['total_balance'] - replay['delta']
+
+    return {
+        'wallet_id': wallet_id,
+        'at': at,
+        'balance': balance,
+        'checkpoint_at': checkpoint and checkpoint['as_of'],
+        'replayed_entries': replay['entries'],
+    }
+
+
+def _replay_from_current(wallet_id: str, at: datetime) -> dict:
+    """
+    Текущий баланс кошелька и записи журнала после at (total_balance, delta, entries) одним запросом.
+
+    :raises Wallet.DoesNotExist: Если кошелек не найден.
+    """
+
+    after = (
+        WalletTransaction.objects
+        .filter(wallet_id=OuterRef('wallet_id'), created_at__gt=at)
+        .order_by()
+        .values('wallet_id')
+    )
+    row = (
+        Wallet.objects
+        .with_total_balance()
+        .filter(wallet_id=wallet_id)
+        .annotate(delta=Coalesce(Subquery(after.annotate(delta=Sum(signed_amount())).values('delta')),
+                                 zero_amount()),
+                  entries=Coalesce(Subquery(after.annotate(entries=Count('id')).values('entries')), 0))
+        .values('total_balance', 'delta', 'entries')
+        .first()
+    )
+    if row is None:
+        raise Wallet.DoesNotExist
+    return row
+
+
+def create_checkpoints(at: Optional[datetime] = None, min_entries: Optional[int] = None,
+                       batch_size: Optional[int] = None,
+                       progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Создает контрольные точки балансов кошельков на момент at.
+
+    Кошельки обходятся пакетами по wallet_id, каждый пакет обрабатывается одним
+    запросом (CHECKPOINT_SQL) в своей транзакции, поэтому прерванную команду
+    можно повторить. По умолчанию at - текущий момент минус
+    WALLET_CHECKPOINTS['SAFETY_LAG'] секунд: операция получает created_at до
+    фиксации, и записи журнала не позже at к этому моменту уже зафиксированы.
+
+    Args:
+        at (Optional[datetime]): Момент контрольных точек.
+        min_entries (Optional[int]): Минимальное количество записей журнала после предыдущей точки.
+        batch_size (Optional[int]): Количество кошельков в пакете.
+        progress (Optional[Callable]): Вызывается после каждого пакета с текущим отчетом.
+
+    Returns:
+        dict: Отчет: at, wallets (обработано кошельков), created (создано точек),
+        replay_avg и replay_max (среднее и максимальное количество записей журнала,
+        которые запросу баланса на текущий момент нужно проиграть от ближайшей точки),
+        elapsed (секунды).
+    """
+
+    config = settings.WALLET_CHECKPOINTS
+    if at is None:
+        at = timezone.now() - timedelta(seconds=config['SAFETY_LAG'])
+    min_entries = config['MIN_ENTRIES'] if min_entries is None else min_entries
+    batch_size = batch_size or config['BATCH_SIZE']
+    if batch_size < 1:
+        raise ValueError("Размер пакета должен быть положительным.")
+
+    report = {'at': at, 'wallets': 0, 'created': 0, 'replay_avg': 0.0, 'replay_max': 0, 'elapsed': 0.0}
+    replay_total = 0
+    after = '00000000-0000-0000-0000-000000000000'
+    started = time.monotonic()
+
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(CHECKPOINT_SQL, {'after': after, 'limit': batch_size, 'at': at,
+                                            'min_entries': min_entries})
+            wallets, last_wallet_id, created, replay_sum, replay_max = cursor.fetchone()
+
+        if not wallets:
+            break
+
+        after = last_wallet_id
+        report['wallets'] += wallets
+        report['created'] += created
+        replay_total += int(replay_sum)
+        report['replay_max'] = max(report['replay_max'], int(replay_max))
+        report['replay_avg'] = round(replay_total / report['wallets'], 1)
+        report['elapsed'] = round(time.monotonic() - started, 3)
+
+        if progress is not None:
+            progress(report)
+
+        if wallets < batch_size:
+            break
+
+    logger.info("Контрольные точки балансов на %s: обработано кошельков %s, создано точек %s, "
+                "записей для проигрывания в среднем %s, не более %s",
+                at, report['wallets'], report['created'], report['replay_avg'], report['replay_max'])
+    return report
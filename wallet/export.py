@@ -0,0 +1,122 @@
+import zlib
+
+from typing import Iterator, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from wallet.models import Wallet, WalletStripe, major_units_sql
+from utilities.logger_utils import logger
+
+
+WALLET_TABLE = Wallet._meta.db_table
+STRIPE_TABLE = WalletStripe._meta.db_table
+
+# Общий баланс кошелька с учетом полос в минорных единицах.
+TOTAL_BALANCE_SQL = f"""
+    w.balance + COALESCE((SELECT SUM(s.balance)
+                            FROM {STRIPE_TABLE} s
+                           WHERE s.wallet_id = w.wallet_id), 0)
+"""
+
+# Кошельки в порядке wallet_id: поля совпадают с WalletSerializer (wallet_id, user, balance - с учетом полос;
+# баланс хранится в минорных единицах и выгружается в основных с двумя знаками после точки).
+EXPORT_ROWS_SQL = f"""
+    SELECT w.wallet_id, w.user_id AS user, {major_units_sql(TOTAL_BALANCE_SQL)} AS balance
+      FROM {WALLET_TABLE} w
+     ORDER BY w.wallet_id
+"""
+
+# Строки NDJSON (как в потоковом списке кошельков) формирует PostgreSQL: значения (UUID, числа)
+# не содержат символов, которые экранируют JSON и COPY в текстовом формате.
+EXPORT_COPY_SQL = {
+    'csv': f"COPY ({EXPORT_ROWS_SQL}) TO STDOUT WITH (FORMAT csv, HEADER)",
+    'ndjson': f"""
+        COPY (SELECT '{{"wallet_id": "' || e.wallet_id || '", "user": ' || e.user || ', "balance": "' || e.balance || '"}}'
+                FROM ({EXPORT_ROWS_SQL}) e) TO STDOUT
+    """,
+}
+
+# Количество кошельков и сумма балансов в том же снимке данных, что и выгрузка.
+EXPORT_TOTALS_SQL = f"""
+    SELECT count(*), COALESCE(SUM(e.balance), 0) FROM ({EXPORT_ROWS_SQL}) e
+"""
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Минимальный размер блока выгрузки в байтах: COPY передает данные построчно.
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class WalletExport:
+    """
+    Выгрузка всех кошельков в CSV или NDJSON через COPY ... TO STDOUT.
+
+    Строки формирует PostgreSQL, экземпляры моделей не создаются, а данные
+    передаются блоками по мере чтения, поэтому расход памяти не зависит от
+    количества кошельков. В режиме snapshot выгрузка и итоги (totals)
+    выполняются в одной транзакции REPEATABLE READ только для чтения, поэтому
+    итоги совпадают с выгруженными строками.
+
+    Итерация по объекту выгрузки возвращает блоки байтов (при compress - gzip).
+    Итоги вычисляются перед первым блоком.
+    """
+
+    def __init__(self, file_format: str = 'csv', compress: bool = False, snapshot: bool = True,
+                 using: str = DEFAULT_DB_ALIAS):
+        """
+        Args:
+            file_format (str): Формат выгрузки ("csv" или "ndjson").
+            compress (bool): Сжимать выгрузку gzip.
+            snapshot (bool): Выгрузка и итоги в одной транзакции REPEATABLE READ.
+            using (str): Алиас базы данных.
+
+        :raises ValueError: Если формат неизвестен.
+        """
+
+        if file_format not in EXPORT_COPY_SQL:
+            raise ValueError(f"Неверный формат выгрузки: {file_format}. Допустимые значения: csv, ndjson.")
+
+        self.file_format = file_format
+        self.compress = compress
+        self.snapshot = snapshot
+        self.using = using
+        self.totals: Optional[dict] = None
+
+    @property
+    def content_type(self) -> str:
+        return EXPORT_CONTENT_TYPES[self.file_format]
+
+    def __iter__(self) -> Iterator[bytes]:
+        compressor = zlib.compressobj(wbits=31) if self.compress else None
+        connection = connections[self.using]
+        # Внутри уже открытой транзакции снимок данных определяет она.
+        outermost = not connection.in_atomic_block
+        size = 0
+
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            if self.snapshot:
+                if outermost:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute(EXPORT_TOTALS_SQL)
+                wallets, balance = cursor.fetchone()
+                self.totals = {'wallets': wallets, 'balance': balance}
+
+            buffer = bytearray()
+            with cursor.cursor.copy(EXPORT_COPY_SQL[self.file_format]) as copy:
+                for data in copy:
+                    buffer += data
+                    if len(buffer) >= EXPORT_BUFFER_SIZE:
+                        size += len(buffer)
+                        yield compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+                        buffer.clear()
+
+        size += len(buffer)
+        if compressor:
+            yield compressor.compress(bytes(buffer)) + compressor.flush()
+        elif buffer:
+            yield bytes(buffer)
+
+        logger.info("Выгрузка кошельков в %s завершена: %s байт", self.file_format, size)
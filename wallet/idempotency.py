@@ -0,0 +1,346 @@
+import json
+import time
+import random
+import hashlib
+import threading
+
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from wallet.models import IdempotencyKey
+
+
+# Код ошибки PostgreSQL при превышении lock_timeout.
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+class IdempotencyConflict(Exception):
+    """
+    Ключ идемпотентности уже использован запросом с другими данными.
+    """
+
+
+class IdempotencyInProgress(Exception):
+    """
+    Запрос с тем же ключом идемпотентности все еще выполняется.
+    """
+
+
+class IdempotencyEntry:
+    """
+    Результат проверки ключа идемпотентности.
+
+    Attributes:
+        replay (Optional[tuple[int, dict]]): Сохраненный ответ (статус, данные),
+            если запрос с этим ключом уже выполнен.
+        result (Optional[tuple[int, dict]]): Ответ текущего запроса, переданный в complete().
+    """
+
+    def __init__(self, replay: Optional[tuple] = None):
+        self.replay = replay
+        self.result = None
+
+    def complete(self, status_code: int, data: dict) -> None:
+        """
+        Сохраняет ответ на запрос. Ответы с кодом 5xx не сохраняются,
+        такой запрос можно повторить с тем же ключом.
+        """
+
+        if status_code < 500:
+            self.result = (status_code, data)
+
+
+def sqlstate(error: DatabaseError) -> Optional[str]:
+    """
+    Возвращает код ошибки PostgreSQL (SQLSTATE) для драйверов psycopg 3 и psycopg2.
+    """
+
+    cause = error.__cause__
+    return getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+
+
+def make_fingerprint(*parts) -> str:
+    """
+    Возвращает отпечаток данных запроса для проверки повторного использования ключа.
+    """
+
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BaseIdempotencyStore:
+    """
+    Базовое хранилище ответов на запросы с ключом идемпотентности.
+
+    Args:
+        ttl (int): Время хранения ответа в секундах.
+        wait_timeout (float): Сколько секунд повторный запрос ждет завершения исходного.
+    """
+
+    def __init__(self, ttl: int = 86400, wait_timeout: float = 30.0, **options):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+
+    @contextmanager
+    def guard(self, key: str, fingerprint: str) -> Iterator[IdempotencyEntry]:
+        """
+        Захватывает ключ на время выполнения запроса.
+
+        Если ответ для ключа уже сохранен, возвращает запись с заполненным replay.
+        Иначе запрос выполняется внутри блока with, его ответ передается в
+        IdempotencyEntry.complete() и сохраняется при выходе из блока.
+
+        :raises IdempotencyConflict: Если ключ использован с другими данными запроса.
+        :raises IdempotencyInProgress: Если исходный запрос не завершился за wait_timeout.
+        """
+
+        raise NotImplementedError
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[tuple]:
+        """
+        Возвращает сохраненный ответ (статус, данные) для ключа и отпечатка без захвата ключа.
+
+        Повторы завершенных запросов получают ответ до контроля допуска и захвата
+        ключа. None - ответа нет (в том числе запрос еще выполняется или ключ
+        использован с другими данными): запрос следует выполнить через guard().
+        """
+
+        return None
+
+
+class LocMemIdempotencyStore(BaseIdempotencyStore):
+    """
+    Хранилище в памяти процесса: LRU-кэш ответов с ограничением размера и TTL.
+
+    Повторные запросы, пришедшие во время выполнения исходного, ждут его
+    завершения на threading.Event и не обращаются к базе данных. Подходит
+    для развертывания с одним процессом; при нескольких процессах следует
+    использовать DatabaseIdempotencyStore.
+
+    Если guard() выполняется в транзакции, ответ сохраняется и ключ освобождается
+    после ее фиксации (transaction.on_commit), а при откате транзакции retrying_atomic
+    ключ освобождается без ответа (on_rollback): повтор запроса после неудачной
+    фиксации не получает ответ откаченной операции.
+
+    Args:
+        max_entries (int): Максимальное количество сохраненных ответов.
+    """
+
+    def __init__(self, ttl: int = 86400, wait_timeout: float = 30.0, max_entries: int = 10000, **options):
+        super().__init__(ttl, wait_timeout, **options)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def guard(self, key: str, fingerprint: str) -> Iterator[IdempotencyEntry]:
+        event = self._claim(key, fingerprint)
+
+        if not isinstance(event, threading.Event):
+            yield event
+            return
+
+        entry = IdempotencyEntry()
+        try:
+            yield entry
+        except BaseException:
+            self._release(key, event)
+            raise
+
+        result = entry.result
+        if result is None or not connection.in_atomic_block:
+            self._release(key, event, fingerprint, result)
+        else:
+            # Отложенный импорт: wallet.transactions импортирует этот модуль.
+            from wallet.transactions import on_rollback
+
+            transaction.on_commit(lambda: self._release(key, event, fingerprint, result))
+            on_rollback(lambda: self._release(key, event))
+
+    def _release(self, key: str, event: threading.Event, fingerprint: Optional[str] = None,
+                 result: Optional[tuple] = None) -> None:
+        """
+        Сохраняет ответ (если он передан), освобождает захваченный ключ и будит ожидающих.
+        """
+
+        with self._lock:
+            if result is not None:
+                self._entries[key] = (time.monotonic() + self.ttl, fingerprint, result)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight[1] is event:
+                del self._in_flight[key]
+        event.set()
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[tuple]:
+        with self._lock:
+            record = self._entries.get(key)
+            if record is not None and record[0] > time.monotonic() and record[1] == fingerprint:
+                self._entries.move_to_end(key)
+                return record[2]
+        return None
+
+    def _claim(self, key: str, fingerprint: str):
+        """
+        Возвращает IdempotencyEntry с сохраненным ответом либо threading.Event
+        захваченного ключа. Ждет завершения запроса, уже выполняющегося с этим ключом.
+        """
+
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            with self._lock:
+                record = self._entries.get(key)
+                if record is not None and record[0] <= time.monotonic():
+                    del self._entries[key]
+                    record = None
+
+                if record is not None:
+                    self._entries.move_to_end(key)
+                    if record[1] != fingerprint:
+                        raise IdempotencyConflict(key)
+                    return IdempotencyEntry(replay=record[2])
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    event = threading.Event()
+                    self._in_flight[key] = (fingerprint, event)
+                    return event
+
+            if in_flight[0] != fingerprint:
+                raise IdempotencyConflict(key)
+            if not in_flight[1].wait(max(deadline - time.monotonic(), 0)):
+                raise IdempotencyInProgress(key)
+
+
+class DatabaseIdempotencyStore(BaseIdempotencyStore):
+    """
+    Хранилище в таблице IdempotencyKey, общее для всех процессов.
+
+    Ключ захватывается INSERT ... ON CONFLICT в транзакции, которая длится
+    до сохранения ответа. Повторный запрос с тем же ключом ждет на
+    уникальном индексе, пока исходная транзакция не завершится, и затем
+    получает сохраненный ответ. Устаревшие ключи перезаписываются при
+    повторном использовании и периодически удаляются пакетами.
+
+    На время захвата ключа lock_timeout заменяется на wait_timeout, после
+    захвата восстанавливается lock_timeout внешней транзакции (retrying_atomic
+    с настройкой WALLET_TRANSACTIONS).
+
+    Args:
+        purge_probability (float): Вероятность удаления пакета устаревших ключей при захвате ключа.
+        purge_batch_size (int): Размер пакета удаляемых ключей.
+    """
+
+    TABLE = IdempotencyKey._meta.db_table
+
+    CLAIM_SQL = f"""
+        INSERT INTO {TABLE} (key, fingerprint, created_at, expires_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (key) DO UPDATE
+           SET fingerprint = EXCLUDED.fingerprint,
+               created_at = EXCLUDED.created_at,
+               expires_at = EXCLUDED.expires_at,
+               status_code = NULL,
+               response = NULL
+         WHERE {TABLE}.expires_at <= EXCLUDED.created_at
+        RETURNING key
+    """
+
+    PURGE_SQL = f"""
+        DELETE FROM {TABLE}
+         WHERE key IN (SELECT key FROM {TABLE} WHERE expires_at <= %s LIMIT %s FOR UPDATE SKIP LOCKED)
+    """
+
+    def __init__(self, ttl: int = 86400, wait_timeout: float = 30.0,
+                 purge_probability: float = 0.01, purge_batch_size: int = 1000, **options):
+        super().__init__(ttl, wait_timeout, **options)
+        self.purge_probability = purge_probability
+        self.purge_batch_size = purge_batch_size
+
+    @contextmanager
+    def guard(self, key: str, fingerprint: str) -> Iterator[IdempotencyEntry]:
+        with transaction.atomic():
+            now = timezone.now()
+
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW lock_timeout")
+                lock_timeout = cursor.fetchone()[0]
+                cursor.execute(f"SET LOCAL lock_timeout = {int(self.wait_timeout * 1000)}")
+                try:
+                    cursor.execute(self.CLAIM_SQL, [key, fingerprint, now, now + timedelta(seconds=self.ttl)])
+                except DatabaseError as e:
+                    if sqlstate(e) == LOCK_NOT_AVAILABLE:
+                        raise IdempotencyInProgress(key) from e
+                    raise
+                claimed = cursor.fetchone() is not None
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+
+            if not claimed:
+                record = IdempotencyKey.objects.get(key=key)
+                if record.fingerprint != fingerprint:
+                    raise IdempotencyConflict(key)
+                if record.status_code is None:
+                    raise IdempotencyInProgress(key)
+                yield IdempotencyEntry(replay=(record.status_code, record.response))
+                return
+
+            entry = IdempotencyEntry()
+            yield entry
+
+            if entry.result is not None:
+                IdempotencyKey.objects.filter(key=key).update(status_code=entry.result[0], response=entry.result[1])
+            else:
+                IdempotencyKey.objects.filter(key=key).delete()
+
+        if random.random() < self.purge_probability:
+            self.purge()
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[tuple]:
+        record = IdempotencyKey.objects.filter(
+            key=key, fingerprint=fingerprint, expires_at__gt=timezone.now(), status_code__isnull=False
+        ).values_list('status_code', 'response').first()
+        return record and tuple(record)
+
+    def purge(self) -> int:
+        """
+        Удаляет пакет устаревших ключей и возвращает количество удаленных.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(self.PURGE_SQL, [timezone.now(), self.purge_batch_size])
+            return cursor.rowcount
+
+
+@lru_cache(maxsize=None)
+def get_idempotency_store() -> BaseIdempotencyStore:
+    """
+    Возвращает хранилище ключей идемпотентности согласно настройке WALLET_IDEMPOTENCY.
+    """
+
+    config = settings.WALLET_IDEMPOTENCY
+    store_class = import_string(config['BACKEND'])
+    return store_class(ttl=config['TTL'], **config.get('OPTIONS', {}))
+
+
+def _reset_store(setting: str, **kwargs) -> None:
+    """
+    Сбрасывает хранилище при изменении настройки (override_settings в тестах).
+    """
+
+    if setting == 'WALLET_IDEMPOTENCY':
+        get_idempotency_store.cache_clear()
+
+
+setting_changed.connect(_reset_store)
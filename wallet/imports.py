@@ -0,0 +1,281 @@
+import csv
+import time
+import hashlib
+
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User
+from wallet.models import (MINOR_UNITS, BalanceImportChunk, Wallet, WalletStripe, WalletTransaction,
+                           major_units_sql)
+from wallet.services import _balance_changed
+from utilities.logger_utils import logger
+
+
+USER_TABLE = User._meta.db_table
+WALLET_TABLE = Wallet._meta.db_table
+STRIPE_TABLE = WalletStripe._meta.db_table
+LEDGER_TABLE = WalletTransaction._meta.db_table
+STAGING_TABLE = 'wallet_balance_import_staging'
+
+# Начальный баланс должен помещаться в Wallet.balance (MinorUnitsField.max_digits и decimal_places).
+BALANCE_FIELD = Wallet._meta.get_field('balance')
+BALANCE_PATTERN = (f'^[0-9]{{1,{BALANCE_FIELD.max_digits - BALANCE_FIELD.decimal_places}}}'
+                   f'([.][0-9]{{1,{BALANCE_FIELD.decimal_places}}})?$')
+
+# Максимальное количество ошибок валидации, сохраняемых в отчете.
+MAX_REPORTED_ERRORS = 100
+
+# Временная таблица пакета: строки удаляются при завершении транзакции пакета
+# (и перед каждым пакетом - если импорт выполняется внутри внешней транзакции).
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+        record bigint NOT NULL,
+        email text NOT NULL,
+        balance text NOT NULL,
+        user_id bigint,
+        error text
+    ) ON COMMIT DELETE ROWS
+"""
+
+STAGING_COPY_SQL = f"COPY {STAGING_TABLE} (record, email, balance) FROM STDIN"
+
+# Балансы кошельков и полос хранятся в минорных единицах, начальный баланс файла - в основных.
+OPENING_SQL = f"(s.balance::numeric * {MINOR_UNITS})::bigint"
+
+# Проверка пакета одним запросом: формат и точность баланса, существование
+# пользователя, повтор email в пакете (применяется последняя запись с корректным
+# балансом), баланс кошелька с полосами не меньше суммы его полос (полосы не изменяются)
+# и не меньше заблокированных средств (held_balance).
+VALIDATE_SQL = f"""
+    UPDATE {STAGING_TABLE} s
+       SET user_id = u.id,
+           error = CASE
+               WHEN s.balance !~ %(pattern)s THEN 'Некорректный баланс: ' || s.balance
+               WHEN u.id IS NULL THEN 'Пользователь не найден: ' || s.email
+               WHEN u.duplicate
+                   THEN 'Повтор email в пакете, применена последняя запись: ' || s.email
+               WHEN {OPENING_SQL} < (SELECT COALESCE(SUM(st.balance), 0)
+                                            FROM {WALLET_TABLE} w
+                                            JOIN {STRIPE_TABLE} st ON st.wallet_id = w.wallet_id
+                                           WHERE w.user_id = u.id)
+                   THEN 'Баланс меньше суммы полос кошелька: ' || s.email
+               WHEN {OPENING_SQL} < (SELECT COALESCE(SUM(w.held_balance), 0)
+                                            FROM {WALLET_TABLE} w
+                                           WHERE w.user_id = u.id)
+                   THEN 'Баланс меньше заблокированных средств кошелька: ' || s.email
+           END
+      FROM (SELECT s2.record, u2.id,
+                   s2.record < max(s2.record) FILTER (WHERE s2.balance ~ %(pattern)s)
+                                   OVER (PARTITION BY s2.email) AS duplicate
+              FROM {STAGING_TABLE} s2
+              LEFT JOIN {USER_TABLE} u2 ON u2.email = s2.email) u
+     WHERE u.record = s.record
+"""
+
+ERRORS_SQL = f"""
+    SELECT record, error FROM {STAGING_TABLE} WHERE error IS NOT NULL ORDER BY record
+"""
+
+# Кошельки пакета блокируются в порядке wallet_id, как при переводах.
+LOCK_SQL = f"""
+    SELECT w.wallet_id
+      FROM {WALLET_TABLE} w
+      JOIN {STAGING_TABLE} s ON s.user_id = w.user_id
+     WHERE s.error IS NULL
+     ORDER BY w.wallet_id
+       FOR UPDATE OF w
+"""
+
+# Текущий и новый баланс кошельков пакета.
+DIFF_SQL = f"""
+    SELECT s.record, s.email, s.user_id, w.wallet_id,
+           w.balance + COALESCE((SELECT SUM(st.balance)
+                                   FROM {STRIPE_TABLE} st
+                                  WHERE st.wallet_id = w.wallet_id), 0) AS current,
+           {OPENING_SQL} AS opening
+      FROM {STAGING_TABLE} s
+      LEFT JOIN {WALLET_TABLE} w ON w.user_id = s.user_id
+     WHERE s.error IS NULL
+"""
+
+# Отчет о различиях (CSV): email, кошелек, текущий и новый баланс, изменение (в основных единицах) и действие.
+REPORT_COLUMNS = ('record', 'email', 'wallet_id', 'current_balance', 'new_balance', 'delta', 'action')
+REPORT_COPY_SQL = f"""
+    COPY (SELECT d.record, d.email, d.wallet_id, {major_units_sql('d.current')}, {major_units_sql('d.opening')},
+                 {major_units_sql('d.opening - COALESCE(d.current, 0)')},
+                 CASE WHEN d.wallet_id IS NULL THEN 'create'
+                      WHEN d.opening = d.current THEN 'unchanged'
+                      ELSE 'update' END
+            FROM ({DIFF_SQL}) d
+           ORDER BY d.record) TO STDOUT WITH (FORMAT csv)
+"""
+
+# Изменение балансов пакета одним запросом: UPDATE ... FROM для существующих
+# кошельков (баланс полос не изменяется), INSERT ... ON CONFLICT для пользователей
+# без кошелька и записи журнала операций на изменение баланса, чтобы журнал
+# и контрольные точки балансов сходились с новыми балансами.
+MERGE_SQL = f"""
+    WITH diff AS ({DIFF_SQL}), updated AS (
+        UPDATE {WALLET_TABLE} w
+           SET balance = w.balance + (d.opening - d.current)
+          FROM diff d
+         WHERE w.wallet_id = d.wallet_id
+           AND d.opening <> d.current
+     RETURNING w.wallet_id, d.opening - d.current AS delta
+    ), created AS (
+        INSERT INTO {WALLET_TABLE} (wallet_id, user_id, balance, held_balance, stripe_count)
+        SELECT gen_random_uuid(), d.user_id, d.opening, 0, 0
+          FROM diff d
+         WHERE d.wallet_id IS NULL
+        ON CONFLICT (user_id) DO NOTHING
+     RETURNING wallet_id, balance AS delta
+    ), changed AS (
+        SELECT 'update' AS action, wallet_id, delta FROM updated
+         UNION ALL
+        SELECT 'create', wallet_id, delta FROM created
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id, CASE WHEN delta > 0 THEN 'DEPOSIT' ELSE 'WITHDRAW' END, abs(delta), %(now)s
+          FROM changed
+         WHERE delta <> 0
+    )
+    SELECT action, wallet_id FROM changed
+"""
+
+
+def read_balance_records(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    Читает записи начальных балансов из CSV с заголовком email,balance.
+
+    Возвращает (номер записи, email, баланс): email нормализуется как при
+    создании пользователя, баланс проверяется при импорте.
+    """
+
+    for number, record in enumerate(csv.DictReader(lines), 1):
+        email = User.objects.normalize_email(str(record.get('email') or '').strip())
+        yield number, email, str(record.get('balance') or '').strip()
+
+
+def file_import_id(path: str) -> str:
+    """
+    Идентификатор импорта по умолчанию: SHA-256 содержимого файла.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def import_balances(records: Iterable[tuple], import_id: str, chunk_size: int = 10000, dry_run: bool = False,
+                    report_file: Optional[BinaryIO] = None,
+                    progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Загружает начальные балансы кошельков пакетами через COPY во временную таблицу.
+
+    Каждый пакет копируется во временную таблицу, проверяется одним запросом
+    (VALIDATE_SQL) и применяется одним запросом (MERGE_SQL) в своей транзакции:
+    общий баланс кошелька пользователя становится равен начальному, изменение
+    записывается в журнал операций, пользователю без кошелька кошелек создается.
+    Примененные пакеты сохраняются в BalanceImportChunk, поэтому повторный запуск
+    с тем же import_id пропускает их. В режиме dry_run пакеты проверяются и
+    попадают в отчет о различиях, но транзакции откатываются.
+
+    Args:
+        records (Iterable[tuple]): Записи (номер записи, email, баланс), см. read_balance_records.
+        import_id (str): Идентификатор импорта для возобновления.
+        chunk_size (int): Количество записей в пакете.
+        dry_run (bool): Только проверить записи и сформировать отчет о различиях.
+        report_file (Optional[BinaryIO]): Двоичный файл отчета о различиях (CSV, REPORT_COLUMNS).
+        progress (Optional[Callable]): Вызывается после каждого пакета с текущим отчетом.
+
+    Returns:
+        dict: Отчет: processed, updated, created, unchanged, invalid, skipped_chunks (пакеты,
+        примененные ранее), errors (первые ошибки с номерами записей), elapsed (секунды),
+        rate (записей в секунду).
+    """
+
+    if chunk_size < 1:
+        raise ValueError("Размер пакета должен быть положительным.")
+
+    report = {'processed': 0, 'updated': 0, 'created': 0, 'unchanged': 0, 'invalid': 0, 'skipped_chunks': 0,
+              'errors': [], 'elapsed': 0.0, 'rate': 0.0}
+    applied = set(BalanceImportChunk.objects.filter(import_id=import_id).values_list('chunk', flat=True))
+    if report_file is not None:
+        report_file.write((','.join(REPORT_COLUMNS) + '\n').encode())
+
+    started = time.monotonic()
+    records = iter(records)
+    chunk_number = 0
+
+    while chunk := list(islice(records, chunk_size)):
+        if chunk_number in applied:
+            report['skipped_chunks'] += 1
+        else:
+            with transaction.atomic():
+                _import_chunk(chunk, report, report_file, dry_run)
+                if dry_run:
+                    transaction.set_rollback(True)
+                else:
+                    BalanceImportChunk.objects.create(import_id=import_id, chunk=chunk_number, rows=len(chunk),
+                                                      created_at=timezone.now())
+
+        chunk_number += 1
+        report['processed'] += len(chunk)
+        report['elapsed'] = round(time.monotonic() - started, 3)
+        report['rate'] = round(report['processed'] / report['elapsed'], 1) if report['elapsed'] else 0.0
+
+        if progress is not None:
+            progress(report)
+
+    logger.info("Импорт балансов %s завершен: обработано %s, изменено %s, создано кошельков %s, с ошибками %s за %s с",
+                import_id, report['processed'], report['updated'], report['created'], report['invalid'],
+                report['elapsed'])
+    return report
+
+
+def _import_chunk(chunk: list[tuple], report: dict, report_file: Optional[BinaryIO], dry_run: bool) -> None:
+    """
+    Копирует, проверяет и (если не dry_run) применяет пакет записей в текущей транзакции.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(STAGING_SQL)
+        cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+        with cursor.cursor.copy(STAGING_COPY_SQL) as copy:
+            for row in chunk:
+                copy.write_row(row)
+        cursor.execute(f"ANALYZE {STAGING_TABLE}")
+
+        cursor.execute(VALIDATE_SQL, {'pattern': BALANCE_PATTERN})
+        cursor.execute(ERRORS_SQL)
+        errors = cursor.fetchall()
+        report['invalid'] += len(errors)
+        for number, error in errors[:MAX_REPORTED_ERRORS - len(report['errors'])]:
+            report['errors'].append({'record': number, 'error': error})
+
+        cursor.execute(LOCK_SQL)
+        if report_file is not None:
+            with cursor.cursor.copy(REPORT_COPY_SQL) as copy:
+                for data in copy:
+                    report_file.write(data)
+
+        if dry_run:
+            cursor.execute(f"SELECT count(*) FILTER (WHERE d.wallet_id IS NULL), "
+                           f"count(*) FILTER (WHERE d.opening <> d.current) FROM ({DIFF_SQL}) d")
+            created, updated = cursor.fetchone()
+        else:
+            cursor.execute(MERGE_SQL, {'now': timezone.now()})
+            changed = cursor.fetchall()
+            created = sum(action == 'create' for action, _ in changed)
+            updated = len(changed) - created
+            _balance_changed(wallet_id for action, wallet_id in changed if action == 'update')
+
+    report['created'] += created
+    report['updated'] += updated
+    report['unchanged'] += len(chunk) - len(errors) - created - updated
@@ -0,0 +1,150 @@
+import json
+import time
+import uuid
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.test import Client, override_settings
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+from users.models import User, create_wallet
+from utilities.renderers import FastJSONParser, FastJSONRenderer
+from wallet.api.fast_serializers import wallet_representation
+from wallet.api.views import WalletViewSet
+from wallet.factories import WalletFactory
+
+
+# Сравниваемые варианты: (название, рендерер JSON, парсер JSON).
+VARIANTS = (
+    ('DRF', JSONRenderer, JSONParser),
+    ('orjson', FastJSONRenderer, FastJSONParser),
+)
+
+# Варианты чередуются по раундам, чтобы рост журнала операций в транзакции не влиял на сравнение.
+ROUNDS = 10
+
+# Размер страницы списка кошельков в сравнении скорости только рендеринга.
+RENDER_PAGE_SIZE = 1000
+
+VERSION_ACCEPT = {
+    '1': 'application/json',
+    '2': 'application/json; version=2',
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравнение пропускной способности эндпоинтов с JSONRenderer/JSONParser DRF и utilities.renderers
+    """
+
+    help = 'Бенчмарк: запросов в секунду GET .../<WALLET_UUID>/ и POST .../operation/ с рендерером DRF и orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Количество запросов к каждому эндпоинту в каждом варианте (по умолчанию 2000)')
+        parser.add_argument('--api-version', choices=list(VERSION_ACCEPT), default='1',
+                            help='Версия API в заголовке Accept (по умолчанию 1)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Выполняет запросы тестовым клиентом Django к временному кошельку и выводит
+        запросов в секунду по вариантам и ускорение, а также время только рендеринга
+        ответов эндпоинтов и страницы списка кошельков.
+
+        Кошелек и операции создаются в транзакции, которая откатывается, контроль
+        допуска отключается. Ответы вариантов сравниваются.
+        """
+
+        count = kwargs['requests']
+        if count < 1:
+            raise CommandError("Количество запросов должно быть положительным.")
+
+        accept = VERSION_ACCEPT[kwargs['api_version']]
+        admission = {**settings.WALLET_ADMISSION, 'ENABLED': False}
+        renderer_classes, parser_classes = WalletViewSet.renderer_classes, WalletViewSet.parser_classes
+
+        post_save.disconnect(create_wallet, sender=User)
+        try:
+            with override_settings(WALLET_ADMISSION=admission), transaction.atomic():
+                wallet = WalletFactory(balance=Decimal('1000000.00'))
+                host = next((host for host in settings.ALLOWED_HOSTS
+                             if host and host != '*' and not host.startswith('.')), 'localhost')
+                client = Client(HTTP_HOST=host, HTTP_ACCEPT=accept)
+                cases = [
+                    ('retrieve', lambda: client.get(f'/api/v1/wallets/{wallet.wallet_id}/')),
+                    ('operation', lambda: client.post(f'/api/v1/wallets/{wallet.wallet_id}/operation/',
+                                                      {'operation_type': 'DEPOSIT', 'amount': '0.01'},
+                                                      content_type='application/json')),
+                ]
+
+                elapsed, bodies = {}, {}
+                for _ in range(ROUNDS):
+                    for variant, renderer, parser in VARIANTS:
+                        WalletViewSet.renderer_classes = [renderer, BrowsableAPIRenderer]
+                        WalletViewSet.parser_classes = [parser, FormParser, MultiPartParser]
+                        for name, request in cases:
+                            seconds, bodies[(variant, name)] = self._measure(request, max(count // ROUNDS, 1))
+                            elapsed[(variant, name)] = elapsed.get((variant, name), 0.0) + seconds
+
+                transaction.set_rollback(True)
+        finally:
+            WalletViewSet.renderer_classes, WalletViewSet.parser_classes = renderer_classes, parser_classes
+            post_save.connect(create_wallet, sender=User)
+
+        requests = max(count // ROUNDS, 1) * ROUNDS
+        for name, _ in cases:
+            drf_rate, fast_rate = requests / elapsed[('DRF', name)], requests / elapsed[('orjson', name)]
+            fast_body = bodies[('orjson', name)]
+            if json.loads(bodies[('DRF', name)]).keys() != json.loads(fast_body).keys():
+                raise CommandError(f"{name}: ответы рендереров DRF и orjson различаются")
+            self.stdout.write(
+                f"{name}: DRF {drf_rate:.0f} запросов/с, orjson {fast_rate:.0f} запросов/с, "
+                f"ускорение x{fast_rate / drf_rate:.2f}"
+            )
+
+        page = {'next': None, 'previous': None,
+                'results': [wallet_representation(uuid.uuid4(), user_id, Decimal(user_id) / 100)
+                            for user_id in range(RENDER_PAGE_SIZE)]}
+        payloads = [(name, json.loads(bodies[('DRF', name)])) for name, _ in cases]
+        payloads.append((f'страница из {RENDER_PAGE_SIZE} кошельков', page))
+        for name, data in payloads:
+            drf_time, fast_time = (self._measure_render(renderer, data, count) for _, renderer, _ in VARIANTS)
+            self.stdout.write(
+                f"рендеринг ({name}): DRF {drf_time * 1e6:.1f} мкс, orjson {fast_time * 1e6:.1f} мкс, "
+                f"ускорение x{drf_time / fast_time:.1f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Пример ответа (версия {kwargs['api_version']}): {fast_body.decode()}"))
+
+    @staticmethod
+    def _measure(request, count: int) -> tuple[float, bytes]:
+        """
+        Выполняет request count раз и возвращает (время в секундах, тело последнего ответа).
+
+        :raises CommandError: Если ответ не 200.
+        """
+
+        started = time.perf_counter()
+        for _ in range(count):
+            response = request()
+        elapsed = time.perf_counter() - started
+
+        if response.status_code != 200:
+            raise CommandError(f"Ответ {response.status_code}: {response.content.decode()}")
+        return elapsed, response.content
+
+    @staticmethod
+    def _measure_render(renderer_class, data, count: int) -> float:
+        """
+        Возвращает среднее время рендеринга data в секундах.
+        """
+
+        started = time.perf_counter()
+        for _ in range(count):
+            renderer_class().render(data)
+        return (time.perf_counter() - started) / count
@@ -0,0 +1,76 @@
+import time
+import uuid
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from wallet.models import Wallet
+from wallet.api.serializers import WalletOperationSerializer, WalletSerializer
+from wallet.api.fast_serializers import validate_operation, wallet_representation
+
+
+class Command(BaseCommand):
+    """
+    Сравнение скорости сериализаторов DRF и быстрого пути wallet.api.fast_serializers
+    """
+
+    help = 'Микробенчмарк: WalletOperationSerializer/WalletSerializer против быстрого пути'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000,
+                            help='Количество повторов каждого варианта (по умолчанию 20000)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Проверяет, что оба пути дают одинаковый результат, и выводит время одного вызова и ускорение.
+
+        База данных не используется: измеряется только работа сериализаторов.
+        """
+
+        iterations = kwargs['iterations']
+        payload = {'operation_type': 'WITHDRAW', 'amount': '1250.50'}
+        wallet_id, user_id, balance = uuid.uuid4(), 42, Decimal('98765.43')
+
+        def drf_validate():
+            serializer = WalletOperationSerializer(data=payload)
+            serializer.is_valid()
+            return serializer.validated_data['operation_type'], serializer.validated_data['amount']
+
+        def drf_info():
+            wallet = Wallet(wallet_id=wallet_id, user_id=user_id)
+            wallet.total_balance = balance
+            return JSONRenderer().render(WalletSerializer(wallet).data)
+
+        def fast_info():
+            return JSONRenderer().render(wallet_representation(wallet_id, user_id, balance))
+
+        cases = [
+            ('operation', drf_validate, lambda: validate_operation(payload)),
+            ('info', drf_info, fast_info),
+        ]
+
+        for name, drf, fast in cases:
+            if drf() != fast():
+                raise CommandError(f"{name}: результаты сериализатора DRF и быстрого пути различаются")
+
+            drf_time = self._measure(drf, iterations)
+            fast_time = self._measure(fast, iterations)
+            self.stdout.write(
+                f"{name}: DRF {drf_time * 1e6:.1f} мкс, быстрый путь {fast_time * 1e6:.1f} мкс, "
+                f"ускорение x{drf_time / fast_time:.1f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Результаты совпадают'))
+
+    @staticmethod
+    def _measure(func, iterations: int) -> float:
+        """
+        Возвращает среднее время одного вызова func в секундах.
+        """
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - started) / iterations
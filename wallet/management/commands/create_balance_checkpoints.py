@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.checkpoints import create_checkpoints
+
+
+class Command(BaseCommand):
+    """
+    Создание контрольных точек балансов кошельков
+    """
+
+    help = ('Создание контрольных точек балансов кошельков, от которых запрос баланса на момент времени '
+            'проигрывает записи журнала операций')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=int,
+                            help='Отставание момента точек от текущего, секунд '
+                                 '(по умолчанию WALLET_CHECKPOINTS["SAFETY_LAG"])')
+        parser.add_argument('--min-entries', type=int,
+                            help='Минимальное количество записей журнала после предыдущей точки '
+                                 '(по умолчанию WALLET_CHECKPOINTS["MIN_ENTRIES"])')
+        parser.add_argument('--batch-size', type=int,
+                            help='Количество кошельков в пакете (по умолчанию WALLET_CHECKPOINTS["BATCH_SIZE"])')
+
+    def handle(self, *args, **kwargs):
+        """
+        Создает контрольные точки и выводит количество записей журнала, которые нужно проиграть запросу баланса.
+
+        Команду следует запускать по расписанию (например, раз в час): чем чаще
+        создаются точки, тем меньше записей журнала проигрывает запрос баланса.
+        """
+
+        at = None
+        if kwargs['lag'] is not None:
+            if kwargs['lag'] < 0:
+                raise CommandError("Отставание не может быть отрицательным.")
+            at = timezone.now() - timedelta(seconds=kwargs['lag'])
+
+        def progress(report: dict) -> None:
+            self.stdout.write(f"Обработано кошельков {report['wallets']}: создано точек {report['created']}")
+
+        try:
+            report = create_checkpoints(at, kwargs['min_entries'], kwargs['batch_size'], progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Записей журнала для проигрывания запросом баланса: в среднем {report['replay_avg']}, "
+            f"не более {report['replay_max']}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Контрольные точки на {report['at'].isoformat()} созданы за {report['elapsed']} с: {report['created']}"
+        ))
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.db import connection
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Создание месячных секций журнала операций
+    """
+
+    help = 'Создание месячных секций журнала операций на текущий и следующие месяцы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3,
+                            help='Количество месяцев, начиная с текущего (по умолчанию 3)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Создает недостающие секции таблицы wallet_wallettransaction.
+
+        Команду следует запускать по расписанию (например, раз в сутки), чтобы
+        секция следующего месяца существовала заранее и записи не попадали
+        в секцию по умолчанию.
+        """
+
+        today = date.today()
+
+        with connection.cursor() as cursor:
+            for offset in range(kwargs['months']):
+                year, month = divmod(today.month - 1 + offset, 12)
+                cursor.execute(
+                    "SELECT wallet_wallettransaction_create_partition(%s)",
+                    [date(today.year + year, month + 1, 1)]
+                )
+                self.stdout.write(f"Секция {cursor.fetchone()[0]} готова")
+
+        self.stdout.write(self.style.SUCCESS('Секции журнала операций созданы'))
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.export import EXPORT_COPY_SQL, WalletExport
+
+
+class Command(BaseCommand):
+    """
+    Выгрузка всех кошельков
+    """
+
+    help = 'Потоковая выгрузка всех кошельков в CSV или NDJSON через COPY ... TO STDOUT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к файлу выгрузки ("-" - стандартный вывод)')
+        parser.add_argument('--format', choices=list(EXPORT_COPY_SQL), default='csv',
+                            help='Формат выгрузки (по умолчанию csv)')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument('--no-snapshot', action='store_true',
+                            help='Не вычислять итоги в одной транзакции REPEATABLE READ с выгрузкой')
+
+    def handle(self, *args, **kwargs):
+        """
+        Выгружает кошельки и выводит количество кошельков и сумму балансов того же снимка данных.
+
+        При выгрузке в стандартный вывод итоги выводятся в stderr.
+        """
+
+        export = WalletExport(kwargs['format'], compress=kwargs['gzip'], snapshot=not kwargs['no_snapshot'])
+        report = self.stderr if kwargs['output'] == '-' else self.stdout
+
+        try:
+            if kwargs['output'] == '-':
+                for chunk in export:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+            else:
+                with open(kwargs['output'], 'wb') as file:
+                    for chunk in export:
+                        file.write(chunk)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        if export.totals is not None:
+            report.write(f"Кошельков: {export.totals['wallets']}, сумма балансов: {export.totals['balance']:.2f}")
+        report.write(self.style.SUCCESS(f"Выгрузка в {kwargs['output']} завершена"))
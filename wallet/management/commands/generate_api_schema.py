@@ -0,0 +1,45 @@
+import os
+import hashlib
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utilities.api_docs import generate_schema
+
+
+class Command(BaseCommand):
+    """
+    Генерация схемы OpenAPI
+    """
+
+    help = 'Генерация схемы OpenAPI в файл, который отдает GET /swagger.json при API_DOCS_DYNAMIC=False'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Путь к файлу схемы (по умолчанию API_SCHEMA_FILE)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Строит схему drf_yasg и атомарно заменяет файл схемы: работающие процессы
+        не прочитают частично записанный файл.
+        """
+
+        if not settings.API_DOCS_DYNAMIC:
+            raise CommandError("Схема строится из описаний drf_yasg: выполните команду с API_DOCS_DYNAMIC=True.")
+
+        output = Path(kwargs['output'] or settings.API_SCHEMA_FILE)
+        content = generate_schema()
+
+        temporary = output.with_name(f'.{output.name}.tmp')
+        try:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_bytes(content)
+            os.replace(temporary, output)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Схема OpenAPI записана в {output}: {len(content)} байт, ETag {hashlib.sha256(content).hexdigest()}"
+        ))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.imports import file_import_id, import_balances, read_balance_records
+
+
+class Command(BaseCommand):
+    """
+    Массовая загрузка начальных балансов кошельков
+    """
+
+    help = 'Загрузка начальных балансов кошельков из CSV (email,balance) пакетами через COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу CSV с заголовком email,balance')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Количество записей в пакете (по умолчанию 10000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только проверить записи и сформировать отчет о различиях')
+        parser.add_argument('--report', default=None,
+                            help='Файл отчета о различиях (CSV: текущий и новый баланс каждого кошелька)')
+        parser.add_argument('--import-id', default=None,
+                            help='Идентификатор импорта для возобновления (по умолчанию SHA-256 файла)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Загружает балансы и выводит прогресс после каждого пакета.
+
+        Прерванный импорт возобновляется повторным запуском с тем же файлом
+        (или --import-id): уже примененные пакеты пропускаются.
+        """
+
+        path = kwargs['path']
+
+        def progress(report: dict) -> None:
+            self.stdout.write(
+                f"Обработано {report['processed']}: изменено {report['updated']}, создано кошельков "
+                f"{report['created']}, без изменений {report['unchanged']}, с ошибками {report['invalid']} "
+                f"({report['rate']} записей/с)"
+            )
+
+        try:
+            import_id = kwargs['import_id'] or file_import_id(path)
+            report_file = open(kwargs['report'], 'wb') if kwargs['report'] else None
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as file:
+                    report = import_balances(read_balance_records(file), import_id, kwargs['chunk_size'],
+                                             kwargs['dry_run'], report_file, progress)
+            finally:
+                if report_file is not None:
+                    report_file.close()
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Запись {error['record']}: {error['error']}")
+        if report['skipped_chunks']:
+            self.stdout.write(f"Пропущено пакетов, примененных ранее: {report['skipped_chunks']}")
+
+        mode = 'Проверка (без изменений)' if kwargs['dry_run'] else 'Импорт'
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode} завершен за {report['elapsed']} с: изменено балансов - {report['updated']}, "
+            f"создано кошельков - {report['created']}"
+        ))
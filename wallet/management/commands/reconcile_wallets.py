@@ -0,0 +1,57 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    """
+    Сверка балансов всех кошельков
+    """
+
+    help = 'Сверка всех кошельков в нескольких процессах с отчетом о расхождениях (NDJSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='reconcile_wallets.ndjson',
+                            help='Файл отчета о расхождениях (по умолчанию reconcile_wallets.ndjson)')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов (по умолчанию - количество ядер)')
+        parser.add_argument('--ranges', type=int, default=None,
+                            help='Количество диапазонов wallet_id (по умолчанию processes * 4)')
+        parser.add_argument('--headroom', type=float, default=0.9,
+                            help='Доля максимального баланса Wallet.balance, выше которой кошелек '
+                                 'близок к переполнению (по умолчанию 0.9)')
+        parser.add_argument('--no-ledger', action='store_true',
+                            help='Не сверять балансы с журналом операций')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Количество строк в пакете серверного курсора (по умолчанию 2000)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Сверяет кошельки и выводит количество расхождений по проверкам.
+
+        Команду следует запускать по расписанию (например, раз в сутки).
+
+        :raises CommandError: Если параметры неверны или найдены расхождения.
+        """
+
+        def progress(report: dict) -> None:
+            self.stdout.write(f"Проверено кошельков {report['wallets']}: расхождений {report['discrepancies']} "
+                              f"({report['rate']} кошельков/с)")
+
+        try:
+            report = reconcile(kwargs['output'], kwargs['processes'], kwargs['ranges'], kwargs['headroom'],
+                               not kwargs['no_ledger'], kwargs['chunk_size'], progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for check, count in sorted(report['checks'].items()):
+            self.stdout.write(f"{check}: {count}")
+
+        if report['discrepancies']:
+            raise CommandError(f"Найдено расхождений: {report['discrepancies']}, отчет - {kwargs['output']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Сверка завершена за {report['elapsed']} с: проверено кошельков - {report['wallets']}, расхождений нет"
+        ))
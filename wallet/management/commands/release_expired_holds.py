@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.services import release_expired_holds
+
+
+class Command(BaseCommand):
+    """
+    Снятие истекших блокировок средств
+    """
+
+    help = 'Снятие истекших блокировок средств кошельков пакетами без ожидания блокировок строк (SKIP LOCKED)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Количество блокировок в пакете (по умолчанию WALLET_HOLDS["SWEEP_BATCH_SIZE"])')
+
+    def handle(self, *args, **kwargs):
+        """
+        Снимает блокировки, истекшие к моменту запуска, и выводит их количество.
+
+        Команду следует запускать по расписанию (например, раз в минуту): блокировки,
+        строки которых были заняты операциями, снимаются следующим запуском.
+        """
+
+        def progress(report: dict) -> None:
+            self.stdout.write(f"Пакетов {report['batches']}: снято блокировок {report['released']}")
+
+        try:
+            report = release_expired_holds(kwargs['batch_size'], progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Истекшие на {report['at'].isoformat()} блокировки сняты за {report['elapsed']} с: "
+            f"{report['released']} (кошельков {report['wallets']})"
+        ))
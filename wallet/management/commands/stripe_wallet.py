@@ -0,0 +1,33 @@
+from django.http import Http404
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.services import set_wallet_stripes
+
+
+class Command(BaseCommand):
+    """
+    Разбиение баланса кошелька на полосы и обратное объединение
+    """
+
+    help = 'Разбиение баланса кошелька на полосы (--stripes 0 - объединение полос)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wallet_id', help='UUID кошелька')
+        parser.add_argument('--stripes', type=int, required=True,
+                            help='Новое количество полос баланса (0 - отключить полосы)')
+
+    def handle(self, *args, **kwargs):
+        """
+        Изменяет количество полос баланса кошелька без остановки операций с ним.
+        """
+
+        try:
+            wallet = set_wallet_stripes(kwargs['wallet_id'], kwargs['stripes'])
+        except (ValueError, ValidationError, Http404) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Кошелек {wallet.wallet_id}: полос баланса - {wallet.stripe_count}, "
+            f"баланс - {wallet.get_total_balance()}"
+        ))
@@ -0,0 +1,419 @@
+import json
+import time
+import uuid
+import random
+import threading
+import http.client
+import multiprocessing
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Optional
+from urllib.parse import urlsplit
+
+import django
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Sum
+from django.db.models.signals import post_save
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from users.models import User, create_wallet
+from wallet.factories import WalletFactory
+from wallet.models import Wallet, WalletTransaction
+
+
+OPERATION_PATH = '/api/v1/wallets/{}/operation/'
+RETRIEVE_PATH = '/api/v1/wallets/{}/'
+
+# Перцентили задержки в отчете.
+PERCENTILES = (50, 95, 99)
+
+
+class HttpClient:
+    """
+    Клиент работающего сервера (--url): одно постоянное HTTP-соединение на поток.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method: str, path: str, data: Optional[dict] = None) -> tuple[int, bytes]:
+        body = json.dumps(data) if data is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class LocalClient:
+    """
+    Клиент без сервера: запросы обрабатываются приложением в текущем процессе (django.test.Client).
+    """
+
+    def __init__(self):
+        host = next((host for host in settings.ALLOWED_HOSTS if host and host != '*' and not host.startswith('.')),
+                    'localhost')
+        # Необработанные исключения приложения возвращаются ответом 500, как на сервере.
+        self.client = Client(HTTP_HOST=host, raise_request_exception=False)
+
+    def request(self, method: str, path: str, data: Optional[dict] = None) -> tuple[int, bytes]:
+        if method == 'GET':
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, data, content_type='application/json')
+        return response.status_code, response.content
+
+    def close(self) -> None:
+        connections.close_all()
+
+
+def _new_result() -> dict:
+    """
+    Результат потока (или процесса) нагрузки.
+    """
+
+    return {
+        'latencies': {'operation': [], 'retrieve': []},
+        'errors': Counter(),
+        'applied': {},
+        'unknown': 0,
+    }
+
+
+def _merge_results(target: dict, result: dict) -> None:
+    """
+    Добавляет результат потока или процесса к target.
+    """
+
+    for kind, latencies in result['latencies'].items():
+        target['latencies'][kind].extend(latencies)
+    target['errors'].update(result['errors'])
+    for wallet_id, amount in result['applied'].items():
+        target['applied'][wallet_id] = target['applied'].get(wallet_id, Decimal('0.00')) + amount
+    target['unknown'] += result['unknown']
+
+
+def _error_class(kind: str, status_code: int, body: bytes) -> str:
+    """
+    Класс ошибки для отчета: вид запроса, код ответа и текст ошибки API.
+    """
+
+    try:
+        message = json.loads(body).get('error')
+    except (ValueError, AttributeError):
+        message = None
+    return f"{kind}: HTTP {status_code}" + (f" {message}" if message else '')
+
+
+def _run_thread(config: dict, count: Optional[int], seed: int, result: dict) -> None:
+    """
+    Выполняет count запросов (или запросы до config['deadline']) и записывает результат в result.
+    """
+
+    rng = random.Random(seed)
+    wallet_ids = config['wallet_ids']
+    hot_ids = wallet_ids[:config['hot_wallets']]
+    client = HttpClient(config['url']) if config['url'] else LocalClient()
+
+    try:
+        sent = 0
+        while (sent < count) if count is not None else (time.time() < config['deadline']):
+            sent += 1
+            if config['distribution'] == 'hot' and rng.random() < config['hot_fraction']:
+                wallet_id = rng.choice(hot_ids)
+            else:
+                wallet_id = rng.choice(wallet_ids)
+
+            if rng.random() < config['read_ratio']:
+                kind, method, path, data = 'retrieve', 'GET', RETRIEVE_PATH.format(wallet_id), None
+            else:
+                operation_type = 'WITHDRAW' if rng.random() < config['withdraw_ratio'] else 'DEPOSIT'
+                amount = Decimal(rng.randint(1, config['max_amount_cents'])) / 100
+                kind, method, path = 'operation', 'POST', OPERATION_PATH.format(wallet_id)
+                data = {'operation_type': operation_type, 'amount': str(amount)}
+
+            started = time.perf_counter()
+            try:
+                status_code, body = client.request(method, path, data)
+            except Exception as e:
+                result['errors'][f"{kind}: {type(e).__name__}"] += 1
+                result['unknown'] += kind == 'operation'
+                continue
+            result['latencies'][kind].append(time.perf_counter() - started)
+
+            if status_code == 200:
+                if kind == 'operation':
+                    delta = amount if operation_type == 'DEPOSIT' else -amount
+                    result['applied'][wallet_id] = result['applied'].get(wallet_id, Decimal('0.00')) + delta
+            else:
+                result['errors'][_error_class(kind, status_code, body)] += 1
+                # Результат операции, завершившейся ошибкой сервера, неизвестен
+                # (кроме 503: операция отклонена из-за конкуренции и не применена).
+                result['unknown'] += kind == 'operation' and status_code >= 500 and status_code != 503
+    finally:
+        client.close()
+
+
+def run_load(config: dict, requests: Optional[int], seed: int) -> dict:
+    """
+    Запускает config['threads'] потоков нагрузки и возвращает их общий результат.
+
+    Args:
+        config (dict): Параметры нагрузки (кошельки, распределение, доли операций).
+        requests (Optional[int]): Количество запросов процесса (None - до config['deadline']).
+        seed (int): Начальное значение генератора случайных чисел.
+    """
+
+    threads_count = config['threads']
+    results = [_new_result() for _ in range(threads_count)]
+    threads = [
+        threading.Thread(
+            target=_run_thread,
+            args=(config,
+                  None if requests is None else requests // threads_count + (index < requests % threads_count),
+                  seed * 1000 + index,
+                  results[index]),
+        )
+        for index in range(threads_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = _new_result()
+    for result in results:
+        _merge_results(total, result)
+    return total
+
+
+def _percentile(values: list, percent: int) -> float:
+    """
+    Перцентиль по методу ближайшего ранга (values отсортирован).
+    """
+
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочное тестирование API операций с кошельками
+    """
+
+    help = 'Нагрузочный тест: операции и чтение баланса из многих потоков или процессов с проверкой балансов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=100,
+                            help='Количество создаваемых кошельков (по умолчанию 100)')
+        parser.add_argument('--initial-balance', type=Decimal, default=Decimal('1000.00'),
+                            help='Начальный баланс кошельков (по умолчанию 1000.00)')
+        parser.add_argument('--requests', type=int, default=10000,
+                            help='Общее количество запросов (по умолчанию 10000)')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Длительность теста в секундах (вместо --requests)')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Количество потоков в каждом процессе (по умолчанию 16)')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Количество процессов (по умолчанию 1)')
+        parser.add_argument('--distribution', choices=['uniform', 'hot'], default='uniform',
+                            help='Выбор кошелька: uniform - равномерно, hot - чаще "горячие" кошельки')
+        parser.add_argument('--hot-wallets', type=int, default=1,
+                            help='Количество "горячих" кошельков (по умолчанию 1)')
+        parser.add_argument('--hot-fraction', type=float, default=0.9,
+                            help='Доля запросов к "горячим" кошелькам (по умолчанию 0.9)')
+        parser.add_argument('--read-ratio', type=float, default=0.2,
+                            help='Доля запросов баланса GET .../<WALLET_UUID>/ (по умолчанию 0.2)')
+        parser.add_argument('--withdraw-ratio', type=float, default=0.5,
+                            help='Доля списаний среди операций (по умолчанию 0.5)')
+        parser.add_argument('--max-amount', type=Decimal, default=Decimal('10.00'),
+                            help='Максимальная сумма операции (по умолчанию 10.00)')
+        parser.add_argument('--url', default=None,
+                            help='Адрес работающего сервера (например, http://localhost:8000); '
+                                 'без него запросы обрабатываются в процессе команды')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Удалить созданных пользователей и кошельки после теста')
+
+    def handle(self, *args, **kwargs):
+        """
+        Создает кошельки фабрикой WalletFactory, выполняет нагрузку и выводит отчет:
+        пропускную способность, перцентили задержки, классы ошибок и проверку балансов.
+
+        :raises CommandError: Если параметры неверны или итоговые балансы не сходятся с журналом операций.
+        """
+
+        self._validate(kwargs)
+
+        wallet_ids = self._create_wallets(kwargs['wallets'], kwargs['initial_balance'])
+        self.stdout.write(f"Создано кошельков: {len(wallet_ids)}")
+
+        config = {
+            'wallet_ids': wallet_ids,
+            'url': kwargs['url'],
+            'threads': kwargs['threads'],
+            'distribution': kwargs['distribution'],
+            'hot_wallets': min(kwargs['hot_wallets'], len(wallet_ids)),
+            'hot_fraction': kwargs['hot_fraction'],
+            'read_ratio': kwargs['read_ratio'],
+            'withdraw_ratio': kwargs['withdraw_ratio'],
+            'max_amount_cents': int(kwargs['max_amount'] * 100),
+            'deadline': time.time() + kwargs['duration'] if kwargs['duration'] else None,
+        }
+        requests = None if kwargs['duration'] else kwargs['requests']
+        seed = kwargs['seed'] if kwargs['seed'] is not None else random.randrange(1 << 30)
+
+        try:
+            started = time.perf_counter()
+            result = self._run(config, requests, seed, kwargs['processes'])
+            elapsed = time.perf_counter() - started
+
+            self._report(result, elapsed)
+            self._check_balances(wallet_ids, kwargs['initial_balance'], result)
+        finally:
+            if kwargs['cleanup']:
+                User.objects.filter(wallet__wallet_id__in=wallet_ids).delete()
+                self.stdout.write("Созданные пользователи и кошельки удалены")
+
+    @staticmethod
+    def _validate(options: dict) -> None:
+        """
+        Проверяет параметры команды.
+
+        :raises CommandError: Если параметр вне допустимого диапазона.
+        """
+
+        for name in ('wallets', 'requests', 'threads', 'processes', 'hot_wallets'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} должно быть положительным числом")
+        for name in ('hot_fraction', 'read_ratio', 'withdraw_ratio'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} должно быть от 0 до 1")
+        if options['duration'] is not None and options['duration'] <= 0:
+            raise CommandError("--duration должно быть положительным числом")
+        if options['max_amount'] < Decimal('0.01'):
+            raise CommandError("--max-amount должно быть не меньше 0.01")
+
+    @staticmethod
+    def _create_wallets(count: int, balance: Decimal) -> list[str]:
+        """
+        Создает пользователей и кошельки фабрикой WalletFactory (сигнал создания кошелька отключается).
+        """
+
+        run = uuid.uuid4().hex[:8]
+        post_save.disconnect(create_wallet, sender=User)
+        try:
+            with transaction.atomic():
+                wallets = [
+                    WalletFactory(balance=balance,
+                                  user__email=f'loadtest-{run}-{number}@example.com',
+                                  user__password=None)
+                    for number in range(count)
+                ]
+        finally:
+            post_save.connect(create_wallet, sender=User)
+        return [str(wallet.wallet_id) for wallet in wallets]
+
+    @staticmethod
+    def _run(config: dict, requests: Optional[int], seed: int, processes: int) -> dict:
+        """
+        Выполняет нагрузку в текущем процессе или в processes процессах.
+        """
+
+        if processes == 1:
+            return run_load(config, requests, seed)
+
+        counts = [None] * processes if requests is None else [
+            requests // processes + (index < requests % processes) for index in range(processes)
+        ]
+        connections.close_all()
+        total = _new_result()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=django.setup) as executor:
+            futures = [executor.submit(run_load, config, count, seed + index) for index, count in enumerate(counts)]
+            for future in futures:
+                _merge_results(total, future.result())
+        return total
+
+    def _report(self, result: dict, elapsed: float) -> None:
+        """
+        Выводит пропускную способность, перцентили задержки и классы ошибок.
+        """
+
+        sent = sum(len(latencies) for latencies in result['latencies'].values())
+        sent += sum(count for error, count in result['errors'].items() if 'HTTP' not in error)
+        self.stdout.write(f"Запросов: {sent} за {elapsed:.2f} с, {sent / elapsed:.1f} запросов/с")
+
+        for kind, latencies in result['latencies'].items():
+            if not latencies:
+                continue
+            latencies.sort()
+            stats = ', '.join(f"p{percent} {_percentile(latencies, percent) * 1000:.2f} мс" for percent in PERCENTILES)
+            self.stdout.write(f"{kind}: {len(latencies)} ответов, {stats}, max {latencies[-1] * 1000:.2f} мс")
+
+        if result['errors']:
+            self.stdout.write("Ошибки:")
+            for error, count in result['errors'].most_common():
+                self.stdout.write(f"  {error} - {count}")
+        else:
+            self.stdout.write("Ошибок нет")
+
+    def _check_balances(self, wallet_ids: list[str], initial_balance: Decimal, result: dict) -> None:
+        """
+        Проверяет инвариант: итоговый баланс каждого кошелька равен начальному балансу
+        плюс сумма операций журнала и (если исход всех операций известен) сумма
+        операций, подтвержденных ответами API.
+
+        :raises CommandError: Если балансы не сходятся.
+        """
+
+        ledger = {}
+        for row in (WalletTransaction.objects.filter(wallet_id__in=wallet_ids)
+                    .values('wallet_id', 'operation_type').annotate(total=Sum('amount'))):
+            sign = 1 if row['operation_type'] in WalletTransaction.CREDIT_TYPES else -1
+            key = str(row['wallet_id'])
+            ledger[key] = ledger.get(key, Decimal('0.00')) + sign * row['total']
+
+        balances = {
+            str(wallet_id): total
+            for wallet_id, total in Wallet.objects.with_total_balance()
+            .filter(wallet_id__in=wallet_ids).values_list('wallet_id', 'total_balance')
+        }
+
+        mismatches = []
+        for wallet_id in wallet_ids:
+            expected = initial_balance + ledger.get(wallet_id, Decimal('0.00'))
+            if balances[wallet_id] != expected:
+                mismatches.append(f"{wallet_id}: баланс {balances[wallet_id]}, по журналу {expected}")
+            if balances[wallet_id] < 0:
+                mismatches.append(f"{wallet_id}: отрицательный баланс {balances[wallet_id]}")
+            if not result['unknown']:
+                expected = initial_balance + result['applied'].get(wallet_id, Decimal('0.00'))
+                if balances[wallet_id] != expected:
+                    mismatches.append(f"{wallet_id}: баланс {balances[wallet_id]}, по ответам API {expected}")
+
+        if result['unknown']:
+            self.stdout.write(self.style.WARNING(
+                f"Исход {result['unknown']} операций неизвестен: сверка с ответами API пропущена"
+            ))
+        if mismatches:
+            raise CommandError("Балансы не сходятся:\n" + '\n'.join(mismatches[:20]))
+
+        total = sum(balances.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Балансы сходятся: {len(wallet_ids)} кошельков, общий баланс {total}"
+        ))
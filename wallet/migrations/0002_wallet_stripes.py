@@ -0,0 +1,33 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='stripe_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Количество полос баланса'),
+        ),
+        migrations.CreateModel(
+            name='WalletStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(verbose_name='Номер полосы')),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=10, verbose_name='Баланс')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripes', to='wallet.wallet', verbose_name='Кошелек')),
+            ],
+            options={
+                'verbose_name': 'Полоса баланса',
+                'verbose_name_plural': 'Полосы баланса',
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'index'), name='wallet_walletstripe_wallet_index_uniq')],
+            },
+        ),
+    ]
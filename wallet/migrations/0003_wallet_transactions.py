@@ -0,0 +1,86 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Таблица журнала секционирована по месяцам, поэтому создается SQL-запросами
+# (те же запросы - в resources/changelog.xml), а Django хранит только состояние модели.
+CREATE_LEDGER_SQL = [
+    """
+    CREATE TABLE wallet_wallettransaction (
+        id bigserial NOT NULL,
+        wallet_id uuid NOT NULL,
+        operation_type varchar(16) NOT NULL,
+        amount numeric(10, 2) NOT NULL,
+        created_at timestamp with time zone NOT NULL,
+        CONSTRAINT wallet_wallettransaction_pkey PRIMARY KEY (id, created_at),
+        CONSTRAINT wallet_wallettransaction_wallet_id_fk_wallet_wallet_wallet_id
+            FOREIGN KEY (wallet_id) REFERENCES wallet_wallet (wallet_id) DEFERRABLE INITIALLY DEFERRED
+    ) PARTITION BY RANGE (created_at)
+    """,
+    """
+    CREATE INDEX wallet_transaction_recent_idx
+        ON wallet_wallettransaction (wallet_id, created_at DESC)
+        INCLUDE (id, operation_type, amount)
+    """,
+    """
+    CREATE TABLE wallet_wallettransaction_default PARTITION OF wallet_wallettransaction DEFAULT
+    """,
+    """
+    CREATE OR REPLACE FUNCTION wallet_wallettransaction_create_partition(month_start date) RETURNS text AS $$
+    DECLARE
+        partition_from timestamptz := date_trunc('month', month_start::timestamp) AT TIME ZONE 'UTC';
+        partition_name text := 'wallet_wallettransaction_' || to_char(month_start, 'YYYYMM');
+    BEGIN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF wallet_wallettransaction FOR VALUES FROM (%L) TO (%L)',
+            partition_name, partition_from, partition_from + interval '1 month'
+        );
+        RETURN partition_name;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    SELECT wallet_wallettransaction_create_partition((date_trunc('month', now()) + interval '1 month' * n)::date)
+      FROM generate_series(0, 2) AS n
+    """,
+]
+
+DROP_LEDGER_SQL = [
+    "DROP TABLE wallet_wallettransaction",
+    "DROP FUNCTION wallet_wallettransaction_create_partition(date)",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_wallet_stripes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_LEDGER_SQL, reverse_sql=DROP_LEDGER_SQL),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='WalletTransaction',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('operation_type', models.CharField(choices=[('DEPOSIT', 'Пополнение'), ('WITHDRAW', 'Списание')], max_length=16, verbose_name='Тип операции')),
+                        ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                        ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата операции')),
+                        ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='wallet.wallet', verbose_name='Кошелек')),
+                    ],
+                    options={
+                        'verbose_name': 'Операция по кошельку',
+                        'verbose_name_plural': 'Операции по кошелькам',
+                        'indexes': [models.Index(fields=['wallet', '-created_at'], include=('id', 'operation_type', 'amount'), name='wallet_transaction_recent_idx')],
+                    },
+                ),
+            ],
+        ),
+    ]
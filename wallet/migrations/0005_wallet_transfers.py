@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wallettransaction',
+            name='operation_type',
+            field=models.CharField(choices=[('DEPOSIT', 'Пополнение'), ('WITHDRAW', 'Списание'), ('TRANSFER_IN', 'Входящий перевод'), ('TRANSFER_OUT', 'Исходящий перевод')], max_length=16, verbose_name='Тип операции'),
+        ),
+    ]
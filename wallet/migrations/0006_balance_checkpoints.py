@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_wallet_transfers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField(verbose_name='Баланс на момент')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Баланс')),
+                ('entries', models.PositiveIntegerField(verbose_name='Записей журнала после предыдущей точки')),
+                ('wallet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='wallet.wallet', verbose_name='Кошелек')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка баланса',
+                'verbose_name_plural': 'Контрольные точки баланса',
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'as_of'), name='wallet_checkpoint_wallet_as_of_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceImportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('import_id', models.CharField(max_length=64, verbose_name='Идентификатор импорта')),
+                ('chunk', models.PositiveIntegerField(verbose_name='Номер пакета')),
+                ('rows', models.PositiveIntegerField(verbose_name='Количество записей')),
+                ('created_at', models.DateTimeField(verbose_name='Дата применения')),
+            ],
+            options={
+                'verbose_name': 'Пакет импорта балансов',
+                'verbose_name_plural': 'Пакеты импорта балансов',
+                'constraints': [models.UniqueConstraint(fields=('import_id', 'chunk'), name='wallet_balance_import_chunk_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_balance_import_chunks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletAdmissionBucket',
+            fields=[
+                ('wallet_id', models.UUIDField(primary_key=True, serialize=False, verbose_name='UUID кошелька')),
+                ('tokens', models.FloatField(verbose_name='Количество токенов')),
+                ('updated_at', models.DateTimeField(db_index=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Корзина токенов кошелька',
+                'verbose_name_plural': 'Корзины токенов кошельков',
+            },
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE wallet_walletadmissionbucket SET UNLOGGED',
+            reverse_sql='ALTER TABLE wallet_walletadmissionbucket SET LOGGED',
+        ),
+    ]
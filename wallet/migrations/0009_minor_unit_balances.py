@@ -0,0 +1,63 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:40
+
+import wallet.models
+from django.db import migrations
+
+
+# Денежные столбцы переводятся из numeric(10, 2) в BIGINT минорных единиц (те же запросы -
+# в resources/changelog.xml). Таблицы перезаписываются под блокировкой ACCESS EXCLUSIVE,
+# поэтому миграцию больших таблиц следует выполнять в окно обслуживания.
+MONEY_COLUMNS = [
+    ('wallet_wallet', 'balance'),
+    ('wallet_walletstripe', 'balance'),
+    ('wallet_wallettransaction', 'amount'),
+    ('wallet_walletbalancecheckpoint', 'balance'),
+]
+
+TO_MINOR_UNITS_SQL = [
+    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE bigint USING round({column} * 100)::bigint"
+    for table, column in MONEY_COLUMNS
+]
+
+# Обратная миграция невозможна для сумм больше 99 999 999.99 (numeric(10, 2)).
+TO_NUMERIC_SQL = [
+    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE numeric(10, 2) USING {column} / 100.0"
+    for table, column in MONEY_COLUMNS
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_wallet_admission_buckets'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(TO_MINOR_UNITS_SQL, reverse_sql=TO_NUMERIC_SQL),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='wallet',
+                    name='balance',
+                    field=wallet.models.MinorUnitsField(default=0, verbose_name='Баланс'),
+                ),
+                migrations.AlterField(
+                    model_name='walletstripe',
+                    name='balance',
+                    field=wallet.models.MinorUnitsField(default=0, verbose_name='Баланс'),
+                ),
+                migrations.AlterField(
+                    model_name='wallettransaction',
+                    name='amount',
+                    field=wallet.models.MinorUnitsField(verbose_name='Сумма'),
+                ),
+                migrations.AlterField(
+                    model_name='walletbalancecheckpoint',
+                    name='balance',
+                    field=wallet.models.MinorUnitsField(verbose_name='Баланс'),
+                ),
+            ],
+        ),
+    ]
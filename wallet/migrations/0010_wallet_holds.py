@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:10
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+import wallet.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_minor_unit_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='held_balance',
+            field=wallet.models.MinorUnitsField(default=0, verbose_name='Заблокировано'),
+        ),
+        migrations.AlterField(
+            model_name='wallettransaction',
+            name='operation_type',
+            field=models.CharField(choices=[('DEPOSIT', 'Пополнение'), ('WITHDRAW', 'Списание'), ('TRANSFER_IN', 'Входящий перевод'), ('TRANSFER_OUT', 'Исходящий перевод'), ('CAPTURE', 'Списание заблокированных средств')], max_length=16, verbose_name='Тип операции'),
+        ),
+        migrations.CreateModel(
+            name='WalletHold',
+            fields=[
+                ('hold_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID блокировки')),
+                ('amount', wallet.models.MinorUnitsField(verbose_name='Сумма')),
+                ('captured_amount', wallet.models.MinorUnitsField(blank=True, null=True, verbose_name='Списанная сумма')),
+                ('status', models.CharField(choices=[('ACTIVE', 'Активна'), ('CAPTURED', 'Списана'), ('RELEASED', 'Снята'), ('EXPIRED', 'Истекла')], default='ACTIVE', max_length=16, verbose_name='Состояние')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата блокировки')),
+                ('expires_at', models.DateTimeField(verbose_name='Срок блокировки')),
+                ('settled_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='wallet.wallet', verbose_name='Кошелек')),
+            ],
+            options={
+                'verbose_name': 'Блокировка средств',
+                'verbose_name_plural': 'Блокировки средств',
+                'indexes': [models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['expires_at'], name='wallet_hold_active_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0010_wallet_holds'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='key',
+            field=models.CharField(max_length=320, primary_key=True, serialize=False, verbose_name='Ключ идемпотентности'),
+        ),
+    ]
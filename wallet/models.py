@@ -1,7 +1,106 @@
 import uuid
 
 from decimal import Decimal
+from django.core import exceptions
 from django.db import models
+from django.utils import timezone
+from django.db.models.functions import Coalesce
+
+
+# Денежные суммы хранятся в базе данных целым числом минорных единиц (копеек, центов)
+# в столбцах BIGINT, в Python и API - Decimal в основных единицах с двумя знаками после точки.
+DECIMAL_PLACES = 2
+MINOR_UNITS = 10 ** DECIMAL_PLACES
+
+
+def to_minor(amount) -> int:
+    """
+    Сумма в минорных единицах для записи в базу данных (0.01 -> 1).
+
+    Дробная часть минорной единицы округляется, как в DecimalField с decimal_places=2.
+    """
+
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int(amount.scaleb(DECIMAL_PLACES).to_integral_value())
+
+
+def from_minor(value) -> Decimal:
+    """
+    Сумма в основных единицах с двумя знаками после точки по сумме в минорных единицах (1 -> 0.01).
+    """
+
+    return Decimal(value).scaleb(-DECIMAL_PLACES)
+
+
+def major_units_sql(expression: str) -> str:
+    """
+    SQL-выражение суммы в основных единицах (numeric с DECIMAL_PLACES знаками после точки)
+    по SQL-выражению в минорных единицах, как from_minor() для выгрузок, которые формирует PostgreSQL.
+    """
+
+    return f"round(({expression})::numeric / {MINOR_UNITS}, {DECIMAL_PLACES})"
+
+
+class MinorUnitsField(models.BigIntegerField):
+    """
+    Денежная сумма: в базе данных - BIGINT в минорных единицах, в Python - Decimal в основных единицах.
+
+    Арифметика и индексы в PostgreSQL работают с целыми числами фиксированного размера
+    вместо numeric. max_digits и decimal_places задают, как у DecimalField, суммы,
+    которые принимают API и импорт: 16 цифр целой части гарантированно помещаются в BIGINT.
+    """
+
+    max_digits = 18
+    decimal_places = DECIMAL_PLACES
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_minor(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(str(value)).quantize(Decimal(1).scaleb(-DECIMAL_PLACES))
+        except ArithmeticError:
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return None if value is None else to_minor(value)
+
+
+def zero_amount() -> models.Value:
+    """
+    Нулевая сумма для выражений ORM с MinorUnitsField (например, Coalesce суммы полос).
+    """
+
+    return models.Value(0, output_field=MinorUnitsField())
+
+
+class WalletQuerySet(models.QuerySet):
+    """
+    Набор запросов для модели кошелька.
+    """
+
+    def with_total_balance(self) -> 'WalletQuerySet':
+        """
+        Добавляет к кошелькам аннотацию total_balance - баланс с учетом полос.
+        """
+
+        stripes_balance = (
+            WalletStripe.objects
+            .filter(wallet_id=models.OuterRef('wallet_id'))
+            .values('wallet_id')
+            .annotate(total=models.Sum('balance'))
+            .values('total')
+        )
+        return self.annotate(
+            total_balance=models.ExpressionWrapper(
+                models.F('balance') + Coalesce(models.Subquery(stripes_balance), zero_amount()),
+                output_field=MinorUnitsField(),
+            )
+        )
 
 
 class Wallet(models.Model):
@@ -10,21 +109,24 @@ class Wallet(models.Model):
 
     Attributes:
         user (models.OneToOneField): Пользователь, которому принадлежит кошелек.
-        balance (models.DecimalField): Текущий баланс кошелька.
+        balance (MinorUnitsField): Текущий баланс кошелька.
+        held_balance (MinorUnitsField): Сумма активных блокировок средств (WalletHold).
         wallet_id (models.UUIDField): Уникальный идентификатор кошелька.
+        stripe_count (models.PositiveSmallIntegerField): Количество полос баланса (0 - кошелек не разбит на полосы).
     """
 
-    objects = models.Manager()
+    objects = WalletQuerySet.as_manager()
 
     user = models.OneToOneField('users.User',
                                 on_delete=models.CASCADE,
                                 verbose_name="Пользователь",
                                 related_name='wallet')
 
-    balance = models.DecimalField(max_digits=10,
-                                  decimal_places=2,
-                                  default=0.0,
-                                  verbose_name="Баланс")
+    balance = MinorUnitsField(default=0,
+                              verbose_name="Баланс")
+
+    held_balance = MinorUnitsField(default=0,
+                                   verbose_name="Заблокировано")
 
     wallet_id = models.UUIDField(unique=True,
                                  primary_key=True,
@@ -32,6 +134,9 @@ class Wallet(models.Model):
                                  editable=False,
                                  verbose_name="ID кошелька")
 
+    stripe_count = models.PositiveSmallIntegerField(default=0,
+                                                    verbose_name="Количество полос баланса")
+
     class Meta:
         """
         Метаданные для определения наименований модели и её поведения.
@@ -49,6 +154,39 @@ class Wallet(models.Model):
 
         return f'Кошелек id[{self.wallet_id}] пользователя {self.user.username}'
 
+    @property
+    def is_striped(self) -> bool:
+        """
+        Признак того, что баланс кошелька распределен по полосам (WalletStripe).
+        """
+
+        return self.stripe_count > 0
+
+    def get_total_balance(self) -> Decimal:
+        """
+        Возвращает полный баланс кошелька: собственный баланс плюс сумма полос.
+
+        Для кошелька без полос, а также если баланс уже получен аннотацией
+        with_total_balance или сервисом операций, дополнительный запрос не выполняется.
+        """
+
+        total_balance = getattr(self, 'total_balance', None)
+        if total_balance is not None:
+            return total_balance
+
+        if not self.is_striped:
+            return self.balance
+
+        stripes_balance = self.stripes.aggregate(total=models.Sum('balance'))['total']
+        return self.balance + (stripes_balance or Decimal('0.00'))
+
+    def get_available_balance(self) -> Decimal:
+        """
+        Возвращает доступный баланс кошелька: полный баланс за вычетом активных блокировок средств.
+        """
+
+        return self.get_total_balance() - self.held_balance
+
     def deposit(self, amount: Decimal) -> None:
         """
         Пополнение баланса.
@@ -57,18 +195,444 @@ class Wallet(models.Model):
         """
 
         self.balance += amount
-        self.save()
+        self.save(update_fields=['balance'])
 
     def withdraw(self, amount: Decimal) -> None:
         """
         Списание средств.
 
         :param amount: Сумма списания.
-        :raises ValueError: Если на счету недостаточно средств.
+        :raises ValueError: Если на счету недостаточно средств (с учетом блокировок).
         """
 
-        if self.balance < amount:
+        if self.balance - self.held_balance < amount:
             raise ValueError("Недостаточно средств на счете")
 
         self.balance -= amount
-        self.save()
+        self.save(update_fields=['balance'])
+
+
+class WalletStripe(models.Model):
+    """
+    Полоса баланса кошелька.
+
+    Баланс "горячего" кошелька может быть распределен по нескольким строкам,
+    чтобы одновременные пополнения не ждали блокировку одной строки Wallet.
+    Полный баланс кошелька равен Wallet.balance плюс сумма балансов его полос.
+
+    Attributes:
+        wallet (models.ForeignKey): Кошелек, которому принадлежит полоса.
+        index (models.PositiveSmallIntegerField): Порядковый номер полосы (от 0 до stripe_count - 1).
+        balance (MinorUnitsField): Баланс полосы.
+    """
+
+    objects = models.Manager()
+
+    wallet = models.ForeignKey(Wallet,
+                               on_delete=models.CASCADE,
+                               verbose_name="Кошелек",
+                               related_name='stripes')
+
+    index = models.PositiveSmallIntegerField(verbose_name="Номер полосы")
+
+    balance = MinorUnitsField(default=0,
+                              verbose_name="Баланс")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Полоса баланса'
+        verbose_name_plural = 'Полосы баланса'
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='wallet_walletstripe_wallet_index_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Полоса {self.index} кошелька id[{self.wallet_id}]'
+
+
+class WalletTransactionQuerySet(models.QuerySet):
+    """
+    Набор запросов для журнала операций кошелька.
+    """
+
+    def replay(self) -> dict:
+        """
+        Проигрывает записи журнала: возвращает изменение баланса (delta) и количество записей (entries).
+        """
+
+        return self.aggregate(delta=Coalesce(models.Sum(signed_amount()), zero_amount()),
+                              entries=models.Count('id'))
+
+
+def signed_amount(prefix: str = '') -> models.Case:
+    """
+    Сумма записи журнала со знаком: положительная для пополнений и входящих переводов.
+
+    Args:
+        prefix (str): Путь к записи журнала в запросе (например, "transactions__").
+    """
+
+    return models.Case(
+        models.When(**{f'{prefix}operation_type__in': WalletTransaction.CREDIT_TYPES},
+                    then=models.F(f'{prefix}amount')),
+        default=-models.F(f'{prefix}amount'),
+        output_field=MinorUnitsField(),
+    )
+
+
+class WalletTransaction(models.Model):
+    """
+    Запись журнала операций кошелька.
+
+    Журнал только пополняется: запись создается в той же транзакции, что и
+    изменение баланса, и после этого не изменяется. В PostgreSQL таблица
+    секционирована по месяцам (RANGE по created_at), первичный ключ таблицы -
+    (id, created_at).
+
+    Attributes:
+        wallet (models.ForeignKey): Кошелек, над которым выполнена операция.
+        operation_type (models.CharField): Тип операции.
+        amount (MinorUnitsField): Сумма операции (всегда положительная).
+        created_at (models.DateTimeField): Дата и время операции.
+    """
+
+    DEPOSIT = 'DEPOSIT'
+    WITHDRAW = 'WITHDRAW'
+    TRANSFER_IN = 'TRANSFER_IN'
+    TRANSFER_OUT = 'TRANSFER_OUT'
+    CAPTURE = 'CAPTURE'
+
+    OPERATION_TYPES = [
+        (DEPOSIT, 'Пополнение'),
+        (WITHDRAW, 'Списание'),
+        (TRANSFER_IN, 'Входящий перевод'),
+        (TRANSFER_OUT, 'Исходящий перевод'),
+        (CAPTURE, 'Списание заблокированных средств'),
+    ]
+
+    # Операции, увеличивающие баланс кошелька.
+    CREDIT_TYPES = (DEPOSIT, TRANSFER_IN)
+
+    objects = WalletTransactionQuerySet.as_manager()
+
+    wallet = models.ForeignKey(Wallet,
+                               on_delete=models.CASCADE,
+                               db_index=False,
+                               verbose_name="Кошелек",
+                               related_name='transactions')
+
+    operation_type = models.CharField(max_length=16,
+                                      choices=OPERATION_TYPES,
+                                      verbose_name="Тип операции")
+
+    amount = MinorUnitsField(verbose_name="Сумма")
+
+    created_at = models.DateTimeField(default=timezone.now,
+                                      verbose_name="Дата операции")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Операция по кошельку'
+        verbose_name_plural = 'Операции по кошелькам'
+        indexes = [
+            models.Index(fields=['wallet', '-created_at'],
+                         include=['id', 'operation_type', 'amount'],
+                         name='wallet_transaction_recent_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'{self.operation_type} {self.amount} кошелька id[{self.wallet_id}] от {self.created_at}'
+
+    def save(self, *args, **kwargs) -> None:
+        """
+        Сохраняет новую запись журнала.
+
+        :raises ValueError: При попытке изменить существующую запись.
+        """
+
+        if not self._state.adding:
+            raise ValueError("Записи журнала операций не изменяются.")
+        super().save(*args, **kwargs)
+
+
+class WalletHold(models.Model):
+    """
+    Блокировка средств кошелька (двухфазное списание: блокировка, затем списание или снятие).
+
+    Сумма активных блокировок кошелька хранится в Wallet.held_balance и
+    изменяется тем же запросом, что и статус блокировки, поэтому доступный
+    баланс не требует суммирования блокировок. Истекшие блокировки снимает
+    команда release_expired_holds.
+
+    Attributes:
+        hold_id (models.UUIDField): Уникальный идентификатор блокировки.
+        wallet (models.ForeignKey): Кошелек, средства которого заблокированы.
+        amount (MinorUnitsField): Заблокированная сумма.
+        captured_amount (MinorUnitsField): Списанная сумма (не больше заблокированной, остаток освобождается).
+        status (models.CharField): Состояние блокировки.
+        created_at (models.DateTimeField): Дата блокировки.
+        expires_at (models.DateTimeField): Дата, после которой блокировка снимается.
+        settled_at (models.DateTimeField): Дата списания или снятия блокировки.
+    """
+
+    ACTIVE = 'ACTIVE'
+    CAPTURED = 'CAPTURED'
+    RELEASED = 'RELEASED'
+    EXPIRED = 'EXPIRED'
+
+    STATUSES = [
+        (ACTIVE, 'Активна'),
+        (CAPTURED, 'Списана'),
+        (RELEASED, 'Снята'),
+        (EXPIRED, 'Истекла'),
+    ]
+
+    objects = models.Manager()
+
+    hold_id = models.UUIDField(primary_key=True,
+                               default=uuid.uuid4,
+                               editable=False,
+                               verbose_name="ID блокировки")
+
+    wallet = models.ForeignKey(Wallet,
+                               on_delete=models.CASCADE,
+                               verbose_name="Кошелек",
+                               related_name='holds')
+
+    amount = MinorUnitsField(verbose_name="Сумма")
+
+    captured_amount = MinorUnitsField(null=True,
+                                      blank=True,
+                                      verbose_name="Списанная сумма")
+
+    status = models.CharField(max_length=16,
+                              choices=STATUSES,
+                              default=ACTIVE,
+                              verbose_name="Состояние")
+
+    created_at = models.DateTimeField(default=timezone.now,
+                                      verbose_name="Дата блокировки")
+
+    expires_at = models.DateTimeField(verbose_name="Срок блокировки")
+
+    settled_at = models.DateTimeField(null=True,
+                                      blank=True,
+                                      verbose_name="Дата завершения")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Блокировка средств'
+        verbose_name_plural = 'Блокировки средств'
+        indexes = [
+            # Очередь истекающих блокировок: индекс содержит только активные блокировки.
+            models.Index(fields=['expires_at'],
+                         condition=models.Q(status='ACTIVE'),
+                         name='wallet_hold_active_expires_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Блокировка {self.amount} кошелька id[{self.wallet_id}] ({self.status})'
+
+
+class WalletBalanceCheckpoint(models.Model):
+    """
+    Контрольная точка баланса кошелька.
+
+    Баланс кошелька на момент as_of с учетом всех записей журнала операций,
+    созданных не позже этого момента. Баланс на произвольный момент вычисляется
+    от ближайшей контрольной точки проигрыванием только записей журнала между
+    ними. Точки создает команда create_balance_checkpoints.
+
+    Attributes:
+        wallet (models.ForeignKey): Кошелек.
+        as_of (models.DateTimeField): Момент, на который вычислен баланс.
+        balance (MinorUnitsField): Баланс кошелька (с учетом полос) на момент as_of.
+        entries (models.PositiveIntegerField): Количество записей журнала после предыдущей точки.
+    """
+
+    objects = models.Manager()
+
+    wallet = models.ForeignKey(Wallet,
+                               on_delete=models.CASCADE,
+                               db_index=False,
+                               verbose_name="Кошелек",
+                               related_name='checkpoints')
+
+    as_of = models.DateTimeField(verbose_name="Баланс на момент")
+
+    balance = MinorUnitsField(verbose_name="Баланс")
+
+    entries = models.PositiveIntegerField(verbose_name="Записей журнала после предыдущей точки")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Контрольная точка баланса'
+        verbose_name_plural = 'Контрольные точки баланса'
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'as_of'], name='wallet_checkpoint_wallet_as_of_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Баланс {self.balance} кошелька id[{self.wallet_id}] на {self.as_of}'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохраненный ответ на запрос с заголовком Idempotency-Key.
+
+    Attributes:
+        key (models.CharField): Ключ идемпотентности с префиксом клиента (пользователь либо IP-адрес).
+        fingerprint (models.CharField): Отпечаток данных исходного запроса.
+        status_code (models.PositiveSmallIntegerField): Код ответа (пусто, пока запрос выполняется).
+        response (models.JSONField): Данные ответа.
+        created_at (models.DateTimeField): Дата захвата ключа.
+        expires_at (models.DateTimeField): Дата, после которой ключ считается устаревшим.
+    """
+
+    objects = models.Manager()
+
+    key = models.CharField(max_length=320,
+                           primary_key=True,
+                           verbose_name="Ключ идемпотентности")
+
+    fingerprint = models.CharField(max_length=64,
+                                   verbose_name="Отпечаток запроса")
+
+    status_code = models.PositiveSmallIntegerField(null=True,
+                                                   blank=True,
+                                                   verbose_name="Код ответа")
+
+    response = models.JSONField(null=True,
+                                blank=True,
+                                verbose_name="Ответ")
+
+    created_at = models.DateTimeField(verbose_name="Дата создания")
+
+    expires_at = models.DateTimeField(db_index=True,
+                                      verbose_name="Срок хранения")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Ключ идемпотентности {self.key}'
+
+
+class BalanceImportChunk(models.Model):
+    """
+    Пакет импорта начальных балансов, примененный командой import_balances.
+
+    Запись добавляется в той же транзакции, что и изменение балансов пакета,
+    поэтому повторный запуск прерванного импорта пропускает уже примененные пакеты.
+
+    Attributes:
+        import_id (models.CharField): Идентификатор импорта (по умолчанию SHA-256 файла).
+        chunk (models.PositiveIntegerField): Номер пакета (с 0).
+        rows (models.PositiveIntegerField): Количество записей пакета.
+        created_at (models.DateTimeField): Дата применения пакета.
+    """
+
+    objects = models.Manager()
+
+    import_id = models.CharField(max_length=64,
+                                 verbose_name="Идентификатор импорта")
+
+    chunk = models.PositiveIntegerField(verbose_name="Номер пакета")
+
+    rows = models.PositiveIntegerField(verbose_name="Количество записей")
+
+    created_at = models.DateTimeField(verbose_name="Дата применения")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Пакет импорта балансов'
+        verbose_name_plural = 'Пакеты импорта балансов'
+        constraints = [
+            models.UniqueConstraint(fields=['import_id', 'chunk'], name='wallet_balance_import_chunk_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Пакет {self.chunk} импорта балансов {self.import_id}'
+
+
+class WalletAdmissionBucket(models.Model):
+    """
+    Корзина токенов кошелька для ограничения частоты операций (wallet.admission.DatabaseAdmissionController).
+
+    Таблица нежурналируемая (UNLOGGED): запись корзины не создает WAL, а после
+    сбоя PostgreSQL таблица очищается, что равносильно полным корзинам.
+
+    Attributes:
+        wallet_id (models.UUIDField): UUID кошелька (без внешнего ключа: корзина проверяется до загрузки кошелька).
+        tokens (models.FloatField): Количество токенов на момент updated_at.
+        updated_at (models.DateTimeField): Дата последнего изменения корзины.
+    """
+
+    objects = models.Manager()
+
+    wallet_id = models.UUIDField(primary_key=True,
+                                 verbose_name="UUID кошелька")
+
+    tokens = models.FloatField(verbose_name="Количество токенов")
+
+    updated_at = models.DateTimeField(db_index=True,
+                                      verbose_name="Дата изменения")
+
+    class Meta:
+        """
+        Метаданные для определения наименований модели и её поведения.
+        """
+
+        verbose_name = 'Корзина токенов кошелька'
+        verbose_name_plural = 'Корзины токенов кошельков'
+
+    def __str__(self) -> str:
+        """
+        Возвращает строковое представление модели.
+        """
+
+        return f'Корзина токенов кошелька {self.wallet_id}'
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import uuid
+import multiprocessing
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Callable, Iterator, Optional
+
+import django
+
+from django.db import connections, transaction
+
+from users.models import User
+from wallet.models import Wallet, WalletBalanceCheckpoint, WalletHold, WalletStripe, WalletTransaction, from_minor
+from utilities.logger_utils import logger
+
+
+WALLET_TABLE = Wallet._meta.db_table
+STRIPE_TABLE = WalletStripe._meta.db_table
+LEDGER_TABLE = WalletTransaction._meta.db_table
+CHECKPOINT_TABLE = WalletBalanceCheckpoint._meta.db_table
+HOLD_TABLE = WalletHold._meta.db_table
+USER_TABLE = User._meta.db_table
+
+CREDIT_TYPES_SQL = ', '.join(f"'{operation_type}'" for operation_type in WalletTransaction.CREDIT_TYPES)
+
+# Максимальный баланс Wallet.balance, который принимают API и импорт (MinorUnitsField.max_digits).
+BALANCE_FIELD = Wallet._meta.get_field('balance')
+MAX_BALANCE = Decimal(10) ** (BALANCE_FIELD.max_digits - BALANCE_FIELD.decimal_places) - \
+    Decimal(10) ** -BALANCE_FIELD.decimal_places
+
+# Проверки сверки.
+NEGATIVE_BALANCE = 'negative_balance'
+BALANCE_HEADROOM = 'balance_headroom'
+STRIPE_COUNT_MISMATCH = 'stripe_count_mismatch'
+LEDGER_MISMATCH = 'ledger_mismatch'
+HELD_BALANCE_MISMATCH = 'held_balance_mismatch'
+USER_WITHOUT_WALLET = 'user_without_wallet'
+
+# Кошельки диапазона [%(start)s, %(stop)s) с балансами полос, суммой активных блокировок
+# средств (в минорных единицах) и, если %(ledger)s,
+# ожидаемым по журналу балансом: баланс последней контрольной точки плюс записи
+# журнала после нее. Начальный баланс кошелька не имеет записи в журнале, поэтому
+# журнал сверяется только для кошельков с контрольными точками.
+RECONCILE_SQL = f"""
+    SELECT w.wallet_id, w.user_id, w.balance, w.stripe_count,
+           s.count, s.total, s.min_balance, l.expected, w.held_balance, h.total
+      FROM {WALLET_TABLE} w
+     CROSS JOIN LATERAL (SELECT count(*) AS count,
+                                COALESCE(SUM(balance), 0) AS total,
+                                MIN(balance) AS min_balance
+                           FROM {STRIPE_TABLE}
+                          WHERE wallet_id = w.wallet_id) s
+     CROSS JOIN LATERAL (SELECT COALESCE(SUM(amount), 0) AS total
+                           FROM {HOLD_TABLE}
+                          WHERE wallet_id = w.wallet_id
+                            AND status = 'ACTIVE') h
+      LEFT JOIN LATERAL (
+          SELECT c.balance + COALESCE((
+                     SELECT SUM(CASE WHEN t.operation_type IN ({CREDIT_TYPES_SQL}) THEN t.amount ELSE -t.amount END)
+                       FROM {LEDGER_TABLE} t
+                      WHERE t.wallet_id = w.wallet_id
+                        AND t.created_at > c.as_of), 0) AS expected
+            FROM {CHECKPOINT_TABLE} c
+           WHERE %(ledger)s
+             AND c.wallet_id = w.wallet_id
+           ORDER BY c.as_of DESC
+           LIMIT 1
+      ) l ON TRUE
+     WHERE w.wallet_id >= %(start)s
+       AND (%(stop)s::uuid IS NULL OR w.wallet_id < %(stop)s)
+"""
+
+# Пользователи без кошелька. Второй кошелек пользователя невозможен: Wallet.user - OneToOneField.
+USERS_WITHOUT_WALLET_SQL = f"""
+    SELECT u.id, u.email
+      FROM {USER_TABLE} u
+     WHERE NOT EXISTS (SELECT 1 FROM {WALLET_TABLE} w WHERE w.user_id = u.id)
+"""
+
+
+def wallet_ranges(count: int) -> list[tuple[str, Optional[str]]]:
+    """
+    Делит пространство wallet_id на count равных диапазонов [start, stop) (stop последнего - None).
+
+    UUID кошельков (версия 4) распределены равномерно, поэтому диапазоны
+    содержат примерно одинаковое количество кошельков.
+    """
+
+    if count < 1:
+        raise ValueError("Количество диапазонов должно быть положительным.")
+
+    bounds = [str(uuid.UUID(int=(index << 128) // count)) for index in range(count)]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _stream(sql: str, params: dict, chunk_size: int) -> Iterator[tuple]:
+    """
+    Читает строки запроса серверным курсором пакетами по chunk_size в транзакции только для чтения.
+
+    Чтение не блокирует строки, а транзакция длится только до конца диапазона.
+    """
+
+    connection = connections['default']
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while rows := cursor.fetchmany(chunk_size):
+                yield from rows
+
+
+def _check_wallet(row: tuple, headroom: Decimal) -> Iterator[dict]:
+    """
+    Проверяет кошелек и возвращает найденные расхождения.
+    """
+
+    wallet_id, user_id, balance, stripe_count, stripes, stripes_total, stripes_min, expected, held, holds_total = row
+    balance, stripes_total = from_minor(balance), from_minor(stripes_total)
+    held, holds_total = from_minor(held), from_minor(holds_total)
+    stripes_min = None if stripes_min is None else from_minor(stripes_min)
+    expected = None if expected is None else from_minor(expected)
+    total = balance + stripes_total
+    found = {'wallet_id': str(wallet_id), 'user_id': user_id}
+
+    if balance < 0 or total < 0 or (stripes_min is not None and stripes_min < 0):
+        yield {**found, 'check': NEGATIVE_BALANCE, 'balance': str(balance), 'total_balance': str(total),
+               'min_stripe_balance': None if stripes_min is None else str(stripes_min)}
+    if total > headroom:
+        yield {**found, 'check': BALANCE_HEADROOM, 'total_balance': str(total), 'max_balance': str(MAX_BALANCE)}
+    if stripe_count != stripes:
+        yield {**found, 'check': STRIPE_COUNT_MISMATCH, 'stripe_count': stripe_count, 'stripes': stripes}
+    if expected is not None and expected != total:
+        yield {**found, 'check': LEDGER_MISMATCH, 'total_balance': str(total), 'ledger_balance': str(expected)}
+    if held != holds_total or (held and held > total):
+        yield {**found, 'check': HELD_BALANCE_MISMATCH, 'held_balance': str(held), 'active_holds': str(holds_total),
+               'total_balance': str(total)}
+
+
+def reconcile_range(start: str, stop: Optional[str], path: str, headroom: Decimal, ledger: bool,
+                    chunk_size: int) -> dict:
+    """
+    Сверяет кошельки диапазона [start, stop) и записывает расхождения в файл path (NDJSON).
+
+    Args:
+        start (str): Начало диапазона wallet_id.
+        stop (Optional[str]): Конец диапазона (не включается), None - до конца.
+        path (str): Файл расхождений диапазона.
+        headroom (Decimal): Баланс, выше которого кошелек близок к переполнению Wallet.balance.
+        ledger (bool): Сверять балансы с журналом операций.
+        chunk_size (int): Количество строк в пакете серверного курсора.
+
+    Returns:
+        dict: wallets (проверено кошельков), checks (количество расхождений по проверкам), path.
+    """
+
+    wallets = 0
+    checks = Counter()
+    params = {'start': start, 'stop': stop, 'ledger': ledger}
+
+    with open(path, 'w', encoding='utf-8') as file:
+        for row in _stream(RECONCILE_SQL, params, chunk_size):
+            wallets += 1
+            for discrepancy in _check_wallet(row, headroom):
+                checks[discrepancy['check']] += 1
+                file.write(json.dumps(discrepancy, ensure_ascii=False) + '\n')
+
+    return {'wallets': wallets, 'checks': dict(checks), 'path': path}
+
+
+def find_users_without_wallet(path: str, chunk_size: int) -> dict:
+    """
+    Записывает в файл path (NDJSON) пользователей без кошелька.
+
+    Returns:
+        dict: wallets (0), checks, path - как reconcile_range.
+    """
+
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for user_id, email in _stream(USERS_WITHOUT_WALLET_SQL, {}, chunk_size):
+            count += 1
+            file.write(json.dumps({'check': USER_WITHOUT_WALLET, 'user_id': user_id, 'email': email},
+                                  ensure_ascii=False) + '\n')
+
+    return {'wallets': 0, 'checks': {USER_WITHOUT_WALLET: count} if count else {}, 'path': path}
+
+
+def _run_in_worker(database_name: str, func: Callable, args: tuple) -> dict:
+    """
+    Выполняет задачу сверки в процессе пула с той же базой данных, что у запустившего процесса.
+    """
+
+    connections['default'].settings_dict['NAME'] = database_name
+    return func(*args)
+
+
+def reconcile(output: str, processes: int = 1, ranges: Optional[int] = None, headroom: float = 0.9,
+              ledger: bool = True, chunk_size: int = 2000,
+              progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Сверяет все кошельки и записывает расхождения в файл output (NDJSON, одно расхождение в строке).
+
+    Пространство wallet_id делится на ranges диапазонов, которые обрабатывают
+    processes процессов; каждый процесс читает свой диапазон серверным курсором
+    и записывает расхождения в свой файл, поэтому расход памяти не зависит от
+    количества кошельков. Каждый диапазон читается одним запросом в отдельной
+    транзакции только для чтения, без блокировок строк.
+
+    Проверки: отрицательный баланс (кошелька, полосы или общий), общий баланс выше
+    доли headroom от максимального значения Wallet.balance, количество полос
+    не совпадает со stripe_count, баланс не совпадает с журналом операций
+    (для кошельков с контрольными точками, если ledger), пользователь без кошелька.
+
+    Args:
+        output (str): Файл отчета о расхождениях.
+        processes (int): Количество процессов (1 - в текущем процессе).
+        ranges (Optional[int]): Количество диапазонов wallet_id (по умолчанию processes * 4).
+        headroom (float): Доля максимального баланса, выше которой кошелек близок к переполнению.
+        ledger (bool): Сверять балансы с журналом операций.
+        chunk_size (int): Количество строк в пакете серверного курсора.
+        progress (Optional[Callable]): Вызывается после каждого диапазона с текущим отчетом.
+
+    Returns:
+        dict: wallets (проверено кошельков), discrepancies (всего расхождений), checks (по проверкам),
+        elapsed (секунды), rate (кошельков в секунду).
+    """
+
+    if processes < 1 or chunk_size < 1:
+        raise ValueError("Количество процессов и размер пакета должны быть положительными.")
+    if not 0 < headroom <= 1:
+        raise ValueError("Доля максимального баланса должна быть от 0 до 1.")
+
+    headroom = (MAX_BALANCE * Decimal(str(headroom))).quantize(MAX_BALANCE)
+    tasks = [(reconcile_range, (start, stop, f'{output}.part{index}', headroom, ledger, chunk_size))
+             for index, (start, stop) in enumerate(wallet_ranges(ranges or processes * 4))]
+    tasks.append((find_users_without_wallet, (f'{output}.users', chunk_size)))
+
+    report = {'wallets': 0, 'discrepancies': 0, 'checks': {}, 'elapsed': 0.0, 'rate': 0.0}
+    checks = Counter()
+    started = time.monotonic()
+
+    with open(output, 'w', encoding='utf-8') as file:
+        def add(result: dict) -> None:
+            report['wallets'] += result['wallets']
+            checks.update(result['checks'])
+            report['checks'] = dict(checks)
+            report['discrepancies'] = sum(checks.values())
+            report['elapsed'] = round(time.monotonic() - started, 3)
+            report['rate'] = round(report['wallets'] / report['elapsed'], 1) if report['elapsed'] else 0.0
+
+            with open(result['path'], encoding='utf-8') as part:
+                for line in part:
+                    file.write(line)
+            os.remove(result['path'])
+
+            if progress is not None:
+                progress(report)
+
+        if processes == 1:
+            for func, args in tasks:
+                add(func(*args))
+        else:
+            database_name = connections['default'].settings_dict['NAME']
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=django.setup) as executor:
+                futures = [executor.submit(_run_in_worker, database_name, func, args) for func, args in tasks]
+                for future in as_completed(futures):
+                    add(future.result())
+
+    logger.info("Сверка кошельков завершена: проверено %s, расхождений %s за %s с",
+                report['wallets'], report['discrepancies'], report['elapsed'])
+    return report
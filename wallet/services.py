@@ -1,19 +1,314 @@
-from django.db import transaction
+import time
+import random
+import itertools
+
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
 from django.core.exceptions import ObjectDoesNotExist
 
 from decimal import Decimal
 
 from django.http import Http404
+from django.utils import timezone
 
-from wallet.models import Wallet
+from wallet.cache import get_balance_cache
+from utilities.db_routing import pin_to_primary, wallet_key
+from utilities.metrics import LOCK_WAIT, OPERATION_OUTCOMES
+from wallet.models import Wallet, WalletHold, WalletStripe, WalletTransaction, from_minor, to_minor
+from wallet.transactions import TransactionContention, retrying_atomic
 from utilities.logger_utils import logger
 
 
-@transaction.atomic
+WALLET_TABLE = Wallet._meta.db_table
+STRIPE_TABLE = WalletStripe._meta.db_table
+LEDGER_TABLE = WalletTransaction._meta.db_table
+HOLD_TABLE = WalletHold._meta.db_table
+
+# Суммы в запросах - в минорных единицах (to_minor), балансы в результатах переводятся from_minor.
+# Кошельки с полосами (stripe_count > 0) не затрагиваются этими запросами:
+# для них пополнения идут в полосы, а списания - через _withdraw_striped.
+# Запись журнала операций добавляется тем же запросом, что и изменение баланса.
+# Списание не может использовать заблокированные средства (held_balance).
+DEPOSIT_SQL = f"""
+    WITH changed AS (
+        UPDATE {WALLET_TABLE}
+           SET balance = balance + %s
+         WHERE wallet_id = %s
+           AND stripe_count = 0
+     RETURNING wallet_id, user_id, balance
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id, 'DEPOSIT', %s, %s FROM changed
+    )
+    SELECT wallet_id, user_id, balance FROM changed
+"""
+
+WITHDRAW_SQL = f"""
+    WITH changed AS (
+        UPDATE {WALLET_TABLE}
+           SET balance = balance - %s
+         WHERE wallet_id = %s
+           AND stripe_count = 0
+           AND balance - held_balance >= %s
+     RETURNING wallet_id, user_id, balance
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id, 'WITHDRAW', %s, %s FROM changed
+    )
+    SELECT wallet_id, user_id, balance FROM changed
+"""
+
+# Пополнение одной полосы кошелька. Номер полосы вычисляется как
+# mod(<номер попытки>, stripe_count), строка Wallet при этом не блокируется.
+STRIPE_DEPOSIT_SQL = f"""
+    WITH stripe AS (
+        UPDATE {STRIPE_TABLE}
+           SET balance = balance + %s
+         WHERE wallet_id = %s
+           AND index = (SELECT mod(%s, stripe_count)
+                          FROM {WALLET_TABLE}
+                         WHERE wallet_id = %s
+                           AND stripe_count > 0)
+     RETURNING wallet_id, index, balance
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id, 'DEPOSIT', %s, %s FROM stripe
+    )
+    SELECT w.wallet_id,
+           w.user_id,
+           w.balance + stripe.balance + COALESCE((SELECT SUM(s.balance)
+                                                    FROM {STRIPE_TABLE} s
+                                                   WHERE s.wallet_id = w.wallet_id
+                                                     AND s.index <> stripe.index), 0)
+      FROM stripe
+      JOIN {WALLET_TABLE} w ON w.wallet_id = stripe.wallet_id
+"""
+
+# Перевод между кошельками без полос одним запросом: оба кошелька блокируются
+# в порядке возрастания wallet_id (ORDER BY ... FOR UPDATE), поэтому встречные
+# переводы A -> B и B -> A не блокируют друг друга взаимно. Балансы изменяются,
+# только если оба кошелька найдены, не разбиты на полосы и на счете отправителя
+# достаточно незаблокированных средств; обе записи журнала добавляются тем же запросом.
+TRANSFER_SQL = f"""
+    WITH locked AS (
+        SELECT wallet_id, balance, held_balance, stripe_count
+          FROM {WALLET_TABLE}
+         WHERE wallet_id IN (%(source)s, %(destination)s)
+         ORDER BY wallet_id
+           FOR UPDATE
+    ), checked AS (
+        SELECT count(*) = 2
+               AND bool_and(stripe_count = 0)
+               AND bool_or(wallet_id = %(source)s AND balance - held_balance >= %(amount)s) AS allowed
+          FROM locked
+    ), changed AS (
+        UPDATE {WALLET_TABLE} w
+           SET balance = w.balance + CASE WHEN w.wallet_id = %(destination)s THEN %(amount)s ELSE -%(amount)s END
+          FROM checked
+         WHERE checked.allowed
+           AND w.wallet_id IN (%(source)s, %(destination)s)
+     RETURNING w.wallet_id, w.user_id, w.balance
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id,
+               CASE WHEN wallet_id = %(destination)s THEN 'TRANSFER_IN' ELSE 'TRANSFER_OUT' END,
+               %(amount)s,
+               %(created_at)s
+          FROM changed
+    )
+    SELECT wallet_id, user_id, balance FROM changed
+"""
+
+# Блокировка средств кошелька без полос одним запросом: held_balance увеличивается,
+# только если незаблокированных средств достаточно, блокировка добавляется тем же запросом.
+HOLD_SQL = f"""
+    WITH changed AS (
+        UPDATE {WALLET_TABLE}
+           SET held_balance = held_balance + %(amount)s
+         WHERE wallet_id = %(wallet)s
+           AND stripe_count = 0
+           AND balance - held_balance >= %(amount)s
+     RETURNING wallet_id, user_id, balance, held_balance
+    ), hold AS (
+        INSERT INTO {HOLD_TABLE} (hold_id, wallet_id, amount, status, created_at, expires_at)
+        SELECT %(hold)s, wallet_id, %(amount)s, 'ACTIVE', %(now)s, %(expires_at)s FROM changed
+    )
+    SELECT wallet_id, user_id, balance, held_balance FROM changed
+"""
+
+# Списание активной неистекшей блокировки кошелька без полос одним запросом: строка
+# кошелька блокируется первой (как при блокировке средств и операциях), затем
+# блокировка переводится в CAPTURED, с баланса списывается %(amount)s (NULL - вся
+# заблокированная сумма), held_balance уменьшается на всю заблокированную сумму,
+# запись журнала CAPTURE добавляется тем же запросом. Списание, после которого
+# баланс стал бы меньше остальных заблокированных средств, не выполняется.
+CAPTURE_SQL = f"""
+    WITH locked AS (
+        SELECT wallet_id, balance, held_balance
+          FROM {WALLET_TABLE}
+         WHERE wallet_id = (SELECT wallet_id FROM {HOLD_TABLE} WHERE hold_id = %(hold)s)
+           AND stripe_count = 0
+           FOR UPDATE
+    ), hold AS (
+        UPDATE {HOLD_TABLE} h
+           SET status = 'CAPTURED',
+               captured_amount = COALESCE(%(amount)s::bigint, h.amount),
+               settled_at = %(now)s
+          FROM locked
+         WHERE h.hold_id = %(hold)s
+           AND h.wallet_id = locked.wallet_id
+           AND h.status = 'ACTIVE'
+           AND h.expires_at > %(now)s
+           AND h.amount >= COALESCE(%(amount)s::bigint, h.amount)
+           AND locked.balance - (locked.held_balance - h.amount) >= COALESCE(%(amount)s::bigint, h.amount)
+     RETURNING h.hold_id, h.wallet_id, h.amount, h.captured_amount, h.created_at, h.expires_at
+    ), changed AS (
+        UPDATE {WALLET_TABLE} w
+           SET balance = w.balance - hold.captured_amount,
+               held_balance = w.held_balance - hold.amount
+          FROM hold
+         WHERE w.wallet_id = hold.wallet_id
+     RETURNING w.wallet_id, w.user_id, w.balance, w.held_balance
+    ), entry AS (
+        INSERT INTO {LEDGER_TABLE} (wallet_id, operation_type, amount, created_at)
+        SELECT wallet_id, 'CAPTURE', captured_amount, %(now)s FROM hold
+    )
+    SELECT c.wallet_id, c.user_id, c.balance, c.held_balance, c.balance,
+           h.amount, h.captured_amount, h.created_at, h.expires_at
+      FROM changed c
+      JOIN hold h ON h.wallet_id = c.wallet_id
+"""
+
+# Снятие активной блокировки одним запросом (в том числе для кошельков с полосами:
+# held_balance хранится в строке кошелька, баланс не изменяется). Порядок блокировки
+# строк тот же, что в CAPTURE_SQL: кошелек, затем блокировка средств.
+RELEASE_SQL = f"""
+    WITH locked AS (
+        SELECT wallet_id
+          FROM {WALLET_TABLE}
+         WHERE wallet_id = (SELECT wallet_id FROM {HOLD_TABLE} WHERE hold_id = %(hold)s)
+           FOR UPDATE
+    ), hold AS (
+        UPDATE {HOLD_TABLE} h
+           SET status = 'RELEASED',
+               settled_at = %(now)s
+          FROM locked
+         WHERE h.hold_id = %(hold)s
+           AND h.wallet_id = locked.wallet_id
+           AND h.status = 'ACTIVE'
+     RETURNING h.hold_id, h.wallet_id, h.amount, h.captured_amount, h.created_at, h.expires_at
+    ), changed AS (
+        UPDATE {WALLET_TABLE} w
+           SET held_balance = w.held_balance - hold.amount
+          FROM hold
+         WHERE w.wallet_id = hold.wallet_id
+     RETURNING w.wallet_id, w.user_id, w.balance, w.held_balance
+    )
+    SELECT c.wallet_id, c.user_id, c.balance, c.held_balance,
+           c.balance + COALESCE((SELECT SUM(s.balance)
+                                   FROM {STRIPE_TABLE} s
+                                  WHERE s.wallet_id = c.wallet_id), 0),
+           h.amount, h.captured_amount, h.created_at, h.expires_at
+      FROM changed c
+      JOIN hold h ON h.wallet_id = c.wallet_id
+"""
+
+# Снятие пакета истекших блокировок (не более %(limit)s, истекших не позже %(now)s).
+# Блокировки и их кошельки, строки которых заблокированы другими транзакциями,
+# пропускаются (SKIP LOCKED): запрос не ждет операций с кошельками и не задерживает их.
+# held_balance каждого кошелька уменьшается одним UPDATE на сумму его истекших блокировок.
+EXPIRE_HOLDS_SQL = f"""
+    WITH expired AS (
+        SELECT h.hold_id
+          FROM {HOLD_TABLE} h
+          JOIN {WALLET_TABLE} w ON w.wallet_id = h.wallet_id
+         WHERE h.status = 'ACTIVE'
+           AND h.expires_at <= %(now)s
+         ORDER BY h.expires_at
+         LIMIT %(limit)s
+           FOR UPDATE OF h, w SKIP LOCKED
+    ), released AS (
+        UPDATE {HOLD_TABLE} h
+           SET status = 'EXPIRED',
+               settled_at = %(now)s
+          FROM expired
+         WHERE h.hold_id = expired.hold_id
+     RETURNING h.wallet_id, h.amount
+    ), totals AS (
+        SELECT wallet_id, SUM(amount)::bigint AS amount
+          FROM released
+         GROUP BY wallet_id
+    ), changed AS (
+        UPDATE {WALLET_TABLE} w
+           SET held_balance = w.held_balance - totals.amount
+          FROM totals
+         WHERE w.wallet_id = totals.wallet_id
+     RETURNING w.wallet_id
+    )
+    SELECT (SELECT count(*) FROM released), (SELECT count(*) FROM changed)
+"""
+
+# Количество попыток операции, если во время нее у кошелька изменилось число полос.
+STRIPE_RETRIES = 3
+
+_round_robin = itertools.count()
+
+
+def _next_stripe_seed() -> int:
+    """
+    Возвращает число, по которому выбирается полоса для пополнения
+    (согласно настройке WALLET_STRIPE_STRATEGY).
+    """
+
+    if settings.WALLET_STRIPE_STRATEGY == 'round_robin':
+        return next(_round_robin)
+    return random.getrandbits(31)
+
+
+def _balance_changed(wallet_ids: Iterable) -> None:
+    """
+    После фиксации транзакции закрепляет чтения кошельков за основной базой
+    данных, пока реплики не получат изменения, и удаляет балансы кошельков из кэша.
+
+    Закрепление выполняется до удаления из кэша: промах кэша после удаления
+    уже не прочитает с отстающей реплики баланс до операции.
+    """
+
+    wallet_ids = list(wallet_ids)
+
+    def changed():
+        pin_to_primary(wallet_key(wallet_id) for wallet_id in wallet_ids)
+        get_balance_cache().invalidate(wallet_ids)
+
+    transaction.on_commit(changed)
+
+
+def _count_outcome(operation_type: str, outcome: str) -> None:
+    """
+    Учитывает результат операции в метрике OPERATION_OUTCOMES после фиксации транзакции.
+
+    Результат, записанный до фиксации, учитывался бы повторно при повторе
+    транзакции (retrying_atomic) и при неудачной фиксации.
+    """
+
+    transaction.on_commit(lambda: OPERATION_OUTCOMES.inc(operation_type, outcome))
+
+
+@retrying_atomic
 def perform_operation(wallet_id: str, operation_type: str, amount: Decimal) -> Wallet:
     """
     Выполняет операцию над кошельком (пополнение или списание).
 
+    В зависимости от настройки WALLET_ATOMIC_OPERATIONS операция выполняется
+    одним UPDATE ... RETURNING (по умолчанию) либо через SELECT ... FOR UPDATE
+    с изменением баланса на стороне Python. Транзакция выполняется с уровнем
+    изоляции WALLET_TRANSACTIONS и повторяется после взаимной блокировки или
+    ошибки сериализации (см. retrying_atomic).
+
     Args:
         wallet_id (str): UUID кошелька.
         operation_type (str): Тип операции ("DEPOSIT" или "WITHDRAW").
@@ -21,22 +316,746 @@ def perform_operation(wallet_id: str, operation_type: str, amount: Decimal) -> W
 
     :raises ValueError: Если тип операции неверный или недостаточно средств.
     :raises Http404: Если кошелек не найден.
+    :raises TransactionContention: Если операция не выполнена после всех повторов.
     """
 
+    if operation_type not in ("DEPOSIT", "WITHDRAW"):
+        raise ValueError("Неверный тип операции.")
+
     try:
-        wallet = Wallet.objects.select_for_update().get(wallet_id=wallet_id)
-    except ObjectDoesNotExist:
-        raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+        if settings.WALLET_ATOMIC_OPERATIONS:
+            wallet = _perform_atomic_operation(wallet_id, operation_type, amount)
+        else:
+            wallet = _perform_locked_operation(wallet_id, operation_type, amount)
+    except Http404:
+        OPERATION_OUTCOMES.inc(operation_type, 'not_found')
+        raise
+    except ValueError:
+        OPERATION_OUTCOMES.inc(operation_type, 'insufficient_funds')
+        raise
+
+    _count_outcome(operation_type, 'success')
+    _balance_changed([wallet.wallet_id])
+    return wallet
+
+
+@retrying_atomic
+def transfer(source_id: str, destination_id: str, amount: Decimal) -> tuple[Wallet, Wallet]:
+    """
+    Переводит средства с одного кошелька на другой в одной транзакции.
+
+    Оба кошелька блокируются в порядке возрастания wallet_id, поэтому
+    одновременные встречные переводы не приводят к взаимной блокировке.
+    Перевод между кошельками без полос выполняется одним запросом (TRANSFER_SQL),
+    с участием кошелька с полосами - через SELECT ... FOR UPDATE в том же порядке.
+    В журнал операций записываются TRANSFER_OUT отправителя и TRANSFER_IN получателя.
+
+    Args:
+        source_id (str): UUID кошелька отправителя.
+        destination_id (str): UUID кошелька получателя.
+        amount (Decimal): Сумма перевода.
+
+    Returns:
+        tuple[Wallet, Wallet]: Кошельки отправителя и получателя с новыми балансами.
+
+    :raises ValueError: Если кошельки совпадают или на счету отправителя недостаточно средств.
+    :raises Http404: Если один из кошельков не найден.
+    :raises TransactionContention: Если перевод не выполнен после всех повторов.
+    """
 
-    logger.info(f"Начат процесс операций с кошельком {wallet.wallet_id}. Текущий баланс: {wallet.balance}")
+    if str(source_id) == str(destination_id):
+        raise ValueError("Нельзя перевести средства на тот же кошелек.")
+
+    try:
+        with connection.cursor() as cursor, LOCK_WAIT.time('transfer'):
+            cursor.execute(TRANSFER_SQL, {'source': source_id, 'destination': destination_id,
+                                          'amount': to_minor(amount), 'created_at': timezone.now()})
+            rows = {str(row[0]): Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]))
+                    for row in cursor.fetchall()}
+
+        if rows:
+            source, destination = rows[str(source_id)], rows[str(destination_id)]
+        else:
+            source, destination = _transfer_locked(source_id, destination_id, amount)
+    except Http404:
+        OPERATION_OUTCOMES.inc('TRANSFER', 'not_found')
+        raise
+    except ValueError:
+        OPERATION_OUTCOMES.inc('TRANSFER', 'insufficient_funds')
+        raise
+
+    _count_outcome('TRANSFER', 'success')
+    _balance_changed([source.wallet_id, destination.wallet_id])
+
+    logger.info(
+        "Перевод %s с кошелька %s на кошелек %s выполнен. Новый баланс: %s",
+        amount, source.wallet_id, destination.wallet_id, source.get_total_balance(),
+        extra={'wallet_id': source.wallet_id, 'operation': 'TRANSFER', 'amount': amount,
+               'balance': source.get_total_balance(), 'sampled': True}
+    )
+    return source, destination
+
+
+def _transfer_locked(source_id: str, destination_id: str, amount: Decimal) -> tuple[Wallet, Wallet]:
+    """
+    Перевод с участием кошелька с полосами: оба кошелька блокируются
+    SELECT ... FOR UPDATE в порядке возрастания wallet_id.
+
+    :raises ValueError: Если на счету отправителя недостаточно средств.
+    :raises Http404: Если один из кошельков не найден.
+    """
+
+    with LOCK_WAIT.time('select_for_update'):
+        wallets = {
+            str(wallet.wallet_id): wallet
+            for wallet in Wallet.objects.select_for_update()
+            .filter(wallet_id__in=[source_id, destination_id]).order_by('wallet_id')
+        }
+    for wallet_id in (source_id, destination_id):
+        if str(wallet_id) not in wallets:
+            raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+
+    source = _withdraw_striped(wallets[str(source_id)], amount)
+    destination = wallets[str(destination_id)]
+    destination.total_balance = destination.get_total_balance() + amount
+    destination.balance += amount
+    destination.save(update_fields=['balance'])
+
+    created_at = timezone.now()
+    WalletTransaction.objects.bulk_create([
+        WalletTransaction(wallet=source, operation_type=WalletTransaction.TRANSFER_OUT,
+                          amount=amount, created_at=created_at),
+        WalletTransaction(wallet=destination, operation_type=WalletTransaction.TRANSFER_IN,
+                          amount=amount, created_at=created_at),
+    ])
+    return source, destination
+
+
+def _perform_atomic_operation(wallet_id: str, operation_type: str, amount: Decimal) -> Wallet:
+    """
+    Выполняет операцию одним SQL-запросом.
+
+    Пополнение: UPDATE ... SET balance = balance + %s RETURNING.
+    Списание: условный UPDATE ... WHERE balance >= %s RETURNING. Если запрос не
+    вернул строк, кошелек либо не существует, либо на нем недостаточно средств,
+    либо его баланс разбит на полосы; причина уточняется дополнительным запросом
+    только в этом случае.
+    """
 
     if operation_type == "DEPOSIT":
-        wallet.deposit(amount)
-        logger.info(f"Кошелек {wallet.wallet_id} пополнен на {amount}. Новый баланс: {wallet.balance}")
+        wallet = _deposit(wallet_id, amount)
+        _log_operation(wallet, operation_type, amount)
         return wallet
-    elif operation_type == "WITHDRAW":
+
+    with connection.cursor() as cursor, LOCK_WAIT.time('update'):
+        minor = to_minor(amount)
+        cursor.execute(WITHDRAW_SQL, [minor, wallet_id, minor, minor, timezone.now()])
+        row = cursor.fetchone()
+
+    if row is not None:
+        wallet = Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]))
+    else:
+        stripe_count = Wallet.objects.filter(wallet_id=wallet_id).values_list('stripe_count', flat=True).first()
+        if stripe_count is None:
+            raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+        if not stripe_count:
+            raise ValueError("Недостаточно средств на счете")
+        wallet = _withdraw_striped(_lock_wallet(wallet_id), amount)
+        WalletTransaction.objects.create(wallet=wallet, operation_type=operation_type, amount=amount)
+
+    _log_operation(wallet, operation_type, amount)
+    return wallet
+
+
+def _perform_locked_operation(wallet_id: str, operation_type: str, amount: Decimal) -> Wallet:
+    """
+    Выполняет операцию с блокировкой строки кошелька (SELECT ... FOR UPDATE).
+    """
+
+    wallet = _lock_wallet(wallet_id)
+
+    logger.debug("Начат процесс операций с кошельком %s. Текущий баланс: %s", wallet.wallet_id, wallet.balance)
+
+    if operation_type == "DEPOSIT":
+        if wallet.is_striped:
+            wallet = _deposit(wallet_id, amount)
+        else:
+            wallet.deposit(amount)
+            WalletTransaction.objects.create(wallet=wallet, operation_type=operation_type, amount=amount)
+    else:
+        wallet = _withdraw_striped(wallet, amount)
+        WalletTransaction.objects.create(wallet=wallet, operation_type=operation_type, amount=amount)
+
+    _log_operation(wallet, operation_type, amount)
+    return wallet
+
+
+def _log_operation(wallet: Wallet, operation_type: str, amount: Decimal) -> None:
+    """
+    Записывает в журнал выполненную операцию (массовая запись, см. LOG_INFO_SAMPLE_RATE).
+
+    Сообщение форматируется фоновым потоком логгера, а не внутри транзакции.
+    """
+
+    balance = wallet.get_total_balance()
+    logger.info(
+        "Операция %s на %s с кошельком %s выполнена. Новый баланс: %s",
+        operation_type, amount, wallet.wallet_id, balance,
+        extra={'wallet_id': wallet.wallet_id, 'operation': operation_type, 'amount': amount,
+               'balance': balance, 'sampled': True}
+    )
+
+
+def _lock_wallet(wallet_id: str) -> Wallet:
+    """
+    Блокирует строку кошелька (SELECT ... FOR UPDATE) и возвращает кошелек.
+
+    :raises Http404: Если кошелек не найден.
+    """
+
+    try:
+        with LOCK_WAIT.time('select_for_update'):
+            return Wallet.objects.select_for_update().get(wallet_id=wallet_id)
+    except ObjectDoesNotExist:
+        raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+
+
+def _deposit(wallet_id: str, amount: Decimal) -> Wallet:
+    """
+    Пополняет кошелек: обычный кошелек - одним UPDATE строки Wallet,
+    кошелек с полосами - одним UPDATE выбранной полосы.
+
+    Если число полос кошелька изменилось во время операции (stripe_wallet),
+    пополнение повторяется с новым снимком данных.
+
+    :raises Http404: Если кошелек не найден.
+    :raises TransactionContention: Если число полос менялось во время всех STRIPE_RETRIES попыток.
+    """
+
+    minor = to_minor(amount)
+    for _ in range(STRIPE_RETRIES):
+        with connection.cursor() as cursor:
+            with LOCK_WAIT.time('update'):
+                cursor.execute(DEPOSIT_SQL, [minor, wallet_id, minor, timezone.now()])
+                row = cursor.fetchone()
+            if row is not None:
+                return Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]))
+
+            cursor.execute(STRIPE_DEPOSIT_SQL,
+                           [minor, wallet_id, _next_stripe_seed(), wallet_id, minor, timezone.now()])
+            row = cursor.fetchone()
+            if row is not None:
+                return _striped_wallet(row)
+
+        if not Wallet.objects.filter(wallet_id=wallet_id).exists():
+            raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+
+    raise TransactionContention(f"Не удалось пополнить кошелек {wallet_id}: число полос меняется во время операции.")
+
+
+def _withdraw_striped(wallet: Wallet, amount: Decimal) -> Wallet:
+    """
+    Списывает средства с кошелька, баланс которого разбит на полосы.
+
+    Строка кошелька должна быть заблокирована вызывающим кодом: все списания
+    кошелька выполняются последовательно, а пополнения могут только увеличить
+    баланс полос. Средства списываются сначала с собственного баланса кошелька,
+    затем с полос в порядке убывания их баланса (заимствование между полосами).
+    Заблокированные средства (held_balance) не списываются.
+
+    :raises ValueError: Если на счету недостаточно средств.
+    """
+
+    if not wallet.is_striped:
         wallet.withdraw(amount)
-        logger.info(f"С кошелька {wallet.wallet_id} списано {amount}. Новый баланс: {wallet.balance}")
         return wallet
-    else:
-        raise ValueError("Неверный тип операции.")
+
+    with LOCK_WAIT.time('stripes'):
+        stripes = list(WalletStripe.objects.select_for_update().filter(wallet=wallet).order_by('index'))
+    total = wallet.balance + sum((stripe.balance for stripe in stripes), Decimal('0.00'))
+
+    if total - wallet.held_balance < amount:
+        raise ValueError("Недостаточно средств на счете")
+
+    remaining = amount
+    from_wallet = min(wallet.balance, remaining)
+    remaining -= from_wallet
+
+    changed = []
+    for stripe in sorted(stripes, key=lambda item: item.balance, reverse=True):
+        if remaining <= 0:
+            break
+        taken = min(stripe.balance, remaining)
+        stripe.balance -= taken
+        remaining -= taken
+        changed.append(stripe)
+
+    if from_wallet:
+        wallet.balance -= from_wallet
+        wallet.save(update_fields=['balance'])
+    if changed:
+        WalletStripe.objects.bulk_update(changed, ['balance'])
+
+    wallet.total_balance = total - amount
+    return wallet
+
+
+def _striped_wallet(row: tuple) -> Wallet:
+    """
+    Создает экземпляр кошелька с полосами по строке (wallet_id, user_id, total_balance).
+    """
+
+    wallet = Wallet(wallet_id=row[0], user_id=row[1])
+    wallet.total_balance = from_minor(row[2])
+    return wallet
+
+
+@retrying_atomic
+def set_wallet_stripes(wallet_id: str, stripe_count: int) -> Wallet:
+    """
+    Изменяет количество полос баланса кошелька.
+
+    При увеличении числа полос создаются новые пустые полосы, баланс не переносится.
+    При уменьшении (в том числе до 0) балансы удаляемых полос переносятся
+    в собственный баланс кошелька. Операция выполняется в одной транзакции и
+    не останавливает работу с кошельком: пополнения, попавшие на удаляемую
+    полосу, повторяются сервисом операций.
+
+    Args:
+        wallet_id (str): UUID кошелька.
+        stripe_count (int): Новое количество полос (0 - отключить полосы).
+
+    :raises ValueError: Если количество полос вне допустимого диапазона.
+    :raises Http404: Если кошелек не найден.
+    """
+
+    if not 0 <= stripe_count <= settings.WALLET_MAX_STRIPES:
+        raise ValueError(f"Количество полос должно быть от 0 до {settings.WALLET_MAX_STRIPES}.")
+
+    wallet = _lock_wallet(wallet_id)
+    current = wallet.stripe_count
+
+    if stripe_count > current:
+        WalletStripe.objects.bulk_create(
+            WalletStripe(wallet=wallet, index=index, balance=Decimal('0.00'))
+            for index in range(current, stripe_count)
+        )
+    elif stripe_count < current:
+        removed = list(
+            WalletStripe.objects.select_for_update().filter(wallet=wallet, index__gte=stripe_count).order_by('index')
+        )
+        wallet.balance += sum((stripe.balance for stripe in removed), Decimal('0.00'))
+        WalletStripe.objects.filter(pk__in=[stripe.pk for stripe in removed]).delete()
+
+    wallet.stripe_count = stripe_count
+    wallet.save(update_fields=['balance', 'stripe_count'])
+    _balance_changed([wallet.wallet_id])
+
+    logger.info("Число полос кошелька %s изменено: %s -> %s", wallet.wallet_id, current, stripe_count,
+                extra={'wallet_id': wallet.wallet_id})
+    return wallet
+
+
+@retrying_atomic
+def perform_batch_operations(operations: list[dict], atomic: bool = True) -> list[dict]:
+    """
+    Выполняет пакет операций над кошельками в одной транзакции.
+
+    Затронутые кошельки блокируются одним запросом в порядке возрастания wallet_id,
+    поэтому одновременные пакеты не могут взаимно заблокировать друг друга.
+    Операции применяются последовательно в памяти, после чего изменения
+    балансов записываются одним UPDATE ... FROM (VALUES ...). Списания не
+    используют заблокированные средства кошельков (held_balance).
+
+    Args:
+        operations (list[dict]): Операции вида {"wallet_id", "operation_type", "amount"}.
+        atomic (bool): True - при ошибке хотя бы одной операции не применяется ни одна,
+            False - ошибочные операции пропускаются, остальные применяются.
+
+    Returns:
+        list[dict]: Результат для каждой операции в исходном порядке:
+            {"wallet_id", "status": "ok" | "error" | "rolled_back", "new_balance" | "error"}.
+    """
+
+    wallet_ids = sorted({operation['wallet_id'] for operation in operations})
+    with LOCK_WAIT.time('batch'):
+        wallets = {
+            wallet.wallet_id: wallet
+            for wallet in Wallet.objects.select_for_update().filter(wallet_id__in=wallet_ids).order_by('wallet_id')
+        }
+
+    striped_ids = [wallet_id for wallet_id, wallet in wallets.items() if wallet.is_striped]
+    stripes_balance = dict(
+        WalletStripe.objects.filter(wallet_id__in=striped_ids)
+        .values('wallet_id')
+        .annotate(total=Sum('balance'))
+        .values_list('wallet_id', 'total')
+    ) if striped_ids else {}
+
+    balances = {
+        wallet_id: wallet.balance + stripes_balance.get(wallet_id, Decimal('0.00'))
+        for wallet_id, wallet in wallets.items()
+    }
+    deltas = dict.fromkeys(wallets, Decimal('0.00'))
+
+    results = []
+    for operation in operations:
+        wallet_id, amount = operation['wallet_id'], operation['amount']
+
+        if wallet_id not in wallets:
+            _count_outcome(operation['operation_type'], 'not_found')
+            results.append({'wallet_id': str(wallet_id), 'status': 'error',
+                            'error': f"Кошелек с ID {wallet_id} не найден."})
+            continue
+
+        if operation['operation_type'] == "DEPOSIT":
+            delta = amount
+        elif operation['operation_type'] == "WITHDRAW":
+            delta = -amount
+        else:
+            results.append({'wallet_id': str(wallet_id), 'status': 'error', 'error': "Неверный тип операции."})
+            continue
+
+        if balances[wallet_id] + delta < wallets[wallet_id].held_balance:
+            _count_outcome(operation['operation_type'], 'insufficient_funds')
+            results.append({'wallet_id': str(wallet_id), 'status': 'error', 'error': "Недостаточно средств на счете"})
+            continue
+
+        balances[wallet_id] += delta
+        deltas[wallet_id] += delta
+        results.append({'wallet_id': str(wallet_id), 'status': 'ok', 'new_balance': balances[wallet_id]})
+
+    failed = sum(1 for result in results if result['status'] == 'error')
+    if atomic and failed:
+        for result in results:
+            if result['status'] == 'ok':
+                result['status'] = 'rolled_back'
+                del result['new_balance']
+        logger.info("Пакет из %s операций отклонен: ошибок - %s", len(operations), failed)
+        return results
+
+    _apply_balance_deltas(wallets, deltas)
+    for operation, result in zip(operations, results):
+        if result['status'] == 'ok':
+            _count_outcome(operation['operation_type'], 'success')
+    _balance_changed(wallet_id for wallet_id, delta in deltas.items() if delta)
+
+    created_at = timezone.now()
+    WalletTransaction.objects.bulk_create(
+        WalletTransaction(wallet_id=operation['wallet_id'],
+                          operation_type=operation['operation_type'],
+                          amount=operation['amount'],
+                          created_at=created_at)
+        for operation, result in zip(operations, results)
+        if result['status'] == 'ok'
+    )
+
+    logger.info("Пакет из %s операций выполнен: успешно - %s, ошибок - %s", len(operations), len(operations) - failed, failed)
+    return results
+
+
+def _apply_balance_deltas(wallets: dict, deltas: dict) -> None:
+    """
+    Записывает изменения балансов заблокированных кошельков одним UPDATE ... FROM (VALUES ...).
+
+    Чистое списание с кошелька с полосами выполняется через _withdraw_striped,
+    чтобы собственный баланс кошелька не стал отрицательным.
+    """
+
+    values = []
+    for wallet_id, delta in deltas.items():
+        if not delta:
+            continue
+        if delta < 0 and wallets[wallet_id].is_striped:
+            _withdraw_striped(wallets[wallet_id], -delta)
+            continue
+        values.append((wallet_id, to_minor(delta)))
+
+    if not values:
+        return
+
+    placeholders = ', '.join(['(%s::uuid, %s::bigint)'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {WALLET_TABLE} AS w
+               SET balance = w.balance + v.delta
+              FROM (VALUES {placeholders}) AS v(wallet_id, delta)
+             WHERE w.wallet_id = v.wallet_id
+            """,
+            [param for value in values for param in value]
+        )
+
+
+@retrying_atomic
+def hold_funds(wallet_id: str, amount: Decimal, ttl: Optional[int] = None) -> WalletHold:
+    """
+    Блокирует средства кошелька (первая фаза двухфазного списания).
+
+    Заблокированная сумма добавляется к Wallet.held_balance: доступный баланс
+    (баланс минус held_balance) уменьшается, баланс не изменяется. Блокировка
+    кошелька без полос выполняется одним запросом (HOLD_SQL), кошелька с
+    полосами - с блокировкой строки кошелька (SELECT ... FOR UPDATE).
+
+    Args:
+        wallet_id (str): UUID кошелька.
+        amount (Decimal): Сумма блокировки.
+        ttl (Optional[int]): Срок блокировки в секундах (по умолчанию WALLET_HOLDS["TTL"]).
+
+    Returns:
+        WalletHold: Блокировка; hold.wallet - кошелек с новым held_balance.
+
+    :raises ValueError: Если срок блокировки вне допустимого диапазона или недостаточно средств.
+    :raises Http404: Если кошелек не найден.
+    :raises TransactionContention: Если блокировка не выполнена после всех повторов.
+    """
+
+    ttl = settings.WALLET_HOLDS['TTL'] if ttl is None else ttl
+    if not 0 < ttl <= settings.WALLET_HOLDS['MAX_TTL']:
+        raise ValueError(f"Срок блокировки должен быть от 1 до {settings.WALLET_HOLDS['MAX_TTL']} секунд.")
+
+    now = timezone.now()
+    hold = WalletHold(wallet_id=wallet_id, amount=amount, created_at=now, expires_at=now + timedelta(seconds=ttl))
+
+    try:
+        with connection.cursor() as cursor, LOCK_WAIT.time('update'):
+            cursor.execute(HOLD_SQL, {'hold': hold.hold_id, 'wallet': wallet_id, 'amount': to_minor(amount),
+                                      'now': now, 'expires_at': hold.expires_at})
+            row = cursor.fetchone()
+
+        if row is not None:
+            hold.wallet = Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]),
+                                 held_balance=from_minor(row[3]))
+        else:
+            stripe_count = Wallet.objects.filter(wallet_id=wallet_id).values_list('stripe_count', flat=True).first()
+            if stripe_count is None:
+                raise Http404(f"Кошелек с ID {wallet_id} не найден.")
+            if not stripe_count:
+                raise ValueError("Недостаточно средств на счете")
+            hold.wallet = _hold_striped(_lock_wallet(wallet_id), hold)
+    except Http404:
+        OPERATION_OUTCOMES.inc('HOLD', 'not_found')
+        raise
+    except ValueError:
+        OPERATION_OUTCOMES.inc('HOLD', 'insufficient_funds')
+        raise
+
+    _count_outcome('HOLD', 'success')
+    _log_hold(hold, 'HOLD', amount)
+    return hold
+
+
+def _hold_striped(wallet: Wallet, hold: WalletHold) -> Wallet:
+    """
+    Блокирует средства кошелька с полосами. Строка кошелька должна быть заблокирована вызывающим кодом.
+
+    :raises ValueError: Если на счету недостаточно средств.
+    """
+
+    total = wallet.get_total_balance()
+    if total - wallet.held_balance < hold.amount:
+        raise ValueError("Недостаточно средств на счете")
+
+    wallet.held_balance += hold.amount
+    wallet.save(update_fields=['held_balance'])
+    hold.save(force_insert=True)
+
+    wallet.total_balance = total
+    return wallet
+
+
+@retrying_atomic
+def capture_hold(hold_id: str, amount: Optional[Decimal] = None) -> WalletHold:
+    """
+    Списывает заблокированные средства (вторая фаза двухфазного списания).
+
+    С баланса списывается amount (по умолчанию вся заблокированная сумма),
+    held_balance уменьшается на всю заблокированную сумму: остаток блокировки
+    освобождается. В журнал операций записывается CAPTURE. Списание для кошелька
+    без полос выполняется одним запросом (CAPTURE_SQL), для кошелька с полосами -
+    с блокировкой строки кошелька, как списание WITHDRAW.
+
+    Args:
+        hold_id (str): UUID блокировки.
+        amount (Optional[Decimal]): Списываемая сумма (не больше заблокированной).
+
+    Returns:
+        WalletHold: Блокировка в состоянии CAPTURED; hold.wallet - кошелек с новыми балансами.
+
+    :raises ValueError: Если блокировка не активна, истекла, сумма больше заблокированной
+        или на счете недостаточно средств.
+    :raises Http404: Если блокировка не найдена.
+    :raises TransactionContention: Если списание не выполнено после всех повторов.
+    """
+
+    if amount is not None and amount <= 0:
+        raise ValueError("Сумма должна быть положительной.")
+
+    now = timezone.now()
+    try:
+        with connection.cursor() as cursor, LOCK_WAIT.time('update'):
+            cursor.execute(CAPTURE_SQL, {'hold': hold_id, 'amount': None if amount is None else to_minor(amount),
+                                         'now': now})
+            row = cursor.fetchone()
+
+        if row is not None:
+            hold = _settled_hold(hold_id, WalletHold.CAPTURED, now, row)
+        else:
+            hold = _capture_locked(hold_id, amount, now)
+    except Http404:
+        OPERATION_OUTCOMES.inc('CAPTURE', 'not_found')
+        raise
+    except ValueError:
+        OPERATION_OUTCOMES.inc('CAPTURE', 'rejected')
+        raise
+
+    _count_outcome('CAPTURE', 'success')
+    _balance_changed([hold.wallet_id])
+    _log_hold(hold, 'CAPTURE', hold.captured_amount)
+    return hold
+
+
+def _capture_locked(hold_id: str, amount: Optional[Decimal], now: datetime) -> WalletHold:
+    """
+    Списание блокировки с блокировкой строк кошелька и блокировки средств (в этом порядке).
+
+    Выполняется для кошельков с полосами и для выяснения причины, по которой
+    CAPTURE_SQL не вернул строк.
+
+    :raises ValueError: Если блокировка не активна, истекла, сумма больше заблокированной
+        или на счете недостаточно средств.
+    :raises Http404: Если блокировка не найдена.
+    """
+
+    wallet_id = WalletHold.objects.filter(hold_id=hold_id).values_list('wallet_id', flat=True).first()
+    if wallet_id is None:
+        raise Http404(f"Блокировка средств с ID {hold_id} не найдена.")
+
+    wallet = _lock_wallet(wallet_id)
+    hold = WalletHold.objects.select_for_update().get(hold_id=hold_id)
+    if hold.status != WalletHold.ACTIVE:
+        raise ValueError(f"Блокировка средств уже завершена (состояние {hold.status}).")
+    if hold.expires_at <= now:
+        raise ValueError("Срок блокировки средств истек.")
+    if amount is not None and amount > hold.amount:
+        raise ValueError("Сумма списания превышает заблокированную сумму.")
+
+    wallet.held_balance -= hold.amount
+    wallet.save(update_fields=['held_balance'])
+    captured = hold.amount if amount is None else amount
+    wallet = _withdraw_striped(wallet, captured)
+
+    hold.status, hold.captured_amount, hold.settled_at = WalletHold.CAPTURED, captured, now
+    hold.save(update_fields=['status', 'captured_amount', 'settled_at'])
+    WalletTransaction.objects.create(wallet=wallet, operation_type=WalletTransaction.CAPTURE,
+                                     amount=captured, created_at=now)
+    hold.wallet = wallet
+    return hold
+
+
+@retrying_atomic
+def release_hold(hold_id: str) -> WalletHold:
+    """
+    Снимает блокировку средств без списания одним запросом (RELEASE_SQL).
+
+    Args:
+        hold_id (str): UUID блокировки.
+
+    Returns:
+        WalletHold: Блокировка в состоянии RELEASED; hold.wallet - кошелек с новым held_balance.
+
+    :raises ValueError: Если блокировка уже списана, снята или истекла.
+    :raises Http404: Если блокировка не найдена.
+    :raises TransactionContention: Если снятие не выполнено после всех повторов.
+    """
+
+    now = timezone.now()
+    with connection.cursor() as cursor, LOCK_WAIT.time('update'):
+        cursor.execute(RELEASE_SQL, {'hold': hold_id, 'now': now})
+        row = cursor.fetchone()
+
+    if row is None:
+        hold_status = WalletHold.objects.filter(hold_id=hold_id).values_list('status', flat=True).first()
+        OPERATION_OUTCOMES.inc('RELEASE', 'not_found' if hold_status is None else 'rejected')
+        if hold_status is None:
+            raise Http404(f"Блокировка средств с ID {hold_id} не найдена.")
+        raise ValueError(f"Блокировка средств уже завершена (состояние {hold_status}).")
+
+    hold = _settled_hold(hold_id, WalletHold.RELEASED, now, row)
+    _count_outcome('RELEASE', 'success')
+    _log_hold(hold, 'RELEASE', hold.amount)
+    return hold
+
+
+def _settled_hold(hold_id: str, hold_status: str, now: datetime, row: tuple) -> WalletHold:
+    """
+    Создает экземпляр завершенной блокировки по строке CAPTURE_SQL или RELEASE_SQL
+    (wallet_id, user_id, balance, held_balance, total_balance, amount, captured_amount, created_at, expires_at).
+    """
+
+    wallet = Wallet(wallet_id=row[0], user_id=row[1], balance=from_minor(row[2]), held_balance=from_minor(row[3]))
+    wallet.total_balance = from_minor(row[4])
+    return WalletHold(hold_id=hold_id, wallet=wallet, amount=from_minor(row[5]),
+                      captured_amount=None if row[6] is None else from_minor(row[6]),
+                      status=hold_status, created_at=row[7], expires_at=row[8], settled_at=now)
+
+
+def _log_hold(hold: WalletHold, operation: str, amount: Decimal) -> None:
+    """
+    Записывает в журнал операцию с блокировкой средств (массовая запись, см. LOG_INFO_SAMPLE_RATE).
+    """
+
+    balance = hold.wallet.get_available_balance()
+    logger.info(
+        "Операция %s на %s с блокировкой %s кошелька %s выполнена. Доступный баланс: %s",
+        operation, amount, hold.hold_id, hold.wallet_id, balance,
+        extra={'wallet_id': hold.wallet_id, 'operation': operation, 'amount': amount,
+               'balance': balance, 'sampled': True}
+    )
+
+
+def release_expired_holds(batch_size: Optional[int] = None,
+                          progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Снимает блокировки средств, истекшие к моменту запуска, пакетами по batch_size.
+
+    Каждый пакет - один запрос (EXPIRE_HOLDS_SQL) в своей короткой транзакции:
+    блокировки и кошельки, строки которых заняты операциями, пропускаются
+    (FOR UPDATE SKIP LOCKED) и снимаются следующим запуском, поэтому снятие
+    не ждет операций с кошельками и не задерживает их.
+
+    Args:
+        batch_size (Optional[int]): Количество блокировок в пакете (по умолчанию WALLET_HOLDS["SWEEP_BATCH_SIZE"]).
+        progress (Optional[Callable]): Вызывается после каждого пакета с промежуточным отчетом.
+
+    Returns:
+        dict: at (момент истечения), released (снято блокировок), wallets (изменено строк кошельков),
+            batches (пакетов), elapsed (секунд).
+
+    :raises ValueError: Если размер пакета не положительный.
+    """
+
+    batch_size = settings.WALLET_HOLDS['SWEEP_BATCH_SIZE'] if batch_size is None else batch_size
+    if batch_size < 1:
+        raise ValueError("Размер пакета должен быть положительным.")
+
+    started = time.monotonic()
+    report = {'at': timezone.now(), 'released': 0, 'wallets': 0, 'batches': 0}
+
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(EXPIRE_HOLDS_SQL, {'now': report['at'], 'limit': batch_size})
+            released, wallets = cursor.fetchone()
+        if not released:
+            break
+
+        report['released'] += released
+        report['wallets'] += wallets
+        report['batches'] += 1
+        if progress is not None:
+            progress(report)
+
+    report['elapsed'] = round(time.monotonic() - started, 3)
+    logger.info("Снято истекших блокировок средств: %s (кошельков %s, пакетов %s)",
+                report['released'], report['wallets'], report['batches'])
+    return report
@@ -1,20 +1,72 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import functools
+import uuid
+import queue
+import logging
+import tempfile
+import threading
+import subprocess
+import sys
+
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from pathlib import Path
 
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
 from django.db.models.signals import post_save
+from django.http import Http404
+from asgiref.sync import sync_to_async
+from django.core import checks
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.test import (AsyncRequestFactory, RequestFactory, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+from django.core.management import CommandError, call_command
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase  #, APIClient
 
 from users.factories import UserFactory
 from users.models import create_wallet, User
-from utilities.logger_utils import logger
+from utilities.db_routing import (ReplicaRouter, check_sticky_cache, is_pinned, pin_to_primary, replica_reads,
+                                   replicas_allowed, use_replicas, wallet_key)
+from utilities import metrics
+from utilities.logger_utils import JsonFormatter, NonBlockingQueueHandler, SamplingFilter, logger
+from utilities.renderers import FastJSONParser, FastJSONRenderer, decimal_value
 
+from wallet.admission import (GLOBAL_IN_FLIGHT, WALLET_CONCURRENCY, WALLET_RATE, AdmissionRejected,
+                              DatabaseAdmissionController, LocMemAdmissionController, get_admission_controller)
+from wallet.api import async_views
+from wallet.api.fast_serializers import validate_operation
+from wallet.api.views import WalletViewSet
+from wallet.async_services import close_async_pool
+from wallet.api.serializers import WalletOperationSerializer
+from wallet.cache import BalanceCache, get_balance_cache
+from wallet.checkpoints import balance_at, create_checkpoints
+from wallet.export import WalletExport
 from wallet.factories import WalletFactory
-from wallet.services import perform_operation
+from wallet.idempotency import LOCK_NOT_AVAILABLE, LocMemIdempotencyStore
+from wallet.imports import import_balances
+from wallet.reconciliation import reconcile, wallet_ranges
+from wallet.models import (IdempotencyKey, Wallet, WalletAdmissionBucket, WalletBalanceCheckpoint, WalletHold,
+                           WalletStripe, WalletTransaction)
+from wallet.services import (DEPOSIT_SQL, STRIPE_DEPOSIT_SQL, capture_hold, hold_funds, perform_batch_operations,
+                             perform_operation, release_expired_holds, release_hold, set_wallet_stripes, transfer)
+from wallet.transactions import (DEADLOCK_DETECTED, SERIALIZATION_FAILURE, TransactionContention, retry_stats,
+                                 retrying_atomic)
 
 
-class WalletServiceTests(APITestCase):
+class WalletFactoryMixin:
     """
-    Тесты для сервиса операций с кошельком.
+    Отключает создание кошелька сигналом: в тестах кошельки создаются фабрикой.
     """
 
     @classmethod
@@ -35,16 +87,29 @@ class WalletServiceTests(APITestCase):
         post_save.connect(create_wallet, sender=User)
         super().tearDownClass()
 
+
+class WalletTestCase(WalletFactoryMixin, APITestCase):
+    """
+    Базовый класс тестов кошелька: кошельки создаются фабрикой, а не сигналом.
+    """
+
     def setUp(self):
         """
         Настройка тестового окружения.
         """
 
         self.user = UserFactory()
+        get_balance_cache.cache_clear()
         # для jwt авторизации
         # self.client = APIClient()
         # self.client.force_login(user=self.user)
 
+
+class WalletServiceTests(WalletTestCase):
+    """
+    Тесты для сервиса операций с кошельком.
+    """
+
     def test_unique_wallet_per_user(self):
         """
         Тестирует, что при создании второго кошелька для того же пользователя возникает ошибка IntegrityError.
@@ -130,3 +195,3014 @@ class WalletServiceTests(APITestCase):
         with self.assertRaises(ValueError):
             perform_operation(self.wallet.wallet_id, "INVALID", Decimal(50.00))
         logger.info("Тест test_invalid_operation_type пройден успешно")
+
+    def test_wallet_not_found(self):
+        """
+        Тестирует, что операция с несуществующим кошельком вызывает Http404.
+        """
+
+        logger.info("Начало теста test_wallet_not_found")
+        with self.assertRaises(Http404):
+            perform_operation(uuid.uuid4(), "DEPOSIT", Decimal(50.00))
+        logger.info("Тест test_wallet_not_found пройден успешно")
+
+    def test_insufficient_funds_keeps_balance(self):
+        """
+        Тестирует, что неудачное списание не изменяет баланс кошелька.
+        """
+
+        logger.info("Начало теста test_insufficient_funds_keeps_balance")
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+        with self.assertRaises(ValueError):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal(100.01))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('100.00'))
+        logger.info("Тест test_insufficient_funds_keeps_balance пройден успешно")
+
+    def test_operation_returns_new_balance(self):
+        """
+        Тестирует, что операция возвращает кошелек с актуальным балансом и владельцем.
+        """
+
+        logger.info("Начало теста test_operation_returns_new_balance")
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+        wallet = perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('100.00'))
+
+        self.assertEqual(wallet.balance, Decimal('0.00'))
+        self.assertEqual(wallet.user_id, self.user.id)
+        logger.info("Тест test_operation_returns_new_balance пройден успешно")
+
+    @override_settings(WALLET_ATOMIC_OPERATIONS=False)
+    def test_locked_operations(self):
+        """
+        Тестирует режим операций с блокировкой строки (SELECT ... FOR UPDATE).
+        """
+
+        logger.info("Начало теста test_locked_operations")
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('25.50'))
+        wallet = perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('5.50'))
+        self.assertEqual(wallet.balance, Decimal('120.00'))
+
+        with self.assertRaises(ValueError):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('500.00'))
+
+        self.assertEqual(Wallet.objects.get(wallet_id=self.wallet.wallet_id).balance, Decimal('120.00'))
+        logger.info("Тест test_locked_operations пройден успешно")
+
+    def test_minor_unit_storage(self):
+        """
+        Тестирует хранение сумм в минимальных денежных единицах (BIGINT) и их перевод в Decimal.
+        """
+
+        logger.info("Начало теста test_minor_unit_storage")
+        self.wallet = WalletFactory(user=self.user, balance=Decimal('12.34'))
+        wallet = perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('999999999999.99'))
+        self.assertEqual(wallet.balance, Decimal('1000000000012.33'))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT balance FROM wallet_wallet WHERE wallet_id = %s", [self.wallet.wallet_id])
+            self.assertEqual(cursor.fetchone()[0], 100000000001233)
+            cursor.execute("SELECT amount FROM wallet_wallettransaction WHERE wallet_id = %s",
+                           [self.wallet.wallet_id])
+            self.assertEqual(cursor.fetchone()[0], 99999999999999)
+
+        wallet = Wallet.objects.with_total_balance().get(wallet_id=self.wallet.wallet_id)
+        self.assertEqual(wallet.total_balance, Decimal('1000000000012.33'))
+        self.assertEqual(Wallet.objects.filter(balance__gt=Decimal('1000000000012.32')).count(), 1)
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet).replay(),
+                         {'delta': Decimal('999999999999.99'), 'entries': 1})
+        logger.info("Тест test_minor_unit_storage пройден успешно")
+
+
+class WalletStripeTests(WalletTestCase):
+    """
+    Тесты для кошельков с балансом, разбитым на полосы.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька с тремя полосами баланса.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+        set_wallet_stripes(self.wallet.wallet_id, 3)
+
+    def test_deposit_goes_to_stripes(self):
+        """
+        Тестирует, что пополнения не изменяют собственный баланс кошелька, а попадают в полосы.
+        """
+
+        logger.info("Начало теста test_deposit_goes_to_stripes")
+        for _ in range(5):
+            wallet = perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+
+        self.assertEqual(wallet.get_total_balance(), Decimal('150.00'))
+        self.assertEqual(Wallet.objects.get(wallet_id=self.wallet.wallet_id).balance, Decimal('100.00'))
+        self.assertEqual(sum(WalletStripe.objects.values_list('balance', flat=True)), Decimal('50.00'))
+        logger.info("Тест test_deposit_goes_to_stripes пройден успешно")
+
+    @override_settings(WALLET_STRIPE_STRATEGY='round_robin')
+    def test_round_robin_strategy(self):
+        """
+        Тестирует равномерное распределение пополнений по полосам.
+        """
+
+        logger.info("Начало теста test_round_robin_strategy")
+        for _ in range(6):
+            perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('1.00'))
+
+        balances = list(WalletStripe.objects.order_by('index').values_list('balance', flat=True))
+        self.assertEqual(balances, [Decimal('2.00')] * 3)
+        logger.info("Тест test_round_robin_strategy пройден успешно")
+
+    def test_withdraw_borrows_across_stripes(self):
+        """
+        Тестирует списание суммы, превышающей баланс кошелька и любой отдельной полосы.
+        """
+
+        logger.info("Начало теста test_withdraw_borrows_across_stripes")
+        WalletStripe.objects.filter(wallet_id=self.wallet.wallet_id).update(balance=Decimal('20.00'))
+
+        wallet = perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('150.00'))
+
+        self.assertEqual(wallet.get_total_balance(), Decimal('10.00'))
+        self.assertEqual(Wallet.objects.get(wallet_id=self.wallet.wallet_id).balance, Decimal('0.00'))
+        self.assertEqual(sum(WalletStripe.objects.values_list('balance', flat=True)), Decimal('10.00'))
+
+        with self.assertRaises(ValueError):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('10.01'))
+        logger.info("Тест test_withdraw_borrows_across_stripes пройден успешно")
+
+    @override_settings(WALLET_ATOMIC_OPERATIONS=False)
+    def test_locked_operations_with_stripes(self):
+        """
+        Тестирует операции с полосами в режиме SELECT ... FOR UPDATE.
+        """
+
+        logger.info("Начало теста test_locked_operations_with_stripes")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('30.00'))
+        wallet = perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('120.00'))
+
+        self.assertEqual(wallet.get_total_balance(), Decimal('10.00'))
+        logger.info("Тест test_locked_operations_with_stripes пройден успешно")
+
+    def test_unstripe_folds_balance(self):
+        """
+        Тестирует объединение полос командой stripe_wallet: баланс полос переносится в кошелек.
+        """
+
+        logger.info("Начало теста test_unstripe_folds_balance")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('25.00'))
+
+        call_command('stripe_wallet', str(self.wallet.wallet_id), stripes=0, stdout=io.StringIO())
+
+        wallet = Wallet.objects.get(wallet_id=self.wallet.wallet_id)
+        self.assertFalse(wallet.is_striped)
+        self.assertEqual(wallet.balance, Decimal('125.00'))
+        self.assertFalse(WalletStripe.objects.filter(wallet=wallet).exists())
+        logger.info("Тест test_unstripe_folds_balance пройден успешно")
+
+    def test_deposit_contention_on_stripe_changes(self):
+        """
+        Тестирует ответ 503, если число полос кошелька меняется во время всех попыток пополнения.
+        """
+
+        logger.info("Начало теста test_deposit_contention_on_stripe_changes")
+        flip = f"UPDATE {Wallet._meta.db_table} SET stripe_count = %s WHERE wallet_id = %s"
+
+        def change_stripes(execute, sql, params, many, context):
+            # Перед каждым запросом пополнения число полос меняется так, чтобы запрос не нашел строку
+            if sql in (DEPOSIT_SQL, STRIPE_DEPOSIT_SQL):
+                count = 3 if sql == DEPOSIT_SQL else 0
+                context['cursor'].cursor.execute(flip, [count, self.wallet.wallet_id])
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(change_stripes):
+            with self.assertRaises(TransactionContention):
+                perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+            response = self.client.post(f'/api/v1/wallets/{self.wallet.wallet_id}/operation/',
+                                        {'operation_type': 'DEPOSIT', 'amount': 10}, format='json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        wallet = Wallet.objects.get(wallet_id=self.wallet.wallet_id)
+        self.assertEqual((wallet.stripe_count, wallet.get_total_balance()), (3, Decimal('100.00')))
+        logger.info("Тест test_deposit_contention_on_stripe_changes пройден успешно")
+
+    def test_retrieve_sums_stripes(self):
+        """
+        Тестирует, что эндпоинты чтения возвращают баланс с учетом полос.
+        """
+
+        logger.info("Начало теста test_retrieve_sums_stripes")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('0.50'))
+
+        response = self.client.get(f'/api/v1/wallets/{self.wallet.wallet_id}/')
+        self.assertEqual(response.json(), {'balance': 100.5})
+
+        response = self.client.get(f'/api/v1/wallets/{self.wallet.wallet_id}/info/')
+        self.assertEqual(response.json()['balance'], '100.50')
+        logger.info("Тест test_retrieve_sums_stripes пройден успешно")
+
+    def test_exact_decimal_version(self):
+        """
+        Тестирует суммы строками в версии API 2 (Accept: application/json; version=2) и ответ 406 на недопустимую версию.
+        """
+
+        logger.info("Начало теста test_exact_decimal_version")
+        url = f'/api/v1/wallets/{self.wallet.wallet_id}/'
+        accept = 'application/json; version=2'
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('0.10'))
+
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT=accept).json(), {'balance': '100.10'})
+        self.assertEqual(self.client.get(url).json(), {'balance': 100.1})
+
+        response = self.client.post(f'{url}operation/', {'operation_type': 'DEPOSIT', 'amount': '0.20'},
+                                    format='json', HTTP_ACCEPT=accept)
+        self.assertEqual(response.json()['new_balance'], '100.30')
+
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/json; version=3').status_code, 406)
+        logger.info("Тест test_exact_decimal_version пройден успешно")
+
+
+class WalletBatchOperationTests(WalletTestCase):
+    """
+    Тесты для пакетного выполнения операций.
+    """
+
+    def setUp(self):
+        """
+        Создание двух кошельков для пакетных операций.
+        """
+
+        super().setUp()
+        self.first = WalletFactory(user=self.user, balance=100.00)
+        self.second = WalletFactory(balance=10.00)
+
+    def post_batch(self, operations: list, atomic: bool = True):
+        """
+        Отправляет пакет операций на эндпоинт пакетной обработки.
+        """
+
+        return self.client.post('/api/v1/wallets/operations/batch/',
+                                {'atomic': atomic, 'operations': operations},
+                                format='json')
+
+    def test_batch_applies_operations_in_order(self):
+        """
+        Тестирует последовательное применение операций пакета к нескольким кошелькам.
+        """
+
+        logger.info("Начало теста test_batch_applies_operations_in_order")
+        response = self.post_batch([
+            {'wallet_id': str(self.second.wallet_id), 'operation_type': 'DEPOSIT', 'amount': '40.00'},
+            {'wallet_id': str(self.second.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '50.00'},
+            {'wallet_id': str(self.first.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '0.01'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['new_balance'] for result in response.json()['results']], [50.0, 0.0, 99.99])
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.balance, Decimal('99.99'))
+        self.assertEqual(self.second.balance, Decimal('0.00'))
+        logger.info("Тест test_batch_applies_operations_in_order пройден успешно")
+
+    def test_atomic_batch_rolls_back(self):
+        """
+        Тестирует, что при ошибке в атомарном пакете не применяется ни одна операция.
+        """
+
+        logger.info("Начало теста test_atomic_batch_rolls_back")
+        response = self.post_batch([
+            {'wallet_id': str(self.first.wallet_id), 'operation_type': 'DEPOSIT', 'amount': '5.00'},
+            {'wallet_id': str(self.second.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '11.00'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['rolled_back', 'error'])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.balance, Decimal('100.00'))
+        logger.info("Тест test_atomic_batch_rolls_back пройден успешно")
+
+    def test_per_item_batch_skips_failures(self):
+        """
+        Тестирует, что в неатомарном пакете ошибочные операции пропускаются, а остальные применяются.
+        """
+
+        logger.info("Начало теста test_per_item_batch_skips_failures")
+        response = self.post_batch([
+            {'wallet_id': str(uuid.uuid4()), 'operation_type': 'DEPOSIT', 'amount': '5.00'},
+            {'wallet_id': str(self.second.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '11.00'},
+            {'wallet_id': str(self.first.wallet_id), 'operation_type': 'DEPOSIT', 'amount': '5.00'},
+        ], atomic=False)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['error', 'error', 'ok'])
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.balance, Decimal('105.00'))
+        self.assertEqual(self.second.balance, Decimal('10.00'))
+        logger.info("Тест test_per_item_batch_skips_failures пройден успешно")
+
+    def test_batch_withdraw_from_striped_wallet(self):
+        """
+        Тестирует пакетное списание с кошелька с полосами: собственный баланс не уходит в минус.
+        """
+
+        logger.info("Начало теста test_batch_withdraw_from_striped_wallet")
+        set_wallet_stripes(self.second.wallet_id, 2)
+        perform_operation(self.second.wallet_id, "DEPOSIT", Decimal('30.00'))
+
+        response = self.post_batch([
+            {'wallet_id': str(self.second.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '25.00'},
+        ])
+
+        self.assertEqual(response.json()['results'][0]['new_balance'], 15.0)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.balance, Decimal('0.00'))
+        self.assertEqual(self.second.get_total_balance(), Decimal('15.00'))
+        logger.info("Тест test_batch_withdraw_from_striped_wallet пройден успешно")
+
+
+class WalletTransactionTests(WalletTestCase):
+    """
+    Тесты для журнала операций кошелька.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька для операций.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+    def test_operations_are_recorded(self):
+        """
+        Тестирует, что каждая успешная операция записывается в журнал, а неуспешная - нет.
+        """
+
+        logger.info("Начало теста test_operations_are_recorded")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+        perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('30.00'))
+        with self.assertRaises(ValueError):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('500.00'))
+
+        entries = list(WalletTransaction.objects.filter(wallet=self.wallet)
+                       .order_by('id').values_list('operation_type', 'amount'))
+        self.assertEqual(entries, [('DEPOSIT', Decimal('10.00')), ('WITHDRAW', Decimal('30.00'))])
+        logger.info("Тест test_operations_are_recorded пройден успешно")
+
+    @override_settings(WALLET_ATOMIC_OPERATIONS=False)
+    def test_locked_operations_are_recorded(self):
+        """
+        Тестирует запись в журнал в режиме SELECT ... FOR UPDATE.
+        """
+
+        logger.info("Начало теста test_locked_operations_are_recorded")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+        perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('5.00'))
+
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet).count(), 2)
+        logger.info("Тест test_locked_operations_are_recorded пройден успешно")
+
+    def test_entries_are_immutable(self):
+        """
+        Тестирует, что существующую запись журнала нельзя изменить.
+        """
+
+        logger.info("Начало теста test_entries_are_immutable")
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+        entry = WalletTransaction.objects.get(wallet=self.wallet)
+
+        entry.amount = Decimal('1000.00')
+        with self.assertRaises(ValueError):
+            entry.save()
+        logger.info("Тест test_entries_are_immutable пройден успешно")
+
+    def test_transactions_endpoint(self):
+        """
+        Тестирует получение последних операций кошелька через API.
+        """
+
+        logger.info("Начало теста test_transactions_endpoint")
+        for amount in ('1.00', '2.00', '3.00'):
+            perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal(amount))
+
+        response = self.client.get(f'/api/v1/wallets/{self.wallet.wallet_id}/transactions/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['amount'] for entry in response.json()], ['3.00', '2.00'])
+
+        response = self.client.get(f'/api/v1/wallets/{uuid.uuid4()}/transactions/')
+        self.assertEqual(response.status_code, 404)
+        logger.info("Тест test_transactions_endpoint пройден успешно")
+
+
+class WalletIdempotencyTests(WalletTestCase):
+    """
+    Тесты для ключей идемпотентности эндпоинта операций.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька для операций.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+        self.url = f'/api/v1/wallets/{self.wallet.wallet_id}/operation/'
+
+    def post_operation(self, key: str, amount: str = '10.00'):
+        """
+        Отправляет операцию списания с заголовком Idempotency-Key.
+        """
+
+        return self.client.post(self.url, {'operation_type': 'WITHDRAW', 'amount': amount},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def assert_replayed_once(self):
+        """
+        Проверяет, что повтор запроса с тем же ключом не выполняет операцию повторно.
+        """
+
+        # Ответ сохраняется после фиксации транзакции операции
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.post_operation('retry-1')
+        second = self.post_operation('retry-1')
+
+        self.assertEqual(first.json(), second.json())
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('90.00'))
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet).count(), 1)
+
+    def test_database_store_replays_response(self):
+        """
+        Тестирует повтор запроса с хранилищем ключей в базе данных.
+        """
+
+        logger.info("Начало теста test_database_store_replays_response")
+        self.assert_replayed_once()
+        logger.info("Тест test_database_store_replays_response пройден успешно")
+
+    @override_settings(WALLET_IDEMPOTENCY={'BACKEND': 'wallet.idempotency.LocMemIdempotencyStore', 'TTL': 60})
+    def test_locmem_store_replays_response(self):
+        """
+        Тестирует повтор запроса с хранилищем ключей в памяти процесса.
+        """
+
+        logger.info("Начало теста test_locmem_store_replays_response")
+        self.assert_replayed_once()
+        logger.info("Тест test_locmem_store_replays_response пройден успешно")
+
+    def test_key_reuse_with_other_payload(self):
+        """
+        Тестирует, что ключ нельзя использовать повторно с другими данными запроса.
+        """
+
+        logger.info("Начало теста test_key_reuse_with_other_payload")
+        self.post_operation('retry-2')
+        response = self.post_operation('retry-2', amount='20.00')
+
+        self.assertEqual(response.status_code, 422)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('90.00'))
+        logger.info("Тест test_key_reuse_with_other_payload пройден успешно")
+
+    def test_expired_key_is_reused(self):
+        """
+        Тестирует, что устаревший ключ захватывается заново и операция выполняется.
+        """
+
+        logger.info("Начало теста test_expired_key_is_reused")
+        self.post_operation('retry-3')
+        IdempotencyKey.objects.filter(key='ip:127.0.0.1:retry-3').update(expires_at=timezone.now())
+
+        response = self.post_operation('retry-3')
+
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('80.00'))
+        logger.info("Тест test_expired_key_is_reused пройден успешно")
+
+    def test_keys_are_scoped_to_client(self):
+        """
+        Тестирует, что одинаковые ключи разных пользователей не возвращают ответы друг друга.
+        """
+
+        logger.info("Начало теста test_keys_are_scoped_to_client")
+        self.client.force_authenticate(user=self.user)
+        first = self.post_operation('shared-key')
+        self.client.force_authenticate(user=UserFactory())
+        second = self.post_operation('shared-key')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertNotIn('Idempotent-Replayed', second.headers)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('80.00'))
+        self.assertEqual(IdempotencyKey.objects.filter(key__endswith=':shared-key').count(), 2)
+        self.assertTrue(IdempotencyKey.objects.filter(key=f'user:{self.user.pk}:shared-key').exists())
+        logger.info("Тест test_keys_are_scoped_to_client пройден успешно")
+
+
+class WalletListTests(WalletTestCase):
+    """
+    Тесты для постраничного и потокового списка кошельков.
+    """
+
+    def setUp(self):
+        """
+        Создание нескольких кошельков.
+        """
+
+        super().setUp()
+        self.wallets = [WalletFactory(user=self.user, balance=10.00)]
+        self.wallets += [WalletFactory(user=UserFactory(), balance=10.00 * i) for i in range(2, 6)]
+        self.wallet_ids = sorted(str(wallet.wallet_id) for wallet in self.wallets)
+
+    def test_cursor_pagination_is_stable(self):
+        """
+        Тестирует, что обход страниц не пропускает и не повторяет кошельки при вставке новых.
+        """
+
+        logger.info("Начало теста test_cursor_pagination_is_stable")
+        url = '/api/v1/wallets/?page_size=2'
+        seen = []
+        inserted = None
+
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [wallet['wallet_id'] for wallet in response.json()['results']]
+            url = response.json()['next']
+            if inserted is None:
+                inserted = str(WalletFactory(user=UserFactory(), balance=1.00).wallet_id)
+
+        expected = sorted(self.wallet_ids + [inserted]) if inserted > seen[1] else self.wallet_ids
+        self.assertEqual(seen, expected)
+        logger.info("Тест test_cursor_pagination_is_stable пройден успешно")
+
+    def test_stream_json(self):
+        """
+        Тестирует потоковую выдачу списка кошельков JSON-массивом.
+        """
+
+        logger.info("Начало теста test_stream_json")
+        with self.settings(WALLET_LIST_STREAM_CHUNK_SIZE=2):
+            response = self.client.get('/api/v1/wallets/?stream=json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([wallet['wallet_id'] for wallet in data], self.wallet_ids)
+        self.assertEqual(data[0]['balance'], '%.2f' % Wallet.objects.get(wallet_id=data[0]['wallet_id']).balance)
+        logger.info("Тест test_stream_json пройден успешно")
+
+    def test_stream_ndjson(self):
+        """
+        Тестирует потоковую выдачу списка кошельков в формате NDJSON.
+        """
+
+        logger.info("Начало теста test_stream_ndjson")
+        response = self.client.get('/api/v1/wallets/?stream=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['wallet_id'] for line in lines], self.wallet_ids)
+        self.assertEqual(self.client.get('/api/v1/wallets/?stream=xml').status_code, 400)
+        logger.info("Тест test_stream_ndjson пройден успешно")
+
+
+    async def test_stream_under_asgi(self):
+        """
+        Тестирует, что под ASGI поток списка кошельков отдается асинхронным итератором по блокам.
+        """
+
+        logger.info("Начало теста test_stream_under_asgi")
+        with self.settings(WALLET_LIST_STREAM_CHUNK_SIZE=2):
+            response = await self.async_client.get('/api/v1/wallets/?stream=ndjson')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertGreater(len(chunks), 2)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual([json.loads(line)['wallet_id'] for line in lines], self.wallet_ids)
+        logger.info("Тест test_stream_under_asgi пройден успешно")
+
+class ReplicaRoutingTests(WalletTestCase):
+    """
+    Тесты для чтения с реплик и закрепления клиентов за основной базой данных.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька.
+        """
+
+        super().setUp()
+        cache.clear()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+    def test_router(self):
+        """
+        Тестирует, что реплики используются только внутри use_replicas, а запись - всегда на основной базе.
+        """
+
+        logger.info("Начало теста test_router")
+        router = ReplicaRouter()
+
+        with self.settings(DATABASE_REPLICAS=['replica_1']):
+            self.assertEqual(router.db_for_read(Wallet), 'default')
+            with use_replicas():
+                self.assertEqual(router.db_for_read(Wallet), 'replica_1')
+                self.assertEqual(router.db_for_write(Wallet), 'default')
+            self.assertFalse(router.allow_migrate('replica_1', 'wallet'))
+
+        with use_replicas():
+            self.assertEqual(router.db_for_read(Wallet), 'default')
+        logger.info("Тест test_router пройден успешно")
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_operation_pins_client_and_wallet(self):
+        """
+        Тестирует, что после операции клиент и кошелек читаются с основной базы данных.
+        """
+
+        logger.info("Начало теста test_operation_pins_client_and_wallet")
+        replica_allowed = []
+
+        class View:
+            @replica_reads
+            def retrieve(self, request, wallet_id=None):
+                replica_allowed.append(replicas_allowed())
+
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        View().retrieve(request, wallet_id=self.wallet.wallet_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/wallets/{self.wallet.wallet_id}/operation/',
+                                        {'operation_type': 'DEPOSIT', 'amount': '10.00'},
+                                        format='json', REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_pinned('ip:10.0.0.2'))
+        View().retrieve(request, wallet_id=self.wallet.wallet_id)
+        View().retrieve(request, wallet_id=uuid.uuid4())
+        self.assertEqual(replica_allowed, [True, False, True])
+        logger.info("Тест test_operation_pins_client_and_wallet пройден успешно")
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_pin_applies_during_request(self):
+        """
+        Тестирует, что закрепление кошелька, установленное после начала запроса,
+        действует на следующие чтения того же запроса.
+        """
+
+        logger.info("Начало теста test_pin_applies_during_request")
+        replica_allowed = []
+
+        class View:
+            @replica_reads
+            def retrieve(self, request, wallet_id=None):
+                replica_allowed.append(replicas_allowed())
+                pin_to_primary([wallet_key(wallet_id)])
+                replica_allowed.append(replicas_allowed())
+                replica_allowed.append(ReplicaRouter().db_for_read(Wallet))
+
+        View().retrieve(RequestFactory().get('/', REMOTE_ADDR='10.0.0.4'), wallet_id=self.wallet.wallet_id)
+        self.assertEqual(replica_allowed, [True, False, 'default'])
+        logger.info("Тест test_pin_applies_during_request пройден успешно")
+
+    def test_sticky_cache_check(self):
+        """
+        Тестирует, что проверка системы требует общий кэш закреплений при репликах.
+        """
+
+        logger.info("Начало теста test_sticky_cache_check")
+        self.assertEqual(check_sticky_cache(), [])
+        with self.settings(DATABASE_REPLICAS=['default']):
+            self.assertEqual([error.id for error in run_checks(tags=[checks.Tags.caches])], ['wallet.E002'])
+            with self.settings(DATABASE_REPLICA_STICKY_CACHE='missing'):
+                self.assertEqual([error.id for error in check_sticky_cache()], ['wallet.E001'])
+            shared = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'sticky_pins'}
+            with self.settings(CACHES={'default': settings.CACHES['default'], 'sticky': shared},
+                               DATABASE_REPLICA_STICKY_CACHE='sticky'):
+                self.assertEqual(check_sticky_cache(), [])
+        logger.info("Тест test_sticky_cache_check пройден успешно")
+
+    def test_stats_include_connections(self):
+        """
+        Тестирует, что статистика соединений доступна в эндпоинте stats.
+        """
+
+        logger.info("Начало теста test_stats_include_connections")
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        databases = self.client.get('/api/v1/wallets/stats/').json()['databases']
+
+        self.assertTrue(databases['default']['connected'])
+        self.assertTrue(databases['default']['health_checks'])
+        logger.info("Тест test_stats_include_connections пройден успешно")
+
+
+def closing_async_pool(test):
+    """
+    Закрывает пул асинхронных соединений после теста: каждый асинхронный тест выполняется в своем цикле событий.
+    """
+
+    @functools.wraps(test)
+    async def wrapper(self):
+        try:
+            await test(self)
+        finally:
+            await close_async_pool()
+    return wrapper
+
+
+class WalletMetricsTests(WalletTestCase):
+    """
+    Тесты для метрик процесса (GET /metrics).
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+    def observed(self, metric, *labels):
+        """
+        Значение счетчика или количество наблюдений гистограммы с метками labels.
+        """
+
+        values = metrics.collect()[metric.name].get(labels)
+        if values is None:
+            return 0
+        return values[0] if isinstance(metric, metrics.Counter) else sum(values[:-1])
+
+    def test_request_latency_and_queries_by_endpoint(self):
+        """
+        Тестирует запись времени обработки и количества SQL-запросов по эндпоинтам.
+        """
+
+        logger.info("Начало теста test_request_latency_and_queries_by_endpoint")
+        url = f'/api/v1/wallets/{self.wallet.wallet_id}/operation/'
+        before = self.observed(metrics.REQUEST_LATENCY, 'operation', 'POST', 200)
+        queries_before = metrics.collect()[metrics.REQUEST_QUERIES.name].get(('operation',), [0])[-1]
+
+        response = self.client.post(url, {'operation_type': 'DEPOSIT', 'amount': 10}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.observed(metrics.REQUEST_LATENCY, 'operation', 'POST', 200), before + 1)
+        self.assertGreater(metrics.collect()[metrics.REQUEST_QUERIES.name][('operation',)][-1], queries_before)
+        logger.info("Тест test_request_latency_and_queries_by_endpoint пройден успешно")
+
+    def test_operation_outcomes(self):
+        """
+        Тестирует подсчет успешных операций, нехватки средств и несуществующих кошельков.
+        """
+
+        logger.info("Начало теста test_operation_outcomes")
+        outcomes = ['success', 'insufficient_funds', 'not_found']
+        before = [self.observed(metrics.OPERATION_OUTCOMES, 'WITHDRAW', outcome) for outcome in outcomes]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('10.00'))
+        with self.assertRaises(ValueError):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('1000.00'))
+        with self.assertRaises(Http404):
+            perform_operation(uuid.uuid4(), "WITHDRAW", Decimal('10.00'))
+
+        after = [self.observed(metrics.OPERATION_OUTCOMES, 'WITHDRAW', outcome) for outcome in outcomes]
+        self.assertEqual(after, [count + 1 for count in before])
+        logger.info("Тест test_operation_outcomes пройден успешно")
+
+    @override_settings(WALLET_ATOMIC_OPERATIONS=False)
+    def test_lock_wait(self):
+        """
+        Тестирует запись времени ожидания блокировки SELECT ... FOR UPDATE.
+        """
+
+        logger.info("Начало теста test_lock_wait")
+        before = self.observed(metrics.LOCK_WAIT, 'select_for_update')
+
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('10.00'))
+
+        self.assertEqual(self.observed(metrics.LOCK_WAIT, 'select_for_update'), before + 1)
+        logger.info("Тест test_lock_wait пройден успешно")
+
+    def test_metrics_endpoint(self):
+        """
+        Тестирует вывод метрик в текстовом формате Prometheus.
+        """
+
+        logger.info("Начало теста test_metrics_endpoint")
+        self.client.get(f'/api/v1/wallets/{self.wallet.wallet_id}/info/')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE wallet_http_request_duration_seconds histogram', body)
+        self.assertIn('wallet_http_request_duration_seconds_bucket{endpoint="info",method="GET",status="200",le="+Inf"}',
+                      body)
+        self.assertIn('# TYPE wallet_operation_outcomes_total counter', body)
+
+        with self.settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        logger.info("Тест test_metrics_endpoint пройден успешно")
+
+    def test_values_of_finished_threads_are_kept(self):
+        """
+        Тестирует, что значения завершившихся потоков не теряются при выводе метрик.
+        """
+
+        logger.info("Начало теста test_values_of_finished_threads_are_kept")
+        before = self.observed(metrics.LOCK_WAIT, 'test')
+
+        threads = [threading.Thread(target=metrics.LOCK_WAIT.observe, args=(0.01, 'test')) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.observed(metrics.LOCK_WAIT, 'test'), before + 3)
+        logger.info("Тест test_values_of_finished_threads_are_kept пройден успешно")
+
+
+class WalletAsyncViewTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты для асинхронных представлений (ASGI).
+
+    Асинхронные представления работают через собственный пул соединений,
+    поэтому данные тестов фиксируются в базе (TransactionTestCase).
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька.
+        """
+
+        get_balance_cache.cache_clear()
+        self.wallet = WalletFactory(user=UserFactory(), balance=100.00)
+        self.factory = AsyncRequestFactory()
+
+    async def post_operation(self, payload, **extra):
+        """
+        Выполняет асинхронный запрос операции с кошельком.
+        """
+
+        request = self.factory.post('/', payload, content_type='application/json', **extra)
+        return await async_views.wallet_operation(request, wallet_id=self.wallet.wallet_id)
+
+    @closing_async_pool
+    async def test_retrieve_and_info(self):
+        """
+        Тестирует получение баланса и информации о кошельке асинхронными представлениями.
+        """
+
+        logger.info("Начало теста test_retrieve_and_info")
+        wallet_id = self.wallet.wallet_id
+
+        response = await async_views.wallet_retrieve(self.factory.get('/'), wallet_id=wallet_id)
+        self.assertEqual(json.loads(response.content), {'balance': 100.0})
+
+        response = await async_views.wallet_info(self.factory.get('/'), wallet_id=wallet_id)
+        self.assertEqual(json.loads(response.content)['balance'], '100.00')
+
+        response = await async_views.wallet_retrieve(self.factory.get('/'), wallet_id=uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+        logger.info("Тест test_retrieve_and_info пройден успешно")
+
+    @closing_async_pool
+    async def test_operation(self):
+        """
+        Тестирует выполнение операций асинхронным представлением, запись журнала операций
+        и времени ожидания блокировки строки кошелька.
+        """
+
+        logger.info("Начало теста test_operation")
+        await async_views.wallet_retrieve(self.factory.get('/'), wallet_id=self.wallet.wallet_id)
+        lock_waits = sum(metrics.collect()[metrics.LOCK_WAIT.name].get(('update',), [0])[:-1])
+
+        response = await self.post_operation({'operation_type': 'WITHDRAW', 'amount': '30.00'})
+        self.assertEqual(json.loads(response.content), {'message': 'Операция выполнена успешно.', 'new_balance': 70.0})
+        self.assertEqual(sum(metrics.collect()[metrics.LOCK_WAIT.name][('update',)][:-1]), lock_waits + 1)
+
+        response = await async_views.wallet_retrieve(self.factory.get('/'), wallet_id=self.wallet.wallet_id)
+        self.assertEqual(json.loads(response.content), {'balance': 70.0})
+        self.assertEqual(await WalletTransaction.objects.filter(wallet_id=self.wallet.wallet_id).acount(), 1)
+        logger.info("Тест test_operation пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS, 'LOCK_TIMEOUT': 50, 'MAX_RETRIES': 1,
+                                            'RETRY_BASE_DELAY': 0})
+    @closing_async_pool
+    async def test_operation_returns_503_on_contention(self):
+        """
+        Тестирует, что асинхронная операция ждет блокировку не дольше lock_timeout,
+        повторяется и после всех повторов возвращает 503 с заголовком Retry-After.
+        """
+
+        logger.info("Начало теста test_operation_returns_503_on_contention")
+        before = retry_stats()['exhausted'].get(LOCK_NOT_AVAILABLE, 0)
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Wallet.objects.select_for_update().get(wallet_id=self.wallet.wallet_id)
+                locked.set()
+                release.wait(timeout=10)
+            connections.close_all()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(timeout=5)
+        try:
+            response = await self.post_operation({'operation_type': 'WITHDRAW', 'amount': '10.00'})
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(retry_stats()['exhausted'][LOCK_NOT_AVAILABLE], before + 1)
+        await self.wallet.arefresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('100.00'))
+        logger.info("Тест test_operation_returns_503_on_contention пройден успешно")
+
+    @closing_async_pool
+    async def test_fallback_to_sync_view(self):
+        """
+        Тестирует, что ошибки валидации и кошельки с полосами обрабатываются синхронным представлением.
+        """
+
+        logger.info("Начало теста test_fallback_to_sync_view")
+        response = await self.post_operation({'operation_type': 'WITHDRAW', 'amount': '-1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.data)
+
+        await sync_to_async(set_wallet_stripes)(self.wallet.wallet_id, 2)
+        response = await self.post_operation({'operation_type': 'DEPOSIT', 'amount': '10.00'})
+        self.assertEqual(response.data['new_balance'], 110.0)
+        logger.info("Тест test_fallback_to_sync_view пройден успешно")
+
+    @override_settings(WALLET_ADMISSION={'ENABLED': True, 'BACKEND': 'wallet.admission.LocMemAdmissionController',
+                                         'MAX_IN_FLIGHT': 1, 'WALLET_CONCURRENCY': 1, 'WALLET_RATE': 0.01,
+                                         'WALLET_BURST': 1})
+    @closing_async_pool
+    async def test_fallback_is_admitted_once(self):
+        """
+        Тестирует, что операция, допущенная асинхронным представлением и переданная
+        синхронному, не проходит контроль допуска повторно (не расходует второй токен кошелька).
+        """
+
+        logger.info("Начало теста test_fallback_is_admitted_once")
+        await sync_to_async(set_wallet_stripes)(self.wallet.wallet_id, 2)
+
+        response = await self.post_operation({'operation_type': 'DEPOSIT', 'amount': '10.00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_balance'], 110.0)
+        self.assertEqual(get_admission_controller().stats()['in_flight'], 0)
+        logger.info("Тест test_fallback_is_admitted_once пройден успешно")
+
+    @closing_async_pool
+    async def test_exact_decimal_version(self):
+        """
+        Тестирует суммы строками в версии API 2 и ответ 406 на недопустимую версию.
+        """
+
+        logger.info("Начало теста test_exact_decimal_version")
+        accept = {'headers': {'Accept': 'application/json; version=2'}}
+        wallet_id = self.wallet.wallet_id
+
+        response = await async_views.wallet_retrieve(self.factory.get('/', **accept), wallet_id=wallet_id)
+        self.assertEqual(json.loads(response.content), {'balance': '100.00'})
+
+        response = await self.post_operation({'operation_type': 'WITHDRAW', 'amount': '0.10'}, **accept)
+        self.assertEqual(json.loads(response.content)['new_balance'], '99.90')
+
+        request = self.factory.get('/', headers={'Accept': 'application/json; version=9'})
+        response = await async_views.wallet_retrieve(request, wallet_id=wallet_id)
+        self.assertEqual(response.status_code, 406)
+        logger.info("Тест test_exact_decimal_version пройден успешно")
+
+
+class WalletTransferTests(WalletTestCase):
+    """
+    Тесты для переводов между кошельками.
+    """
+
+    def setUp(self):
+        """
+        Создание двух кошельков.
+        """
+
+        super().setUp()
+        self.source = WalletFactory(user=self.user, balance=100.00)
+        self.destination = WalletFactory(user=UserFactory(), balance=50.00)
+        self.url = f'/api/v1/wallets/{self.source.wallet_id}/transfer/'
+
+    def test_transfer(self):
+        """
+        Тестирует перевод и записи журнала обоих кошельков.
+        """
+
+        logger.info("Начало теста test_transfer")
+        source, destination = transfer(self.source.wallet_id, self.destination.wallet_id, Decimal('30.00'))
+
+        self.assertEqual(source.balance, Decimal('70.00'))
+        self.assertEqual(destination.balance, Decimal('80.00'))
+        self.destination.refresh_from_db()
+        self.assertEqual(self.destination.balance, Decimal('80.00'))
+        self.assertEqual(
+            sorted(WalletTransaction.objects.values_list('wallet_id', 'operation_type', 'amount')),
+            sorted([(self.source.wallet_id, 'TRANSFER_OUT', Decimal('30.00')),
+                    (self.destination.wallet_id, 'TRANSFER_IN', Decimal('30.00'))])
+        )
+        logger.info("Тест test_transfer пройден успешно")
+
+    def test_transfer_errors_do_not_change_balances(self):
+        """
+        Тестирует отказ при нехватке средств, переводе на тот же кошелек и несуществующем получателе.
+        """
+
+        logger.info("Начало теста test_transfer_errors_do_not_change_balances")
+        with self.assertRaisesMessage(ValueError, "Недостаточно средств на счете"):
+            transfer(self.source.wallet_id, self.destination.wallet_id, Decimal('100.01'))
+        with self.assertRaises(ValueError):
+            transfer(self.source.wallet_id, str(self.source.wallet_id), Decimal('1.00'))
+        with self.assertRaises(Http404):
+            transfer(self.source.wallet_id, uuid.uuid4(), Decimal('1.00'))
+        with self.assertRaises(Http404):
+            transfer(uuid.uuid4(), self.source.wallet_id, Decimal('1.00'))
+
+        self.source.refresh_from_db()
+        self.destination.refresh_from_db()
+        self.assertEqual((self.source.balance, self.destination.balance), (Decimal('100.00'), Decimal('50.00')))
+        self.assertFalse(WalletTransaction.objects.exists())
+        logger.info("Тест test_transfer_errors_do_not_change_balances пройден успешно")
+
+    def test_transfer_with_striped_wallets(self):
+        """
+        Тестирует перевод с кошелька с полосами и на него.
+        """
+
+        logger.info("Начало теста test_transfer_with_striped_wallets")
+        set_wallet_stripes(self.source.wallet_id, 4)
+        perform_operation(self.source.wallet_id, "DEPOSIT", Decimal('20.00'))
+
+        source, destination = transfer(self.source.wallet_id, self.destination.wallet_id, Decimal('110.00'))
+        self.assertEqual(source.get_total_balance(), Decimal('10.00'))
+        self.assertEqual(destination.get_total_balance(), Decimal('160.00'))
+
+        source, destination = transfer(self.destination.wallet_id, self.source.wallet_id, Decimal('60.00'))
+        self.assertEqual(source.get_total_balance(), Decimal('100.00'))
+        self.assertEqual(Wallet.objects.get(wallet_id=self.source.wallet_id).get_total_balance(), Decimal('70.00'))
+        logger.info("Тест test_transfer_with_striped_wallets пройден успешно")
+
+    def test_transfer_endpoint(self):
+        """
+        Тестирует эндпоинт перевода, его ошибки и повтор запроса с ключом идемпотентности.
+        """
+
+        logger.info("Начало теста test_transfer_endpoint")
+        payload = {'destination_wallet_id': str(self.destination.wallet_id), 'amount': '25.50'}
+
+        response = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='transfer-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'message': 'Перевод выполнен успешно.', 'new_balance': 74.5})
+
+        response = self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY='transfer-1')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.destination.refresh_from_db()
+        self.assertEqual(self.destination.balance, Decimal('75.50'))
+
+        response = self.client.post(self.url, {**payload, 'amount': '1000.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Недостаточно средств на счете'})
+
+        response = self.client.post(self.url, {**payload, 'destination_wallet_id': str(uuid.uuid4())}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.post(self.url, {'amount': '1.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('destination_wallet_id', response.json())
+        logger.info("Тест test_transfer_endpoint пройден успешно")
+
+
+class WalletHoldTests(WalletTestCase):
+    """
+    Тесты для блокировок средств (двухфазного списания).
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька с балансом 100.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+
+    def held(self) -> Decimal:
+        """
+        Возвращает held_balance кошелька из базы данных.
+        """
+
+        return Wallet.objects.get(wallet_id=self.wallet.wallet_id).held_balance
+
+    def test_hold_and_capture(self):
+        """
+        Тестирует блокировку, отказ в списании заблокированных средств и списание блокировки.
+        """
+
+        logger.info("Начало теста test_hold_and_capture")
+        hold = hold_funds(self.wallet.wallet_id, Decimal('30.00'))
+        self.assertEqual(hold.wallet.get_available_balance(), Decimal('70.00'))
+        self.assertEqual(self.held(), Decimal('30.00'))
+
+        other = WalletFactory(user=UserFactory(), balance=0)
+        with self.assertRaisesMessage(ValueError, "Недостаточно средств на счете"):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('70.01'))
+        with self.assertRaisesMessage(ValueError, "Недостаточно средств на счете"):
+            transfer(self.wallet.wallet_id, other.wallet_id, Decimal('70.01'))
+        with self.assertRaisesMessage(ValueError, "Недостаточно средств на счете"):
+            hold_funds(self.wallet.wallet_id, Decimal('70.01'))
+        results = perform_batch_operations([
+            {'wallet_id': self.wallet.wallet_id, 'operation_type': 'WITHDRAW', 'amount': Decimal('70.01')},
+        ])
+        self.assertEqual(results[0]['status'], 'error')
+
+        perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('60.00'))
+        captured = capture_hold(hold.hold_id)
+        self.assertEqual(captured.status, WalletHold.CAPTURED)
+        self.assertEqual(captured.captured_amount, Decimal('30.00'))
+        self.assertEqual(captured.wallet.balance, Decimal('10.00'))
+        self.assertEqual(captured.wallet.get_available_balance(), Decimal('10.00'))
+
+        self.assertEqual(self.held(), Decimal('0.00'))
+        self.assertEqual(WalletHold.objects.get(hold_id=hold.hold_id).status, WalletHold.CAPTURED)
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet, operation_type='CAPTURE')
+                         .values_list('amount', flat=True).get(), Decimal('30.00'))
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet).replay()['delta'], Decimal('-90.00'))
+        logger.info("Тест test_hold_and_capture пройден успешно")
+
+    def test_partial_capture_and_release(self):
+        """
+        Тестирует частичное списание (остаток освобождается), снятие блокировки и повторное завершение.
+        """
+
+        logger.info("Начало теста test_partial_capture_and_release")
+        hold = hold_funds(self.wallet.wallet_id, Decimal('50.00'))
+        with self.assertRaisesMessage(ValueError, "Сумма списания превышает заблокированную сумму."):
+            capture_hold(hold.hold_id, Decimal('50.01'))
+
+        captured = capture_hold(hold.hold_id, Decimal('20.00'))
+        self.assertEqual(captured.amount, Decimal('50.00'))
+        self.assertEqual(captured.wallet.balance, Decimal('80.00'))
+        self.assertEqual(self.held(), Decimal('0.00'))
+
+        second = hold_funds(self.wallet.wallet_id, Decimal('10.00'))
+        released = release_hold(second.hold_id)
+        self.assertEqual(released.status, WalletHold.RELEASED)
+        self.assertEqual(released.wallet.get_available_balance(), Decimal('80.00'))
+        self.assertEqual(self.held(), Decimal('0.00'))
+
+        for settle in (release_hold, capture_hold):
+            for hold_id in (hold.hold_id, second.hold_id):
+                with self.assertRaisesMessage(ValueError, "Блокировка средств уже завершена"):
+                    settle(hold_id)
+            with self.assertRaises(Http404):
+                settle(uuid.uuid4())
+        with self.assertRaises(ValueError):
+            hold_funds(self.wallet.wallet_id, Decimal('1.00'), ttl=0)
+        with self.assertRaises(Http404):
+            hold_funds(uuid.uuid4(), Decimal('1.00'))
+        self.assertEqual(Wallet.objects.get(wallet_id=self.wallet.wallet_id).balance, Decimal('80.00'))
+        logger.info("Тест test_partial_capture_and_release пройден успешно")
+
+    def test_striped_wallet(self):
+        """
+        Тестирует блокировку и списание блокировки кошелька с полосами (средства в полосах).
+        """
+
+        logger.info("Начало теста test_striped_wallet")
+        set_wallet_stripes(self.wallet.wallet_id, 2)
+        perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('90.00'))
+        perform_operation(self.wallet.wallet_id, "DEPOSIT", Decimal('40.00'))
+
+        hold = hold_funds(self.wallet.wallet_id, Decimal('45.00'))
+        self.assertEqual(hold.wallet.get_available_balance(), Decimal('5.00'))
+        with self.assertRaisesMessage(ValueError, "Недостаточно средств на счете"):
+            perform_operation(self.wallet.wallet_id, "WITHDRAW", Decimal('5.01'))
+
+        captured = capture_hold(hold.hold_id, Decimal('42.00'))
+        self.assertEqual(captured.wallet.get_total_balance(), Decimal('8.00'))
+        wallet = Wallet.objects.get(wallet_id=self.wallet.wallet_id)
+        self.assertEqual((wallet.get_total_balance(), wallet.held_balance), (Decimal('8.00'), Decimal('0.00')))
+
+        second = hold_funds(self.wallet.wallet_id, Decimal('8.00'))
+        self.assertEqual(release_hold(second.hold_id).wallet.get_available_balance(), Decimal('8.00'))
+        logger.info("Тест test_striped_wallet пройден успешно")
+
+    def test_expired_holds(self):
+        """
+        Тестирует отказ в списании истекшей блокировки и снятие истекших блокировок пакетами.
+        """
+
+        logger.info("Начало теста test_expired_holds")
+        other = WalletFactory(user=UserFactory(), balance=100.00)
+        expired = [hold_funds(wallet.wallet_id, Decimal('10.00')).hold_id
+                   for wallet in (self.wallet, self.wallet, other)]
+        active = hold_funds(self.wallet.wallet_id, Decimal('5.00'))
+        # Разные сроки задают порядок пакетов: две блокировки self.wallet, затем блокировка other
+        now = timezone.now()
+        for age, hold_id in zip((3, 2, 1), expired):
+            WalletHold.objects.filter(hold_id=hold_id).update(expires_at=now - timedelta(seconds=age))
+
+        with self.assertRaisesMessage(ValueError, "Срок блокировки средств истек."):
+            capture_hold(expired[0])
+
+        report = release_expired_holds(batch_size=2)
+        self.assertEqual((report['released'], report['wallets'], report['batches']), (3, 2, 2))
+        self.assertEqual(self.held(), Decimal('5.00'))
+        self.assertEqual(Wallet.objects.get(wallet_id=other.wallet_id).held_balance, Decimal('0.00'))
+        self.assertEqual(set(WalletHold.objects.filter(hold_id__in=expired).values_list('status', flat=True)),
+                         {WalletHold.EXPIRED})
+        self.assertEqual(WalletHold.objects.get(hold_id=active.hold_id).status, WalletHold.ACTIVE)
+        self.assertEqual(release_expired_holds()['released'], 0)
+
+        out = io.StringIO()
+        call_command('release_expired_holds', stdout=out)
+        self.assertIn('сняты', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('release_expired_holds', batch_size=0)
+        logger.info("Тест test_expired_holds пройден успешно")
+
+    def test_hold_api(self):
+        """
+        Тестирует эндпоинты блокировки, списания и снятия блокировки.
+        """
+
+        logger.info("Начало теста test_hold_api")
+        url = f'/api/v1/wallets/{self.wallet.wallet_id}/holds/'
+        response = self.client.post(url, {'amount': '25.00', 'ttl': 60}, format='json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['status'], data['amount'], data['captured_amount'], data['available_balance']),
+                         ('ACTIVE', '25.00', None, '75.00'))
+
+        replayed = [self.client.post(url, {'amount': '1.00'}, format='json', headers={'Idempotency-Key': 'hold-1'})
+                    for _ in range(2)]
+        self.assertEqual(replayed[0].json(), replayed[1].json())
+        self.assertEqual(self.held(), Decimal('26.00'))
+
+        self.assertEqual(self.client.post(url, {'amount': '74.01'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'amount': '1.00', 'ttl': 0}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(f'/api/v1/wallets/{uuid.uuid4()}/holds/', {'amount': '1.00'},
+                                          format='json').status_code, 404)
+
+        capture_url = f"/api/v1/wallets/holds/{data['hold_id']}/capture/"
+        response = self.client.post(capture_url, {'amount': '20.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['status'], response.json()['captured_amount']), ('CAPTURED', '20.00'))
+        self.assertEqual(self.client.post(capture_url, {}, format='json').status_code, 400)
+
+        release_url = f"/api/v1/wallets/holds/{replayed[0].json()['hold_id']}/release/"
+        response = self.client.post(release_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['status'], response.json()['available_balance']), ('RELEASED', '80.00'))
+        self.assertEqual(self.client.post(release_url).status_code, 400)
+        self.assertEqual(self.client.post(f'/api/v1/wallets/holds/{uuid.uuid4()}/release/').status_code, 404)
+        logger.info("Тест test_hold_api пройден успешно")
+
+    def test_reconcile_held_balance(self):
+        """
+        Тестирует обнаружение сверкой расхождения held_balance с суммой активных блокировок.
+        """
+
+        logger.info("Начало теста test_reconcile_held_balance")
+        output = str(Path(self.enterContext(tempfile.TemporaryDirectory())) / 'report.ndjson')
+        hold_funds(self.wallet.wallet_id, Decimal('10.00'))
+        self.assertEqual(reconcile(output, ranges=2)['checks'], {})
+
+        Wallet.objects.filter(wallet_id=self.wallet.wallet_id).update(held_balance=Decimal('15.00'))
+        self.assertEqual(reconcile(output, ranges=2)['checks'], {'held_balance_mismatch': 1})
+        logger.info("Тест test_reconcile_held_balance пройден успешно")
+
+
+class WalletBalanceCheckpointTests(WalletTestCase):
+    """
+    Тесты для баланса кошелька на момент времени и контрольных точек баланса.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька с начальным балансом и операций до и после моментов moments.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+        wallet_id = str(self.wallet.wallet_id)
+
+        # Моменты: до операций, после пополнений, после списаний.
+        self.moments = [timezone.now()]
+        for _ in range(3):
+            perform_operation(wallet_id, 'DEPOSIT', Decimal('10.00'))
+        self.moments.append(timezone.now())
+        for _ in range(2):
+            perform_operation(wallet_id, 'WITHDRAW', Decimal('5.00'))
+        self.moments.append(timezone.now())
+        self.expected = [Decimal('100.00'), Decimal('130.00'), Decimal('120.00')]
+
+    def test_balance_at_without_checkpoints(self):
+        """
+        Тестирует вычисление баланса от текущего баланса кошелька с полосами.
+        """
+
+        logger.info("Начало теста test_balance_at_without_checkpoints")
+        set_wallet_stripes(self.wallet.wallet_id, 2)
+        perform_operation(str(self.wallet.wallet_id), 'DEPOSIT', Decimal('1.00'))
+
+        for at, expected, replayed in zip(self.moments, self.expected, [6, 3, 1]):
+            data = balance_at(self.wallet.wallet_id, at)
+            self.assertEqual(data['balance'], expected)
+            self.assertIsNone(data['checkpoint_at'])
+            self.assertEqual(data['replayed_entries'], replayed)
+
+        with self.assertRaises(Wallet.DoesNotExist):
+            balance_at(uuid.uuid4(), timezone.now())
+        logger.info("Тест test_balance_at_without_checkpoints пройден успешно")
+
+    def test_balance_at_replays_entries_from_nearest_checkpoint(self):
+        """
+        Тестирует проигрывание записей журнала вперед и назад от ближайшей контрольной точки.
+        """
+
+        logger.info("Начало теста test_balance_at_replays_entries_from_nearest_checkpoint")
+        report = create_checkpoints(at=self.moments[1], min_entries=0)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['replay_max'], 2)
+
+        checkpoint = WalletBalanceCheckpoint.objects.get(wallet=self.wallet)
+        self.assertEqual((checkpoint.balance, checkpoint.entries), (Decimal('130.00'), 3))
+
+        for at, expected, replayed in zip(self.moments, self.expected, [3, 0, 2]):
+            data = balance_at(self.wallet.wallet_id, at)
+            self.assertEqual(data['balance'], expected)
+            self.assertEqual(data['checkpoint_at'], self.moments[1])
+            self.assertEqual(data['replayed_entries'], replayed)
+        logger.info("Тест test_balance_at_replays_entries_from_nearest_checkpoint пройден успешно")
+
+    def test_create_checkpoints_min_entries(self):
+        """
+        Тестирует создание следующей точки только после MIN_ENTRIES записей журнала и повторный запуск.
+        """
+
+        logger.info("Начало теста test_create_checkpoints_min_entries")
+        create_checkpoints(at=self.moments[1], min_entries=0)
+        self.assertEqual(create_checkpoints(at=self.moments[2], min_entries=3)['created'], 0)
+        self.assertEqual(create_checkpoints(at=self.moments[2], min_entries=2, batch_size=1)['created'], 1)
+        self.assertEqual(create_checkpoints(at=self.moments[2], min_entries=0)['created'], 0)
+
+        self.assertEqual(
+            list(WalletBalanceCheckpoint.objects.order_by('as_of').values_list('balance', 'entries')),
+            [(Decimal('130.00'), 3), (Decimal('120.00'), 2)]
+        )
+        data = balance_at(self.wallet.wallet_id, timezone.now())
+        self.assertEqual((data['balance'], data['replayed_entries']), (Decimal('120.00'), 0))
+        logger.info("Тест test_create_checkpoints_min_entries пройден успешно")
+
+    def test_create_balance_checkpoints_command(self):
+        """
+        Тестирует команду create_balance_checkpoints.
+        """
+
+        logger.info("Начало теста test_create_balance_checkpoints_command")
+        out = io.StringIO()
+        call_command('create_balance_checkpoints', '--lag', '0', '--min-entries', '1', stdout=out)
+
+        self.assertIn('Контрольные точки на', out.getvalue())
+        self.assertEqual(WalletBalanceCheckpoint.objects.get(wallet=self.wallet).balance, Decimal('120.00'))
+        with self.assertRaises(CommandError):
+            call_command('create_balance_checkpoints', '--lag', '-1', stdout=out)
+        logger.info("Тест test_create_balance_checkpoints_command пройден успешно")
+
+    def test_balance_at_endpoint(self):
+        """
+        Тестирует GET api/v1/wallets/<WALLET_UUID>/balance/?at= и ошибки параметров.
+        """
+
+        logger.info("Начало теста test_balance_at_endpoint")
+        url = f'/api/v1/wallets/{self.wallet.wallet_id}/balance/'
+
+        response = self.client.get(url, {'at': self.moments[1].isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '130.00')
+        self.assertEqual(response.json()['replayed_entries'], 2)
+        self.assertIsNone(response.json()['checkpoint_at'])
+
+        response = self.client.get(url, {'at': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '100.00')
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertIn('at', self.client.get(url, {'at': 'вчера'}).json())
+        response = self.client.get(f'/api/v1/wallets/{uuid.uuid4()}/balance/', {'at': '2000-01-01'})
+        self.assertEqual(response.status_code, 404)
+        logger.info("Тест test_balance_at_endpoint пройден успешно")
+
+
+class WalletReconciliationTests(WalletTestCase):
+    """
+    Тесты для сверки кошельков (reconcile_wallets).
+    """
+
+    def setUp(self):
+        """
+        Создание кошельков с расхождениями каждого вида и файла отчета.
+        """
+
+        super().setUp()
+        self.output = str(Path(self.enterContext(tempfile.TemporaryDirectory())) / 'report.ndjson')
+        self.valid = WalletFactory(user=UserFactory(), balance=10.00)
+        self.negative = WalletFactory(user=UserFactory(), balance=10.00)
+        self.large = WalletFactory(user=UserFactory(), balance=Decimal('9500000000000000.00'))
+        self.striped = WalletFactory(user=UserFactory(), balance=10.00)
+        self.tampered = WalletFactory(user=UserFactory(), balance=10.00)
+
+        perform_operation(str(self.tampered.wallet_id), 'DEPOSIT', Decimal('5.00'))
+        create_checkpoints(at=timezone.now(), min_entries=1)
+        perform_operation(str(self.tampered.wallet_id), 'WITHDRAW', Decimal('2.00'))
+
+        Wallet.objects.filter(wallet_id=self.negative.wallet_id).update(balance=Decimal('-1.00'))
+        Wallet.objects.filter(wallet_id=self.striped.wallet_id).update(stripe_count=2)
+        Wallet.objects.filter(wallet_id=self.tampered.wallet_id).update(balance=Decimal('14.00'))
+
+    def read_report(self) -> set:
+        """
+        Возвращает расхождения отчета как множество (проверка, кошелек или пользователь).
+        """
+
+        with open(self.output, encoding='utf-8') as file:
+            return {(item['check'], item.get('wallet_id') or item['user_id']) for item in map(json.loads, file)}
+
+    def test_wallet_ranges(self):
+        """
+        Тестирует разбиение пространства wallet_id на диапазоны без пропусков.
+        """
+
+        logger.info("Начало теста test_wallet_ranges")
+        ranges = wallet_ranges(3)
+        self.assertEqual(ranges[0][0], '00000000-0000-0000-0000-000000000000')
+        self.assertEqual([start for start, _ in ranges[1:]], [stop for _, stop in ranges[:-1]])
+        self.assertIsNone(ranges[-1][1])
+        with self.assertRaises(ValueError):
+            wallet_ranges(0)
+        logger.info("Тест test_wallet_ranges пройден успешно")
+
+    def test_reconcile_reports_discrepancies(self):
+        """
+        Тестирует обнаружение расхождений каждого вида во всех диапазонах.
+        """
+
+        logger.info("Начало теста test_reconcile_reports_discrepancies")
+        report = reconcile(self.output, ranges=5)
+
+        self.assertEqual(report['wallets'], 5)
+        self.assertEqual(self.read_report(), {
+            ('negative_balance', str(self.negative.wallet_id)),
+            ('balance_headroom', str(self.large.wallet_id)),
+            ('stripe_count_mismatch', str(self.striped.wallet_id)),
+            ('ledger_mismatch', str(self.tampered.wallet_id)),
+            ('user_without_wallet', self.user.id),
+        })
+        self.assertEqual(report['discrepancies'], 5)
+
+        report = reconcile(self.output, headroom=1, ledger=False)
+        self.assertNotIn('balance_headroom', report['checks'])
+        self.assertNotIn('ledger_mismatch', report['checks'])
+        logger.info("Тест test_reconcile_reports_discrepancies пройден успешно")
+
+    def test_reconcile_wallets_command(self):
+        """
+        Тестирует команду reconcile_wallets: ошибка при расхождениях и успешная сверка.
+        """
+
+        logger.info("Начало теста test_reconcile_wallets_command")
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, 'Найдено расхождений: 5'):
+            call_command('reconcile_wallets', '--processes', '1', '--output', self.output, stdout=out)
+        self.assertIn('ledger_mismatch: 1', out.getvalue())
+
+        User.objects.exclude(wallet=self.valid).delete()
+        call_command('reconcile_wallets', '--processes', '1', '--output', self.output, stdout=out)
+        self.assertIn('расхождений нет', out.getvalue())
+        self.assertEqual(self.read_report(), set())
+        logger.info("Тест test_reconcile_wallets_command пройден успешно")
+
+
+class WalletReconciliationProcessTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты для сверки кошельков в нескольких процессах.
+    """
+
+    def test_reconcile_in_processes(self):
+        """
+        Тестирует сверку диапазонов в пуле процессов с той же базой данных.
+        """
+
+        logger.info("Начало теста test_reconcile_in_processes")
+        output = str(Path(self.enterContext(tempfile.TemporaryDirectory())) / 'report.ndjson')
+        wallets = [WalletFactory(user=UserFactory(), balance=10.00) for _ in range(6)]
+        Wallet.objects.filter(wallet_id=wallets[0].wallet_id).update(balance=Decimal('-5.00'))
+
+        report = reconcile(output, processes=2, ranges=4)
+
+        self.assertEqual(report['wallets'], 6)
+        self.assertEqual(report['checks'], {'negative_balance': 1})
+        self.assertEqual(sorted(os.listdir(Path(output).parent)), ['report.ndjson'])
+        logger.info("Тест test_reconcile_in_processes пройден успешно")
+
+
+class WalletExportTests(WalletTestCase):
+    """
+    Тесты для выгрузки кошельков через COPY (export_wallets и GET api/v1/wallets/export/).
+    """
+
+    def setUp(self):
+        """
+        Создание кошельков, в том числе с полосами.
+        """
+
+        super().setUp()
+        self.wallets = [WalletFactory(user=UserFactory(), balance=balance) for balance in (10.50, 0, 99.99)]
+        set_wallet_stripes(self.wallets[2].wallet_id, 2)
+        perform_operation(str(self.wallets[2].wallet_id), 'DEPOSIT', Decimal('0.01'))
+        self.expected = sorted(
+            [{'wallet_id': str(wallet.wallet_id), 'user': wallet.user_id, 'balance': balance}
+             for wallet, balance in zip(self.wallets, ['10.50', '0.00', '100.00'])],
+            key=lambda item: item['wallet_id']
+        )
+
+    def test_export_formats(self):
+        """
+        Тестирует выгрузку CSV и NDJSON (со сжатием и без) и итоги снимка данных.
+        """
+
+        logger.info("Начало теста test_export_formats")
+        export = WalletExport('csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(export).decode())))
+        self.assertEqual([{**row, 'user': int(row['user'])} for row in rows], self.expected)
+        self.assertEqual(export.totals, {'wallets': 3, 'balance': Decimal('110.50')})
+
+        export = WalletExport('ndjson', compress=True, snapshot=False)
+        lines = gzip.decompress(b''.join(export)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+        self.assertIsNone(export.totals)
+
+        with self.assertRaises(ValueError):
+            WalletExport('xml')
+        logger.info("Тест test_export_formats пройден успешно")
+
+    def test_export_large_balance_is_exact(self):
+        """
+        Тестирует, что баланс, близкий к максимальному, выгружается без потери точности.
+        """
+
+        logger.info("Начало теста test_export_large_balance_is_exact")
+        wallet = WalletFactory(user=UserFactory(), balance=Decimal('9999999999999999.99'))
+
+        lines = b''.join(WalletExport('ndjson')).decode().splitlines()
+        exported = {item['wallet_id']: item['balance'] for item in map(json.loads, lines)}
+        self.assertEqual(exported[str(wallet.wallet_id)], '9999999999999999.99')
+        logger.info("Тест test_export_large_balance_is_exact пройден успешно")
+
+    def test_export_wallets_command(self):
+        """
+        Тестирует команду export_wallets.
+        """
+
+        logger.info("Начало теста test_export_wallets_command")
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'wallets.ndjson'
+        out = io.StringIO()
+        call_command('export_wallets', str(path), '--format', 'ndjson', stdout=out)
+
+        self.assertEqual([json.loads(line) for line in path.read_text().splitlines()], self.expected)
+        self.assertIn('Кошельков: 3, сумма балансов: 110.50', out.getvalue())
+        logger.info("Тест test_export_wallets_command пройден успешно")
+
+    def test_export_endpoint(self):
+        """
+        Тестирует GET api/v1/wallets/export/: доступ только администраторам, заголовки итогов и сжатие.
+        """
+
+        logger.info("Начало теста test_export_endpoint")
+        url = '/api/v1/wallets/export/'
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.get(url, {'file_format': 'ndjson', 'gzip': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('wallets.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual((response['X-Wallet-Count'], response['X-Wallet-Total-Balance']), ('3', '110.50'))
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+
+        response = self.client.get(url, {'snapshot': 'false'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertNotIn('X-Wallet-Count', response)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+        self.assertEqual(self.client.get(url, {'file_format': 'xml'}).status_code, 400)
+        logger.info("Тест test_export_endpoint пройден успешно")
+
+
+    async def test_export_endpoint_under_asgi(self):
+        """
+        Тестирует, что под ASGI выгрузка отдается асинхронным итератором в одной транзакции снимка.
+        """
+
+        logger.info("Начало теста test_export_endpoint_under_asgi")
+        admin = await sync_to_async(UserFactory)(is_staff=True)
+        await self.async_client.aforce_login(admin)
+        response = await self.async_client.get('/api/v1/wallets/export/', {'file_format': 'ndjson'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['X-Wallet-Total-Balance'], '110.50')
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+        logger.info("Тест test_export_endpoint_under_asgi пройден успешно")
+
+class WalletBalanceImportTests(WalletTestCase):
+    """
+    Тесты для загрузки начальных балансов (import_balances).
+    """
+
+    def setUp(self):
+        """
+        Создание пользователей с кошельками (в том числе с полосами) и пользователя без кошелька.
+        """
+
+        super().setUp()
+        self.wallets = [WalletFactory(user=UserFactory(), balance=balance) for balance in (10.00, 50.00, 5.00)]
+        set_wallet_stripes(self.wallets[2].wallet_id, 2)
+        WalletStripe.objects.filter(wallet=self.wallets[2]).update(balance=Decimal('0.40'))
+        self.new_user = UserFactory()
+        Wallet.objects.filter(user=self.new_user).delete()
+
+    def records(self, *rows: tuple) -> list[tuple]:
+        return [(number, email, balance) for number, (email, balance) in enumerate(rows, 1)]
+
+    def total(self, wallet: Wallet) -> Decimal:
+        wallet.refresh_from_db()
+        return wallet.balance + sum(stripe.balance for stripe in wallet.stripes.all())
+
+    def test_import_balances(self):
+        """
+        Тестирует изменение балансов, создание кошелька, записи журнала и ошибки валидации.
+        """
+
+        logger.info("Начало теста test_import_balances")
+        first, second, striped = self.wallets
+        report = import_balances(self.records(
+            (first.user.email, '25.50'),
+            (second.user.email, '50'),
+            (striped.user.email, '1.20'),
+            (self.new_user.email, '7.25'),
+            ('nobody@example.com', '1.00'),
+            (first.user.email, '12.345'),
+            (second.user.email, '-1'),
+            (second.user.email, '40.00'),
+        ), 'test-import')
+
+        self.assertEqual((report['updated'], report['created'], report['unchanged'], report['invalid']), (3, 1, 0, 4))
+        self.assertEqual([error['record'] for error in report['errors']], [2, 5, 6, 7])
+        self.assertEqual(self.total(first), Decimal('25.50'))
+        self.assertEqual(self.total(second), Decimal('40.00'))
+        self.assertEqual(self.total(striped), Decimal('1.20'))
+        self.assertEqual(striped.balance, Decimal('0.40'))
+        self.assertEqual(Wallet.objects.get(user=self.new_user).balance, Decimal('7.25'))
+
+        entries = WalletTransaction.objects.filter(wallet=second)
+        self.assertEqual([(entry.operation_type, entry.amount) for entry in entries], [('WITHDRAW', Decimal('10.00'))])
+        self.assertEqual(WalletTransaction.objects.get(wallet__user=self.new_user).amount, Decimal('7.25'))
+
+        report = import_balances(self.records((striped.user.email, '0.50')), 'test-import-stripes')
+        self.assertEqual(report['invalid'], 1)
+        self.assertIn('суммы полос', report['errors'][0]['error'])
+        logger.info("Тест test_import_balances пройден успешно")
+
+    def test_import_keeps_held_funds(self):
+        """
+        Тестирует, что импорт не уменьшает баланс ниже заблокированных средств,
+        а списание блокировки не делает баланс отрицательным.
+        """
+
+        logger.info("Начало теста test_import_keeps_held_funds")
+        first = self.wallets[0]
+        hold = hold_funds(first.wallet_id, Decimal('8.00'))
+
+        report = import_balances(self.records((first.user.email, '5.00')), 'test-import-held')
+        self.assertEqual(report['invalid'], 1)
+        self.assertIn('заблокированных средств', report['errors'][0]['error'])
+        self.assertEqual(self.total(first), Decimal('10.00'))
+
+        report = import_balances(self.records((first.user.email, '9.00')), 'test-import-held-ok')
+        self.assertEqual(report['updated'], 1)
+        self.assertEqual(capture_hold(hold.hold_id).wallet.balance, Decimal('1.00'))
+
+        hold = hold_funds(first.wallet_id, Decimal('1.00'))
+        Wallet.objects.filter(wallet_id=first.wallet_id).update(balance=Decimal('0.50'))
+        with self.assertRaisesMessage(ValueError, 'Недостаточно средств'):
+            capture_hold(hold.hold_id)
+        first.refresh_from_db()
+        self.assertEqual((first.balance, first.held_balance), (Decimal('0.50'), Decimal('1.00')))
+        logger.info("Тест test_import_keeps_held_funds пройден успешно")
+
+    def test_dry_run_report(self):
+        """
+        Тестирует отчет о различиях в режиме dry_run без изменения балансов.
+        """
+
+        logger.info("Начало теста test_dry_run_report")
+        first, second, _ = self.wallets
+        report_file = io.BytesIO()
+        report = import_balances(self.records(
+            (first.user.email, '11.00'),
+            (second.user.email, '50.00'),
+            (self.new_user.email, '3.00'),
+        ), 'test-dry-run', dry_run=True, report_file=report_file)
+
+        self.assertEqual((report['updated'], report['created'], report['unchanged']), (1, 1, 1))
+        rows = list(csv.DictReader(io.StringIO(report_file.getvalue().decode())))
+        self.assertEqual([(row['email'], row['delta'], row['action']) for row in rows], [
+            (first.user.email, '1.00', 'update'),
+            (second.user.email, '0.00', 'unchanged'),
+            (self.new_user.email, '3.00', 'create'),
+        ])
+        self.assertEqual(self.total(first), Decimal('10.00'))
+        self.assertFalse(Wallet.objects.filter(user=self.new_user).exists())
+        self.assertFalse(WalletTransaction.objects.exists())
+        logger.info("Тест test_dry_run_report пройден успешно")
+
+    def test_resume(self):
+        """
+        Тестирует пропуск пакетов, примененных ранее с тем же идентификатором импорта.
+        """
+
+        logger.info("Начало теста test_resume")
+        first, second, _ = self.wallets
+        records = self.records((first.user.email, '1.00'), (second.user.email, '2.00'))
+        import_balances(records[:1], 'test-resume', chunk_size=1)
+        first.balance = Decimal('99.00')
+        first.save()
+
+        report = import_balances(records, 'test-resume', chunk_size=1)
+        self.assertEqual((report['processed'], report['skipped_chunks'], report['updated']), (2, 1, 1))
+        self.assertEqual(self.total(first), Decimal('99.00'))
+        self.assertEqual(self.total(second), Decimal('2.00'))
+        logger.info("Тест test_resume пройден успешно")
+
+    def test_import_balances_command(self):
+        """
+        Тестирует команду import_balances.
+        """
+
+        logger.info("Начало теста test_import_balances_command")
+        first = self.wallets[0]
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        path = directory / 'balances.csv'
+        path.write_text(f'email,balance\n {first.user.email} ,30.00\nnobody@example.com,1\n')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_balances', str(path), '--dry-run', '--report', str(directory / 'diff.csv'),
+                     stdout=out, stderr=err)
+        self.assertIn('Запись 2: Пользователь не найден', err.getvalue())
+        self.assertIn('update', (directory / 'diff.csv').read_text())
+        self.assertEqual(self.total(first), Decimal('10.00'))
+
+        call_command('import_balances', str(path), stdout=out, stderr=err)
+        self.assertEqual(self.total(first), Decimal('30.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('import_balances', str(directory / 'missing.csv'), stdout=out, stderr=err)
+        logger.info("Тест test_import_balances_command пройден успешно")
+
+
+ADMISSION_SETTINGS = {
+    'ENABLED': True, 'BACKEND': 'wallet.admission.LocMemAdmissionController',
+    'MAX_IN_FLIGHT': 2, 'WALLET_CONCURRENCY': 1, 'WALLET_RATE': 1, 'WALLET_BURST': 2,
+}
+
+
+class WalletAdmissionTests(WalletTestCase):
+    """
+    Тесты для контроля допуска операций (wallet.admission) в памяти процесса.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+        self.url = f'/api/v1/wallets/{self.wallet.wallet_id}/operation/'
+
+    def test_wallet_limits(self):
+        """
+        Тестирует корзину токенов и ограничение одновременных операций кошелька:
+        запрос, отклоненный из-за одновременных операций, не расходует токен.
+        """
+
+        logger.info("Начало теста test_wallet_limits")
+        controller = LocMemAdmissionController(max_in_flight=0, wallet_concurrency=1, wallet_rate=0.5,
+                                               wallet_burst=2)
+        wallet_id = str(self.wallet.wallet_id)
+
+        with controller.admit(wallet_id):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                with controller.admit(wallet_id):
+                    pass
+            self.assertEqual((rejected.exception.reason, rejected.exception.status_code), (WALLET_CONCURRENCY, 429))
+
+            with controller.admit('other-wallet'):
+                pass
+
+        with controller.admit(wallet_id):
+            pass
+        with self.assertRaises(AdmissionRejected) as rejected:
+            with controller.admit(wallet_id):
+                pass
+        self.assertEqual((rejected.exception.reason, rejected.exception.retry_after), (WALLET_RATE, 2))
+        self.assertEqual(controller.stats()['in_flight'], 0)
+        logger.info("Тест test_wallet_limits пройден успешно")
+
+    def test_global_in_flight(self):
+        """
+        Тестирует ограничение одновременных операций процесса и освобождение места при ошибке операции.
+        """
+
+        logger.info("Начало теста test_global_in_flight")
+        controller = LocMemAdmissionController(max_in_flight=1, wallet_concurrency=0, wallet_rate=0)
+
+        with self.assertRaises(ValueError):
+            with controller.admit('first'):
+                raise ValueError
+        with controller.admit('first'):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                with controller.admit('second'):
+                    pass
+        self.assertEqual((rejected.exception.reason, rejected.exception.status_code), (GLOBAL_IN_FLIGHT, 503))
+        self.assertEqual(controller.stats(), {'in_flight': 0, 'max_in_flight': 1})
+
+        with self.assertRaises(ValueError):
+            LocMemAdmissionController(wallet_rate=1, wallet_burst=0)
+        logger.info("Тест test_global_in_flight пройден успешно")
+
+    @override_settings(WALLET_ADMISSION=ADMISSION_SETTINGS)
+    def test_operation_endpoint(self):
+        """
+        Тестирует ответы 429 и 503 с заголовком Retry-After эндпоинта операций.
+        """
+
+        logger.info("Начало теста test_operation_endpoint")
+        data = {'operation_type': 'DEPOSIT', 'amount': '1.00'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.url, data, format='json').status_code, 200)
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertIn('частота', response.json()['error'])
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.get_total_balance(), Decimal('102.00'))
+
+        other = WalletFactory(user=UserFactory(), balance=10.00)
+        controller = get_admission_controller()
+        with controller.admit('first'), controller.admit('second'):
+            response = self.client.post(f'/api/v1/wallets/{other.wallet_id}/operation/', data, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        self.assertIn('wallet_admission_rejections_total{reason="global_in_flight"}',
+                      self.client.get('/metrics').content.decode())
+        logger.info("Тест test_operation_endpoint пройден успешно")
+
+    @override_settings(WALLET_ADMISSION=ADMISSION_SETTINGS)
+    def test_replay_before_admission(self):
+        """
+        Тестирует, что повтор завершенного запроса с ключом идемпотентности получает
+        сохраненный ответ, даже если ограничения кошелька исчерпаны.
+        """
+
+        logger.info("Начало теста test_replay_before_admission")
+        data = {'operation_type': 'DEPOSIT', 'amount': '1.00'}
+        key = {'Idempotency-Key': 'admission-replay'}
+        first = self.client.post(self.url, data, format='json', headers=key)
+        self.assertEqual(self.client.post(self.url, data, format='json').status_code, 200)
+        self.assertEqual(self.client.post(self.url, data, format='json').status_code, 429)
+
+        response = self.client.post(self.url, data, format='json', headers=key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json(), first.json())
+
+        response = self.client.post(self.url, {**data, 'amount': '2.00'}, format='json', headers=key)
+        self.assertEqual(response.status_code, 429)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.get_total_balance(), Decimal('102.00'))
+        logger.info("Тест test_replay_before_admission пройден успешно")
+
+
+class DatabaseAdmissionTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты для контроля допуска на PostgreSQL (DatabaseAdmissionController).
+
+    Места кошелька - сеансовые блокировки, поэтому конкурирующие операции
+    выполняются в отдельных соединениях (TransactionTestCase).
+    """
+
+    def test_shared_limits(self):
+        """
+        Тестирует корзину токенов в таблице и места кошелька, общие для соединений:
+        запрос, отклоненный из-за одновременных операций, не расходует токен.
+        """
+
+        logger.info("Начало теста test_shared_limits")
+        controller = DatabaseAdmissionController(max_in_flight=0, wallet_concurrency=1, wallet_rate=1,
+                                                 wallet_burst=2)
+        wallet_id = str(uuid.uuid4())
+        held, done = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with controller.admit(wallet_id):
+                    held.set()
+                    done.wait(timeout=10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.assertTrue(held.wait(timeout=10))
+        try:
+            with self.assertRaises(AdmissionRejected) as rejected:
+                with controller.admit(wallet_id):
+                    pass
+            self.assertEqual(rejected.exception.reason, WALLET_CONCURRENCY)
+        finally:
+            done.set()
+            thread.join()
+
+        with controller.admit(wallet_id):
+            pass
+        with self.assertRaises(AdmissionRejected) as rejected:
+            with controller.admit(wallet_id):
+                pass
+        self.assertEqual((rejected.exception.reason, rejected.exception.retry_after), (WALLET_RATE, 1))
+        self.assertLess(WalletAdmissionBucket.objects.get(wallet_id=wallet_id).tokens, 1)
+
+        WalletAdmissionBucket.objects.update(updated_at=timezone.now() - timedelta(seconds=10))
+        self.assertEqual(controller.purge(), 1)
+        logger.info("Тест test_shared_limits пройден успешно")
+
+    def test_global_limit_shared_by_processes(self):
+        """
+        Тестирует, что ограничение max_in_flight действует для всех процессов
+        (контроллеры с отдельными счетчиками в разных соединениях).
+        """
+
+        logger.info("Начало теста test_global_limit_shared_by_processes")
+        first, second = (DatabaseAdmissionController(max_in_flight=1, wallet_concurrency=0, wallet_rate=0)
+                         for _ in range(2))
+        held, done = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with first.admit(str(uuid.uuid4())):
+                    held.set()
+                    done.wait(timeout=10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        self.assertTrue(held.wait(timeout=10))
+        try:
+            with self.assertRaises(AdmissionRejected) as rejected:
+                with second.admit(str(uuid.uuid4())):
+                    pass
+            self.assertEqual((rejected.exception.reason, rejected.exception.status_code), (GLOBAL_IN_FLIGHT, 503))
+            self.assertEqual(second.stats()['in_flight'], 0)
+        finally:
+            done.set()
+            thread.join()
+
+        with second.admit(str(uuid.uuid4())):
+            self.assertEqual(second.stats()['in_flight'], 1)
+        with second.admit(str(uuid.uuid4())):
+            pass
+        logger.info("Тест test_global_limit_shared_by_processes пройден успешно")
+
+
+class TransferConcurrencyTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты встречных переводов из многих потоков.
+
+    Переводы выполняются в отдельных соединениях, поэтому данные тестов
+    фиксируются в базе (TransactionTestCase).
+    """
+
+    THREADS = 16
+    TRANSFERS_PER_THREAD = 20
+
+    def setUp(self):
+        """
+        Создание двух кошельков.
+        """
+
+        get_balance_cache.cache_clear()
+        self.first = WalletFactory(user=UserFactory(), balance=1000.00)
+        self.second = WalletFactory(user=UserFactory(), balance=1000.00)
+
+    def run_crossed_transfers(self):
+        """
+        Выполняет встречные переводы A -> B и B -> A из THREADS потоков и проверяет
+        отсутствие ошибок и взаимных блокировок, сумму балансов и журнал операций.
+        """
+
+        deadlocks = retry_stats()['retries'].get(DEADLOCK_DETECTED, 0)
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def run(number):
+            wallets = [self.first.wallet_id, self.second.wallet_id]
+            if number % 2:
+                wallets.reverse()
+            try:
+                barrier.wait(timeout=10)
+                for _ in range(self.TRANSFERS_PER_THREAD):
+                    transfer(wallets[0], wallets[1], Decimal('1.00'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(retry_stats()['retries'].get(DEADLOCK_DETECTED, 0), deadlocks)
+
+        balances = [Wallet.objects.get(wallet_id=wallet.wallet_id).get_total_balance()
+                    for wallet in (self.first, self.second)]
+        self.assertEqual(balances, [Decimal('1000.00'), Decimal('1000.00')])
+        self.assertEqual(WalletTransaction.objects.count(), 2 * self.THREADS * self.TRANSFERS_PER_THREAD)
+
+    def test_crossed_transfers(self):
+        """
+        Тестирует встречные переводы между кошельками без полос (один SQL-запрос).
+        """
+
+        logger.info("Начало теста test_crossed_transfers")
+        self.run_crossed_transfers()
+        logger.info("Тест test_crossed_transfers пройден успешно")
+
+    def test_crossed_transfers_with_striped_wallet(self):
+        """
+        Тестирует встречные переводы с участием кошелька с полосами (SELECT ... FOR UPDATE).
+        """
+
+        logger.info("Начало теста test_crossed_transfers_with_striped_wallet")
+        set_wallet_stripes(self.second.wallet_id, 4)
+        self.run_crossed_transfers()
+        logger.info("Тест test_crossed_transfers_with_striped_wallet пройден успешно")
+
+
+class HoldSweeperConcurrencyTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты снятия истекших блокировок при занятых операциями строках кошельков.
+    """
+
+    def test_sweeper_skips_locked_wallets(self):
+        """
+        Тестирует, что снятие истекших блокировок пропускает заблокированный кошелек, не ожидая его.
+        """
+
+        logger.info("Начало теста test_sweeper_skips_locked_wallets")
+        wallet = WalletFactory(user=UserFactory(), balance=100.00)
+        hold = hold_funds(wallet.wallet_id, Decimal('10.00'))
+        WalletHold.objects.filter(hold_id=hold.hold_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        locked, done = threading.Event(), threading.Event()
+
+        def lock_wallet():
+            try:
+                with transaction.atomic():
+                    Wallet.objects.select_for_update().get(wallet_id=wallet.wallet_id)
+                    locked.set()
+                    done.wait(timeout=10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=lock_wallet)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(timeout=10))
+            started = time.monotonic()
+            self.assertEqual(release_expired_holds()['released'], 0)
+            self.assertLess(time.monotonic() - started, 5)
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(release_expired_holds()['released'], 1)
+        self.assertEqual(Wallet.objects.get(wallet_id=wallet.wallet_id).held_balance, Decimal('0.00'))
+        logger.info("Тест test_sweeper_skips_locked_wallets пройден успешно")
+
+
+class WalletLoadTestCommandTests(TransactionTestCase):
+    """
+    Тесты для команды нагрузочного тестирования wallet_loadtest.
+
+    Потоки команды работают через собственные соединения с базой данных,
+    поэтому данные тестов фиксируются в базе (TransactionTestCase).
+    """
+
+    def setUp(self):
+        """
+        Очистка кэша балансов.
+        """
+
+        get_balance_cache.cache_clear()
+
+    def run_loadtest(self, *args):
+        """
+        Запускает команду с тремя кошельками и тремя потоками и возвращает ее вывод.
+        """
+
+        out = io.StringIO()
+        call_command('wallet_loadtest', '--wallets', '3', '--threads', '3', '--cleanup', *args, stdout=out)
+        return out.getvalue()
+
+    def test_mixed_load_keeps_balances(self):
+        """
+        Тестирует нагрузку с "горячим" кошельком и сверку итоговых балансов.
+        """
+
+        logger.info("Начало теста test_mixed_load_keeps_balances")
+        output = self.run_loadtest('--requests', '60', '--distribution', 'hot', '--seed', '1')
+
+        self.assertIn("Запросов: 60", output)
+        self.assertIn("operation:", output)
+        self.assertIn("Балансы сходятся: 3 кошельков", output)
+        self.assertFalse(Wallet.objects.exists())
+        logger.info("Тест test_mixed_load_keeps_balances пройден успешно")
+
+    def test_insufficient_funds_reported_as_client_error(self):
+        """
+        Тестирует, что нехватка средств возвращается ответом 400 и попадает в классы ошибок.
+        """
+
+        logger.info("Начало теста test_insufficient_funds_reported_as_client_error")
+        output = self.run_loadtest('--requests', '9', '--read-ratio', '0', '--withdraw-ratio', '1',
+                                   '--initial-balance', '0', '--seed', '1')
+
+        self.assertIn("operation: HTTP 400 Недостаточно средств на счете - 9", output)
+        self.assertIn("Балансы сходятся", output)
+        logger.info("Тест test_insufficient_funds_reported_as_client_error пройден успешно")
+
+    def test_invalid_options(self):
+        """
+        Тестирует проверку параметров команды.
+        """
+
+        logger.info("Начало теста test_invalid_options")
+        with self.assertRaises(CommandError):
+            self.run_loadtest('--withdraw-ratio', '2')
+        logger.info("Тест test_invalid_options пройден успешно")
+
+
+class SerializationFailure(Exception):
+    """
+    Ошибка драйвера с кодом ошибки сериализации PostgreSQL.
+    """
+
+    sqlstate = SERIALIZATION_FAILURE
+
+
+class TransactionRetryTests(WalletFactoryMixin, TransactionTestCase):
+    """
+    Тесты для повторов транзакций после временных ошибок БД (wallet.transactions).
+
+    Взаимные блокировки воспроизводятся транзакциями из разных потоков,
+    поэтому данные тестов фиксируются в базе (TransactionTestCase).
+    """
+
+    def setUp(self):
+        """
+        Создание двух кошельков.
+        """
+
+        get_balance_cache.cache_clear()
+        self.first = WalletFactory(user=UserFactory(), balance=100.00)
+        self.second = WalletFactory(user=UserFactory(), balance=100.00)
+
+    def test_deadlock_is_retried(self):
+        """
+        Тестирует, что транзакция, прерванная взаимной блокировкой, повторяется и выполняется.
+        """
+
+        logger.info("Начало теста test_deadlock_is_retried")
+        before = retry_stats()['retries'].get(DEADLOCK_DETECTED, 0)
+        barrier = threading.Barrier(2)
+        attempts = []
+        errors = []
+
+        @retrying_atomic
+        def transfer(first_id, second_id):
+            attempts.append(first_id)
+            Wallet.objects.select_for_update().get(wallet_id=first_id)
+            if attempts.count(first_id) == 1:
+                barrier.wait(timeout=5)
+            Wallet.objects.select_for_update().get(wallet_id=second_id)
+
+        def run(first_id, second_id):
+            try:
+                transfer(first_id, second_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=run, args=(self.first.wallet_id, self.second.wallet_id)),
+            threading.Thread(target=run, args=(self.second.wallet_id, self.first.wallet_id)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(retry_stats()['retries'][DEADLOCK_DETECTED], before + 1)
+        logger.info("Тест test_deadlock_is_retried пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS,
+                                            'ISOLATION_LEVEL': 'serializable', 'LOCK_TIMEOUT': 50})
+    def test_isolation_level_and_lock_timeout(self):
+        """
+        Тестирует уровень изоляции и lock_timeout транзакции из настройки WALLET_TRANSACTIONS.
+        """
+
+        logger.info("Начало теста test_isolation_level_and_lock_timeout")
+
+        @retrying_atomic
+        def show():
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW transaction_isolation")
+                isolation = cursor.fetchone()[0]
+                cursor.execute("SHOW lock_timeout")
+                return isolation, cursor.fetchone()[0]
+
+        self.assertEqual(show(), ('serializable', '50ms'))
+        perform_operation(self.first.wallet_id, "DEPOSIT", Decimal('10.00'))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.balance, Decimal('110.00'))
+        logger.info("Тест test_isolation_level_and_lock_timeout пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS,
+                                            'ISOLATION_LEVEL': 'repeatable read', 'LOCK_TIMEOUT': 70})
+    def test_idempotent_request_uses_transaction_settings(self):
+        """
+        Тестирует, что операция с Idempotency-Key выполняется с уровнем изоляции
+        и lock_timeout из WALLET_TRANSACTIONS, а не с настройками транзакции захвата ключа.
+        """
+
+        logger.info("Начало теста test_idempotent_request_uses_transaction_settings")
+        observed = []
+
+        def observe(execute, sql, params, many, context):
+            if sql == DEPOSIT_SQL:
+                raw = context['cursor'].cursor
+                raw.execute("SHOW transaction_isolation")
+                isolation = raw.fetchone()[0]
+                raw.execute("SHOW lock_timeout")
+                observed.append((isolation, raw.fetchone()[0]))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(observe):
+            response = self.client.post(f'/api/v1/wallets/{self.first.wallet_id}/operation/',
+                                        {'operation_type': 'DEPOSIT', 'amount': 10}, format='json',
+                                        headers={'Idempotency-Key': 'isolation-key'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(observed, [('repeatable read', '70ms')])
+        self.assertEqual(IdempotencyKey.objects.get(key='ip:127.0.0.1:isolation-key').status_code, 200)
+        logger.info("Тест test_idempotent_request_uses_transaction_settings пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS, 'MAX_RETRIES': 2, 'RETRY_BASE_DELAY': 0})
+    def test_retries_are_bounded(self):
+        """
+        Тестирует, что после MAX_RETRIES повторов возникает TransactionContention,
+        а ошибка сериализации во вложенной транзакции не повторяется.
+        """
+
+        logger.info("Начало теста test_retries_are_bounded")
+        calls = []
+
+        @retrying_atomic
+        def fail():
+            calls.append(1)
+            raise DatabaseError("could not serialize access") from SerializationFailure()
+
+        with self.assertRaises(TransactionContention):
+            fail()
+        self.assertEqual(len(calls), 3)
+
+        calls.clear()
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            fail()
+        self.assertEqual(len(calls), 1)
+        logger.info("Тест test_retries_are_bounded пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS, 'RETRY_BASE_DELAY': 0})
+    def test_locmem_idempotency_stores_on_commit(self):
+        """
+        Тестирует, что хранилище ключей в памяти сохраняет ответ только после фиксации транзакции:
+        после отката попытки (ошибка сериализации после выхода из guard, как при фиксации)
+        повтор выполняет запрос заново, а не возвращает ответ откаченной попытки.
+        """
+
+        logger.info("Начало теста test_locmem_idempotency_stores_on_commit")
+        store = LocMemIdempotencyStore(ttl=60)
+        attempts = []
+
+        @retrying_atomic
+        def request():
+            with store.guard('key', 'fingerprint') as entry:
+                if entry.replay is not None:
+                    return entry.replay
+                attempts.append(1)
+                entry.complete(200, {'attempt': len(attempts)})
+            self.assertIsNone(store.lookup('key', 'fingerprint'))
+            if len(attempts) == 1:
+                raise DatabaseError("could not serialize access") from SerializationFailure()
+            return 200, {'attempt': len(attempts)}
+
+        self.assertEqual(request(), (200, {'attempt': 2}))
+        self.assertEqual(store.lookup('key', 'fingerprint'), (200, {'attempt': 2}))
+        self.assertEqual(request(), (200, {'attempt': 2}))
+        self.assertEqual(len(attempts), 2)
+        logger.info("Тест test_locmem_idempotency_stores_on_commit пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS, 'RETRY_BASE_DELAY': 0})
+    def test_outcome_counted_once_after_retry(self):
+        """
+        Тестирует, что успешная операция учитывается в метрике один раз, если транзакция
+        была повторена после ошибки сериализации, возникшей уже после выполнения операции.
+        """
+
+        logger.info("Начало теста test_outcome_counted_once_after_retry")
+        before = metrics.collect()[metrics.OPERATION_OUTCOMES.name].get(('DEPOSIT', 'success'), [0])[0]
+        attempts = []
+
+        @retrying_atomic
+        def deposit():
+            wallet = perform_operation(self.first.wallet_id, "DEPOSIT", Decimal('10.00'))
+            attempts.append(wallet.balance)
+            if len(attempts) == 1:
+                raise DatabaseError("could not serialize access") from SerializationFailure()
+            return wallet
+
+        self.assertEqual(deposit().balance, Decimal('110.00'))
+        self.assertEqual(len(attempts), 2)
+        after = metrics.collect()[metrics.OPERATION_OUTCOMES.name].get(('DEPOSIT', 'success'), [0])[0]
+        self.assertEqual(after - before, 1)
+        logger.info("Тест test_outcome_counted_once_after_retry пройден успешно")
+
+    @override_settings(WALLET_TRANSACTIONS={**settings.WALLET_TRANSACTIONS, 'LOCK_TIMEOUT': 50, 'MAX_RETRIES': 1})
+    def test_operation_returns_503_on_contention(self):
+        """
+        Тестирует ответ 503 с заголовком Retry-After, если кошелек заблокирован дольше всех повторов.
+        """
+
+        logger.info("Начало теста test_operation_returns_503_on_contention")
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Wallet.objects.select_for_update().get(wallet_id=self.first.wallet_id)
+                locked.set()
+                release.wait(timeout=10)
+            connections.close_all()
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(timeout=5)
+        try:
+            response = self.client.post(f'/api/v1/wallets/{self.first.wallet_id}/operation/',
+                                        {'operation_type': 'WITHDRAW', 'amount': 10}, format='json')
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.balance, Decimal('100.00'))
+        logger.info("Тест test_operation_returns_503_on_contention пройден успешно")
+
+
+class FastSerializerTests(WalletTestCase):
+    """
+    Тесты для быстрого пути проверки операций и вывода кошелька.
+    """
+
+    PAYLOADS = [
+        {'operation_type': 'DEPOSIT', 'amount': '100'},
+        {'operation_type': 'WITHDRAW', 'amount': ' 12.5 '},
+        {'operation_type': 'DEPOSIT', 'amount': 99999999.99},
+        {'operation_type': 'DEPOSIT', 'amount': 7},
+        {'operation_type': 'DEPOSIT', 'amount': '1e3'},
+        {'operation_type': 'DEPOSIT', 'amount': '0.001'},
+        {'operation_type': 'DEPOSIT', 'amount': '0.00'},
+        {'operation_type': 'DEPOSIT', 'amount': '-5'},
+        {'operation_type': 'DEPOSIT', 'amount': '12345678901234567'},
+        {'operation_type': 'DEPOSIT', 'amount': True},
+        {'operation_type': 'deposit', 'amount': '10'},
+        {'operation_type': 'TRANSFER', 'amount': '10'},
+        {'amount': '10'},
+        {},
+    ]
+
+    def test_validation_matches_serializer(self):
+        """
+        Тестирует, что быстрая проверка принимает только данные, которые сериализатор принимает с тем же результатом.
+        """
+
+        logger.info("Начало теста test_validation_matches_serializer")
+        for payload in self.PAYLOADS:
+            serializer = WalletOperationSerializer(data=payload)
+            fast = validate_operation(payload)
+            if fast is not None:
+                self.assertTrue(serializer.is_valid(), payload)
+                self.assertEqual(fast, tuple(serializer.validated_data.values()), payload)
+                self.assertEqual(str(fast[1]), str(serializer.validated_data['amount']), payload)
+
+        self.assertEqual(validate_operation(self.PAYLOADS[0]), ('DEPOSIT', Decimal('100.00')))
+        logger.info("Тест test_validation_matches_serializer пройден успешно")
+
+    def test_responses_are_identical(self):
+        """
+        Тестирует, что ответы info и ошибки operation не зависят от WALLET_FAST_SERIALIZERS.
+        """
+
+        logger.info("Начало теста test_responses_are_identical")
+        wallet = WalletFactory(user=self.user, balance=1234.5)
+        url = f'/api/v1/wallets/{wallet.wallet_id}/'
+
+        responses = []
+        for fast in (True, False):
+            with self.settings(WALLET_FAST_SERIALIZERS=fast):
+                responses.append([self.client.get(f'{url}info/').content] + [
+                    self.client.post(f'{url}operation/', payload, format='json').content
+                    for payload in self.PAYLOADS[5:]
+                ])
+
+        self.assertEqual(responses[0], responses[1])
+        self.assertEqual(json.loads(responses[0][0])['balance'], '1234.50')
+        logger.info("Тест test_responses_are_identical пройден успешно")
+
+    def test_benchmark_command(self):
+        """
+        Тестирует команду сравнения скорости сериализаторов.
+        """
+
+        logger.info("Начало теста test_benchmark_command")
+        out = io.StringIO()
+        call_command('benchmark_serializers', iterations=10, stdout=out)
+
+        self.assertIn('Результаты совпадают', out.getvalue())
+        logger.info("Тест test_benchmark_command пройден успешно")
+
+
+class WalletBalanceCacheTests(WalletTestCase):
+    """
+    Тесты для кэша балансов эндпоинтов чтения.
+    """
+
+    def setUp(self):
+        """
+        Создание кошелька и администратора для просмотра счетчиков кэша.
+        """
+
+        super().setUp()
+        self.wallet = WalletFactory(user=self.user, balance=100.00)
+        self.url = f'/api/v1/wallets/{self.wallet.wallet_id}/'
+        self.admin = UserFactory(is_staff=True)
+
+    def test_repeated_reads_hit_cache(self):
+        """
+        Тестирует, что повторное чтение баланса не обращается к базе данных.
+        """
+
+        logger.info("Начало теста test_repeated_reads_hit_cache")
+        self.assertEqual(self.client.get(self.url).json(), {'balance': 100.0})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json(), {'balance': 100.0})
+            response = self.client.get(f'{self.url}info/')
+
+        self.assertEqual(response.json()['balance'], '100.00')
+        self.assertEqual(response.json()['user'], self.user.id)
+        stats = get_balance_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['loads']), (2, 1, 1))
+        logger.info("Тест test_repeated_reads_hit_cache пройден успешно")
+
+    def test_missing_wallet_is_not_cached(self):
+        """
+        Тестирует, что отсутствующий кошелек возвращает 404 и не сохраняется в кэше.
+        """
+
+        logger.info("Начало теста test_missing_wallet_is_not_cached")
+        url = f'/api/v1/wallets/{uuid.uuid4()}/'
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(get_balance_cache().stats()['loads'], 2)
+        logger.info("Тест test_missing_wallet_is_not_cached пройден успешно")
+
+    def test_operation_invalidates_on_commit(self):
+        """
+        Тестирует, что операция удаляет баланс из кэша только после фиксации транзакции.
+        """
+
+        logger.info("Начало теста test_operation_invalidates_on_commit")
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            perform_operation(self.wallet.wallet_id, 'DEPOSIT', Decimal('50.00'))
+            self.assertEqual(self.client.get(self.url).json(), {'balance': 100.0})
+
+        # Удаление баланса из кэша и учет успешной операции в метриках
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(self.client.get(self.url).json(), {'balance': 150.0})
+        logger.info("Тест test_operation_invalidates_on_commit пройден успешно")
+
+    @override_settings(DATABASE_REPLICAS=['default'],
+                       WALLET_BALANCE_CACHE={**settings.WALLET_BALANCE_CACHE, 'SHARED_CACHE_ALIAS': 'default'})
+    def test_lagging_replica_is_not_cached(self):
+        """
+        Тестирует, что промах кэша после операции не сохраняет баланс отстающей реплики:
+        чтение начато до фиксации операции, а загрузка баланса выполняется после нее.
+        """
+
+        logger.info("Начало теста test_lagging_replica_is_not_cached")
+        cache.clear()
+        table = Wallet._meta.db_table
+        lag = f"UPDATE {table} SET balance = balance + %s WHERE wallet_id = %s"
+
+        def lagging_replica(execute, sql, params, many, context):
+            # Чтение с "реплики" (DATABASE_REPLICAS=['default']) видит баланс до пополнения на 50.00
+            if not replicas_allowed() or not sql.startswith('SELECT') or table not in sql:
+                return execute(sql, params, many, context)
+            with context['connection'].connection.cursor() as raw:
+                raw.execute(lag, [-5000, self.wallet.wallet_id])
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    raw.execute(lag, [5000, self.wallet.wallet_id])
+
+        test = self
+
+        class View:
+            @replica_reads
+            def retrieve(self, request, wallet_id=None):
+                with test.captureOnCommitCallbacks(execute=True):
+                    perform_operation(wallet_id, 'DEPOSIT', Decimal('50.00'))
+                return WalletViewSet._get_cached_wallet(wallet_id)
+
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.3')
+        with connection.execute_wrapper(lagging_replica):
+            data = View().retrieve(request, wallet_id=self.wallet.wallet_id)
+            self.assertEqual(data['balance'], Decimal('150.00'))
+            get_balance_cache()._local.clear()
+            self.assertEqual(self.client.get(self.url).json(), {'balance': 150.0})
+        logger.info("Тест test_lagging_replica_is_not_cached пройден успешно")
+
+    def test_rolled_back_operation_keeps_cache(self):
+        """
+        Тестирует, что откаченная операция не изменяет кэш.
+        """
+
+        logger.info("Начало теста test_rolled_back_operation_keeps_cache")
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError):
+                perform_operation(self.wallet.wallet_id, 'WITHDRAW', Decimal('500.00'))
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(get_balance_cache().stats()['invalidations'], 0)
+        logger.info("Тест test_rolled_back_operation_keeps_cache пройден успешно")
+
+    def test_batch_invalidates_changed_wallets(self):
+        """
+        Тестирует, что пакет операций удаляет из кэша балансы измененных кошельков.
+        """
+
+        logger.info("Начало теста test_batch_invalidates_changed_wallets")
+        self.client.get(self.url)
+        operations = [{'wallet_id': str(self.wallet.wallet_id), 'operation_type': 'WITHDRAW', 'amount': '30.00'}]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/wallets/operations/batch/', {'operations': operations}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url).json(), {'balance': 70.0})
+        logger.info("Тест test_batch_invalidates_changed_wallets пройден успешно")
+
+    def test_stats_endpoint_requires_admin(self):
+        """
+        Тестирует, что счетчики кэша доступны только администратору.
+        """
+
+        logger.info("Начало теста test_stats_endpoint_requires_admin")
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/api/v1/wallets/stats/').status_code, 403)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/v1/wallets/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_ratio', response.json()['balance_cache'])
+        logger.info("Тест test_stats_endpoint_requires_admin пройден успешно")
+
+
+class BalanceCacheTests(SimpleTestCase):
+    """
+    Тесты для локального кэша балансов.
+    """
+
+    def test_concurrent_misses_share_one_load(self):
+        """
+        Тестирует, что одновременные промахи по одному кошельку выполняют одну загрузку.
+        """
+
+        cache = BalanceCache(local_ttl=60)
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def loader():
+            calls.append(1)
+            release.wait()
+            return {'user': 1, 'balance': Decimal('1.00')}
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('wallet', loader)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(cache.stats()['loads'], 1)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        """
+        Тестирует, что значение, загруженное до удаления записи, не сохраняется в кэше.
+        """
+
+        cache = BalanceCache(local_ttl=60)
+
+        def loader():
+            cache.invalidate(['wallet'])
+            return {'user': 1, 'balance': Decimal('1.00')}
+
+        cache.get_or_load('wallet', loader)
+
+        self.assertEqual(cache.stats()['local_entries'], 0)
+
+    def test_invalidation_from_other_process_during_load(self):
+        """
+        Тестирует, что значение общего кэша, загруженное до удаления записи
+        другим процессом, не возвращается ни одному процессу.
+        """
+
+        cache.clear()
+        first, second, third = (BalanceCache(local_ttl=60, shared_alias='default') for _ in range(3))
+        stale, fresh = {'user': 1, 'balance': Decimal('1.00')}, {'user': 1, 'balance': Decimal('2.00')}
+
+        def loader():
+            second.invalidate(['wallet'])
+            return stale
+
+        self.assertEqual(first.get_or_load('wallet', loader), stale)
+        self.assertEqual(second.get_or_load('wallet', lambda: fresh), fresh)
+        self.assertEqual(second.stats()['loads'], 1)
+        self.assertEqual(third.get_or_load('wallet', lambda: None), fresh)
+        self.assertEqual(third.stats()['shared_hits'], 1)
+
+
+    async def test_async_invalidation_from_other_process_during_load(self):
+        """
+        Тестирует асинхронную загрузку, во время которой другой процесс удаляет запись.
+        """
+
+        await cache.aclear()
+        first, second = BalanceCache(shared_alias='default'), BalanceCache(shared_alias='default')
+        stale, fresh = {'user': 1, 'balance': Decimal('1.00')}, {'user': 1, 'balance': Decimal('2.00')}
+
+        async def loader():
+            await second.ainvalidate(['wallet'])
+            return stale
+
+        async def fresh_loader():
+            return fresh
+
+        self.assertEqual(await first.aget_or_load('wallet', loader), stale)
+        self.assertEqual(await second.aget_or_load('wallet', fresh_loader), fresh)
+        self.assertEqual(await BalanceCache(shared_alias='default').aget_or_load('wallet', loader), fresh)
+
+    def test_lru_eviction_and_ttl(self):
+        """
+        Тестирует вытеснение старых записей и истечение времени жизни.
+        """
+
+        cache = BalanceCache(local_max_entries=2, local_ttl=0.05)
+        for key in ['a', 'b', 'c']:
+            cache.get_or_load(key, lambda: {'user': 1, 'balance': Decimal('1.00')})
+
+        self.assertEqual(cache.stats()['local_entries'], 2)
+        time.sleep(0.06)
+        cache.get_or_load('c', lambda: {'user': 1, 'balance': Decimal('2.00')})
+        self.assertEqual(cache.stats()['loads'], 4)
+
+
+class FastJSONTests(SimpleTestCase):
+    """
+    Тесты для рендерера и парсера JSON на orjson (utilities.renderers).
+    """
+
+    def test_renderer_matches_drf(self):
+        """
+        Тестирует совпадение ответа с JSONRenderer DRF и запись Decimal по версии API.
+        """
+
+        logger.info("Начало теста test_renderer_matches_drf")
+        data = {
+            'wallet_id': uuid.UUID('278e0e9d-098e-43d4-bd40-e016c7c7363d'), 'user': 1, 'balance': Decimal('12.30'),
+            'created_at': datetime(2025, 2, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc),
+            'message': 'Операция выполнена\u2028успешно.', 'items': [None, True, 0.1, {1: 'x'}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+        request = RequestFactory().get('/')
+        request.version = '2'
+        rendered = FastJSONRenderer().render({'balance': Decimal('99999999.99')}, renderer_context={'request': request})
+        self.assertEqual(rendered, b'{"balance":"99999999.99"}')
+        self.assertEqual((decimal_value(Decimal('5'), '2'), decimal_value(Decimal('5'), '1')), ('5.00', 5.0))
+        logger.info("Тест test_renderer_matches_drf пройден успешно")
+
+    def test_parser_matches_drf(self):
+        """
+        Тестирует совпадение разбора с JSONParser DRF, в том числе длинных целых, и ошибки разбора.
+        """
+
+        logger.info("Начало теста test_parser_matches_drf")
+        for body in (b'{"operation_type": "DEPOSIT", "amount": 1250.5}', b'[12345678901234567890123, "\xd1\x8f"]'):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+        for body in (b'{"amount": NaN}', b'{"amount": '):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+        logger.info("Тест test_parser_matches_drf пройден успешно")
+
+
+class ApiDocsTests(SimpleTestCase):
+    """
+    Тесты для схемы OpenAPI и страниц документации (utilities.api_docs).
+    """
+
+    def test_static_schema(self):
+        """
+        Тестирует генерацию файла схемы командой и его выдачу с ETag при API_DOCS_DYNAMIC=False.
+        """
+
+        logger.info("Начало теста test_static_schema")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            call_command('generate_api_schema', output=path, stdout=io.StringIO())
+            with open(path, 'rb') as file:
+                content = file.read()
+            self.assertIn('/wallets/{wallet_id}/operation/', json.loads(content)['paths'])
+
+            with override_settings(API_DOCS_DYNAMIC=False, API_SCHEMA_FILE=path):
+                response = self.client.get('/swagger.json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, content)
+                self.assertEqual(response['Cache-Control'], 'no-cache')
+
+                not_modified = self.client.get('/swagger.json', headers={'If-None-Match': response['ETag']})
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified.content, b'')
+
+                self.assertEqual(self.client.get('/swagger/', {'format': 'openapi'}).content, content)
+                for page in ('/swagger/', '/redoc/'):
+                    self.assertContains(self.client.get(page), '/swagger.json')
+
+                with self.assertRaises(CommandError):
+                    call_command('generate_api_schema', output=path, stdout=io.StringIO())
+
+            with override_settings(API_DOCS_DYNAMIC=False, API_SCHEMA_FILE=os.path.join(directory, 'missing.json')):
+                self.assertEqual(self.client.get('/swagger.json').status_code, 404)
+
+        self.assertEqual(json.loads(self.client.get('/swagger.json').content), json.loads(content))
+        logger.info("Тест test_static_schema пройден успешно")
+
+    def test_docs_assets(self):
+        """
+        Тестирует, что страницы документации загружают скрипты и стили из приложения, а не с CDN.
+        """
+
+        logger.info("Начало теста test_docs_assets")
+        for page in ('/swagger/', '/redoc/'):
+            content = self.client.get(page).content.decode()
+            self.assertIn('/api-docs/assets/', content)
+            self.assertNotIn('https://', content)
+
+        response = self.client.get('/api-docs/assets/swagger_js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/javascript; charset=utf-8')
+        self.assertIn('immutable', response['Cache-Control'])
+        version = response['ETag'].strip('"')[:16]
+        self.assertIn(f'/api-docs/assets/swagger_js?v={version}', self.client.get('/swagger/').content.decode())
+
+        not_modified = self.client.get('/api-docs/assets/swagger_js', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get('/api-docs/assets/missing').status_code, 404)
+        logger.info("Тест test_docs_assets пройден успешно")
+
+    def test_static_mode_skips_drf_yasg(self):
+        """
+        Тестирует, что при API_DOCS_DYNAMIC=False загрузка приложения, URL и файлов интерфейса
+        документации не импортирует drf_yasg.
+        """
+
+        logger.info("Начало теста test_static_mode_skips_drf_yasg")
+        script = ("import sys, django; django.setup(); import config.urls; "
+                  "from utilities.api_docs import load_asset; load_asset('swagger_js'); "
+                  "print(sorted(name for name in sys.modules if name.startswith('drf_yasg')))")
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=60,
+                                cwd=settings.BASE_DIR, env={**os.environ, 'API_DOCS_DYNAMIC': 'False',
+                                                            'DJANGO_SETTINGS_MODULE': 'config.settings'})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+        logger.info("Тест test_static_mode_skips_drf_yasg пройден успешно")
+
+
+class LoggerTests(SimpleTestCase):
+    """
+    Тесты для логгера приложения.
+    """
+
+    def make_record(self, level=logging.INFO, **extra):
+        record = logging.LogRecord('custom_logger', level, __file__, 1, "Кошелек %s пополнен на %s",
+                                   ('wallet', Decimal('10.00')), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_queue_handler_does_not_format_record(self):
+        """
+        Тестирует, что запись помещается в очередь без подстановки аргументов в вызывающем потоке.
+        """
+
+        log_queue = queue.SimpleQueue()
+        NonBlockingQueueHandler(log_queue).emit(self.make_record())
+
+        record = log_queue.get_nowait()
+        self.assertEqual(record.msg, "Кошелек %s пополнен на %s")
+        self.assertEqual(record.args, ('wallet', Decimal('10.00')))
+
+    def test_json_formatter_includes_structured_fields(self):
+        """
+        Тестирует вывод записи в JSON с полями, переданными через extra.
+        """
+
+        wallet_id = uuid.uuid4()
+        data = json.loads(JsonFormatter().format(
+            self.make_record(wallet_id=wallet_id, operation='DEPOSIT', amount=Decimal('10.00'))
+        ))
+
+        self.assertEqual(data['message'], "Кошелек wallet пополнен на 10.00")
+        self.assertEqual(data['level'], 'INFO')
+        self.assertEqual(data['wallet_id'], str(wallet_id))
+        self.assertEqual(data['operation'], 'DEPOSIT')
+        self.assertEqual(data['amount'], '10.00')
+        self.assertNotIn('balance', data)
+
+    def test_sampling_filter_drops_only_sampled_info_records(self):
+        """
+        Тестирует, что выборка отбрасывает только помеченные INFO-записи.
+        """
+
+        sampling = SamplingFilter(0)
+
+        self.assertFalse(sampling.filter(self.make_record(sampled=True)))
+        self.assertTrue(sampling.filter(self.make_record()))
+        self.assertTrue(sampling.filter(self.make_record(logging.WARNING, sampled=True)))
+        self.assertTrue(SamplingFilter(1).filter(self.make_record(sampled=True)))
+
+
+class LocMemIdempotencyStoreTests(SimpleTestCase):
+    """
+    Тесты для хранилища ключей идемпотентности в памяти процесса.
+    """
+
+    def test_concurrent_duplicate_waits_for_original(self):
+        """
+        Тестирует, что повторный запрос ждет завершения исходного и получает его ответ.
+        """
+
+        store = LocMemIdempotencyStore(ttl=60)
+        started = threading.Event()
+        replays = []
+
+        def duplicate():
+            started.wait()
+            with store.guard('key', 'fingerprint') as entry:
+                replays.append(entry.replay)
+
+        thread = threading.Thread(target=duplicate)
+        thread.start()
+        with store.guard('key', 'fingerprint') as entry:
+            started.set()
+            time.sleep(0.05)
+            entry.complete(200, {'new_balance': 1.0})
+        thread.join()
+
+        self.assertEqual(replays, [(200, {'new_balance': 1.0})])
+
+    def test_lru_eviction_and_ttl(self):
+        """
+        Тестирует ограничение размера хранилища и срок хранения ответов.
+        """
+
+        store = LocMemIdempotencyStore(ttl=60, max_entries=2)
+        for key in ('a', 'b', 'c'):
+            with store.guard(key, key) as entry:
+                entry.complete(200, {})
+
+        with store.guard('a', 'a') as entry:
+            self.assertIsNone(entry.replay)
+        with store.guard('c', 'c') as entry:
+            self.assertEqual(entry.replay, (200, {}))
+
+        store.ttl = 0
+        with store.guard('d', 'd') as entry:
+            entry.complete(200, {})
+        with store.guard('d', 'd') as entry:
+            self.assertIsNone(entry.replay)
+
+    def test_failed_request_is_not_stored(self):
+        """
+        Тестирует, что ответ 5xx и исключение не сохраняются и ключ можно использовать повторно.
+        """
+
+        store = LocMemIdempotencyStore(ttl=60)
+        with self.assertRaises(RuntimeError):
+            with store.guard('key', 'fingerprint'):
+                raise RuntimeError
+        with store.guard('key', 'fingerprint') as entry:
+            self.assertIsNone(entry.replay)
+            entry.complete(503, {})
+        with store.guard('key', 'fingerprint') as entry:
+            self.assertIsNone(entry.replay)
@@ -0,0 +1,188 @@
+import time
+import random
+import threading
+
+from functools import wraps
+from typing import Callable
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, transaction
+
+from utilities.metrics import Counter, collect
+from utilities.logger_utils import logger
+from wallet.idempotency import LOCK_NOT_AVAILABLE, sqlstate
+
+
+# Коды ошибок PostgreSQL, после которых транзакцию можно повторить.
+SERIALIZATION_FAILURE = '40001'
+DEADLOCK_DETECTED = '40P01'
+RETRYABLE_SQLSTATES = (SERIALIZATION_FAILURE, DEADLOCK_DETECTED, LOCK_NOT_AVAILABLE)
+
+# Во вложенной транзакции повторяется только точка сохранения: взаимная блокировка
+# и lock_timeout снимаются ее откатом, а ошибка сериализации требует новой транзакции.
+SAVEPOINT_RETRYABLE_SQLSTATES = (DEADLOCK_DETECTED, LOCK_NOT_AVAILABLE)
+
+ISOLATION_LEVELS = {
+    'read committed': 'READ COMMITTED',
+    'repeatable read': 'REPEATABLE READ',
+    'serializable': 'SERIALIZABLE',
+}
+
+TRANSACTION_RETRIES = Counter(
+    'wallet_transaction_retries_total', "Повторы транзакций после временных ошибок БД.",
+    ('sqlstate',),
+)
+TRANSACTION_RETRIES_EXHAUSTED = Counter(
+    'wallet_transaction_retries_exhausted_total', "Транзакции, не выполненные после всех повторов.",
+    ('sqlstate',),
+)
+
+# Функции, вызываемые при откате попыток retrying_atomic потока (стек вложенных попыток).
+_rollback_callbacks = threading.local()
+
+
+class TransactionContention(Exception):
+    """
+    Транзакция не выполнена из-за конкуренции за данные (взаимная блокировка,
+    ошибка сериализации, lock_timeout) после всех повторов.
+    """
+
+
+def begin_statements() -> str:
+    """
+    Команды начала транзакции согласно настройке WALLET_TRANSACTIONS (пустая строка - настройки по умолчанию).
+
+    :raises ImproperlyConfigured: Если уровень изоляции неизвестен.
+    """
+
+    config = settings.WALLET_TRANSACTIONS
+    level = config['ISOLATION_LEVEL'].lower()
+    if level not in ISOLATION_LEVELS:
+        raise ImproperlyConfigured(
+            f"Неизвестный уровень изоляции {config['ISOLATION_LEVEL']!r}. "
+            f"Допустимые значения: {', '.join(ISOLATION_LEVELS)}."
+        )
+
+    statements = []
+    if level != 'read committed':
+        statements.append(f"SET TRANSACTION ISOLATION LEVEL {ISOLATION_LEVELS[level]}")
+    if config['LOCK_TIMEOUT']:
+        statements.append(f"SET LOCAL lock_timeout = {int(config['LOCK_TIMEOUT'])}")
+    return '; '.join(statements)
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Пауза перед повтором attempt (с 0): случайное значение от 0 до экспоненциально
+    растущей границы, чтобы конкурирующие транзакции не повторялись одновременно.
+    """
+
+    config = settings.WALLET_TRANSACTIONS
+    return random.uniform(0, min(config['RETRY_MAX_DELAY'], config['RETRY_BASE_DELAY'] * 2 ** attempt))
+
+
+def retry_pause(name: str, code: str, attempt: int, error: Exception) -> float:
+    """
+    Учитывает временную ошибку БД попытки attempt (с 0) и возвращает паузу перед повтором.
+
+    Args:
+        name (str): Имя повторяемой функции (для журнала).
+        code (str): Код ошибки PostgreSQL (SQLSTATE).
+        attempt (int): Номер неудавшейся попытки.
+        error (Exception): Ошибка БД.
+
+    :raises TransactionContention: Если это была последняя из WALLET_TRANSACTIONS['MAX_RETRIES'] попыток.
+    """
+
+    max_retries = settings.WALLET_TRANSACTIONS['MAX_RETRIES']
+    if attempt >= max_retries:
+        TRANSACTION_RETRIES_EXHAUSTED.inc(code)
+        logger.warning("%s: транзакция не выполнена после %s повторов (SQLSTATE %s)", name, max_retries, code)
+        raise TransactionContention(str(error)) from error
+
+    TRANSACTION_RETRIES.inc(code)
+    logger.debug("%s: повтор %s после ошибки SQLSTATE %s", name, attempt + 1, code)
+    return retry_delay(attempt)
+
+
+def on_rollback(callback: Callable[[], None]) -> None:
+    """
+    Регистрирует функцию, которая вызывается при откате текущей попытки retrying_atomic:
+    после ошибки в функции, при фиксации транзакции и перед повтором.
+
+    Дополняет transaction.on_commit: ровно одна из двух функций будет вызвана, если
+    внешняя транзакция открыта retrying_atomic. Функции вложенного retrying_atomic после
+    его успешного выполнения переходят к внешнему. Вне retrying_atomic, а также при откате
+    транзакции, открытой не retrying_atomic, функция не вызывается.
+    """
+
+    stack = getattr(_rollback_callbacks, 'stack', None)
+    if stack:
+        stack[-1].append(callback)
+
+
+def retrying_atomic(func):
+    """
+    Декоратор: выполняет функцию в транзакции (transaction.atomic) и повторяет ее
+    после временных ошибок БД не более WALLET_TRANSACTIONS['MAX_RETRIES'] раз.
+
+    Внешняя транзакция начинается с уровнем изоляции и lock_timeout из
+    WALLET_TRANSACTIONS и повторяется после взаимной блокировки, ошибки
+    сериализации и превышения lock_timeout. Внутри уже открытой транзакции
+    (например, захвата ключа идемпотентности) функция выполняется в точке
+    сохранения с уровнем изоляции внешней транзакции, и повторяется только
+    откат точки сохранения после взаимной блокировки и lock_timeout.
+    При откате попытки вызываются функции, зарегистрированные в ней on_rollback().
+
+    :raises TransactionContention: Если транзакция не выполнена после всех повторов.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        nested = connection.in_atomic_block
+        retryable = SAVEPOINT_RETRYABLE_SQLSTATES if nested else RETRYABLE_SQLSTATES
+        max_retries = settings.WALLET_TRANSACTIONS['MAX_RETRIES']
+        if not hasattr(_rollback_callbacks, 'stack'):
+            _rollback_callbacks.stack = []
+        stack = _rollback_callbacks.stack
+
+        for attempt in range(max_retries + 1):
+            callbacks = []
+            stack.append(callbacks)
+            try:
+                with transaction.atomic():
+                    if not nested:
+                        statements = begin_statements()
+                        if statements:
+                            with connection.cursor() as cursor:
+                                cursor.execute(statements)
+                    result = func(*args, **kwargs)
+            except BaseException as e:
+                stack.pop()
+                for callback in reversed(callbacks):
+                    callback()
+                code = sqlstate(e) if isinstance(e, DatabaseError) else None
+                if code not in retryable:
+                    raise
+                time.sleep(retry_pause(func.__name__, code, attempt, e))
+            else:
+                stack.pop()
+                if stack:
+                    stack[-1].extend(callbacks)
+                return result
+
+    return wrapper
+
+
+def retry_stats() -> dict:
+    """
+    Количество повторов транзакций и транзакций, не выполненных после всех повторов, по кодам ошибок.
+    """
+
+    collected = collect()
+    return {
+        'retries': {labels[0]: values[0] for labels, values in collected[TRANSACTION_RETRIES.name].items()},
+        'exhausted': {labels[0]: values[0]
+                      for labels, values in collected[TRANSACTION_RETRIES_EXHAUSTED.name].items()},
+    }